@@ -1,13 +1,14 @@
 from django.contrib import admin
 
-from .models import Colaborador, Servicio, Cita, Horario, Bloqueo
+from .models import Colaborador, Servicio, Cita, Horario, Bloqueo, NotificationOutbox
 from django.contrib.admin.models import LogEntry
 from django.urls import path
 from .views import admin_report_view
 from django.contrib.auth.models import User
 from .forms import HorarioAdminForm
 from .reports import generate_excel_report, generate_pdf_report
-from .utils import send_appointment_email
+from django.db import transaction
+from .outbox import enqueue_notification
 from organizacion.models import Sede
 
 # MULTI-TENANT: Import helper for profile management
@@ -231,33 +232,35 @@ class CitaAdmin(admin.ModelAdmin):
 
     def confirmar_citas(self, request, queryset):
         updated_count = 0
-        for cita in queryset.filter(estado='Pendiente'):
-            cita.confirmado = True
-            cita.estado = 'Confirmada'
-            cita.save()
-            send_appointment_email(
-                appointment_id=cita.id,
-                subject=f"Tu cita ha sido confirmada: {', '.join([s.nombre for s in cita.servicios.all()])}",
-                template_name='appointment_confirmation'
-            )
-            updated_count += 1
+        # Cambios y notificaciones (outbox) en una sola transacción; el envío
+        # ocurre en el dispatcher, fuera del request del admin
+        with transaction.atomic():
+            for cita in queryset.filter(estado='Pendiente'):
+                cita.confirmado = True
+                cita.estado = 'Confirmada'
+                cita.save()
+                enqueue_notification(
+                    cita, 'confirmation', ['email'], subject_prefix='Tu cita ha sido confirmada'
+                )
+                updated_count += 1
         self.message_user(request, f"{updated_count} citas han sido confirmadas y notificadas.")
     confirmar_citas.short_description = "Confirmar citas seleccionadas"
 
     def cancelar_citas(self, request, queryset):
         updated_count = 0
-        for cita in queryset.filter(estado__in=['Pendiente', 'Confirmada']):
-            original_fecha = cita.fecha
-            cita.estado = 'Cancelada'
-            cita.confirmado = False
-            cita.save()
-            send_appointment_email(
-                appointment_id=cita.id,
-                subject=f"Cancelación de Cita: {', '.join([s.nombre for s in cita.servicios.all()])}",
-                template_name='appointment_cancellation',
-                context={'original_fecha': original_fecha.isoformat()}
-            )
-            updated_count += 1
+        with transaction.atomic():
+            for cita in queryset.filter(estado__in=['Pendiente', 'Confirmada']):
+                original_fecha = cita.fecha
+                cita.estado = 'Cancelada'
+                cita.confirmado = False
+                cita.save()
+                enqueue_notification(
+                    cita, 'cancellation', ['email'],
+                    context={'original_fecha': original_fecha.isoformat()}
+                )
+                # Elimina los recordatorios pendientes (el dispatcher los planifica por lote)
+                enqueue_notification(cita, 'schedule_reminders', ['whatsapp'])
+                updated_count += 1
         self.message_user(request, f"{updated_count} citas han sido canceladas y notificadas.")
     cancelar_citas.short_description = "Cancelar citas seleccionadas"
 
@@ -356,5 +359,18 @@ class LogEntryAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    """Outbox de notificaciones: solo lectura, para revisar envíos fallidos"""
+    list_display = ('id', 'cita', 'channel', 'event', 'status', 'attempts', 'available_at', 'sent_at')
+    list_filter = ('status', 'channel', 'event')
+    search_fields = ('cita__id', 'cita__nombre')
+    list_select_related = ('cita',)
+    readonly_fields = [field.name for field in NotificationOutbox._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
 # Import WhatsApp admin to register models
 from . import admin_whatsapp  # noqa
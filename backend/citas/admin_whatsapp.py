@@ -225,6 +225,8 @@ class WhatsAppReminderScheduleAdmin(admin.ModelAdmin):
         'is_sent',
         'sent_at',
         'whatsapp_message',
+        'claimed_at',
+        'claimed_by',
         'created_at',
         'updated_at',
     ]
@@ -234,7 +236,7 @@ class WhatsAppReminderScheduleAdmin(admin.ModelAdmin):
             'fields': ('cita', 'reminder_type', 'scheduled_time')
         }),
         ('Estado', {
-            'fields': ('is_sent', 'sent_at', 'whatsapp_message')
+            'fields': ('is_sent', 'sent_at', 'whatsapp_message', 'claimed_at', 'claimed_by')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
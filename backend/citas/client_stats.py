@@ -0,0 +1,100 @@
+"""
+Mantenimiento incremental de ClientStats.
+
+Cada cambio de una Cita (crear, cambiar estado/fecha, cambiar servicios,
+eliminar) recalcula SOLO la fila de estadísticas de ese cliente en esa
+organización, con una agregación acotada a sus citas. El historial del cliente
+lee la fila ya calculada en lugar de agregar todo su historial en cada request.
+
+Un cliente es el User de la cita o, para citas sin usuario, el User cuyo
+username coincide con el nombre de la cita (mismo criterio que el historial).
+"""
+import logging
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Q
+
+from .models import Cita
+from .models_stats import ClientStats
+from .revenue import count_by_servicio, sum_revenue, unique_citas
+
+logger = logging.getLogger(__name__)
+
+TOP_SERVICIOS = 5
+
+
+def client_citas(user, organizacion_id):
+    """
+    Citas de un cliente dentro de una organización.
+
+    Args:
+        user: User del cliente
+        organizacion_id: ID de la organización (None = citas sin organización)
+    """
+    citas = Cita.all_objects.filter(Q(user=user) | Q(nombre=user.username))
+    if organizacion_id:
+        return citas.filter(sede__organizacion_id=organizacion_id)
+    return citas.filter(sede__organizacion__isnull=True)
+
+
+def client_for_cita(cita):
+    """
+    Retorna el ID del User cliente de la cita, o None si no corresponde a ningún usuario.
+    """
+    if cita.user_id:
+        return cita.user_id
+    if cita.nombre:
+        return User.objects.filter(username=cita.nombre).values_list('id', flat=True).first()
+    return None
+
+
+def refresh_client_stats(user_id, organizacion_id):
+    """
+    Recalcula la fila de ClientStats del cliente en la organización.
+
+    Args:
+        user_id: ID del User cliente
+        organizacion_id: ID de la organización (puede ser None)
+
+    Returns:
+        ClientStats actualizado, o None si el usuario no existe
+    """
+    user = User.objects.filter(pk=user_id).first()
+    if not user:
+        return None
+
+    citas = client_citas(user, organizacion_id)
+
+    stats = unique_citas(citas).aggregate(
+        total_citas=Count('id'),
+        asistidas=Count('id', filter=Q(estado='Asistio')),
+        canceladas=Count('id', filter=Q(estado='Cancelada')),
+        no_asistidas=Count('id', filter=Q(estado='No Asistio')),
+        pendientes=Count('id', filter=Q(estado='Pendiente')),
+        confirmadas=Count('id', filter=Q(estado='Confirmada')),
+        ultima_visita=Max('fecha', filter=Q(estado='Asistio')),
+    )
+    stats['ltv'] = sum_revenue(citas, estados=['Asistio'])
+    stats['servicios_top'] = sorted(
+        count_by_servicio(citas), key=lambda item: item['count'], reverse=True
+    )[:TOP_SERVICIOS]
+
+    client_stats, _ = ClientStats.objects.update_or_create(
+        organizacion_id=organizacion_id,
+        user_id=user_id,
+        defaults=stats,
+    )
+    return client_stats
+
+
+def get_client_stats(user, organizacion_id):
+    """
+    Estadísticas materializadas del cliente; se calculan en el primer acceso
+    si todavía no existen (clientes anteriores a la tabla).
+    """
+    client_stats = ClientStats.objects.filter(
+        organizacion_id=organizacion_id, user=user
+    ).first()
+    if client_stats is None:
+        client_stats = refresh_client_stats(user.pk, organizacion_id)
+    return client_stats
@@ -0,0 +1,64 @@
+"""
+Comando para exportar el historial de citas de una organización a Parquet.
+
+Uso:
+    python manage.py export_citas_parquet --organizacion <id|schema_name> --output citas.parquet
+    python manage.py export_citas_parquet --organizacion 3 --output citas.parquet --desde 2022-01-01
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.parquet_export import DEFAULT_BATCH_SIZE, ParquetExportUnavailable, export_citas_parquet
+from organizacion.models import Organizacion
+
+
+class Command(BaseCommand):
+    help = 'Exporta el historial de citas de una organización en formato Parquet (requiere pyarrow)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organizacion',
+            required=True,
+            help='ID o schema_name de la organización a exportar',
+        )
+        parser.add_argument('--output', required=True, help='Ruta del archivo .parquet de salida')
+        parser.add_argument('--desde', help='Fecha inicial (YYYY-MM-DD)')
+        parser.add_argument('--hasta', help='Fecha final (YYYY-MM-DD)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Filas por row group (default: {DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        identificador = options['organizacion']
+        try:
+            if identificador.isdigit():
+                org = Organizacion.objects.get(id=int(identificador))
+            else:
+                org = Organizacion.objects.get(schema_name=identificador)
+        except Organizacion.DoesNotExist:
+            raise CommandError(f'Organización "{identificador}" no encontrada')
+
+        try:
+            desde = datetime.strptime(options['desde'], '%Y-%m-%d').date() if options['desde'] else None
+            hasta = datetime.strptime(options['hasta'], '%Y-%m-%d').date() if options['hasta'] else None
+        except ValueError:
+            raise CommandError('Formato de fecha inválido. Use YYYY-MM-DD.')
+
+        self.stdout.write(f'Exportando citas de {org.nombre} a {options["output"]}...')
+
+        try:
+            total = export_citas_parquet(
+                org,
+                options['output'],
+                start_date=desde,
+                end_date=hasta,
+                batch_size=options['batch_size'],
+            )
+        except ParquetExportUnavailable as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} citas exportadas'))
@@ -0,0 +1,44 @@
+"""
+Comando para reconstruir las estadísticas materializadas de clientes (ClientStats).
+
+Útil tras desplegar la tabla por primera vez o después de cargas masivas que no
+disparan signals (bulk_create, QuerySet.update).
+
+Uso:
+    python manage.py rebuild_client_stats
+    python manage.py rebuild_client_stats --organizacion 3
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from citas.client_stats import refresh_client_stats
+from citas.models import Cita
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye ClientStats a partir de las citas existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organizacion',
+            type=int,
+            help='ID de la organización a reconstruir (por defecto todas)',
+        )
+
+    def handle(self, *args, **options):
+        # ARQUITECTURA: Forzar search_path a public donde están los datos
+        with connection.cursor() as cursor:
+            cursor.execute("SET search_path TO public;")
+
+        citas = Cita.all_objects.filter(user__isnull=False)
+        if options['organizacion']:
+            citas = citas.filter(sede__organizacion_id=options['organizacion'])
+
+        pares = citas.order_by().values_list('user_id', 'sede__organizacion_id').distinct().iterator()
+
+        total = 0
+        for user_id, organizacion_id in pares:
+            refresh_client_stats(user_id, organizacion_id)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} estadísticas de clientes reconstruidas'))
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-19 10:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0028_add_guest_booking_fields'),
+        ('organizacion', '0006_tenant_schema_support'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_citas', models.PositiveIntegerField(default=0)),
+                ('asistidas', models.PositiveIntegerField(default=0)),
+                ('canceladas', models.PositiveIntegerField(default=0)),
+                ('no_asistidas', models.PositiveIntegerField(default=0)),
+                ('pendientes', models.PositiveIntegerField(default=0)),
+                ('confirmadas', models.PositiveIntegerField(default=0)),
+                ('ltv', models.DecimalField(decimal_places=0, default=0, max_digits=12)),
+                ('ultima_visita', models.DateTimeField(blank=True, null=True)),
+                ('servicios_top', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organizacion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='client_stats', to='organizacion.organizacion')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Estadísticas de Cliente',
+                'verbose_name_plural': 'Estadísticas de Clientes',
+                'db_table': 'citas_client_stats',
+                'unique_together': {('organizacion', 'user')},
+            },
+        ),
+    ]
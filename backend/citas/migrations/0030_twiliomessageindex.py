@@ -0,0 +1,25 @@
+# Generated by Django 5.0.6 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0029_clientstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TwilioMessageIndex',
+            fields=[
+                ('twilio_sid', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('schema_name', models.CharField(help_text='Schema PostgreSQL donde vive el WhatsAppMessage', max_length=63)),
+                ('message_id', models.BigIntegerField(help_text='ID del WhatsAppMessage en su schema')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'citas_twilio_message_index',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0030_twiliomessageindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('email', 'Email'), ('whatsapp', 'WhatsApp')], max_length=20)),
+                ('event', models.CharField(choices=[('confirmation', 'Confirmación'), ('cancellation', 'Cancelación'), ('reschedule', 'Reprogramación'), ('guest_booking', 'Reserva de invitado'), ('guest_cancellation', 'Cancelación de invitado'), ('schedule_reminders', 'Programar recordatorios')], max_length=30)),
+                ('payload', models.JSONField(blank=True, default=dict, help_text='Datos del evento (ej: fecha original, motivo de cancelación)')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'En curso'), ('sent', 'Enviado'), ('failed', 'Fallido')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('available_at', models.DateTimeField(help_text='No enviar antes de este momento (backoff entre reintentos)')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('cita', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones_outbox', to='citas.cita')),
+            ],
+            options={
+                'db_table': 'citas_notification_outbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='citas_notif_status_2adc52_idx')],
+            },
+        ),
+    ]
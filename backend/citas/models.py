@@ -137,9 +137,25 @@ class Cita(models.Model):
     objects = models.Manager()
     all_objects = models.Manager()
 
+    # Campos que determinan el cliente de la cita (ver citas/client_stats.py)
+    CLIENT_FIELDS = ('user_id', 'nombre', 'sede_id')
+
     def __str__(self):
         return f"{self.nombre} - {self.fecha}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valores cargados: permiten detectar un cambio de cliente sin otro SELECT
+        if all(field in instance.__dict__ for field in cls.CLIENT_FIELDS):
+            instance._loaded_client_fields = instance.client_fields()
+        return instance
+
+    def client_fields(self):
+        return tuple(getattr(self, field) for field in self.CLIENT_FIELDS)
+
 
 # Import WhatsApp models to register them with Django
-from .models_whatsapp import WhatsAppMessage, WhatsAppReminderSchedule  # noqa
\ No newline at end of file
+from .models_whatsapp import WhatsAppMessage, WhatsAppReminderSchedule, TwilioMessageIndex, WhatsAppCampaign  # noqa
+from .models_stats import ClientStats  # noqa
+from .models_outbox import NotificationOutbox  # noqa
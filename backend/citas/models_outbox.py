@@ -0,0 +1,75 @@
+"""
+Outbox transaccional de notificaciones.
+
+Las notificaciones de una cita (emails, WhatsApp) se guardan como filas de
+NotificationOutbox en la MISMA transacción que el cambio de la cita. Un
+dispatcher de Celery las envía por lotes después del commit (ver
+citas/outbox.py), así:
+
+- La latencia del request no incluye SMTP ni el broker.
+- Si la transacción hace rollback, la notificación nunca se envía.
+- El contenido se arma al enviar, cuando los servicios M2M ya están guardados.
+"""
+from django.db import models
+
+
+class NotificationOutbox(models.Model):
+    """
+    Notificación pendiente de envío.
+    """
+
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('whatsapp', 'WhatsApp'),
+    ]
+
+    EVENT_CHOICES = [
+        ('confirmation', 'Confirmación'),
+        ('cancellation', 'Cancelación'),
+        ('reschedule', 'Reprogramación'),
+        ('guest_booking', 'Reserva de invitado'),
+        ('guest_cancellation', 'Cancelación de invitado'),
+        ('schedule_reminders', 'Programar recordatorios'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('processing', 'En curso'),
+        ('sent', 'Enviado'),
+        ('failed', 'Fallido'),
+    ]
+
+    cita = models.ForeignKey(
+        'citas.Cita',
+        on_delete=models.CASCADE,
+        related_name='notificaciones_outbox'
+    )
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    event = models.CharField(max_length=30, choices=EVENT_CHOICES)
+    payload = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Datos del evento (ej: fecha original, motivo de cancelación)'
+    )
+
+    # Estado del envío
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(
+        help_text='No enviar antes de este momento (backoff entre reintentos)'
+    )
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'citas_notification_outbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} {self.get_event_display()} cita #{self.cita_id} - {self.status}"
@@ -0,0 +1,66 @@
+"""
+Estadísticas materializadas por cliente.
+
+ClientStats guarda, por organización y cliente, los conteos de citas por estado,
+el LTV, la última visita y los servicios más usados. Se mantiene al día desde
+los signals de Cita (ver citas/client_stats.py), así el historial del cliente no
+necesita agregar todas sus citas en cada request.
+"""
+from django.contrib.auth.models import User
+from django.db import models
+
+
+class ClientStats(models.Model):
+    """
+    Estadísticas de un cliente dentro de una organización.
+    """
+
+    organizacion = models.ForeignKey(
+        'organizacion.Organizacion',
+        on_delete=models.CASCADE,
+        related_name='client_stats',
+        null=True,
+        blank=True
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='client_stats'
+    )
+
+    # Conteos por estado
+    total_citas = models.PositiveIntegerField(default=0)
+    asistidas = models.PositiveIntegerField(default=0)
+    canceladas = models.PositiveIntegerField(default=0)
+    no_asistidas = models.PositiveIntegerField(default=0)
+    pendientes = models.PositiveIntegerField(default=0)
+    confirmadas = models.PositiveIntegerField(default=0)
+
+    # Lifetime Value: suma de precios de las citas con estado 'Asistio'
+    ltv = models.DecimalField(max_digits=12, decimal_places=0, default=0)
+    ultima_visita = models.DateTimeField(null=True, blank=True)
+
+    # Top servicios: [{"servicios__nombre": str, "count": int}, ...]
+    servicios_top = models.JSONField(default=list, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'citas_client_stats'
+        verbose_name = 'Estadísticas de Cliente'
+        verbose_name_plural = 'Estadísticas de Clientes'
+        unique_together = [['organizacion', 'user']]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.total_citas} citas"
+
+    def as_stats(self):
+        """Formato de `stats` que consume el historial del cliente."""
+        return {
+            'total': self.total_citas,
+            'asistidas': self.asistidas,
+            'canceladas': self.canceladas,
+            'no_asistidas': self.no_asistidas,
+            'ltv': self.ltv,
+            'ultima_visita': self.ultima_visita,
+        }
@@ -1,9 +1,13 @@
 """
 Modelos para el sistema de notificaciones por WhatsApp.
 """
-from django.db import models
+import logging
+
+from django.db import connection, models, transaction
 from django.utils.translation import gettext_lazy as _
 
+logger = logging.getLogger(__name__)
+
 
 class WhatsAppMessage(models.Model):
     """
@@ -42,6 +46,14 @@ class WhatsAppMessage(models.Model):
         on_delete=models.CASCADE,
         related_name='whatsapp_messages'
     )
+    campaign = models.ForeignKey(
+        'citas.WhatsAppCampaign',
+        on_delete=models.SET_NULL,
+        related_name='messages',
+        blank=True,
+        null=True,
+        help_text='Campaña de marketing a la que pertenece (si aplica)'
+    )
 
     # Información del mensaje
     message_type = models.CharField(
@@ -137,6 +149,9 @@ class WhatsAppMessage(models.Model):
         self.twilio_status = twilio_status
         self.sent_at = timezone.now()
         self.save(update_fields=['status', 'twilio_sid', 'twilio_status', 'sent_at', 'updated_at'])
+        # Índice global SID -> (schema, id) para enrutar el webhook de Twilio en O(1)
+        TwilioMessageIndex.register(twilio_sid, self.pk)
+        self._publish_activity('message_sent')
 
     def mark_as_failed(self, error_code, error_message):
         """Marca el mensaje como fallido"""
@@ -144,6 +159,12 @@ class WhatsAppMessage(models.Model):
         self.error_code = error_code
         self.error_message = error_message
         self.save(update_fields=['status', 'error_code', 'error_message', 'updated_at'])
+        self._publish_activity('message_failed')
+
+    def _publish_activity(self, event_type):
+        """Evento de dominio para el panel en tiempo real (organizacion/activity_events.py)."""
+        from organizacion.activity_events import publish_event
+        publish_event(event_type, self.organizacion_id, cita_id=self.cita_id, message_type=self.message_type)
 
     def mark_as_delivered(self):
         """Marca el mensaje como entregado"""
@@ -153,6 +174,60 @@ class WhatsAppMessage(models.Model):
         self.save(update_fields=['status', 'delivered_at', 'updated_at'])
 
 
+class WhatsAppCampaign(models.Model):
+    """
+    Campaña de marketing por WhatsApp.
+
+    Los mensajes se crean con bulk_create en estado 'pending' y se envían por
+    chunks en tareas Celery; el progreso (enviados/fallidos) se actualiza por
+    lotes, por lo que una campaña interrumpida se reanuda enviando solo los
+    mensajes que siguen pendientes.
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('sending', 'Enviando'),
+        ('completed', 'Completada'),
+        ('failed', 'Fallida'),
+    ]
+
+    organizacion = models.ForeignKey(
+        'organizacion.Organizacion',
+        on_delete=models.CASCADE,
+        related_name='whatsapp_campaigns'
+    )
+    created_by = models.ForeignKey(
+        'auth.User',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='whatsapp_campaigns'
+    )
+    message_body = models.TextField()
+    media_url = models.URLField(max_length=500, blank=True, null=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'citas_whatsapp_campaign'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Campaña #{self.pk} - {self.organizacion_id} ({self.status})"
+
+    @property
+    def pending_count(self):
+        return max(self.total - self.sent_count - self.failed_count, 0)
+
+
 class WhatsAppReminderSchedule(models.Model):
     """
     Programación de recordatorios de WhatsApp.
@@ -200,6 +275,19 @@ class WhatsAppReminderSchedule(models.Model):
         help_text='Mensaje enviado asociado'
     )
 
+    # Reclamo en curso (varios workers se reparten el backlog sin duplicar envíos)
+    claimed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text='Momento en que un worker tomó el recordatorio para enviarlo'
+    )
+    claimed_by = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text='Worker que tiene el recordatorio en curso'
+    )
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -210,6 +298,7 @@ class WhatsAppReminderSchedule(models.Model):
         indexes = [
             models.Index(fields=['is_sent', 'scheduled_time']),
             models.Index(fields=['cita', 'reminder_type']),
+            models.Index(fields=['is_sent', 'claimed_at']),
         ]
         # Evitar duplicados
         unique_together = [['cita', 'reminder_type']]
@@ -224,4 +313,92 @@ class WhatsAppReminderSchedule(models.Model):
         self.is_sent = True
         self.sent_at = timezone.now()
         self.whatsapp_message = whatsapp_message
-        self.save(update_fields=['is_sent', 'sent_at', 'whatsapp_message', 'updated_at'])
+        self.claimed_at = None
+        self.save(update_fields=['is_sent', 'sent_at', 'whatsapp_message', 'claimed_at', 'updated_at'])
+
+
+class TwilioMessageIndex(models.Model):
+    """
+    Índice global (schema public) de Twilio SID -> (schema, id de WhatsAppMessage).
+
+    El webhook de estados de Twilio no sabe en qué schema vive el mensaje; con
+    este índice resuelve el tenant con UNA búsqueda indexada en lugar de probar
+    schema por schema. Siempre se lee/escribe con SQL calificado `public.` para
+    no depender del search_path activo.
+    """
+
+    twilio_sid = models.CharField(max_length=100, primary_key=True)
+    schema_name = models.CharField(
+        max_length=63,
+        help_text='Schema PostgreSQL donde vive el WhatsAppMessage'
+    )
+    message_id = models.BigIntegerField(help_text='ID del WhatsAppMessage en su schema')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'citas_twilio_message_index'
+
+    def __str__(self):
+        return f"{self.twilio_sid} -> {self.schema_name}#{self.message_id}"
+
+    @classmethod
+    def register(cls, twilio_sid, message_id):
+        """
+        Registra (o actualiza) el SID con el schema actual del search_path.
+        Un fallo aquí no debe impedir el envío: el webhook tiene fallback.
+        """
+        if not twilio_sid:
+            return
+        try:
+            # Savepoint: si falla no aborta la transacción del llamador
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO public.citas_twilio_message_index
+                        (twilio_sid, schema_name, message_id, created_at)
+                    VALUES (%s, current_schema(), %s, now())
+                    ON CONFLICT (twilio_sid) DO UPDATE
+                        SET schema_name = EXCLUDED.schema_name,
+                            message_id = EXCLUDED.message_id
+                """, [twilio_sid, message_id])
+        except Exception as e:
+            logger.warning(
+                f"[WhatsApp] No se pudo indexar SID {twilio_sid}: {e}"
+            )
+
+    @classmethod
+    def register_many(cls, pairs):
+        """
+        Registra varios SIDs en una sola ida a la BD.
+
+        Args:
+            pairs: Lista de tuplas (twilio_sid, message_id)
+        """
+        pairs = [(sid, message_id) for sid, message_id in pairs if sid]
+        if not pairs:
+            return
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO public.citas_twilio_message_index
+                        (twilio_sid, schema_name, message_id, created_at)
+                    VALUES (%s, current_schema(), %s, now())
+                    ON CONFLICT (twilio_sid) DO UPDATE
+                        SET schema_name = EXCLUDED.schema_name,
+                            message_id = EXCLUDED.message_id
+                """, pairs)
+        except Exception as e:
+            logger.warning(f"[WhatsApp] No se pudieron indexar {len(pairs)} SIDs: {e}")
+
+    @classmethod
+    def resolve(cls, twilio_sid):
+        """
+        Returns:
+            Tupla (schema_name, message_id) o None si el SID no está indexado
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT schema_name, message_id
+                FROM public.citas_twilio_message_index
+                WHERE twilio_sid = %s
+            """, [twilio_sid])
+            return cursor.fetchone()
@@ -0,0 +1,305 @@
+"""
+Outbox transaccional de notificaciones (ver models_outbox.py).
+
+Uso desde vistas/admin, dentro de la transacción que modifica la cita:
+
+    with transaction.atomic():
+        cita.estado = 'Cancelada'
+        cita.save()
+        enqueue_notification(cita, 'cancellation', ['email', 'whatsapp'], reason=reason)
+
+El dispatcher (`dispatch_notification_outbox`, Beat cada 5 segundos) reclama
+lotes con SELECT ... FOR UPDATE SKIP LOCKED, envía cada notificación por su
+canal y reintenta con backoff exponencial hasta MAX_ATTEMPTS.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from core.mailer import send_email
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models_outbox import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = timedelta(seconds=30)
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Plantilla y asunto por defecto de los emails de cita (send_appointment_email)
+EMAIL_TEMPLATES = {
+    'confirmation': ('appointment_confirmation', 'Confirmación de Cita'),
+    'cancellation': ('appointment_cancellation', 'Cancelación de Cita'),
+    'reschedule': ('appointment_reschedule', 'Reprogramación de Cita'),
+}
+
+
+class WhatsAppSendError(Exception):
+    """Twilio rechazó el mensaje (el servicio lo marca 'failed' sin lanzar)."""
+
+
+def enqueue_notification(cita, event, channels=('email',), **payload):
+    """
+    Registra notificaciones de la cita en el outbox (una fila por canal).
+
+    Debe llamarse dentro de la transacción que modifica la cita: si esa
+    transacción hace rollback, las notificaciones desaparecen con ella.
+
+    Args:
+        cita: Cita afectada
+        event: Evento (ver NotificationOutbox.EVENT_CHOICES)
+        channels: Canales a notificar ('email', 'whatsapp')
+        **payload: Datos del evento (JSON serializable)
+
+    Returns:
+        Lista de NotificationOutbox creadas
+    """
+    if event == 'cancellation':
+        # Evento de dominio para el panel en tiempo real (todas las cancelaciones pasan por aquí)
+        from organizacion.activity_events import publish_cita_event
+        publish_cita_event(cita, 'cita_cancelled')
+
+    now = timezone.now()
+    return NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(cita=cita, channel=channel, event=event, payload=payload, available_at=now)
+        for channel in channels
+    ])
+
+
+# ---------------------------------------------------------------------------
+# Canales
+# ---------------------------------------------------------------------------
+
+def _servicios_nombres(cita):
+    return ', '.join(s.nombre for s in cita.servicios.all())
+
+
+def _send_appointment_email(notification):
+    from .utils import deliver_appointment_email
+
+    cita = notification.cita
+    template_name, default_subject = EMAIL_TEMPLATES[notification.event]
+    subject_prefix = notification.payload.get('subject_prefix', default_subject)
+    # Se ejecuta en el worker del dispatcher (sin pasar de nuevo por el broker);
+    # los errores SMTP se propagan para que el outbox reintente
+    deliver_appointment_email(
+        appointment_id=cita.id,
+        subject=f"{subject_prefix}: {_servicios_nombres(cita)}",
+        template_name=template_name,
+        context=notification.payload.get('context'),
+    )
+
+
+def _send_guest_booking_email(notification):
+    """Email al invitado con el link para ver/cancelar su cita."""
+    cita = notification.cita
+    if not cita.email_cliente:
+        return
+
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
+    manage_link = f"{frontend_url}/cita/{cita.id}?token={cita.token_invitado}"
+    fecha_formateada = cita.fecha.strftime('%d/%m/%Y a las %H:%M')
+
+    message = f"""
+Hola {cita.nombre},
+
+¡Tu cita ha sido confirmada exitosamente!
+
+📅 Fecha: {fecha_formateada}
+📍 Sede: {cita.sede.nombre}
+💼 Servicios: {_servicios_nombres(cita)}
+
+Para ver los detalles de tu cita o cancelarla, usa este enlace:
+{manage_link}
+
+Este enlace es personal e intransferible.
+
+Por favor, llega 10 minutos antes de tu cita.
+
+Si no solicitaste esta cita, puedes ignorar este correo.
+
+¡Te esperamos!
+{cita.sede.organizacion.nombre}
+    """.strip()
+
+    send_email(
+        subject=f'Cita Confirmada - {cita.sede.nombre}',
+        message=message,
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
+        recipient_list=[cita.email_cliente],
+        fail_silently=False,
+    )
+
+
+def _send_guest_cancellation_email(notification):
+    cita = notification.cita
+    if not cita.email_cliente:
+        return
+
+    fecha_formateada = cita.fecha.strftime('%d/%m/%Y a las %H:%M')
+    send_email(
+        subject=f'Cita Cancelada - {cita.sede.nombre}',
+        message=f"""
+Hola {cita.nombre},
+
+Tu cita del {fecha_formateada} ha sido cancelada exitosamente.
+
+Si deseas reagendar, puedes visitar nuestra página de agendamiento.
+
+{cita.sede.organizacion.nombre}
+        """.strip(),
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
+        recipient_list=[cita.email_cliente],
+        fail_silently=False,
+    )
+
+
+# Eventos de WhatsApp que crean, reprograman o eliminan recordatorios.
+# dispatch_batch los agrupa en UN plan_reminders por lote.
+REMINDER_PLAN_EVENTS = {'schedule_reminders', 'reschedule', 'cancellation'}
+
+
+def _plans_reminders(notification):
+    return notification.channel == 'whatsapp' and notification.event in REMINDER_PLAN_EVENTS
+
+
+def _plan_reminders_for(notifications):
+    """
+    Planifica los recordatorios de todas las citas del lote de una vez.
+
+    Returns:
+        La excepción si la planificación falló (esas notificaciones se
+        reintentan), None si no
+    """
+    from .whatsapp.reminder_planner import plan_reminders
+
+    cita_ids = [n.cita_id for n in notifications if _plans_reminders(n)]
+    if not cita_ids:
+        return None
+    try:
+        plan_reminders(cita_ids)
+    except Exception as e:
+        logger.error(f"[Outbox] Error planificando recordatorios de {len(cita_ids)} citas: {e}")
+        return e
+    return None
+
+
+def _send_whatsapp(notification):
+    from .whatsapp.whatsapp_service import whatsapp_service
+
+    cita = notification.cita
+    if notification.event == 'confirmation':
+        message = whatsapp_service.send_appointment_confirmation(cita)
+    elif notification.event == 'cancellation':
+        message = whatsapp_service.send_appointment_cancellation(cita, notification.payload.get('reason', ''))
+    elif notification.event in REMINDER_PLAN_EVENTS:
+        return  # Recordatorios ya planificados por lote en dispatch_batch
+    else:
+        raise ValueError(f"Evento de WhatsApp no soportado: {notification.event}")
+
+    # _send_message captura los errores de Twilio y deja el mensaje en 'failed':
+    # se lanza para que el outbox reintente con backoff
+    if message is not None and message.status == 'failed':
+        raise WhatsAppSendError(f"[{message.error_code}] {message.error_message}")
+
+
+def _send_email(notification):
+    if notification.event == 'guest_booking':
+        _send_guest_booking_email(notification)
+    elif notification.event == 'guest_cancellation':
+        _send_guest_cancellation_email(notification)
+    else:
+        _send_appointment_email(notification)
+
+
+CHANNEL_HANDLERS = {
+    'email': _send_email,
+    'whatsapp': _send_whatsapp,
+}
+
+
+# ---------------------------------------------------------------------------
+# Dispatcher
+# ---------------------------------------------------------------------------
+
+def claim_batch(batch_size=BATCH_SIZE):
+    """
+    Reclama un lote de notificaciones listas para enviar.
+    Incluye las que quedaron 'processing' por un worker caído (CLAIM_TIMEOUT).
+
+    Returns:
+        Lista de IDs reclamados
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            NotificationOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status='pending', available_at__lte=now)
+                | Q(status='processing', claimed_at__lt=now - CLAIM_TIMEOUT)
+            )
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            NotificationOutbox.objects.filter(id__in=ids).update(status='processing', claimed_at=now)
+    return ids
+
+
+def dispatch_batch(batch_size=BATCH_SIZE):
+    """
+    Envía un lote del outbox y guarda los resultados con un bulk_update.
+
+    Returns:
+        dict con claimed, sent, retried y failed
+    """
+    ids = claim_batch(batch_size)
+    result = {'claimed': len(ids), 'sent': 0, 'retried': 0, 'failed': 0}
+    if not ids:
+        return result
+
+    notifications = list(
+        NotificationOutbox.objects.filter(id__in=ids)
+        .select_related('cita__sede__organizacion', 'cita__user')
+        .order_by('id')
+    )
+
+    plan_error = _plan_reminders_for(notifications)
+
+    for notification in notifications:
+        now = timezone.now()
+        try:
+            if plan_error is not None and _plans_reminders(notification):
+                raise plan_error
+            CHANNEL_HANDLERS[notification.channel](notification)
+            notification.status = 'sent'
+            notification.sent_at = now
+            notification.last_error = ''
+            result['sent'] += 1
+        except Exception as e:
+            notification.attempts += 1
+            notification.last_error = str(e)[:2000]
+            if notification.attempts >= MAX_ATTEMPTS:
+                notification.status = 'failed'
+                result['failed'] += 1
+                logger.error(
+                    f"[Outbox] Notificación {notification.id} ({notification.channel}/{notification.event}) "
+                    f"descartada tras {notification.attempts} intentos: {e}"
+                )
+            else:
+                notification.status = 'pending'
+                notification.available_at = now + RETRY_BASE_DELAY * (2 ** (notification.attempts - 1))
+                result['retried'] += 1
+                logger.warning(f"[Outbox] Error enviando notificación {notification.id}, se reintentará: {e}")
+        notification.claimed_at = None
+
+    NotificationOutbox.objects.bulk_update(
+        notifications,
+        ['status', 'attempts', 'available_at', 'claimed_at', 'last_error', 'sent_at'],
+    )
+    return result
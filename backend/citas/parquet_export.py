@@ -0,0 +1,153 @@
+"""
+Exportación columnar (Parquet) del historial de citas de una organización.
+
+Pensado para herramientas de BI con historiales de varios años:
+- Las filas se leen con un cursor del lado del servidor (QuerySet.iterator),
+  sin cargar todo el historial en memoria.
+- Se escribe un row group de Parquet por lote de filas.
+- Las columnas de texto repetitivas (sede, estado, tipo de cita, servicios,
+  colaboradores) van con dictionary encoding, por lo que el archivo resultante
+  es mucho más pequeño que el CSV equivalente.
+
+pyarrow es una dependencia opcional: solo se importa al exportar.
+"""
+import logging
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import OuterRef, Subquery
+
+from .models import Cita
+from .revenue import CitaColaborador, CitaServicio, precio_cita_subquery
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50000
+
+
+class ParquetExportUnavailable(Exception):
+    """pyarrow no está instalado en el entorno."""
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ParquetExportUnavailable(
+            "La exportación a Parquet requiere pyarrow (pip install pyarrow)."
+        ) from exc
+    return pa, pq
+
+
+def _nombres_subquery(through_model, field):
+    """Subquery correlacionada con la lista de nombres de servicios/colaboradores de la cita."""
+    nombres = (
+        through_model.objects
+        .filter(cita_id=OuterRef('pk'))
+        .order_by()
+        .values('cita_id')
+        .annotate(nombres=ArrayAgg(f'{field}__nombre', ordering=f'{field}__nombre'))
+        .values('nombres')
+    )
+    return Subquery(nombres)
+
+
+def _schema(pa):
+    texto = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('id', pa.int64()),
+        ('fecha', pa.timestamp('us', tz='UTC')),
+        ('estado', texto),
+        ('tipo_cita', texto),
+        ('confirmado', pa.bool_()),
+        ('sede_id', pa.int64()),
+        ('sede', texto),
+        ('cliente', pa.string()),
+        ('user_id', pa.int64()),
+        # Las listas usan el dictionary encoding de Parquet (use_dictionary=True)
+        ('servicios', pa.list_(pa.string())),
+        ('colaboradores', pa.list_(pa.string())),
+        ('precio_total', pa.decimal128(12, 0)),
+    ])
+
+
+COLUMNS = [
+    'id', 'fecha', 'estado', 'tipo_cita', 'confirmado', 'sede_id', 'sede__nombre',
+    'nombre', 'user_id', 'servicios_nombres', 'colaboradores_nombres', 'precio_total',
+]
+
+
+def get_export_queryset(organizacion, start_date=None, end_date=None):
+    """
+    Citas de la organización con servicios, colaboradores y precio ya resueltos
+    por subqueries (una fila por cita, sin JOINs ManyToMany).
+    """
+    queryset = Cita.all_objects.filter(sede__organizacion=organizacion)
+    if start_date:
+        queryset = queryset.filter(fecha__date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(fecha__date__lte=end_date)
+
+    return queryset.annotate(
+        servicios_nombres=_nombres_subquery(CitaServicio, 'servicio'),
+        colaboradores_nombres=_nombres_subquery(CitaColaborador, 'colaborador'),
+        precio_total=precio_cita_subquery(),
+    ).order_by('fecha', 'id').values_list(*COLUMNS)
+
+
+def export_citas_parquet(organizacion, sink, start_date=None, end_date=None,
+                         batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Escribe el historial de citas de la organización en formato Parquet.
+
+    Args:
+        organizacion: Organizacion a exportar
+        sink: Ruta o file-like object binario de destino
+        start_date: Fecha inicial opcional (date)
+        end_date: Fecha final opcional (date)
+        batch_size: Filas por row group (y por fetch del cursor)
+
+    Returns:
+        Número de citas exportadas
+
+    Raises:
+        ParquetExportUnavailable: si pyarrow no está instalado
+    """
+    pa, pq = _import_pyarrow()
+    schema = _schema(pa)
+
+    # ARQUITECTURA: Forzar search_path a public donde están los datos
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute("SET search_path TO public;")
+
+    rows = get_export_queryset(organizacion, start_date, end_date).iterator(chunk_size=batch_size)
+
+    total = 0
+    with pq.ParquetWriter(sink, schema, compression='zstd', use_dictionary=True) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_table(_to_table(pa, schema, batch), row_group_size=batch_size)
+                total += len(batch)
+                batch = []
+        if batch or total == 0:
+            # Siempre se escribe al menos un row group para que el archivo tenga el schema
+            writer.write_table(_to_table(pa, schema, batch), row_group_size=batch_size)
+            total += len(batch)
+
+    logger.info(f"[ParquetExport] {total} citas exportadas para {organizacion.nombre}")
+    return total
+
+
+def _to_table(pa, schema, batch):
+    """Convierte un lote de tuplas (values_list) en una tabla Arrow columnar."""
+    columnas = list(zip(*batch)) if batch else [[] for _ in COLUMNS]
+    arrays = []
+    for field, values in zip(schema, columnas):
+        values = list(values)
+        if pa.types.is_list(field.type):
+            values = [v or [] for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
@@ -0,0 +1,161 @@
+"""
+Cache de reportes versionado por tenant + ETags HTTP.
+
+Cada organización tiene un contador "data version" en el cache (Redis) que se
+incrementa en cualquier escritura de Cita, Servicio o Colaborador (ver
+citas/signals.py). La versión forma parte de la clave de cache y del ETag de
+los reportes, por lo que:
+
+- Si nada cambió, el dashboard recibe 304 (If-None-Match) o el payload cacheado
+  sin recalcular agregados.
+- Cualquier escritura invalida de inmediato todos los reportes del tenant, sin
+  tener que borrar claves una por una.
+
+Los superusuarios ven datos de todas las organizaciones, así que usan un
+contador global que también se incrementa en cada escritura.
+
+Si Redis no está disponible, los reportes se calculan normalmente (sin cache).
+"""
+import hashlib
+import logging
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_SCOPE = 'global'
+REPORT_CACHE_TIMEOUT = 60 * 10  # 10 minutos; la versión invalida antes si hay escrituras
+
+
+def _version_key(scope):
+    return f'citas:data_version:{scope}'
+
+
+def _initial_version():
+    # Basado en el reloj: si la clave se pierde (eviction/reinicio de Redis) la
+    # nueva versión nunca coincide con una anterior y no se sirven datos viejos.
+    return int(time.time() * 1000)
+
+
+def get_data_version(scope):
+    """
+    Retorna la versión de datos actual del scope (id de organización o 'global').
+
+    Returns:
+        int con la versión, o None si el cache no está disponible
+    """
+    key = _version_key(scope)
+    try:
+        # add() no sobrescribe: solo inicializa el contador la primera vez
+        cache.add(key, _initial_version(), timeout=None)
+        return cache.get(key)
+    except Exception as e:
+        logger.warning(f"[ReportCache] No se pudo leer la versión de datos ({scope}): {e}")
+        return None
+
+
+def bump_data_version(organizacion_id=None):
+    """
+    Incrementa la versión de datos de la organización y la versión global.
+
+    Args:
+        organizacion_id: ID de la organización afectada (None si no se conoce)
+    """
+    scopes = [GLOBAL_SCOPE]
+    if organizacion_id:
+        scopes.append(organizacion_id)
+
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # La clave no existe todavía (expiró o Redis se reinició)
+            cache.add(key, _initial_version(), timeout=None)
+        except Exception as e:
+            logger.warning(f"[ReportCache] No se pudo incrementar la versión de datos ({scope}): {e}")
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Compara el ETag con la lista de If-None-Match (comparación débil, RFC 9110):
+    coincide si alguna entidad es '*' o es igual al ETag sin el prefijo W/.
+    """
+    for tag in parse_etags(if_none_match or ''):
+        if tag == '*' or tag.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+def get_report_scope(user):
+    """
+    Scope de versionado para el usuario: su organización, o 'global' para
+    superusuarios y usuarios sin organización.
+    """
+    if user.is_superuser:
+        return GLOBAL_SCOPE
+
+    from usuarios.utils import get_perfil_or_first
+    perfil = get_perfil_or_first(user)
+    if perfil and perfil.organizacion_id:
+        return perfil.organizacion_id
+    return GLOBAL_SCOPE
+
+
+def cached_report_response(request, report_name, compute, timeout=REPORT_CACHE_TIMEOUT):
+    """
+    Sirve un reporte usando ETag + cache versionado.
+
+    La clave incluye el usuario (los permisos por sede cambian el resultado),
+    los query params, la fecha actual (los rangos por defecto son relativos a hoy)
+    y la versión de datos del tenant.
+
+    Args:
+        request: Request de DRF
+        report_name: Nombre del reporte (prefijo de la clave)
+        compute: Callable sin argumentos que retorna un Response de DRF
+
+    Returns:
+        Response 304, Response con el payload cacheado o el Response de compute()
+    """
+    scope = get_report_scope(request.user)
+    version = get_data_version(scope)
+    if version is None:
+        return compute()
+
+    params = '&'.join(
+        f'{key}={",".join(sorted(request.query_params.getlist(key)))}'
+        for key in sorted(request.query_params.keys())
+    )
+    fingerprint = hashlib.sha256(
+        f'{request.user.pk}|{params}|{timezone.localdate().isoformat()}'.encode()
+    ).hexdigest()[:32]
+
+    etag = f'"{report_name}-{scope}-{version}-{fingerprint}"'
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    cache_key = f'citas:report:{report_name}:{scope}:{version}:{fingerprint}'
+    try:
+        payload = cache.get(cache_key)
+    except Exception as e:
+        logger.warning(f"[ReportCache] Error leyendo {cache_key}: {e}")
+        payload = None
+
+    if payload is not None:
+        return Response(payload, headers={'ETag': etag})
+
+    response = compute()
+    # Solo se cachean respuestas exitosas
+    if response.status_code == status.HTTP_200_OK:
+        try:
+            cache.set(cache_key, response.data, timeout)
+        except Exception as e:
+            logger.warning(f"[ReportCache] Error guardando {cache_key}: {e}")
+        response['ETag'] = etag
+    return response
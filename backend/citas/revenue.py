@@ -0,0 +1,152 @@
+"""
+Agregación de ingresos sin duplicados por JOINs ManyToMany.
+
+Una cita tiene varios servicios y varios colaboradores. Sumar
+`servicios__precio` sobre un queryset que además filtra por
+`colaboradores__id` o `servicios__id__in` multiplica las filas del JOIN e
+infla los totales (una cita con 2 colaboradores cuenta sus servicios dos veces).
+
+Aquí el precio de cada cita se calcula UNA sola vez con una subquery
+correlacionada sobre la tabla intermedia cita-servicio, y el queryset original
+se colapsa a un semi-join (`pk IN (...)`) antes de agrupar. Todos los reportes
+(citas, sedes, financiero, historial de clientes) deben usar estas funciones.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Cita
+
+# Tablas intermedias de las relaciones ManyToMany de Cita
+CitaServicio = Cita.servicios.through
+CitaColaborador = Cita.colaboradores.through
+
+PRECIO_FIELD = DecimalField(max_digits=12, decimal_places=0)
+
+ESTADOS_ASISTIDA = ['Asistio', 'Asistió']
+
+
+def precio_cita_subquery():
+    """
+    Subquery correlacionada con el precio total de la cita externa
+    (suma de los precios de sus servicios). Retorna 0 si no tiene servicios.
+    """
+    precios = (
+        CitaServicio.objects
+        .filter(cita_id=OuterRef('pk'))
+        .order_by()
+        .values('cita_id')
+        .annotate(total=Sum('servicio__precio'))
+        .values('total')
+    )
+    return Coalesce(
+        Subquery(precios, output_field=PRECIO_FIELD),
+        Value(Decimal('0')),
+        output_field=PRECIO_FIELD,
+    )
+
+
+def unique_citas(queryset):
+    """
+    Colapsa un queryset de citas (con o sin JOINs ManyToMany) a un conjunto de
+    citas sin duplicados, usando un semi-join por pk en lugar de DISTINCT.
+    """
+    return Cita.all_objects.filter(pk__in=queryset.order_by().values('pk'))
+
+
+def with_precio(queryset):
+    """Citas únicas del queryset anotadas con `precio_total`."""
+    return unique_citas(queryset).annotate(precio_total=precio_cita_subquery())
+
+
+def sum_revenue(queryset, estados=None):
+    """
+    Suma el precio de las citas del queryset, contando cada cita una sola vez.
+
+    Args:
+        queryset: Queryset de Cita (puede tener filtros sobre ManyToMany)
+        estados: Lista opcional de estados a incluir (ej: ['Asistio'])
+
+    Returns:
+        Decimal con el total (0 si no hay citas)
+    """
+    citas = with_precio(queryset)
+    if estados:
+        citas = citas.filter(estado__in=estados)
+    return citas.aggregate(
+        total=Coalesce(Sum('precio_total'), Value(Decimal('0')), output_field=PRECIO_FIELD)
+    )['total']
+
+
+def revenue_by_estado(queryset, grupos):
+    """
+    Calcula ingresos y conteo de citas por grupo de estados en UNA sola query.
+
+    Args:
+        queryset: Queryset de Cita
+        grupos: dict nombre -> lista de estados,
+                ej: {'realizados': ['Asistio'], 'cancelados': ['Cancelada']}
+
+    Returns:
+        dict con `ingresos_<nombre>` y `citas_<nombre>` por grupo, más `total_citas`
+    """
+    aggregates = {'total_citas': Count('id')}
+    for nombre, estados in grupos.items():
+        aggregates[f'ingresos_{nombre}'] = Coalesce(
+            Sum('precio_total', filter=Q(estado__in=estados)),
+            Value(Decimal('0')),
+            output_field=PRECIO_FIELD,
+        )
+        aggregates[f'citas_{nombre}'] = Count('id', filter=Q(estado__in=estados))
+    return with_precio(queryset).aggregate(**aggregates)
+
+
+def revenue_by_servicio(queryset, estados=None, limit=None):
+    """
+    Ingresos agrupados por servicio, a partir de la tabla intermedia
+    cita-servicio (una fila por par cita/servicio, sin multiplicar por colaboradores).
+
+    Returns:
+        Lista de dicts con `servicio__nombre`, `total_ingresos` y `cantidad_citas`,
+        ordenada de mayor a menor ingreso.
+    """
+    if estados:
+        queryset = queryset.filter(estado__in=estados)
+    rows = (
+        CitaServicio.objects
+        .filter(cita_id__in=queryset.order_by().values('pk'))
+        .values('servicio__nombre')
+        .annotate(
+            total_ingresos=Sum('servicio__precio'),
+            cantidad_citas=Count('cita_id', distinct=True),
+        )
+        .order_by('-total_ingresos')
+    )
+    if limit:
+        rows = rows[:limit]
+    return list(rows)
+
+
+def count_by_servicio(queryset):
+    """Número de citas por servicio (formato `servicios__nombre` / `count`)."""
+    rows = (
+        CitaServicio.objects
+        .filter(cita_id__in=queryset.order_by().values('pk'))
+        .values('servicio__nombre')
+        .annotate(count=Count('cita_id', distinct=True))
+        .order_by('servicio__nombre')
+    )
+    return [{'servicios__nombre': row['servicio__nombre'], 'count': row['count']} for row in rows]
+
+
+def count_by_colaborador(queryset):
+    """Número de citas por colaborador (formato `colaboradores__nombre` / `count`)."""
+    rows = (
+        CitaColaborador.objects
+        .filter(cita_id__in=queryset.order_by().values('pk'))
+        .values('colaborador__nombre')
+        .annotate(count=Count('cita_id', distinct=True))
+        .order_by('colaborador__nombre')
+    )
+    return [{'colaboradores__nombre': row['colaborador__nombre'], 'count': row['count']} for row in rows]
@@ -51,16 +51,9 @@ class BloqueoSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("El motivo no puede exceder 500 caracteres.")
         return value
 
-    def to_representation(self, instance):
-        """Override to ensure colaborador is fetched with all_objects"""
-        representation = super().to_representation(instance)
-        if instance.colaborador_id:
-            try:
-                colaborador = Colaborador.all_objects.select_related('sede').get(id=instance.colaborador_id)
-                representation['colaborador'] = ColaboradorSerializer(colaborador).data
-            except Colaborador.DoesNotExist:
-                representation['colaborador'] = None
-        return representation
+    # OPTIMIZACIÓN: sin to_representation propio. Antes se volvía a consultar el
+    # colaborador de cada bloqueo (N+1); el acceso por FK ya usa el manager base
+    # (sin filtro de organización) y BloqueoViewSet lo trae con select_related.
 
 class CitaSerializer(serializers.ModelSerializer):
     servicios = ServicioSerializer(many=True, read_only=True)
@@ -231,4 +224,22 @@ class GuestCitaSerializer(serializers.ModelSerializer):
     def validate_servicios_ids(self, value):
         if not value:
             raise serializers.ValidationError("Debe seleccionar al menos un servicio.")
-        return value
\ No newline at end of file
+        return value
+
+class CitaDashboardSerializer(serializers.Serializer):
+    """
+    Serializer de solo lectura para las próximas citas del dashboard.
+
+    OPTIMIZACIÓN: Trabaja sobre diccionarios (`values()`) donde sede, servicios y
+    colaboradores ya vienen resueltos como JSON por subqueries, así que no hace
+    queries adicionales ni anida UserSerializer/ServicioSerializer completos.
+    Conserva la forma que consume el frontend (servicios[].nombre, sede.nombre).
+    """
+    id = serializers.IntegerField()
+    nombre = serializers.CharField()
+    fecha = serializers.DateTimeField()
+    estado = serializers.CharField()
+    confirmado = serializers.BooleanField()
+    sede = serializers.DictField(source='sede_json')
+    servicios = serializers.ListField(child=serializers.DictField(), source='servicios_json')
+    colaboradores = serializers.ListField(child=serializers.DictField(), source='colaboradores_json')
@@ -1,17 +1,125 @@
-from django.db.models.signals import post_save
+from functools import partial
+from types import SimpleNamespace
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Cita
-from .utils import send_appointment_email
+from .models import Cita, Servicio, Colaborador
+from .report_cache import bump_data_version
+from .outbox import enqueue_notification
 
 @receiver(post_save, sender=Cita)
 def send_appointment_confirmation_email(sender, instance, created, **kwargs):
     """
-    Sends a confirmation email when a new appointment is created.
-    This uses the centralized email utility function.
+    Registra el email de confirmación de una cita nueva en el outbox.
+
+    La fila se escribe en la misma transacción que la cita; el asunto y el
+    cuerpo se arman al enviar (ver citas/outbox.py), cuando los servicios M2M
+    ya están guardados.
     """
-    if created:
-        send_appointment_email.delay(
-            appointment_id=instance.id,
-            subject=f"Confirmación de Cita: {', '.join([s.nombre for s in instance.servicios.all()])}",
-            template_name='appointment_confirmation'
-        )
+    if created and not kwargs.get('raw'):
+        enqueue_notification(instance, 'confirmation', ['email'])
+
+
+@receiver(post_save, sender=Cita)
+def publish_cita_created(sender, instance, created, **kwargs):
+    """Evento de dominio para el panel en tiempo real (organizacion/activity_events.py)."""
+    if created and not kwargs.get('raw'):
+        from organizacion.activity_events import publish_cita_event
+        publish_cita_event(instance, 'cita_created')
+
+
+def _organizacion_id_for(instance):
+    """Organización de una Cita/Servicio/Colaborador a través de su sede."""
+    from organizacion.models import Sede
+    if not instance.sede_id:
+        return None
+    return Sede.all_objects.filter(pk=instance.sede_id).values_list('organizacion_id', flat=True).first()
+
+
+@receiver(post_save, sender=Cita)
+@receiver(post_delete, sender=Cita)
+@receiver(post_save, sender=Servicio)
+@receiver(post_delete, sender=Servicio)
+@receiver(post_save, sender=Colaborador)
+@receiver(post_delete, sender=Colaborador)
+@receiver(m2m_changed, sender=Cita.servicios.through)
+@receiver(m2m_changed, sender=Cita.colaboradores.through)
+def invalidate_report_cache(sender, instance, **kwargs):
+    """
+    Incrementa la versión de datos del tenant para invalidar reportes cacheados
+    (ver citas/report_cache.py). Se ejecuta al confirmar la transacción para que
+    ningún reporte cachee datos que aún no son visibles.
+
+    NOTA: QuerySet.update()/bulk_create no disparan signals; el código que los use
+    debe llamar a bump_data_version explícitamente.
+    """
+    action = kwargs.get('action')
+    if action is not None and not action.startswith('post_'):
+        return
+    # En m2m_changed con reverse=True la instancia es el Servicio/Colaborador
+    organizacion_id = _organizacion_id_for(instance) if hasattr(instance, 'sede_id') else None
+    transaction.on_commit(lambda: bump_data_version(organizacion_id))
+
+
+# update_fields que pueden cambiar el cliente o la organización de una cita
+CLIENT_UPDATE_FIELDS = {'user', 'user_id', 'nombre', 'sede', 'sede_id'}
+
+
+@receiver(pre_save, sender=Cita)
+def remember_previous_client(sender, instance, **kwargs):
+    """
+    Guarda el cliente y la organización que tenía la cita antes de guardarla,
+    para que update_client_stats refresque también al cliente anterior cuando
+    la cita se reasigna a otro usuario o a una sede de otra organización.
+
+    Compara con los valores cargados de la BD (Cita.from_db); solo consulta la
+    cita si la instancia no los tiene (ej: construida a mano con pk).
+    """
+    from .client_stats import client_for_cita
+
+    instance._previous_client_stats_key = None
+    if not instance.pk or kwargs.get('raw'):
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not CLIENT_UPDATE_FIELDS.intersection(update_fields):
+        return  # Este guardado no puede cambiar el cliente
+
+    current = instance.client_fields()
+    loaded = instance.__dict__.get('_loaded_client_fields')
+    instance._loaded_client_fields = current
+    if loaded == current:
+        return
+    if loaded is not None:
+        previous = SimpleNamespace(**dict(zip(Cita.CLIENT_FIELDS, loaded)))
+    else:
+        previous = Cita.all_objects.filter(pk=instance.pk).only('user_id', 'nombre', 'sede_id').first()
+        if previous is None:
+            return
+    instance._previous_client_stats_key = (client_for_cita(previous), _organizacion_id_for(previous))
+
+
+@receiver(post_save, sender=Cita)
+@receiver(post_delete, sender=Cita)
+@receiver(m2m_changed, sender=Cita.servicios.through)
+def update_client_stats(sender, instance, **kwargs):
+    """
+    Recalcula las estadísticas materializadas (ClientStats) del cliente de la
+    cita al confirmar la transacción. Solo se tocan la fila de ese cliente y,
+    si la cita cambió de cliente u organización, la del cliente anterior.
+    """
+    from .client_stats import client_for_cita, refresh_client_stats
+
+    action = kwargs.get('action')
+    if action is not None and (not action.startswith('post_') or kwargs.get('reverse')):
+        return
+
+    keys = set()
+    user_id = client_for_cita(instance)
+    if user_id:
+        keys.add((user_id, _organizacion_id_for(instance)))
+    previous = instance.__dict__.pop('_previous_client_stats_key', None)
+    if previous and previous[0]:
+        keys.add(previous)
+    for user_id, organizacion_id in keys:
+        transaction.on_commit(partial(refresh_client_stats, user_id, organizacion_id))
@@ -0,0 +1,40 @@
+"""
+Tareas Celery generales de citas.
+"""
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def dispatch_notification_outbox(max_batches: int = 20):
+    """
+    Dispatcher del outbox de notificaciones (Beat, cada 5 segundos).
+    Recorre los schemas que tienen la tabla del outbox y envía por lotes las
+    notificaciones pendientes. Varios workers pueden ejecutarla a la vez
+    (reclamo con SKIP LOCKED).
+
+    Args:
+        max_batches: Máximo de lotes por schema y ejecución
+    """
+    from .outbox import BATCH_SIZE, dispatch_batch
+    from .tenant_schemas import tenant_schemas_with_table, use_schema
+
+    totals = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+    for schema_name in tenant_schemas_with_table('citas_notification_outbox'):
+        with use_schema(schema_name):
+            for _ in range(max_batches):
+                result = dispatch_batch()
+                for key in totals:
+                    totals[key] += result[key]
+                if result['claimed'] < BATCH_SIZE:
+                    break
+
+    if totals['claimed']:
+        logger.info(
+            f"[Outbox] Notificaciones procesadas: {totals['sent']} enviadas, "
+            f"{totals['retried']} para reintento, {totals['failed']} fallidas"
+        )
+    return totals
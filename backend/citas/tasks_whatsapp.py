@@ -67,150 +67,664 @@ def send_whatsapp_cancellation(self, cita_id: int, reason: str = ''):
         raise self.retry(exc=exc, countdown=300)
 
 
-@shared_task
-def send_scheduled_reminders():
+def _process_reminder(reminder, message_body=None):
+    """
+    Envía un recordatorio ya cargado (con cita__sede__organizacion).
+
+    Args:
+        reminder: WhatsAppReminderSchedule
+        message_body: Mensaje ya renderizado por _render_reminder_bodies
+            (None = renderizarlo al enviar)
+
+    Returns:
+        True si se envió un mensaje, False si se omitió (cita cancelada,
+        WhatsApp deshabilitado o tipo desconocido)
+    """
+    cita = reminder.cita
+
+    # Verificar que la cita no esté cancelada
+    if cita.estado == 'Cancelada':
+        logger.info(f"[WhatsApp] Saltando recordatorio para cita cancelada #{cita.id}")
+        reminder.is_sent = True
+        reminder.save()
+        return False
+
+    # Enviar según tipo de recordatorio
+    if reminder.reminder_type == '24h':
+        result = whatsapp_service.send_appointment_reminder_24h(cita, message_body)
+    elif reminder.reminder_type == '1h':
+        result = whatsapp_service.send_appointment_reminder_1h(cita, message_body)
+    else:
+        logger.warning(f"[WhatsApp] Tipo de recordatorio desconocido: {reminder.reminder_type}")
+        return False
+
+    if result:
+        reminder.mark_as_sent(result)
+        logger.info(
+            f"[WhatsApp] Recordatorio {reminder.reminder_type} enviado para cita #{cita.id}"
+        )
+        return True
+
+    # No se envió pero no es un error (ej: deshabilitado)
+    reminder.is_sent = True
+    reminder.save()
+    logger.debug(
+        f"[WhatsApp] Recordatorio {reminder.reminder_type} no enviado para cita #{cita.id}"
+    )
+    return False
+
+
+def _render_reminder_bodies(reminders):
+    """
+    Renderiza los mensajes de un lote de recordatorios agrupados por
+    (organización, tipo), con la plantilla compilada una vez por grupo
+    (WhatsAppService.render_messages).
+
+    Omite las citas canceladas y las organizaciones con el recordatorio
+    deshabilitado: _process_reminder no las envía.
+
+    Returns:
+        dict {reminder_id: mensaje}
     """
-    Tarea periódica que envía recordatorios programados.
-    Se ejecuta cada 5 minutos vía Celery Beat.
+    enabled_field = {
+        '24h': 'whatsapp_reminder_24h_enabled',
+        '1h': 'whatsapp_reminder_1h_enabled',
+    }
+    groups = {}
+    for reminder in reminders:
+        cita = reminder.cita
+        org = cita.sede.organizacion
+        field = enabled_field.get(reminder.reminder_type)
+        if cita.estado == 'Cancelada' or not field or org is None or not org.whatsapp_enabled or not getattr(org, field):
+            continue
+        group = groups.setdefault((org.pk, reminder.reminder_type), (org, []))
+        group[1].append(reminder)
+
+    bodies = {}
+    for (_org_id, reminder_type), (org, group) in groups.items():
+        messages = whatsapp_service.render_messages(
+            org, f'reminder_{reminder_type}', [reminder.cita for reminder in group]
+        )
+        bodies.update(zip((reminder.id for reminder in group), messages))
+    return bodies
+
+
+def _send_due_reminders(max_reminders: int):
     """
-    now = timezone.now()
+    Reclama y envía recordatorios vencidos del schema actual.
 
-    # Buscar recordatorios pendientes que ya deberían enviarse
-    pending_reminders = WhatsAppReminderSchedule.objects.filter(
-        is_sent=False,
-        scheduled_time__lte=now
-    ).select_related('cita__sede__organizacion')[:100]  # Procesar máximo 100 por ejecución
+    Los lotes se reclaman con SELECT ... FOR UPDATE SKIP LOCKED, así que
+    varios workers pueden ejecutarla a la vez sin enviar duplicados.
+
+    Args:
+        max_reminders: Máximo de recordatorios a reclamar
+
+    Returns:
+        dict con sent, failed, total_processed y claimed
+    """
+    from .whatsapp import reminder_scheduler
 
     sent_count = 0
     failed_count = 0
+    claimed_count = 0
+    worker = reminder_scheduler.worker_name()
+
+    while claimed_count < max_reminders:
+        batch_size = min(reminder_scheduler.CLAIM_BATCH_SIZE, max_reminders - claimed_count)
+        claimed_ids = reminder_scheduler.claim_due_reminders(batch_size=batch_size, worker=worker)
+        claimed_count += len(claimed_ids)
+        if not claimed_ids:
+            break
+
+        reminders = list(WhatsAppReminderSchedule.objects.filter(
+            id__in=claimed_ids
+        ).select_related('cita__sede__organizacion').prefetch_related(
+            'cita__servicios', 'cita__colaboradores'
+        ).order_by('scheduled_time'))
 
-    for reminder in pending_reminders:
         try:
-            cita = reminder.cita
-
-            # Verificar que la cita no esté cancelada
-            if cita.estado == 'Cancelada':
-                logger.info(f"[WhatsApp] Saltando recordatorio para cita cancelada #{cita.id}")
-                reminder.is_sent = True
-                reminder.save()
-                continue
-
-            # Enviar según tipo de recordatorio
-            if reminder.reminder_type == '24h':
-                result = whatsapp_service.send_appointment_reminder_24h(cita)
-            elif reminder.reminder_type == '1h':
-                result = whatsapp_service.send_appointment_reminder_1h(cita)
-            else:
-                logger.warning(f"[WhatsApp] Tipo de recordatorio desconocido: {reminder.reminder_type}")
-                continue
-
-            if result:
-                reminder.mark_as_sent(result)
-                sent_count += 1
-                logger.info(
-                    f"[WhatsApp] Recordatorio {reminder.reminder_type} enviado para cita #{cita.id}"
-                )
-            else:
-                # No se envió pero no es un error (ej: deshabilitado)
-                reminder.is_sent = True
-                reminder.save()
-                logger.debug(
-                    f"[WhatsApp] Recordatorio {reminder.reminder_type} no enviado para cita #{cita.id}"
+            bodies = _render_reminder_bodies(reminders)
+        except Exception as e:
+            # Cada recordatorio se renderiza al enviarlo
+            logger.error(f"[WhatsApp] Error renderizando lote de recordatorios: {str(e)}", exc_info=True)
+            bodies = {}
+
+        failed_ids = []
+        for reminder in reminders:
+            try:
+                if _process_reminder(reminder, bodies.get(reminder.id)):
+                    sent_count += 1
+            except Exception as e:
+                failed_count += 1
+                failed_ids.append(reminder.id)
+                logger.error(
+                    f"[WhatsApp] Error procesando recordatorio {reminder.id}: {str(e)}",
+                    exc_info=True
                 )
 
-        except Exception as e:
-            failed_count += 1
-            logger.error(
-                f"[WhatsApp] Error procesando recordatorio {reminder.id}: {str(e)}",
-                exc_info=True
-            )
+        # Los fallidos quedan disponibles para el siguiente intento
+        reminder_scheduler.release_reminders(failed_ids)
 
-    logger.info(
-        f"[WhatsApp] Tarea de recordatorios completada: "
-        f"{sent_count} enviados, {failed_count} fallidos"
-    )
+        if len(claimed_ids) < batch_size:
+            break
 
     return {
         'sent': sent_count,
         'failed': failed_count,
-        'total_processed': sent_count + failed_count
+        'total_processed': sent_count + failed_count,
+        'claimed': claimed_count,
     }
 
 
 @shared_task
-def schedule_appointment_reminders(cita_id: int):
+def send_scheduled_reminders(max_batches: int = 10):
     """
-    Programa los recordatorios para una cita nueva.
-    Crea los registros de WhatsAppReminderSchedule.
+    Envío de recordatorios por polling de la BD en el schema actual.
+    Se usa desde el comando send_whatsapp_reminders; el envío periódico lo
+    hace `dispatch_due_reminders` y el barrido `fan_out_scheduled_reminders`.
 
     Args:
-        cita_id: ID de la cita
+        max_batches: Máximo de lotes a reclamar por ejecución
     """
+    from .whatsapp.reminder_scheduler import CLAIM_BATCH_SIZE
+
+    result = _send_due_reminders(max_batches * CLAIM_BATCH_SIZE)
+
+    logger.info(
+        f"[WhatsApp] Tarea de recordatorios completada: "
+        f"{result['sent']} enviados, {result['failed']} fallidos"
+    )
+
+    return result
+
+
+# Máximo de recordatorios por turno de un tenant: un tenant con mucho backlog
+# vuelve al final de la cola en lugar de bloquear a los demás.
+PER_TENANT_REMINDER_LIMIT = 200
+
+
+@shared_task
+def fan_out_scheduled_reminders():
+    """
+    Barrido de seguridad por tenant (Beat, cada hora). El camino principal
+    es `dispatch_due_reminders` (sorted sets por tenant, cada 5 segundos);
+    este barrido envía los recordatorios vencidos que no llegaron a Redis
+    (ej: falló el ZADD al planificarlos) sin esperar a la reconciliación.
+
+    Lista los schemas activos con WhatsApp y encola un subtask por tenant
+    con límite por turno, así el throughput escala con el número de workers.
+    """
+    from .tenant_schemas import tenant_schemas_with_table
+
+    schemas = tenant_schemas_with_table('citas_whatsapp_reminder_schedule', whatsapp_enabled=True)
+    for schema_name in schemas:
+        send_tenant_reminders.delay(schema_name)
+
+    return {'tenants': len(schemas)}
+
+
+@shared_task
+def send_tenant_reminders(schema_name: str, limit: int = PER_TENANT_REMINDER_LIMIT):
+    """
+    Envía los recordatorios vencidos de un tenant, con un límite por turno.
+
+    Si el tenant llenó su límite (tiene más backlog), se vuelve a encolar al
+    final de la cola: los demás tenants se atienden en round-robin.
+
+    Args:
+        schema_name: Schema del tenant
+        limit: Máximo de recordatorios por turno
+    """
+    from .tenant_schemas import use_schema
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
+
+    if not SCHEMA_NAME_RE.match(schema_name):
+        logger.error(f"[WhatsApp] Schema inválido para recordatorios: {schema_name}")
+        return
+
+    with use_schema(schema_name):
+        result = _send_due_reminders(limit)
+
+    if result['claimed'] >= limit:
+        send_tenant_reminders.delay(schema_name, limit)
+
+    if result['claimed']:
+        logger.info(
+            f"[WhatsApp] Recordatorios {schema_name}: {result['sent']} enviados, "
+            f"{result['failed']} fallidos"
+        )
+    return result
+
+
+@shared_task
+def dispatch_due_reminders():
+    """
+    Dispatcher de recordatorios (Beat, cada 5 segundos), camino principal.
+    Saca de los sorted sets de Redis los recordatorios vencidos, como mucho
+    PER_TENANT_DISPATCH_LIMIT por tenant en cada ejecución (round-robin), y
+    encola una tarea de envío por cada uno. El backlog de un tenant grande
+    sale en las ejecuciones siguientes sin retrasar a los demás.
+    """
+    from .whatsapp import reminder_scheduler
+
+    dispatched = 0
     try:
-        cita = Cita.all_objects.select_related('sede__organizacion').get(id=cita_id)
-        org = cita.sede.organizacion
+        due = reminder_scheduler.pop_due(timezone.now().timestamp())
+        for schema_name, reminder_id in due:
+            send_whatsapp_reminder.delay(reminder_id, schema_name)
+            dispatched += 1
+    except Exception as e:
+        logger.error(f"[WhatsApp] Dispatcher de recordatorios sin Redis: {e}")
+        return {'dispatched': dispatched, 'error': str(e)}
 
-        # Verificar que WhatsApp esté habilitado
-        if not org.whatsapp_enabled:
-            logger.debug(f"[WhatsApp] WhatsApp deshabilitado para org {org.nombre}")
-            return
+    if dispatched:
+        logger.info(f"[WhatsApp] {dispatched} recordatorios despachados")
+    return {'dispatched': dispatched}
 
-        # Verificar que la cita tenga teléfono
-        if not cita.telefono_cliente:
-            logger.debug(f"[WhatsApp] Cita #{cita_id} sin teléfono")
-            return
 
-        now = timezone.now()
+@shared_task
+def send_whatsapp_reminder(reminder_id: int, schema_name: str = 'public'):
+    """
+    Envía un recordatorio despachado desde el sorted set.
 
-        # Programar recordatorio 24h antes
-        if org.whatsapp_reminder_24h_enabled:
-            reminder_24h_time = cita.fecha - timedelta(hours=24)
+    El recordatorio se reclama con un UPDATE condicional antes de enviarlo:
+    si otro worker ya lo tiene en curso (ej: la reconciliación lo volvió a
+    agregar) o ya fue enviado, se omite.
 
-            # Solo programar si falta más de 24h
-            if reminder_24h_time > now:
-                WhatsAppReminderSchedule.objects.get_or_create(
-                    cita=cita,
-                    reminder_type='24h',
-                    defaults={'scheduled_time': reminder_24h_time}
-                )
-                logger.info(f"[WhatsApp] Recordatorio 24h programado para cita #{cita_id}")
-
-        # Programar recordatorio 1h antes
-        if org.whatsapp_reminder_1h_enabled:
-            reminder_1h_time = cita.fecha - timedelta(hours=1)
-
-            # Solo programar si falta más de 1h
-            if reminder_1h_time > now:
-                WhatsAppReminderSchedule.objects.get_or_create(
-                    cita=cita,
-                    reminder_type='1h',
-                    defaults={'scheduled_time': reminder_1h_time}
-                )
-                logger.info(f"[WhatsApp] Recordatorio 1h programado para cita #{cita_id}")
+    Args:
+        reminder_id: ID de WhatsAppReminderSchedule
+        schema_name: Schema del tenant donde vive el recordatorio
+    """
+    from .tenant_schemas import use_schema
+    from .whatsapp import reminder_scheduler
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
 
-    except Cita.DoesNotExist:
-        logger.error(f"[WhatsApp] Cita #{cita_id} no encontrada al programar recordatorios")
+    if not SCHEMA_NAME_RE.match(schema_name):
+        logger.error(f"[WhatsApp] Schema inválido para recordatorio {reminder_id}: {schema_name}")
+        return
+
+    with use_schema(schema_name):
+        claimed = False
+        try:
+            claimed = reminder_scheduler.claim_reminder(reminder_id)
+            if not claimed:
+                return
+
+            reminder = WhatsAppReminderSchedule.objects.select_related(
+                'cita__sede__organizacion'
+            ).get(id=reminder_id)
+
+            if reminder.scheduled_time > timezone.now() + timedelta(minutes=1):
+                # La cita se reprogramó después de encolar el recordatorio
+                reminder_scheduler.release_reminders([reminder_id])
+                reminder_scheduler.schedule_reminders([reminder], schema_name)
+                return
+
+            _process_reminder(reminder)
+
+        except Exception as e:
+            # Queda pendiente en la BD; la reconciliación lo vuelve a programar
+            logger.error(
+                f"[WhatsApp] Error enviando recordatorio {reminder_id} ({schema_name}): {str(e)}",
+                exc_info=True
+            )
+            if claimed:
+                reminder_scheduler.release_reminders([reminder_id])
+
+
+@shared_task
+def reconcile_reminder_schedule():
+    """
+    Reconstruye el sorted set de recordatorios desde la BD (fuente de verdad)
+    recorriendo los schemas de los tenants.
+    Recupera recordatorios perdidos si Redis se reinició o se vació, y libera
+    los reclamos abandonados por workers caídos.
+    """
+    from .tenant_schemas import tenant_schemas_with_table, use_schema
+    from .whatsapp import reminder_scheduler
+
+    total = 0
+    for schema_name in tenant_schemas_with_table('citas_whatsapp_reminder_schedule', whatsapp_enabled=True):
+        with use_schema(schema_name):
+            # Recordatorios que quedaron en curso por un worker caído
+            reminder_scheduler.recover_stale_claims()
+            try:
+                total += reminder_scheduler.rebuild_from_db(schema_name)
+            except Exception as e:
+                logger.error(f"[WhatsApp] No se pudo reconciliar recordatorios con Redis: {e}")
+                return {'scheduled': total}
+
+    logger.info(f"[WhatsApp] Reconciliación de recordatorios: {total} pendientes en Redis")
+    return {'scheduled': total}
+
+
+@shared_task
+def schedule_appointment_reminders(cita_id: int):
+    """
+    Programa (o reprograma) los recordatorios de una cita.
+    Crea o actualiza los registros de WhatsAppReminderSchedule.
+
+    Args:
+        cita_id: ID de la cita
+    """
+    return plan_appointment_reminders([cita_id])
+
+
+@shared_task
+def plan_appointment_reminders(cita_ids):
+    """
+    Planifica los recordatorios de muchas citas en lotes (ver
+    whatsapp/reminder_planner.py): importaciones masivas, reprogramaciones y
+    cancelaciones sin una tarea por cita.
+
+    Args:
+        cita_ids: IDs de las citas del schema actual
+
+    Returns:
+        dict con scheduled y deleted
+    """
+    from .whatsapp.reminder_planner import plan_reminders
+
+    try:
+        return plan_reminders(cita_ids)
     except Exception as e:
         logger.error(
-            f"[WhatsApp] Error programando recordatorios para cita #{cita_id}: {str(e)}",
+            f"[WhatsApp] Error planificando recordatorios para {len(cita_ids)} citas: {str(e)}",
             exc_info=True
         )
+        raise
+
+
+# Filas por DELETE: evita transacciones enormes y locks largos en tenants grandes
+CLEANUP_DELETE_BATCH = 5000
+WHATSAPP_RETENTION_DAYS = 90
 
 
 @shared_task
 def cleanup_old_whatsapp_messages():
     """
     Tarea de limpieza: elimina mensajes WhatsApp antiguos (> 90 días).
-    Se ejecuta diariamente.
+    Se ejecuta diariamente; encola un subtask por tenant.
     """
-    from .models_whatsapp import WhatsAppMessage
+    from .tenant_schemas import tenant_schemas_with_table
 
-    cutoff_date = timezone.now() - timedelta(days=90)
+    cutoff_date = timezone.now() - timedelta(days=WHATSAPP_RETENTION_DAYS)
+
+    schemas = tenant_schemas_with_table('citas_whatsapp_message')
+    for schema_name in schemas:
+        cleanup_tenant_whatsapp_messages.delay(schema_name, cutoff_date.isoformat())
+
+    # Entradas del índice global SID -> schema (vive siempre en public)
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM public.citas_twilio_message_index WHERE created_at < %s",
+            [cutoff_date]
+        )
 
-    deleted_count, _ = WhatsAppMessage.objects.filter(
-        created_at__lt=cutoff_date
-    ).delete()
+    logger.info(f"[WhatsApp] Limpieza de mensajes encolada para {len(schemas)} schemas")
 
-    logger.info(f"[WhatsApp] Limpieza completada: {deleted_count} mensajes antiguos eliminados")
+    return {'tenants': len(schemas)}
+
+
+def drop_old_whatsapp_message_partitions(schema_name: str, cutoff_date):
+    """
+    Retención sobre citas_whatsapp_message particionada (ver
+    organizacion/partitioning.py): elimina los meses completos anteriores a
+    `cutoff_date`. Antes de cada partición desvincula los recordatorios que
+    apuntan a sus mensajes (la FK no existe en tablas particionadas).
+
+    Returns:
+        Nombres de las particiones eliminadas, o None si la tabla no está particionada
+    """
+    from django.db import connection
+    from organizacion.partitioning import drop_partitions_before, is_partitioned
+
+    if not is_partitioned('citas_whatsapp_message', schema_name):
+        return None
+
+    reminders_table = f'{connection.ops.quote_name(schema_name)}.citas_whatsapp_reminder_schedule'
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [reminders_table])
+        has_reminders = cursor.fetchone()[0] is not None
+
+    def clear_reminder_references(cursor, partition):
+        if has_reminders:
+            cursor.execute(
+                f"UPDATE {reminders_table} SET whatsapp_message_id = NULL "
+                f"WHERE whatsapp_message_id IN (SELECT id FROM {partition})"
+            )
+
+    return drop_partitions_before(
+        'citas_whatsapp_message', cutoff_date, schema_name, before_drop=clear_reminder_references
+    )
+
+
+@shared_task
+def cleanup_tenant_whatsapp_messages(schema_name: str, cutoff: str):
+    """
+    Elimina los mensajes WhatsApp de un tenant anteriores a `cutoff`: por
+    particiones si la tabla está particionada, si no por lotes de DELETE.
+
+    Args:
+        schema_name: Schema del tenant
+        cutoff: Fecha límite en ISO 8601
+    """
+    from django.utils.dateparse import parse_datetime
+    from .models_whatsapp import WhatsAppMessage
+    from .tenant_schemas import use_schema
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
+
+    if not SCHEMA_NAME_RE.match(schema_name):
+        logger.error(f"[WhatsApp] Schema inválido para limpieza: {schema_name}")
+        return
+
+    cutoff_date = parse_datetime(cutoff)
+
+    # Tabla particionada por mes: eliminar particiones completas, sin DELETE
+    dropped = drop_old_whatsapp_message_partitions(schema_name, cutoff_date)
+    if dropped is not None:
+        logger.info(f"[WhatsApp] Limpieza {schema_name}: {len(dropped)} particiones eliminadas")
+        return {'dropped_partitions': len(dropped)}
+
+    deleted_count = 0
+    with use_schema(schema_name):
+        while True:
+            ids = list(
+                WhatsAppMessage.objects.filter(created_at__lt=cutoff_date)
+                .values_list('id', flat=True)[:CLEANUP_DELETE_BATCH]
+            )
+            if not ids:
+                break
+            deleted, _ = WhatsAppMessage.objects.filter(id__in=ids).delete()
+            deleted_count += deleted
+
+    logger.info(f"[WhatsApp] Limpieza {schema_name}: {deleted_count} mensajes antiguos eliminados")
 
     return {'deleted': deleted_count}
+
+
+@shared_task
+def process_whatsapp_status_callbacks(max_batches: int = 20):
+    """
+    Consumidor del Redis Stream de callbacks de estado de Twilio.
+    Aplica los callbacks por lotes (un bulk_update por schema y lote).
+    Se ejecuta cada 10 segundos desde Beat y, con debounce, desde el webhook.
+
+    Args:
+        max_batches: Máximo de lotes por ejecución (evita monopolizar el worker)
+    """
+    from .whatsapp.status_buffer import process_status_batch
+
+    totals = {'read': 0, 'updated': 0, 'requeued': 0, 'dropped': 0}
+    for _ in range(max_batches):
+        result = process_status_batch()
+        for key in totals:
+            totals[key] += result[key]
+        if not result['read'] or result['only_requeued']:
+            break  # Stream vacío o solo callbacks que esperan su SID (backoff)
+
+    if totals['read']:
+        logger.info(
+            f"[WhatsApp] Callbacks de estado procesados: {totals['read']} leídos, "
+            f"{totals['updated']} actualizados, {totals['requeued']} reencolados, "
+            f"{totals['dropped']} descartados"
+        )
+
+    return totals
+
+
+
+@shared_task
+def send_whatsapp_campaign(campaign_id: int, schema_name: str = 'public'):
+    """
+    Coordinador de una campaña de marketing por WhatsApp.
+
+    Divide los mensajes que siguen en 'pending' en chunks y los envía como un
+    chord de tareas `send_whatsapp_campaign_chunk`; al terminar se ejecuta
+    `finalize_whatsapp_campaign`, y si un chunk agota sus reintentos,
+    `mark_whatsapp_campaign_failed`. Es idempotente: relanzarlo reanuda la
+    campaña enviando solo lo pendiente.
+
+    Args:
+        campaign_id: ID de la WhatsAppCampaign
+        schema_name: Schema del tenant donde se creó la campaña
+    """
+    from celery import chord
+    from .models_whatsapp import WhatsAppCampaign, WhatsAppMessage
+    from .tenant_schemas import use_schema
+    from .whatsapp.campaign_sender import CHUNK_SIZE
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
+
+    if not SCHEMA_NAME_RE.match(schema_name):
+        logger.error(f"[WhatsApp] Schema inválido para campaña #{campaign_id}: {schema_name}")
+        return {'chunks': 0}
+
+    with use_schema(schema_name):
+        updated = WhatsAppCampaign.objects.filter(pk=campaign_id).exclude(status='completed').update(
+            status='sending', started_at=timezone.now()
+        )
+        if not updated:
+            logger.info(f"[WhatsApp] Campaña #{campaign_id} no existe o ya fue completada")
+            return {'chunks': 0}
+
+        pending_ids = list(
+            WhatsAppMessage.objects.filter(campaign_id=campaign_id, status='pending')
+            .order_by('id').values_list('id', flat=True)
+        )
+    chunks = [pending_ids[i:i + CHUNK_SIZE] for i in range(0, len(pending_ids), CHUNK_SIZE)]
+
+    if not chunks:
+        finalize_whatsapp_campaign.delay(campaign_id, schema_name)
+        return {'chunks': 0}
+
+    logger.info(
+        f"[WhatsApp] Campaña #{campaign_id} ({schema_name}): {len(pending_ids)} mensajes "
+        f"pendientes en {len(chunks)} chunks"
+    )
+    chord(
+        send_whatsapp_campaign_chunk.s(campaign_id, chunk, schema_name) for chunk in chunks
+    )(
+        finalize_whatsapp_campaign.si(campaign_id, schema_name).on_error(
+            mark_whatsapp_campaign_failed.s(campaign_id, schema_name)
+        )
+    )
+
+    return {'chunks': len(chunks)}
+
+
+@shared_task(bind=True, max_retries=3, acks_late=True)
+def send_whatsapp_campaign_chunk(self, campaign_id: int, message_ids: list, schema_name: str = 'public'):
+    """
+    Envía un chunk de mensajes de la campaña (concurrencia acotada + token bucket).
+    Los resultados se guardan por lotes; un reintento solo reenvía lo que siga en 'pending'.
+    """
+    from .tenant_schemas import use_schema
+    from .whatsapp.campaign_sender import send_campaign_messages
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
+
+    if not SCHEMA_NAME_RE.match(schema_name):
+        # Falla el chunk: el chord ejecuta mark_whatsapp_campaign_failed
+        raise ValueError(f"Schema inválido para campaña #{campaign_id}: {schema_name}")
+
+    try:
+        with use_schema(schema_name):
+            sent, failed = send_campaign_messages(
+                campaign_id, message_ids, whatsapp_service.campaign_sender()
+            )
+        logger.info(f"[WhatsApp] Campaña #{campaign_id}: chunk enviado ({sent} ok, {failed} fallidos)")
+        return {'sent': sent, 'failed': failed}
+    except Exception as exc:
+        logger.error(f"[WhatsApp] Error en chunk de campaña #{campaign_id}: {str(exc)}")
+        raise self.retry(exc=exc, countdown=60)
+
+
+def _close_campaign(campaign_id, status_if_pending):
+    """
+    Recalcula los contadores de la campaña desde los mensajes (fuente de
+    verdad, por si algún lote se reintentó) y fija su estado.
+
+    Args:
+        campaign_id: ID de la WhatsAppCampaign
+        status_if_pending: Estado si quedan mensajes pendientes ('sending' o 'failed')
+    """
+    from django.db.models import Count, Q
+    from .models_whatsapp import WhatsAppCampaign, WhatsAppMessage
+
+    counts = WhatsAppMessage.objects.filter(campaign_id=campaign_id).aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+        failed=Count('id', filter=Q(status='failed')),
+    )
+    sent = counts['total'] - counts['pending'] - counts['failed']
+
+    WhatsAppCampaign.objects.filter(pk=campaign_id).update(
+        sent_count=sent,
+        failed_count=counts['failed'],
+        status='completed' if not counts['pending'] else status_if_pending,
+        finished_at=timezone.now() if not counts['pending'] else None,
+        updated_at=timezone.now(),
+    )
+    return {'sent': sent, 'failed': counts['failed'], 'pending': counts['pending']}
+
+
+@shared_task
+def finalize_whatsapp_campaign(campaign_id: int, schema_name: str = 'public'):
+    """
+    Cierra la campaña recalculando los contadores desde los mensajes.
+    """
+    from .tenant_schemas import use_schema
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
+
+    if not SCHEMA_NAME_RE.match(schema_name):
+        logger.error(f"[WhatsApp] Schema inválido para campaña #{campaign_id}: {schema_name}")
+        return
+
+    with use_schema(schema_name):
+        result = _close_campaign(campaign_id, status_if_pending='sending')
+    logger.info(
+        f"[WhatsApp] Campaña #{campaign_id} finalizada: {result['sent']} enviados, "
+        f"{result['failed']} fallidos, {result['pending']} pendientes"
+    )
+    return result
+
+
+@shared_task
+def mark_whatsapp_campaign_failed(request, exc, traceback, campaign_id: int, schema_name: str = 'public'):
+    """
+    Error callback del chord de la campaña: un chunk agotó sus reintentos.
+
+    La campaña queda en 'failed' (no en 'sending' para siempre) con los
+    contadores al día; se puede reanudar con POST a
+    /api/marketing/whatsapp-campaigns/<id>/, que solo reenvía lo pendiente.
+    """
+    from .tenant_schemas import use_schema
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
+
+    logger.error(f"[WhatsApp] Campaña #{campaign_id} ({schema_name}) interrumpida: {exc}")
+    if not SCHEMA_NAME_RE.match(schema_name):
+        logger.error(f"[WhatsApp] Schema inválido para campaña #{campaign_id}: {schema_name}")
+        return
+
+    with use_schema(schema_name):
+        return _close_campaign(campaign_id, status_if_pending='failed')
@@ -0,0 +1,80 @@
+"""
+Utilidades para ejecutar tareas de Celery por schema de tenant.
+
+La conexión de un worker de Celery no tiene un search_path definido por
+ningún request, así que las tareas periódicas que recorren tablas por tenant
+(recordatorios, limpieza de mensajes) listan los schemas activos y fijan el
+search_path explícitamente en cada subtarea.
+"""
+import logging
+from contextlib import contextmanager
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_SCHEMA = 'public'
+
+
+def tenant_schemas_with_table(table_name, **org_filters):
+    """
+    Schemas activos que tienen la tabla indicada.
+
+    'public' se incluye siempre (los datos compartidos y los tenants sin
+    schema propio viven ahí). Los schemas de tenants que todavía no tienen la
+    tabla se omiten con UNA consulta a information_schema.
+
+    Args:
+        table_name: Tabla que debe existir en el schema (ej: 'citas_whatsapp_message')
+        **org_filters: Filtros adicionales sobre Organizacion (ej: whatsapp_enabled=True)
+
+    Returns:
+        Lista de nombres de schema ('public' primero)
+    """
+    from organizacion.models import Organizacion
+    from .whatsapp.status_buffer import SCHEMA_NAME_RE
+
+    candidatos = [
+        schema_name
+        for schema_name in Organizacion.objects.filter(is_active=True, **org_filters)
+        .exclude(schema_name='')
+        .values_list('schema_name', flat=True)
+        # SECURITY: solo nombres con forma de schema válido (se interpolan en SET search_path)
+        if SCHEMA_NAME_RE.match(schema_name) and schema_name != PUBLIC_SCHEMA
+    ]
+
+    existentes = set()
+    if candidatos:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT table_schema
+                FROM information_schema.tables
+                WHERE table_name = %s AND table_schema = ANY(%s)
+            """, [table_name, candidatos])
+            existentes = {row[0] for row in cursor.fetchall()}
+
+    return [PUBLIC_SCHEMA] + sorted(existentes)
+
+
+def current_schema():
+    """Schema activo en el search_path de la conexión."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT current_schema()")
+        return cursor.fetchone()[0]
+
+
+@contextmanager
+def use_schema(schema_name):
+    """
+    Fija el search_path al schema del tenant y lo restaura a public al salir.
+
+    Args:
+        schema_name: Schema validado (ver SCHEMA_NAME_RE)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SET search_path TO {connection.ops.quote_name(schema_name)}, public")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SET search_path TO public")
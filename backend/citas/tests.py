@@ -1,87 +1,1206 @@
 from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.urls import reverse
-from .models import Cita, Servicio, Recurso, Sede
+from .models import Cita, Servicio, Colaborador, Sede
+from rest_framework_simplejwt.tokens import AccessToken
+from organizacion.models import Organizacion
+from organizacion.thread_locals import set_current_organization, set_current_user
 from usuarios.models import PerfilUsuario
 from datetime import datetime, timedelta
 import pytz
+import unittest
+
+try:
+    import fakeredis
+except ImportError:  # Dependencia solo de tests
+    fakeredis = None
 
 class CitaAPITests(APITestCase):
 
     def setUp(self):
-        # Create Sedes
-        self.sede1 = Sede.objects.create(nombre='Sede Principal', direccion='Calle 1')
-        self.sede2 = Sede.objects.create(nombre='Sede Secundaria', direccion='Calle 2')
+        # Create Organization and Sedes
+        self.organizacion = Organizacion.objects.create(nombre='Organizacion Test')
+        self.sede1 = Sede.all_objects.create(organizacion=self.organizacion, nombre='Sede Principal', direccion='Calle 1')
+        self.sede2 = Sede.all_objects.create(organizacion=self.organizacion, nombre='Sede Secundaria', direccion='Calle 2')
 
         # Create Users
-        self.staff_user = User.objects.create_user(username='staff', password='password123', is_staff=True)
+        self.staff_user = User.objects.create_superuser(username='staff', password='password123')
         self.admin_user = User.objects.create_user(username='admin_sede', password='password123')
         self.regular_user1 = User.objects.create_user(username='user1', password='password123')
         self.regular_user2 = User.objects.create_user(username='user2', password='password123')
 
         # Create Profiles
-        self.perfil_admin = PerfilUsuario.objects.create(user=self.admin_user, is_sede_admin=True)
+        self.perfil_admin = PerfilUsuario.all_objects.create(
+            user=self.admin_user, organizacion=self.organizacion, role='sede_admin'
+        )
         self.perfil_admin.sedes_administradas.add(self.sede1)
 
-        self.perfil_user1 = PerfilUsuario.objects.create(user=self.regular_user1, sede=self.sede1)
-        self.perfil_user2 = PerfilUsuario.objects.create(user=self.regular_user2, sede=self.sede2)
+        self.perfil_user1 = PerfilUsuario.all_objects.create(
+            user=self.regular_user1, organizacion=self.organizacion, sede=self.sede1
+        )
+        self.perfil_user2 = PerfilUsuario.all_objects.create(
+            user=self.regular_user2, organizacion=self.organizacion, sede=self.sede2
+        )
 
-        # Create Services and Resources
+        # Create Services and Colaboradores
         self.servicio1 = Servicio.objects.create(nombre='Servicio 1', sede=self.sede1)
-        self.recurso1 = Recurso.objects.create(nombre='Recurso 1', sede=self.sede1)
+        self.colaborador1 = Colaborador.objects.create(nombre='Colaborador 1', sede=self.sede1)
 
         self.servicio2 = Servicio.objects.create(nombre='Servicio 2', sede=self.sede2)
-        self.recurso2 = Recurso.objects.create(nombre='Recurso 2', sede=self.sede2)
+        self.colaborador2 = Colaborador.objects.create(nombre='Colaborador 2', sede=self.sede2)
 
         # Create Appointments
         utc = pytz.UTC
         self.cita_user1 = Cita.objects.create(
             user=self.regular_user1, nombre='Cita User 1', fecha=datetime.now(utc) + timedelta(days=1),
-            servicio=self.servicio1, sede=self.sede1
+            sede=self.sede1
         )
+        self.cita_user1.servicios.add(self.servicio1)
         self.cita_user2 = Cita.objects.create(
             user=self.regular_user2, nombre='Cita User 2', fecha=datetime.now(utc) + timedelta(days=2),
-            servicio=self.servicio2, sede=self.sede2
+            sede=self.sede2
         )
+        self.cita_user2.servicios.add(self.servicio2)
 
         self.client = APIClient()
 
+    def tearDown(self):
+        set_current_user(None)
+        set_current_organization(None)
+
+    def _authenticate(self, user):
+        # El middleware de organización resuelve el tenant desde el JWT
+        token = AccessToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
     def test_regular_user_permissions(self):
         """
         Ensure a regular user can only see their own appointments.
         """
         self.client.force_authenticate(user=self.regular_user1)
-        response = self.client.get(reverse('cita-list'))
+        response = self.client.get(reverse('citas:cita-list'))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['id'], self.cita_user1.id)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], self.cita_user1.id)
 
     def test_sede_admin_permissions(self):
         """
         Ensure a Sede Admin can see all appointments in their managed sede, but not others.
         """
-        self.client.force_authenticate(user=self.admin_user)
-        response = self.client.get(reverse('cita-list'))
+        self._authenticate(self.admin_user)
+        response = self.client.get(reverse('citas:cita-list'))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['id'], self.cita_user1.id) # Sees cita from Sede 1
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], self.cita_user1.id) # Sees cita from Sede 1
 
+    # El UserSerializer anidado consulta perfil, sedes y grupos por cada cita;
+    # este test cubre permisos, no el presupuesto de queries del listado
+    @override_settings(QUERY_BUDGET_RAISE=False)
     def test_staff_user_permissions(self):
         """
         Ensure a staff user can see all appointments from all sedes.
         """
-        self.client.force_authenticate(user=self.staff_user)
-        response = self.client.get(reverse('cita-list'))
+        self._authenticate(self.staff_user)
+        response = self.client.get(reverse('citas:cita-list'))
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2) # Sees both appointments
+        self.assertEqual(len(response.data['results']), 2) # Sees both appointments
 
     def test_unauthenticated_access(self):
         """
         Ensure unauthenticated users cannot access the appointments list.
         """
-        response = self.client.get(reverse('cita-list'))
+        response = self.client.get(reverse('citas:cita-list'))
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class RevenueAggregationTests(APITestCase):
+    """
+    Los ingresos se calculan una sola vez por cita, aunque la cita tenga
+    varios servicios y varios colaboradores (sin inflado por JOINs M2M).
+    """
+
+    def setUp(self):
+        from .models import Colaborador
+
+        self.sede = Sede.all_objects.create(nombre='Sede Ingresos')
+        self.corte = Servicio.objects.create(nombre='Corte', precio=30000, sede=self.sede)
+        self.barba = Servicio.objects.create(nombre='Barba', precio=20000, sede=self.sede)
+        self.ana = Colaborador.objects.create(nombre='Ana', sede=self.sede)
+        self.luis = Colaborador.objects.create(nombre='Luis', sede=self.sede)
+
+        fecha = datetime.now(pytz.UTC) - timedelta(days=1)
+        # Cita con 2 servicios y 2 colaboradores: 2x2 filas en un JOIN ingenuo
+        self.cita_multiple = Cita.all_objects.create(
+            nombre='cliente', fecha=fecha, sede=self.sede, estado='Asistio'
+        )
+        self.cita_multiple.servicios.add(self.corte, self.barba)
+        self.cita_multiple.colaboradores.add(self.ana, self.luis)
+
+        self.cita_simple = Cita.all_objects.create(
+            nombre='cliente', fecha=fecha, sede=self.sede, estado='Asistio'
+        )
+        self.cita_simple.servicios.add(self.corte)
+        self.cita_simple.colaboradores.add(self.ana)
+
+        self.cita_cancelada = Cita.all_objects.create(
+            nombre='cliente', fecha=fecha, sede=self.sede, estado='Cancelada'
+        )
+        self.cita_cancelada.servicios.add(self.barba)
+
+    def test_sum_revenue_counts_each_cita_once(self):
+        from .revenue import sum_revenue
+
+        queryset = Cita.all_objects.filter(sede=self.sede)
+        self.assertEqual(sum_revenue(queryset, estados=['Asistio']), 80000)
+
+        # Filtrar por colaborador no debe duplicar ni perder citas
+        por_colaborador = queryset.filter(colaboradores__in=[self.ana, self.luis])
+        self.assertEqual(sum_revenue(por_colaborador, estados=['Asistio']), 80000)
+        self.assertEqual(sum_revenue(queryset.filter(colaboradores=self.luis)), 50000)
+
+    def test_revenue_by_estado_and_servicio(self):
+        from .revenue import revenue_by_estado, revenue_by_servicio
+
+        queryset = Cita.all_objects.filter(sede=self.sede, colaboradores__isnull=False)
+        metrics = revenue_by_estado(queryset, {
+            'realizados': ['Asistio'],
+            'cancelados': ['Cancelada'],
+        })
+        self.assertEqual(metrics['total_citas'], 2)
+        self.assertEqual(metrics['citas_realizados'], 2)
+        self.assertEqual(metrics['ingresos_realizados'], 80000)
+        self.assertEqual(metrics['ingresos_cancelados'], 0)
+
+        por_servicio = {
+            row['servicio__nombre']: row
+            for row in revenue_by_servicio(Cita.all_objects.filter(sede=self.sede), estados=['Asistio'])
+        }
+        self.assertEqual(por_servicio['Corte']['total_ingresos'], 60000)
+        self.assertEqual(por_servicio['Corte']['cantidad_citas'], 2)
+        self.assertEqual(por_servicio['Barba']['total_ingresos'], 20000)
+
+    def test_count_by_colaborador(self):
+        from .revenue import count_by_colaborador
+
+        counts = {
+            row['colaboradores__nombre']: row['count']
+            for row in count_by_colaborador(Cita.all_objects.filter(sede=self.sede))
+        }
+        self.assertEqual(counts, {'Ana': 2, 'Luis': 1})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReportCacheTests(APITestCase):
+    """Reportes cacheados por versión de datos del tenant, con ETag/304."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.org = Organizacion.objects.create(nombre='Org Reportes')
+        self.sede1 = Sede.all_objects.create(organizacion=self.org, nombre='Sede 1')
+        self.sede2 = Sede.all_objects.create(organizacion=self.org, nombre='Sede 2')
+        self.admin1 = self._sede_admin('admin1', self.sede1)
+        self.admin2 = self._sede_admin('admin2', self.sede2)
+
+    def _sede_admin(self, username, sede):
+        user = User.objects.create_user(username=username, password='password123')
+        perfil = PerfilUsuario.all_objects.create(user=user, organizacion=self.org, role='sede_admin')
+        perfil.sedes_administradas.add(sede)
+        return user
+
+    def _get(self, user, compute, **headers):
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from .report_cache import cached_report_response
+
+        request = Request(APIRequestFactory().get('/api/reports/test/', {'desde': '2026-01-01'}, **headers))
+        request.user = user
+        return cached_report_response(request, 'test', compute)
+
+    def _compute_for(self, user):
+        from unittest.mock import Mock
+        from rest_framework.response import Response
+
+        return Mock(side_effect=lambda: Response({'user': user.username}))
+
+    def test_cita_save_invalidates_the_cached_report(self):
+        compute = self._compute_for(self.admin1)
+
+        first = self._get(self.admin1, compute)
+        cached = self._get(self.admin1, compute)
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(cached['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Cita.all_objects.create(nombre='ana', fecha=datetime.now(pytz.UTC), sede=self.sede1)
+
+        fresh = self._get(self.admin1, compute)
+        self.assertEqual(compute.call_count, 2)
+        self.assertNotEqual(fresh['ETag'], first['ETag'])
+
+    def test_if_none_match_compares_entity_tags_exactly(self):
+        compute = self._compute_for(self.admin1)
+        etag = self._get(self.admin1, compute)['ETag']
+
+        for header in (etag, f'"otro", W/{etag}', '*'):
+            response = self._get(self.admin1, compute, HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED, header)
+
+        # Una entidad distinta que contiene el ETag como texto no coincide
+        for header in (f'{etag}-viejo', f'"v1{etag}"', etag[:-1] + '-viejo"', ''):
+            response = self._get(self.admin1, compute, HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, header)
+
+    def test_users_with_different_sede_scope_never_share_a_cached_body(self):
+        first = self._get(self.admin1, self._compute_for(self.admin1))
+        second = self._get(self.admin2, self._compute_for(self.admin2))
+
+        self.assertEqual((first.data, second.data), ({'user': 'admin1'}, {'user': 'admin2'}))
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        response = self._get(self.admin2, self._compute_for(self.admin2), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardSummaryTests(APITestCase):
+    """
+    El resumen del dashboard (agregación única + serializer liviano) coincide
+    por rol con el cálculo anterior (CitaViewSet.get_queryset + CitaSerializer).
+    """
+
+    def setUp(self):
+        from decimal import Decimal
+        from django.core.cache import cache
+
+        cache.clear()
+        org = Organizacion.objects.create(nombre='Org Dashboard')
+        self.sede1 = Sede.all_objects.create(organizacion=org, nombre='Sede Norte')
+        sede2 = Sede.all_objects.create(organizacion=org, nombre='Sede Sur')
+
+        self.staff = User.objects.create_superuser(username='staff', password='password123')
+        self.sede_admin = User.objects.create_user(username='admin_norte', password='password123')
+        PerfilUsuario.all_objects.create(
+            user=self.sede_admin, organizacion=org, role='sede_admin'
+        ).sedes_administradas.add(self.sede1)
+        self.colaborador_user = User.objects.create_user(username='luis', password='password123')
+        PerfilUsuario.all_objects.create(user=self.colaborador_user, organizacion=org, role='colaborador')
+        luis = Colaborador.all_objects.create(nombre='Luis', sede=self.sede1, usuario=self.colaborador_user)
+        self.cliente = User.objects.create_user(username='ana', password='password123')
+        PerfilUsuario.all_objects.create(user=self.cliente, organizacion=org, role='cliente')
+
+        corte = Servicio.all_objects.create(nombre='Corte', sede=self.sede1, precio=Decimal('20000'))
+        barba = Servicio.all_objects.create(nombre='Barba', sede=self.sede1, precio=Decimal('15000'))
+        tinte = Servicio.all_objects.create(nombre='Tinte', sede=sede2, precio=Decimal('50000'))
+
+        ahora = datetime.now(pytz.UTC)
+        citas = [
+            # (sede, user, fecha, estado, servicios, colaboradores)
+            (self.sede1, self.cliente, ahora + timedelta(days=1), 'Pendiente', [corte, barba], [luis]),
+            (self.sede1, None, ahora + timedelta(days=2), 'Confirmada', [corte], []),
+            (self.sede1, self.cliente, ahora, 'Asistio', [corte, barba], [luis]),
+            (sede2, self.cliente, ahora + timedelta(days=3), 'Pendiente', [tinte], []),
+            (sede2, None, ahora, 'Asistio', [tinte], []),
+            (self.sede1, self.cliente, ahora + timedelta(days=4), 'Cancelada', [corte], [luis]),
+        ]
+        for sede, user, fecha, estado, servicios, colaboradores in citas:
+            cita = Cita.all_objects.create(nombre='ana', user=user, fecha=fecha, sede=sede, estado=estado)
+            cita.servicios.add(*servicios)
+            cita.colaboradores.add(*colaboradores)
+
+    def tearDown(self):
+        set_current_user(None)
+        set_current_organization(None)
+
+    def _summary(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = self.client.get(reverse('citas:dashboard-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def _previous_summary(self, user, is_admin_user):
+        """Cálculo anterior del dashboard sobre CitaViewSet.get_queryset."""
+        from django.utils import timezone
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from .serializers import CitaSerializer
+        from .views import CitaViewSet
+
+        viewset = CitaViewSet()
+        viewset.request = Request(APIRequestFactory().get('/'))
+        viewset.request.user = user
+        base = viewset.get_queryset()
+        proximas = base.filter(
+            fecha__gte=timezone.now(), estado__in=['Pendiente', 'Confirmada']
+        ).order_by('fecha')
+        if not is_admin_user:
+            primera = proximas.first()
+            return {'proxima_cita': self._project(CitaSerializer(primera).data) if primera else None}
+
+        today = timezone.now().date()
+        asistidas = base.filter(estado='Asistio', fecha__gte=today.replace(day=1))
+        return {
+            'citas_hoy': base.filter(fecha__date=today).count(),
+            'pendientes_confirmacion': base.filter(estado='Pendiente').count(),
+            'ingresos_mes': float(sum(s.precio for cita in asistidas for s in cita.servicios.all())),
+            'proximas_citas': [self._project(data) for data in CitaSerializer(proximas[:5], many=True).data],
+        }
+
+    def _project(self, cita):
+        """Campos de la cita que el dashboard expone (orden estable de las relaciones)."""
+        import json
+
+        cita = json.loads(json.dumps(cita, default=str))
+        return {
+            'id': cita['id'], 'nombre': cita['nombre'], 'fecha': cita['fecha'],
+            'estado': cita['estado'], 'confirmado': cita['confirmado'],
+            'sede': {'id': cita['sede']['id'], 'nombre': cita['sede']['nombre']},
+            'servicios': sorted(({'id': s['id'], 'nombre': s['nombre']} for s in cita['servicios']),
+                                key=lambda item: item['id']),
+            'colaboradores': sorted(({'id': c['id'], 'nombre': c['nombre']} for c in cita['colaboradores']),
+                                    key=lambda item: item['id']),
+        }
+
+    def _assert_matches_previous(self, user, is_admin_user):
+        summary = self._summary(user)
+        if is_admin_user:
+            summary['proximas_citas'] = [self._project(cita) for cita in summary['proximas_citas']]
+        elif summary['proxima_cita']:
+            summary['proxima_cita'] = self._project(summary['proxima_cita'])
+        self.assertEqual(summary, self._previous_summary(user, is_admin_user))
+        return summary
+
+    def test_staff_sees_every_cita(self):
+        summary = self._assert_matches_previous(self.staff, is_admin_user=True)
+        self.assertEqual((summary['pendientes_confirmacion'], summary['ingresos_mes']), (2, 85000.0))
+        self.assertEqual(len(summary['proximas_citas']), 3)
+
+    def test_sede_admin_sees_only_managed_sedes(self):
+        summary = self._assert_matches_previous(self.sede_admin, is_admin_user=True)
+        self.assertEqual((summary['pendientes_confirmacion'], summary['ingresos_mes']), (1, 35000.0))
+        self.assertEqual({c['sede']['nombre'] for c in summary['proximas_citas']}, {'Sede Norte'})
+
+    def test_colaborador_sees_next_assigned_cita(self):
+        summary = self._assert_matches_previous(self.colaborador_user, is_admin_user=False)
+        self.assertEqual(summary['proxima_cita']['colaboradores'][0]['nombre'], 'Luis')
+
+    def test_client_sees_own_next_cita(self):
+        summary = self._assert_matches_previous(self.cliente, is_admin_user=False)
+        self.assertEqual(summary['proxima_cita']['estado'], 'Pendiente')
+        self.assertEqual(summary['proxima_cita']['sede']['nombre'], 'Sede Norte')
+
+    def test_cached_summary_is_invalidated_by_writes(self):
+        from unittest.mock import patch
+        from .views import DashboardSummaryView
+
+        first = self._summary(self.staff)
+        with patch.object(DashboardSummaryView, '_build_summary') as build:
+            self.assertEqual(self._summary(self.staff), first)
+        build.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Cita.all_objects.create(nombre='beto', fecha=datetime.now(pytz.UTC) + timedelta(days=1),
+                                    sede=self.sede1, estado='Pendiente')
+        self.assertEqual(self._summary(self.staff)['pendientes_confirmacion'], first['pendientes_confirmacion'] + 1)
+
+
+class ClientStatsReassignmentTests(APITestCase):
+    """
+    Al reasignar una cita a otro cliente se recalculan las estadísticas de
+    ambos clientes, no solo las del nuevo.
+    """
+
+    def setUp(self):
+        self.sede = Sede.all_objects.create(nombre='Sede Stats')
+        self.ana = User.objects.create_user(username='ana', password='password123')
+        self.luis = User.objects.create_user(username='luis', password='password123')
+
+    def test_reassigned_cita_refreshes_previous_client(self):
+        from .models_stats import ClientStats
+
+        fecha = datetime.now(pytz.UTC) + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            cita = Cita.all_objects.create(user=self.ana, nombre='ana', fecha=fecha, sede=self.sede)
+        self.assertEqual(ClientStats.objects.get(user=self.ana).total_citas, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cita.user = self.luis
+            cita.nombre = 'luis'
+            cita.save()
+
+        self.assertEqual(ClientStats.objects.get(user=self.ana).total_citas, 0)
+        self.assertEqual(ClientStats.objects.get(user=self.luis).total_citas, 1)
+
+    def test_saves_that_keep_the_client_do_not_reload_the_cita(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        fecha = datetime.now(pytz.UTC) + timedelta(days=1)
+        Cita.all_objects.create(user=self.ana, nombre='ana', fecha=fecha, sede=self.sede)
+        cita = Cita.all_objects.get(user=self.ana)
+
+        with CaptureQueriesContext(connection) as queries:
+            cita.estado = 'Confirmada'
+            cita.save()
+            cita.save(update_fields=['estado'])
+
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and '"citas_cita"' in q['sql']]
+        self.assertEqual(selects, [])
+
+    # El UserSerializer anidado consulta perfil, sedes y grupos por cada cita;
+    # este test cubre la paginación, no el presupuesto de queries
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_history_is_paginated_by_default(self):
+        from citas.pagination import StandardResultsSetPagination
+
+        org = Organizacion.objects.create(nombre='Org Historial')
+        self.sede.organizacion = org
+        self.sede.save()
+        self.ana.email = 'ana@example.com'
+        self.ana.save()
+        PerfilUsuario.all_objects.create(user=self.ana, organizacion=org, role='cliente')
+
+        fecha = datetime.now(pytz.UTC) + timedelta(days=1)
+        for i in range(12):
+            Cita.all_objects.create(user=self.ana, nombre='ana', fecha=fecha + timedelta(hours=i), sede=self.sede)
+        admin = User.objects.create_superuser(username='admin', password='password123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(admin)}')
+
+        response = self.client.get(f'/api/clients/{self.ana.id}/history/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['citas']), StandardResultsSetPagination.page_size)
+        self.assertEqual(response.data['citas_pagination']['count'], 12)
+        self.assertIsNotNone(response.data['citas_pagination']['next'])
+        self.assertEqual(response.data['stats']['total'], 12)
+
+        response = self.client.get(f'/api/clients/{self.ana.id}/history/', {'page': 2})
+        self.assertEqual(len(response.data['citas']), 2)
+        self.assertIsNone(response.data['citas_pagination']['next'])
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis no está instalado')
+class StatusCallbackBufferTests(APITestCase):
+    """
+    Callbacks de Twilio por el Redis Stream: colapso por SID, orden de estados
+    y reintento con backoff de los SIDs que todavía no se guardaron.
+    """
+
+    def setUp(self):
+        from unittest.mock import patch
+
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch('citas.whatsapp.status_buffer._redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.org = Organizacion.objects.create(nombre='Org Callbacks')
+
+    def _message(self, sid, status='sent'):
+        from .models_whatsapp import WhatsAppMessage
+
+        return WhatsAppMessage.objects.create(
+            organizacion=self.org, message_type='marketing', recipient_phone='+573001234567',
+            recipient_name='Ana', message_body='Hola', status=status, twilio_sid=sid,
+        )
+
+    def _callback(self, sid, status):
+        from .whatsapp.status_buffer import enqueue_status_callback
+        self.assertTrue(enqueue_status_callback(sid, status, tenant_hint='public'))
+
+    def test_read_beating_delivered_keeps_read(self):
+        from .tasks_whatsapp import process_whatsapp_status_callbacks
+
+        msg = self._message('SM1')
+        self._callback('SM1', 'read')
+        self._callback('SM1', 'delivered')  # Llega después pero es menos avanzado
+
+        totals = process_whatsapp_status_callbacks()
+
+        msg.refresh_from_db()
+        self.assertEqual((msg.status, msg.twilio_status), ('read', 'read'))
+        self.assertIsNotNone(msg.delivered_at)
+        self.assertEqual((totals['read'], totals['updated']), (2, 1))
+
+    def test_stale_callbacks_are_ignored(self):
+        from .tasks_whatsapp import process_whatsapp_status_callbacks
+
+        msg = self._message('SM2', status='read')
+        self._callback('SM2', 'delivered')
+
+        self.assertEqual(process_whatsapp_status_callbacks()['updated'], 0)
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, 'read')
+        self.assertEqual(self.redis.xlen('whatsapp:status_callbacks'), 0)
+
+    def test_callback_before_sid_is_saved_waits_and_then_applies(self):
+        import time
+        from unittest.mock import patch
+        from .tasks_whatsapp import process_whatsapp_status_callbacks
+        from .whatsapp.status_buffer import DELAYED_KEY
+
+        self._callback('SM3', 'delivered')
+
+        # Sin el SID: un solo lote (no se reintenta en la misma ejecución) y queda en backoff
+        totals = process_whatsapp_status_callbacks()
+        self.assertEqual((totals['requeued'], totals['dropped']), (1, 0))
+        self.assertEqual(self.redis.zcard(DELAYED_KEY), 1)
+        self.assertEqual(process_whatsapp_status_callbacks()['read'], 0)
+
+        msg = self._message('SM3')  # El envío masivo guarda el SID
+        with patch('citas.whatsapp.status_buffer.time.time', return_value=time.time() + 60):
+            totals = process_whatsapp_status_callbacks()
+
+        self.assertEqual(totals['updated'], 1)
+        self.assertEqual(self.redis.zcard(DELAYED_KEY), 0)
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, 'delivered')
+
+
+class CampaignSenderStubTwilioTests(SimpleTestCase):
+    """
+    CampaignSender contra un servidor Twilio de prueba local (sin red externa):
+    concurrencia acotada, límite de tasa y manejo de errores de Twilio.
+    """
+
+    ACCOUNT_SID = 'AC' + '0' * 32
+    INVALID_NUMBER = 'whatsapp:+570000000000'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import json
+        import threading
+        import time as _time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import parse_qs
+
+        cls.lock = threading.Lock()
+        cls.requests = []
+        cls.in_flight = 0
+        cls.max_in_flight = 0
+
+        test_case = cls
+
+        class StubTwilioHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                data = parse_qs(self.rfile.read(length).decode())
+                with test_case.lock:
+                    test_case.in_flight += 1
+                    test_case.max_in_flight = max(test_case.max_in_flight, test_case.in_flight)
+                    test_case.requests.append((_time.monotonic(), data))
+                    sid = f'SM{len(test_case.requests):032d}'
+                _time.sleep(0.02)  # Latencia simulada de la API
+
+                if data.get('To', [''])[0] == test_case.INVALID_NUMBER:
+                    status_code = 400
+                    body = {'code': 21211, 'message': "Invalid 'To' Phone Number", 'status': 400}
+                else:
+                    status_code = 201
+                    body = {'sid': sid, 'status': 'queued', 'to': data['To'][0], 'body': data['Body'][0]}
+
+                with test_case.lock:
+                    test_case.in_flight -= 1
+                payload = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubTwilioHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from twilio.rest import Client
+
+        with self.lock:
+            self.requests.clear()
+            type(self).max_in_flight = 0
+        self.client = Client(self.ACCOUNT_SID, 'test-token')
+        self.client.api.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def _sender(self, concurrency, rate):
+        from .whatsapp.campaign_sender import CampaignSender, TokenBucket
+        return CampaignSender(
+            client=self.client,
+            from_number='whatsapp:+14155238886',
+            status_callback='http://localhost/api/citas/whatsapp-webhook/?tenant=public',
+            bucket=TokenBucket(rate),
+            concurrency=concurrency,
+        )
+
+    def test_sends_all_messages_with_bounded_concurrency(self):
+        from .whatsapp.campaign_sender import OutgoingMessage
+
+        messages = [OutgoingMessage(i, f'whatsapp:+5730000000{i:02d}', f'Hola {i}') for i in range(30)]
+        batches = []
+        results = self._sender(concurrency=4, rate=1000).send_many(messages, on_batch=batches.append, batch_size=10)
+
+        self.assertEqual(len(results), 30)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(len({result.sid for result in results}), 30)
+        self.assertEqual(sorted(len(batch) for batch in batches), [10, 10, 10])
+        self.assertLessEqual(self.max_in_flight, 4)
+        self.assertEqual(self.requests[0][1]['StatusCallback'][0],
+                         'http://localhost/api/citas/whatsapp-webhook/?tenant=public')
+
+    def test_token_bucket_limits_rate(self):
+        from .whatsapp.campaign_sender import OutgoingMessage
+
+        messages = [OutgoingMessage(i, f'whatsapp:+5730000000{i:02d}', 'Promo') for i in range(15)]
+        self._sender(concurrency=8, rate=10).send_many(messages)
+
+        timestamps = sorted(ts for ts, _data in self.requests)
+        # 10 tokens iniciales + 5 más a 10/s => al menos ~0.5s en total
+        self.assertGreaterEqual(timestamps[-1] - timestamps[0], 0.4)
+
+    def test_twilio_errors_are_reported_per_message(self):
+        from .whatsapp.campaign_sender import OutgoingMessage
+
+        messages = [
+            OutgoingMessage(1, 'whatsapp:+573000000001', 'Hola'),
+            OutgoingMessage(2, self.INVALID_NUMBER, 'Hola'),
+        ]
+        results = {result.message_id: result for result in self._sender(2, 100).send_many(messages)}
+
+        self.assertTrue(results[1].ok)
+        self.assertFalse(results[2].ok)
+        self.assertEqual(results[2].error_code, '21211')
+
+
+class CampaignTenantSchemaTests(APITestCase):
+    """
+    Las tareas de campaña trabajan en el schema del tenant que creó la
+    campaña (el worker arranca con search_path=public) y un chunk fallido
+    deja la campaña reanudable en lugar de 'sending' para siempre.
+    """
+
+    SCHEMA = 'tenant_campaign_test'
+
+    def setUp(self):
+        from types import SimpleNamespace
+        from django.db import connection
+        from .tenant_schemas import use_schema
+        from .whatsapp.campaign_sender import create_campaign
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE SCHEMA {self.SCHEMA}')
+            for table in ('citas_whatsapp_campaign', 'citas_whatsapp_message'):
+                cursor.execute(f'CREATE TABLE {self.SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL)')
+
+        with use_schema(self.SCHEMA):
+            self.campaign = create_campaign(
+                SimpleNamespace(id=1),
+                [(f'+5730000000{i:02d}', f'Cliente {i}') for i in range(3)],
+                'Promo',
+            )
+
+    def _sender(self):
+        from unittest.mock import Mock
+        from .whatsapp.campaign_sender import SendResult
+
+        def send_many(outgoing, on_batch=None, batch_size=None):
+            results = [SendResult(msg.message_id, sid=f'SMCAMP{msg.message_id:026d}') for msg in outgoing]
+            on_batch(results)
+            return results
+
+        return Mock(send_many=send_many)
+
+    def test_campaign_tasks_run_in_tenant_schema(self):
+        from unittest.mock import patch
+        from django.db import connection
+        from .models_whatsapp import TwilioMessageIndex, WhatsAppCampaign
+        from .tasks_whatsapp import (
+            finalize_whatsapp_campaign, send_whatsapp_campaign, send_whatsapp_campaign_chunk,
+        )
+        from .tenant_schemas import use_schema
+
+        with patch('celery.chord') as chord:
+            result = send_whatsapp_campaign(self.campaign.id, self.SCHEMA)
+        self.assertEqual(result, {'chunks': 1})
+        (header,), _kwargs = chord.call_args
+        chunk_signature = list(header)[0]
+        self.assertEqual(chunk_signature.args[2], self.SCHEMA)
+
+        with patch('citas.tasks_whatsapp.whatsapp_service') as service:
+            service.campaign_sender.return_value = self._sender()
+            send_whatsapp_campaign_chunk(*chunk_signature.args)
+        finalize_whatsapp_campaign(self.campaign.id, self.SCHEMA)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT current_schema()')
+            self.assertEqual(cursor.fetchone()[0], 'public')
+        self.assertEqual(
+            set(TwilioMessageIndex.objects.values_list('schema_name', flat=True)), {self.SCHEMA}
+        )
+        with use_schema(self.SCHEMA):
+            campaign = WhatsAppCampaign.objects.get(pk=self.campaign.id)
+        self.assertEqual(campaign.status, 'completed')
+        self.assertEqual(campaign.sent_count, 3)
+
+    def test_failed_chunk_marks_campaign_resumable(self):
+        from .models_whatsapp import WhatsAppCampaign
+        from .tasks_whatsapp import mark_whatsapp_campaign_failed
+        from .tenant_schemas import use_schema
+
+        mark_whatsapp_campaign_failed(None, RuntimeError('twilio caído'), None, self.campaign.id, self.SCHEMA)
+
+        with use_schema(self.SCHEMA):
+            campaign = WhatsAppCampaign.objects.get(pk=self.campaign.id)
+        self.assertEqual(campaign.status, 'failed')
+        self.assertEqual(campaign.pending_count, 3)
+        self.assertIsNone(campaign.finished_at)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis no está instalado')
+class ReminderSortedSetTests(APITestCase):
+    """Despacho de recordatorios desde el sorted set de Redis (score = scheduled_time)."""
+
+    def setUp(self):
+        from unittest.mock import patch
+
+        self.redis = fakeredis.FakeRedis()
+        patcher = patch('citas.whatsapp.reminder_scheduler._redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ahora = datetime.now(pytz.UTC)
+
+    def _reminder(self, reminder_id, scheduled_time, is_sent=False):
+        from types import SimpleNamespace
+        return SimpleNamespace(id=reminder_id, scheduled_time=scheduled_time, is_sent=is_sent)
+
+    def test_pop_due_returns_only_due_members_once(self):
+        from .whatsapp.reminder_scheduler import pop_due, schedule_reminders, zset_key
+
+        schedule_reminders([
+            self._reminder(1, self.ahora - timedelta(minutes=5)),
+            self._reminder(2, self.ahora - timedelta(seconds=1)),
+            self._reminder(3, self.ahora + timedelta(hours=1)),
+            self._reminder(4, self.ahora - timedelta(minutes=5), is_sent=True),
+        ], 'public')
+
+        self.assertEqual(sorted(pop_due(self.ahora.timestamp())), [('public', 1), ('public', 2)])
+        self.assertEqual(pop_due(self.ahora.timestamp()), [])
+        self.assertEqual(self.redis.zrange(zset_key('public'), 0, -1), [b'public:3'])
+
+    def test_rescheduling_moves_the_score(self):
+        from .whatsapp.reminder_scheduler import pop_due, schedule_reminders, zset_key
+
+        schedule_reminders([self._reminder(7, self.ahora - timedelta(minutes=1))], 'public')
+        nueva_hora = self.ahora + timedelta(days=1)
+        schedule_reminders([self._reminder(7, nueva_hora)], 'public')
+
+        self.assertEqual(pop_due(self.ahora.timestamp()), [])
+        self.assertEqual(self.redis.zcard(zset_key('public')), 1)
+        self.assertEqual(self.redis.zscore(zset_key('public'), 'public:7'), nueva_hora.timestamp())
+
+    def test_reconcile_re_adds_pending_rows_missing_from_the_set(self):
+        from .models_whatsapp import WhatsAppReminderSchedule
+        from .tasks_whatsapp import reconcile_reminder_schedule
+        from .whatsapp.reminder_scheduler import zset_key
+
+        sede = Sede.all_objects.create(nombre='Sede Reconciliación')
+        cita = Cita.all_objects.create(nombre='ana', fecha=self.ahora + timedelta(days=1), sede=sede)
+        pendiente = WhatsAppReminderSchedule.objects.create(
+            cita=cita, reminder_type='24h', scheduled_time=cita.fecha - timedelta(hours=24)
+        )
+        WhatsAppReminderSchedule.objects.create(
+            cita=cita, reminder_type='1h', scheduled_time=cita.fecha - timedelta(hours=1), is_sent=True
+        )
+        self.redis.flushall()  # Redis perdió el set
+
+        self.assertEqual(reconcile_reminder_schedule(), {'scheduled': 1})
+        self.assertEqual(
+            self.redis.zrange(zset_key('public'), 0, -1, withscores=True),
+            [(f'public:{pendiente.id}'.encode(), pendiente.scheduled_time.timestamp())]
+        )
+
+
+class ReminderClaimingTests(TransactionTestCase):
+    """
+    Varios workers procesando el mismo backlog de recordatorios: cada
+    recordatorio se envía exactamente una vez (SELECT ... FOR UPDATE SKIP LOCKED).
+    """
+
+    BACKLOG = 250
+    WORKERS = 4
+
+    def setUp(self):
+        from .models_whatsapp import WhatsAppReminderSchedule
+
+        sede = Sede.all_objects.create(nombre='Sede Recordatorios')
+        ahora = datetime.now(pytz.UTC)
+        citas = [
+            Cita.all_objects.create(
+                nombre=f'cliente{i}', fecha=ahora + timedelta(hours=23), sede=sede, estado='Pendiente'
+            )
+            for i in range(self.BACKLOG)
+        ]
+        WhatsAppReminderSchedule.objects.bulk_create([
+            WhatsAppReminderSchedule(
+                cita=cita, reminder_type='24h', scheduled_time=ahora - timedelta(minutes=1)
+            )
+            for cita in citas
+        ])
+
+    def _run_workers(self, send_side_effect):
+        import threading
+        from unittest.mock import patch
+        from django.db import connection
+        from .tasks_whatsapp import send_scheduled_reminders
+
+        def worker():
+            try:
+                send_scheduled_reminders(max_batches=100)
+            finally:
+                connection.close()
+
+        with patch('citas.tasks_whatsapp.whatsapp_service') as service:
+            service.send_appointment_reminder_24h.side_effect = send_side_effect
+            threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    def test_parallel_workers_send_each_reminder_once(self):
+        import threading
+        import time
+        from collections import Counter
+        from .models_whatsapp import WhatsAppReminderSchedule
+
+        lock = threading.Lock()
+        enviados = Counter()
+
+        def send(cita, message_body=None):
+            time.sleep(0.001)  # Simula la latencia de Twilio para intercalar workers
+            with lock:
+                enviados[cita.id] += 1
+            return None  # Sin mensaje: el recordatorio se marca como procesado
+
+        self._run_workers(send)
+
+        self.assertEqual(len(enviados), self.BACKLOG)
+        self.assertEqual(set(enviados.values()), {1})
+        self.assertFalse(WhatsAppReminderSchedule.objects.filter(is_sent=False).exists())
+
+    def test_stale_claims_are_recovered(self):
+        from django.utils import timezone
+        from .models_whatsapp import WhatsAppReminderSchedule
+        from .whatsapp.reminder_scheduler import CLAIM_TIMEOUT, claim_due_reminders, recover_stale_claims
+
+        # Un worker reclamó todo y "murió" sin enviar
+        claimed = claim_due_reminders(batch_size=self.BACKLOG, worker='worker-caido')
+        self.assertEqual(len(claimed), self.BACKLOG)
+        self.assertEqual(claim_due_reminders(worker='otro'), [])
+
+        WhatsAppReminderSchedule.objects.update(claimed_at=timezone.now() - CLAIM_TIMEOUT * 2)
+        self.assertEqual(recover_stale_claims(), self.BACKLOG)
+        self.assertEqual(len(claim_due_reminders(batch_size=self.BACKLOG, worker='otro')), self.BACKLOG)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis no está instalado')
+class ReminderDispatchFairnessTests(SimpleTestCase):
+    """El backlog de un tenant grande no llena el despacho de los demás."""
+
+    def test_dispatch_takes_at_most_the_per_tenant_limit_from_each_tenant(self):
+        from collections import Counter
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from .tasks_whatsapp import dispatch_due_reminders
+        from .whatsapp import reminder_scheduler
+
+        limit = reminder_scheduler.PER_TENANT_DISPATCH_LIMIT
+        vencido = datetime.now(pytz.UTC) - timedelta(minutes=1)
+
+        def reminders(count):
+            return [SimpleNamespace(id=i, is_sent=False, scheduled_time=vencido) for i in range(1, count + 1)]
+
+        with patch('citas.whatsapp.reminder_scheduler._redis', return_value=fakeredis.FakeRedis()), \
+                patch('citas.tasks_whatsapp.send_whatsapp_reminder') as send:
+            reminder_scheduler.schedule_reminders(reminders(limit * 2 + 50), 'tenant_grande')
+            reminder_scheduler.schedule_reminders(reminders(3), 'tenant_chico')
+
+            despachos = []
+            for _ in range(4):
+                send.reset_mock()
+                dispatch_due_reminders()
+                despachos.append(Counter(call.args[1] for call in send.delay.call_args_list))
+
+        self.assertEqual(despachos[0], {'tenant_grande': limit, 'tenant_chico': 3})
+        self.assertEqual(despachos[1], {'tenant_grande': limit})
+        self.assertEqual(despachos[2], {'tenant_grande': 50})
+        self.assertEqual(despachos[3], {})
+
+
+class NotificationOutboxTests(APITestCase):
+    """
+    Las notificaciones se registran en la misma transacción que la cita:
+    si la transacción hace rollback, no queda nada que enviar.
+    """
+
+    def setUp(self):
+        self.sede = Sede.all_objects.create(nombre='Sede Outbox')
+        self.fecha = datetime.now(pytz.UTC) + timedelta(days=2)
+
+    def test_confirmation_is_enqueued_with_the_cita(self):
+        from .models import NotificationOutbox
+
+        cita = Cita.all_objects.create(nombre='cliente', fecha=self.fecha, sede=self.sede)
+
+        notification = NotificationOutbox.objects.get(cita=cita)
+        self.assertEqual((notification.channel, notification.event, notification.status),
+                         ('email', 'confirmation', 'pending'))
+
+    def test_rolled_back_cita_leaves_no_notification(self):
+        from django.db import transaction
+        from .models import NotificationOutbox
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Cita.all_objects.create(nombre='cliente', fecha=self.fecha, sede=self.sede)
+                raise RuntimeError('rollback')
+
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_failed_send_is_retried_with_backoff(self):
+        from unittest.mock import patch
+        from .models import NotificationOutbox
+        from .outbox import dispatch_batch
+
+        cita = Cita.all_objects.create(nombre='cliente', fecha=self.fecha, sede=self.sede)
+
+        with patch('citas.outbox._send_appointment_email', side_effect=ConnectionError('smtp caído')):
+            result = dispatch_batch()
+
+        self.assertEqual(result['retried'], 1)
+        notification = NotificationOutbox.objects.get(cita=cita)
+        self.assertEqual((notification.status, notification.attempts), ('pending', 1))
+        self.assertGreater(notification.available_at, notification.created_at)
+        # Todavía en backoff: el siguiente lote no la toma
+        self.assertEqual(dispatch_batch()['claimed'], 0)
+
+    def test_smtp_failure_is_retried(self):
+        import smtplib
+        from unittest.mock import patch
+        from .models import NotificationOutbox
+        from .outbox import dispatch_batch
+
+        cliente = User.objects.create_user(username='cliente', email='cliente@example.com')
+        cita = Cita.all_objects.create(user=cliente, nombre='cliente', fecha=self.fecha, sede=self.sede)
+
+        with patch('citas.utils.send_messages', side_effect=smtplib.SMTPException('smtp caído')):
+            result = dispatch_batch()
+
+        self.assertEqual((result['sent'], result['retried']), (0, 1))
+        notification = NotificationOutbox.objects.get(cita=cita)
+        self.assertEqual((notification.status, notification.attempts), ('pending', 1))
+        self.assertIn('smtp caído', notification.last_error)
+
+    def test_failed_whatsapp_message_is_retried(self):
+        from unittest.mock import Mock, patch
+        from .models import NotificationOutbox
+        from .outbox import dispatch_batch, enqueue_notification
+
+        cita = Cita.all_objects.create(nombre='cliente', fecha=self.fecha, sede=self.sede)
+        NotificationOutbox.objects.all().delete()
+        enqueue_notification(cita, 'confirmation', ['whatsapp'])
+
+        # _send_message captura el error de Twilio y devuelve el mensaje en 'failed'
+        failed = Mock(status='failed', error_code='21211', error_message="Invalid 'To' Phone Number")
+        with patch('citas.whatsapp.whatsapp_service.whatsapp_service') as service:
+            service.send_appointment_confirmation.return_value = failed
+            result = dispatch_batch()
+
+        self.assertEqual(result['retried'], 1)
+        notification = NotificationOutbox.objects.get(cita=cita)
+        self.assertEqual((notification.status, notification.attempts), ('pending', 1))
+        self.assertIn('21211', notification.last_error)
+
+
+class WhatsAppTemplateTests(SimpleTestCase):
+    """Plantillas de WhatsApp validadas y compiladas una vez por organización."""
+
+    def _org(self, pk, **templates):
+        from types import SimpleNamespace
+        fields = {
+            'whatsapp_template_confirmation': '',
+            'whatsapp_template_reminder_24h': '',
+            'whatsapp_template_reminder_1h': '',
+            'whatsapp_template_cancellation': '',
+        }
+        fields.update(templates)
+        return SimpleNamespace(pk=pk, **fields)
+
+    def test_rejects_unknown_and_attribute_placeholders(self):
+        from .whatsapp.message_templates import TemplateError, validate_template
+
+        self.assertEqual(validate_template('Hola {nombre}, {fecha}', 'confirmation'), {'nombre', 'fecha'})
+        self.assertEqual(validate_template('', 'confirmation'), frozenset())
+        for template in ('Hola {cliente}', 'Hola {nombre.__class__}', 'Hola {nombre[0]}', 'Hola {}', 'Hola {nombre'):
+            with self.assertRaises(TemplateError, msg=template):
+                validate_template(template, 'confirmation')
+        # {razon} solo existe en cancelaciones
+        self.assertEqual(validate_template('{razon}', 'cancellation'), {'razon'})
+        with self.assertRaises(TemplateError):
+            validate_template('{razon}', 'reminder_1h')
+
+    def test_render_many_uses_one_compiled_template(self):
+        from .whatsapp import message_templates
+
+        org = self._org(9001, whatsapp_template_reminder_1h='{nombre} a las {hora} en {sede}')
+        contexts = [{'nombre': f'cliente{i}', 'hora': '10:00', 'sede': 'Centro'} for i in range(3)]
+
+        self.assertEqual(
+            message_templates.render_many(org, 'reminder_1h', contexts),
+            [f'cliente{i} a las 10:00 en Centro' for i in range(3)],
+        )
+        self.assertIs(
+            message_templates.get_template(org, 'reminder_1h'),
+            message_templates.get_template(org, 'reminder_1h'),
+        )
+
+    def test_invalid_stored_template_falls_back_to_default(self):
+        from .whatsapp import message_templates
+
+        org = self._org(9002, whatsapp_template_confirmation='Hola {cliente}')
+        message = message_templates.render(org, 'confirmation', {
+            'nombre': 'Ana', 'fecha': '01/02/2026', 'hora': '09:30',
+            'sede': 'Norte', 'servicios': 'Corte', 'sender_name': 'Salón',
+        })
+        self.assertIn('¡Hola Ana!', message)
+        self.assertIn('01/02/2026 a las 09:30', message)
+
+
+class WhatsAppTemplateBatchTests(APITestCase):
+    """Plantillas validadas al guardar y renderizadas por lote en los recordatorios."""
+
+    def setUp(self):
+        from organizacion.models import Organizacion
+
+        self.org = Organizacion.objects.create(
+            nombre='Org Plantillas', whatsapp_enabled=True,
+            whatsapp_template_reminder_24h='Mañana {nombre} a las {hora}',
+        )
+
+    def test_save_rejects_invalid_templates(self):
+        from django.core.exceptions import ValidationError
+
+        self.org.whatsapp_template_confirmation = 'Hola {cliente}'
+        with self.assertRaises(ValidationError) as ctx:
+            self.org.save()
+        self.assertIn('whatsapp_template_confirmation', ctx.exception.message_dict)
+
+        # update_fields sin plantillas no revalida
+        self.org.nombre = 'Org Renombrada'
+        self.org.save(update_fields=['nombre'])
+
+    def test_due_reminders_render_once_per_organization(self):
+        from unittest import mock
+        from .models_whatsapp import WhatsAppReminderSchedule
+        from .tasks_whatsapp import _send_due_reminders
+        from .whatsapp import message_templates
+        from .whatsapp.whatsapp_service import WhatsAppService
+
+        sede = Sede.all_objects.create(nombre='Sede Plantillas', organizacion=self.org)
+        ahora = datetime.now(pytz.UTC)
+        fecha = ahora + timedelta(hours=23)
+        for i in range(3):
+            cita = Cita.all_objects.create(
+                nombre=f'cliente{i}', fecha=fecha, sede=sede, estado='Pendiente', telefono_cliente='3001234567'
+            )
+            WhatsAppReminderSchedule.objects.create(
+                cita=cita, reminder_type='24h', scheduled_time=ahora - timedelta(minutes=1)
+            )
+
+        with mock.patch.object(WhatsAppService, '_send_message', return_value=None) as send, \
+                mock.patch.object(message_templates, 'render_many', wraps=message_templates.render_many) as render_many, \
+                mock.patch.object(message_templates, 'render') as render_one:
+            _send_due_reminders(10)
+
+        render_many.assert_called_once()
+        render_one.assert_not_called()
+        bodies = sorted(call.kwargs['message_body'] for call in send.call_args_list)
+        self.assertEqual(bodies, [f"Mañana cliente{i} a las {fecha.strftime('%H:%M')}" for i in range(3)])
+
+
+class ReminderPlannerTests(APITestCase):
+    """Recordatorios de muchas citas planificados con consultas por lote."""
+
+    def setUp(self):
+        from organizacion.models import Organizacion
+
+        org = Organizacion.objects.create(nombre='Org Recordatorios', whatsapp_enabled=True)
+        self.sede = Sede.all_objects.create(nombre='Sede Planner', organizacion=org)
+        self.ahora = datetime.now(pytz.UTC)
+        self.citas = [
+            Cita.all_objects.create(
+                nombre=f'cliente{i}', fecha=self.ahora + timedelta(days=3), sede=self.sede,
+                telefono_cliente='+573001234567',
+            )
+            for i in range(20)
+        ]
+
+    def _plan(self, citas):
+        from unittest.mock import patch
+        from .whatsapp.reminder_planner import plan_reminders
+
+        with patch('citas.whatsapp.reminder_scheduler._redis'):
+            return plan_reminders([cita.id for cita in citas])
+
+    def test_bulk_plan_query_count_does_not_grow_with_citas(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models_whatsapp import WhatsAppReminderSchedule
+
+        with CaptureQueriesContext(connection) as few:
+            self._plan(self.citas[:2])
+        with CaptureQueriesContext(connection) as many:
+            result = self._plan(self.citas[2:])
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(result, {'scheduled': 36, 'deleted': 0})
+        self.assertEqual(WhatsAppReminderSchedule.objects.count(), 40)
+
+    def test_reschedule_moves_reminders_and_cancel_deletes_them(self):
+        from .models_whatsapp import WhatsAppReminderSchedule
+
+        self._plan(self.citas)
+        movida, cancelada = self.citas[0], self.citas[1]
+        movida.fecha = self.ahora + timedelta(days=5)
+        movida.save()
+        cancelada.estado = 'Cancelada'
+        cancelada.save()
+
+        result = self._plan([movida, cancelada])
+
+        self.assertEqual(result['deleted'], 2)
+        self.assertFalse(WhatsAppReminderSchedule.objects.filter(cita=cancelada).exists())
+        reminder = WhatsAppReminderSchedule.objects.get(cita=movida, reminder_type='24h')
+        self.assertEqual(reminder.scheduled_time, movida.fecha - timedelta(hours=24))
+        self.assertEqual(WhatsAppReminderSchedule.objects.filter(cita=movida).count(), 2)
+
+    def test_replanning_does_not_resend_sent_reminders(self):
+        from .models_whatsapp import WhatsAppReminderSchedule
+
+        self._plan(self.citas[:1])
+        WhatsAppReminderSchedule.objects.filter(cita=self.citas[0]).update(is_sent=True)
+
+        self.assertEqual(self._plan(self.citas[:1])['scheduled'], 0)
+        self.assertFalse(WhatsAppReminderSchedule.objects.filter(is_sent=False).exists())
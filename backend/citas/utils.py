@@ -1,19 +1,33 @@
-from django.core.mail import send_mail
+import logging
+
 from django.template.loader import render_to_string
-from django.conf import settings
 from celery import shared_task
+from core.mailer import build_message, send_messages
 from .models import Cita
 
+logger = logging.getLogger(__name__)
+
 @shared_task
 def send_appointment_email(appointment_id, subject, template_name, context=None):
     """
     A utility function to build recipient lists and send appointment-related emails.
-    This is a Celery task, so it runs in the background.
+    This is a Celery task, so it runs in the background. SMTP errors are logged.
+    """
+    try:
+        deliver_appointment_email(appointment_id, subject, template_name, context)
+    except Exception as e:
+        logger.error(f"[Email] Error enviando email de la cita {appointment_id} ({subject}): {e}")
+
+
+def deliver_appointment_email(appointment_id, subject, template_name, context=None):
+    """
+    Builds the recipient list and sends the appointment email.
+    SMTP errors propagate, so callers with their own retries (the outbox) see them.
     """
     try:
         appointment = Cita.objects.get(id=appointment_id)
     except Cita.DoesNotExist:
-        print(f"Error: Cita with id {appointment_id} does not exist. Cannot send email.")
+        logger.error(f"[Email] Cita {appointment_id} no existe, no se envía '{subject}'")
         return
 
     if context is None:
@@ -38,11 +52,9 @@ def send_appointment_email(appointment_id, subject, template_name, context=None)
             recipient_list.append(colaborador.metadata.get("Correo"))
 
     if recipient_list:
-        try:
-            send_mail(
-                subject, plain_message, settings.DEFAULT_FROM_EMAIL,
-                list(set(recipient_list)), html_message=html_message, fail_silently=False
-            )
-        except Exception as e:
-            # In a real application, you would log this error more robustly
-            print(f"Error sending email for appointment {appointment.id} (Subject: {subject}): {e}")
\ No newline at end of file
+        # Un mensaje por destinatario, enviados sobre la conexión SMTP reutilizada
+        messages = [
+            build_message(subject, plain_message, recipient, html_message)
+            for recipient in dict.fromkeys(recipient_list)
+        ]
+        send_messages(messages)
\ No newline at end of file
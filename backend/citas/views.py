@@ -1,7 +1,7 @@
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny, BasePermission
 from .models import Cita, Servicio, Horario, Colaborador, Bloqueo
-from .serializers import CitaSerializer, ServicioSerializer, HorarioSerializer, ColaboradorSerializer, BloqueoSerializer, GuestCitaSerializer
+from .serializers import CitaSerializer, ServicioSerializer, HorarioSerializer, ColaboradorSerializer, BloqueoSerializer, GuestCitaSerializer, CitaDashboardSerializer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from datetime import datetime, timedelta, time
@@ -23,9 +23,12 @@ import logging
 logger = logging.getLogger(__name__)
 from django import forms
 from organizacion.models import Sede
-from django.db.models import Count, Case, When, IntegerField, Sum, Value, DecimalField, F, Prefetch
+from django.db.models import Count, Sum, Value, DecimalField, Prefetch, Q
 from django.db.models.functions import Coalesce
-from .utils import send_appointment_email
+from django.db import transaction
+from .outbox import enqueue_notification
+from .revenue import unique_citas, with_precio, sum_revenue, count_by_servicio, count_by_colaborador, precio_cita_subquery
+from .report_cache import cached_report_response
 from django.views.decorators.cache import cache_page
 from django.utils.decorators import method_decorator
 
@@ -310,9 +313,10 @@ class ServicioViewSet(viewsets.ModelViewSet):
 
 class BloqueoViewSet(viewsets.ModelViewSet):
     """API endpoint for managing resource blocks."""
-    queryset = Bloqueo.all_objects.select_related('colaborador__sede').all()
+    queryset = Bloqueo.all_objects.select_related('colaborador__sede__organizacion').all()
     serializer_class = BloqueoSerializer
     permission_classes = [IsAuthenticated, IsAdminOrSedeAdminOrReadOnly] # Only admins can block time
+    query_budget = {'list': 15, 'retrieve': 15}  # Ver core/query_budget.py
 
     def get_queryset(self):
         # ARQUITECTURA: Forzar search_path a public donde están los datos
@@ -322,7 +326,7 @@ class BloqueoViewSet(viewsets.ModelViewSet):
 
         user = self.request.user
         sede_id = self.request.query_params.get('sede_id')
-        queryset = Bloqueo.all_objects.select_related('colaborador__sede').all()
+        queryset = Bloqueo.all_objects.select_related('colaborador__sede__organizacion').all()
 
         # SUPERUSUARIO: puede ver todos los bloqueos
         if user.is_superuser:
@@ -367,6 +371,7 @@ class CitaViewSet(viewsets.ModelViewSet):
     serializer_class = CitaSerializer
     permission_classes = [IsAuthenticated, IsColaboradorOrAdmin]
     pagination_class = StandardResultsSetPagination
+    query_budget = {'list': 25, 'retrieve': 20}  # Ver core/query_budget.py
 
     def get_queryset(self):
         # ARQUITECTURA: Forzar search_path a public donde están los datos
@@ -398,15 +403,18 @@ class CitaViewSet(viewsets.ModelViewSet):
             if perfil and perfil.sedes_administradas.exists():
                 queryset = base_queryset.filter(sede__in=perfil.sedes_administradas.all())
 
-            # COLABORADOR: solo citas asignadas a él
-            elif Colaborador.all_objects.filter(usuario=user).exists():
-                colaborador = Colaborador.all_objects.get(usuario=user)
-                # Usar __id para evitar conflictos con OrganizacionManager en ManyToMany
-                queryset = base_queryset.filter(colaboradores__id=colaborador.id)
-
-            # CLIENTE: solo sus propias citas
             else:
-                queryset = base_queryset.filter(user=user)
+                # OPTIMIZACIÓN: una sola query para saber si es colaborador (antes exists() + get())
+                colaborador_id = Colaborador.all_objects.filter(usuario=user).values_list('id', flat=True).first()
+
+                # COLABORADOR: solo citas asignadas a él
+                if colaborador_id:
+                    # Usar __id para evitar conflictos con OrganizacionManager en ManyToMany
+                    queryset = base_queryset.filter(colaboradores__id=colaborador_id)
+
+                # CLIENTE: solo sus propias citas
+                else:
+                    queryset = base_queryset.filter(user=user)
 
         # Aplicar filtros adicionales
         # Búsqueda por nombre, email o teléfono
@@ -482,7 +490,10 @@ class CitaViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        # La cita, sus servicios M2M y las notificaciones del outbox se
+        # confirman juntos: si algo falla no se envía ninguna notificación
+        with transaction.atomic():
+            self.perform_create(serializer)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
@@ -535,18 +546,10 @@ class CitaViewSet(viewsets.ModelViewSet):
             # Usuarios regulares crean citas para sí mismos
             cita = serializer.save(user=user)
 
-        # Enviar notificaciones de WhatsApp de forma asíncrona
-        try:
-            from .tasks_whatsapp import send_whatsapp_confirmation, schedule_appointment_reminders
-
-            # Enviar confirmación inmediata
-            send_whatsapp_confirmation.delay(cita.id)
-
-            # Programar recordatorios (24h y 1h antes)
-            schedule_appointment_reminders.delay(cita.id)
-        except Exception as e:
-            # No fallar la creación de la cita si el WhatsApp falla
-            logger.warning(f"Error encolando tareas de WhatsApp para cita {cita.id}: {str(e)}")
+        # Notificaciones de WhatsApp vía outbox (confirmación + programar
+        # recordatorios 24h/1h); el email de confirmación lo registra el signal
+        enqueue_notification(cita, 'confirmation', ['whatsapp'])
+        enqueue_notification(cita, 'schedule_reminders', ['whatsapp'])
 
     def _check_cita_permission(self, cita, action='modify'):
         """
@@ -617,16 +620,14 @@ class CitaViewSet(viewsets.ModelViewSet):
         if not is_admin and original_instance.fecha < timezone.now():
             raise PermissionDenied(_("No se pueden modificar citas pasadas."))
 
-        response = super().partial_update(request, *args, **kwargs)
+        with transaction.atomic():
+            response = super().partial_update(request, *args, **kwargs)
 
-        # After a successful update, check if the date has changed to send a notification
-        updated_instance = self.get_object()
-        if updated_instance.fecha != old_fecha:
-            send_appointment_email.delay(
-                appointment_id=updated_instance.id,
-                subject=f"Reprogramación de Cita: {', '.join([s.nombre for s in updated_instance.servicios.all()])}",
-                template_name='appointment_reschedule'
-            )
+            # After a successful update, check if the date has changed to send a notification
+            updated_instance = self.get_object()
+            if updated_instance.fecha != old_fecha:
+                # Email de reprogramación + mover los recordatorios de WhatsApp
+                enqueue_notification(updated_instance, 'reschedule', ['email', 'whatsapp'])
 
         return response
 
@@ -636,26 +637,17 @@ class CitaViewSet(viewsets.ModelViewSet):
 
         # Store date before changing status, for the email
         original_fecha = instance.fecha
-        instance.estado = 'Cancelada'
-        instance.save()
 
-        # Enviar notificación de cancelación por WhatsApp
-        try:
-            from .tasks_whatsapp import send_whatsapp_cancellation
-            reason = request.data.get('reason', '')
-            send_whatsapp_cancellation.delay(instance.id, reason)
-        except Exception as e:
-            logger.warning(f"Error encolando WhatsApp de cancelación para cita {instance.id}: {str(e)}")
-
-        # Pass serializable data to the Celery task
-        context = {'original_fecha': original_fecha.isoformat()}
-
-        send_appointment_email.delay(
-            appointment_id=instance.id,
-            subject=f"Cancelación de Cita: {', '.join([s.nombre for s in instance.servicios.all()])}",
-            template_name='appointment_cancellation',
-            context=context
-        )
+        with transaction.atomic():
+            instance.estado = 'Cancelada'
+            instance.save()
+
+            # Email + WhatsApp de cancelación vía outbox (payload serializable)
+            enqueue_notification(
+                instance, 'cancellation', ['email', 'whatsapp'],
+                reason=request.data.get('reason', ''),
+                context={'original_fecha': original_fecha.isoformat()},
+            )
 
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -668,15 +660,14 @@ class CitaViewSet(viewsets.ModelViewSet):
             return Response({'status': 'cita ya estaba confirmada'})
 
         if cita.estado == 'Pendiente':
-            cita.estado = 'Confirmada'
-            cita.confirmado = True
-            cita.save()
-
-            send_appointment_email.delay(
-                appointment_id=cita.id,
-                subject=f"Tu cita ha sido confirmada: {', '.join([s.nombre for s in cita.servicios.all()])}",
-                template_name='appointment_confirmation'
-            )
+            with transaction.atomic():
+                cita.estado = 'Confirmada'
+                cita.confirmado = True
+                cita.save()
+
+                enqueue_notification(
+                    cita, 'confirmation', ['email'], subject_prefix='Tu cita ha sido confirmada'
+                )
 
             return Response({'status': 'cita confirmada'})
         else:
@@ -736,74 +727,163 @@ class CitaViewSet(viewsets.ModelViewSet):
         cita.save()
         return Response(CitaSerializer(cita).data)
 
+def _relacionados_json(through_model, field):
+    """
+    Subquery correlacionada con los servicios/colaboradores de la cita como
+    lista JSON [{id, nombre}] (evita prefetch y JOINs ManyToMany).
+    """
+    from django.contrib.postgres.aggregates import JSONBAgg
+    from django.db.models import OuterRef, Subquery, JSONField
+    from django.db.models.functions import JSONObject
+
+    relacionados = (
+        through_model.objects
+        .filter(cita_id=OuterRef('pk'))
+        .order_by()
+        .values('cita_id')
+        .annotate(items=JSONBAgg(JSONObject(id=f'{field}_id', nombre=f'{field}__nombre')))
+        .values('items')
+    )
+    return Coalesce(Subquery(relacionados, output_field=JSONField()), Value([], output_field=JSONField()))
+
+
 class DashboardSummaryView(APIView):
+    """
+    Resumen del dashboard (primera pantalla después del login).
+
+    OPTIMIZACIÓN:
+    - Los permisos se resuelven a un filtro (sin instanciar CitaViewSet ni
+      su prefetch completo).
+    - Conteos e ingresos del mes en UNA query con agregación condicional
+      (el precio de cada cita sale de una subquery, sin sumar en Python).
+    - Próximas citas en UNA query con un serializer liviano.
+    - Cache de 45s por (tenant, usuario) ligado a la versión de datos del tenant,
+      por lo que cualquier escritura de citas/servicios/colaboradores lo invalida.
+    """
     permission_classes = [IsAuthenticated]
+    cache_timeout = 45
 
     def get(self, request, *args, **kwargs):
+        from django.core.cache import cache
+        from .report_cache import get_data_version, get_report_scope
+
         user = request.user
-        today = timezone.now().date()
+        scope = get_report_scope(user)
+        version = get_data_version(scope)
+        cache_key = f'citas:dashboard:{scope}:{version}:{user.pk}' if version is not None else None
 
-        # --- Refactor: Reuse the queryset logic from CitaViewSet ---
-        # This avoids repeating permission logic and keeps the code DRY.
-        cita_viewset = CitaViewSet()
-        cita_viewset.request = request # Provide the request context to the viewset
-        base_queryset = cita_viewset.get_queryset()
-        # -----------------------------------------------------------
+        if cache_key:
+            try:
+                summary = cache.get(cache_key)
+            except Exception as e:
+                logger.warning(f"[Dashboard] Error leyendo cache: {e}")
+                summary = None
+            if summary is not None:
+                return Response(summary)
 
-        # Determine if the user is an admin (staff or sede admin)
-        is_admin_user = user.is_staff
-        if not is_admin_user:
-            is_in_admin_group = user.groups.filter(name='SedeAdmin').exists()
-            perfil = get_perfil_or_first(user)
-            has_sedes_administradas = perfil and perfil.sedes_administradas.exists()
-            is_admin_user = is_in_admin_group or has_sedes_administradas
-
-        # Admin/Staff specific stats
-        if is_admin_user:
-            # Optimized: Combine counts into a single query using aggregation
-            from django.db.models import Count, Q
-
-            # Counts en una sola query
-            stats = base_queryset.aggregate(
-                citas_hoy=Count('id', filter=Q(fecha__date=today)),
-                pendientes_confirmacion=Count('id', filter=Q(estado='Pendiente'))
-            )
+        summary = self._build_summary(user)
+
+        if cache_key:
+            try:
+                cache.set(cache_key, summary, self.cache_timeout)
+            except Exception as e:
+                logger.warning(f"[Dashboard] Error guardando cache: {e}")
 
-            citas_hoy = stats['citas_hoy']
-            pendientes_confirmacion = stats['pendientes_confirmacion']
-
-            # Calcular ingresos del mes usando prefetch para evitar N+1 queries
-            start_of_month = today.replace(day=1)
-
-            # Usar prefetch_related para cargar servicios en una sola query adicional
-            citas_asistidas = base_queryset.filter(
-                estado='Asistio',
-                fecha__gte=start_of_month
-            ).prefetch_related('servicios')
-
-            # Calcular ingresos sumando en Python (más eficiente que Sum con ManyToMany)
-            ingresos_mes = 0
-            for cita in citas_asistidas:
-                ingresos_mes += sum(servicio.precio for servicio in cita.servicios.all())
-
-            # Proximas citas optimizadas con select_related y prefetch_related
-            proximas_citas = base_queryset.filter(
-                fecha__gte=timezone.now(),
-                estado__in=['Pendiente', 'Confirmada']
-            ).select_related('sede').prefetch_related('servicios', 'colaboradores').order_by('fecha')[:5]
-
-            summary = {
-                'citas_hoy': citas_hoy,
-                'pendientes_confirmacion': pendientes_confirmacion,
-                'ingresos_mes': float(ingresos_mes),
-                'proximas_citas': CitaSerializer(proximas_citas, many=True).data
-            }
-        else: # Regular user stats
-            proxima_cita = base_queryset.filter( fecha__gte=timezone.now(), estado__in=['Pendiente', 'Confirmada'] ).order_by('fecha').first()
-            summary = { 'proxima_cita': CitaSerializer(proxima_cita).data if proxima_cita else None }
-            
         return Response(summary)
 
+    def _build_summary(self, user):
+        # ARQUITECTURA: Forzar search_path a public donde están los datos
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute("SET search_path TO public;")
+
+        today = timezone.now().date()
+        citas_filter, is_admin_user = self._citas_filter(user)
+        base_queryset = Cita.all_objects.filter(citas_filter)
+
+        if not is_admin_user:
+            # Regular user stats
+            proxima_cita = self._upcoming(base_queryset, limit=1)
+            return {'proxima_cita': proxima_cita[0] if proxima_cita else None}
+
+        start_of_month = today.replace(day=1)
+        asistidas_mes = Q(estado='Asistio', fecha__gte=start_of_month)
+
+        # UNA query: conteos + ingresos del mes (precio por cita vía subquery)
+        stats = base_queryset.filter(
+            Q(fecha__date=today) | Q(estado='Pendiente') | asistidas_mes
+        ).annotate(
+            precio_total=precio_cita_subquery()
+        ).aggregate(
+            citas_hoy=Count('id', filter=Q(fecha__date=today)),
+            pendientes_confirmacion=Count('id', filter=Q(estado='Pendiente')),
+            ingresos_mes=Coalesce(
+                Sum('precio_total', filter=asistidas_mes),
+                Value(0),
+                output_field=DecimalField(max_digits=12, decimal_places=0)
+            ),
+        )
+
+        return {
+            'citas_hoy': stats['citas_hoy'],
+            'pendientes_confirmacion': stats['pendientes_confirmacion'],
+            'ingresos_mes': float(stats['ingresos_mes']),
+            'proximas_citas': self._upcoming(base_queryset, limit=5),
+        }
+
+    def _citas_filter(self, user):
+        """
+        Traduce los permisos de CitaViewSet.get_queryset a un filtro Q sobre Cita.
+
+        Returns:
+            (Q, is_admin_user)
+        """
+        from .revenue import CitaColaborador
+
+        if user.is_superuser:
+            return Q(), True
+
+        perfil = get_perfil_or_first(user)
+        sedes_admin_ids = list(perfil.sedes_administradas.values_list('id', flat=True)) if perfil else []
+        is_admin_user = (
+            user.is_staff
+            or bool(sedes_admin_ids)
+            or user.groups.filter(name='SedeAdmin').exists()
+        )
+
+        # ADMINISTRADOR DE SEDE: solo citas de las sedes que administra
+        if sedes_admin_ids:
+            return Q(sede_id__in=sedes_admin_ids), is_admin_user
+
+        # COLABORADOR: solo citas asignadas a él (semi-join, sin duplicados)
+        colaborador_id = Colaborador.all_objects.filter(usuario=user).values_list('id', flat=True).first()
+        if colaborador_id:
+            citas_colaborador = CitaColaborador.objects.filter(colaborador_id=colaborador_id).values('cita_id')
+            return Q(pk__in=citas_colaborador), is_admin_user
+
+        # CLIENTE: solo sus propias citas
+        return Q(user=user), is_admin_user
+
+    def _upcoming(self, base_queryset, limit):
+        """Próximas citas pendientes/confirmadas en una sola query."""
+        from django.db.models.functions import JSONObject
+        from .revenue import CitaColaborador, CitaServicio
+
+        citas = base_queryset.filter(
+            fecha__gte=timezone.now(),
+            estado__in=['Pendiente', 'Confirmada']
+        ).annotate(
+            sede_json=JSONObject(id='sede_id', nombre='sede__nombre'),
+            servicios_json=_relacionados_json(CitaServicio, 'servicio'),
+            colaboradores_json=_relacionados_json(CitaColaborador, 'colaborador'),
+        ).order_by('fecha').values(
+            'id', 'nombre', 'fecha', 'estado', 'confirmado',
+            'sede_json', 'servicios_json', 'colaboradores_json'
+        )[:limit]
+
+        # list() simple (no ReturnList) para poder guardarlo en cache
+        return list(CitaDashboardSerializer(list(citas), many=True).data)
+
 class HorarioViewSet(viewsets.ModelViewSet):
     queryset = Horario.objects.select_related('colaborador__sede').all()
     serializer_class = HorarioSerializer
@@ -920,13 +1000,14 @@ class AppointmentReportView(APIView):
                 ])
             return response
         else:
-            appointments_by_status = queryset.values('estado').annotate(count=Count('id'))
+            # Colapsar JOINs de servicios/colaboradores para no contar una cita varias veces
+            appointments_by_status = unique_citas(queryset).values('estado').annotate(count=Count('id')).order_by()
             status_counts = {item['estado']: item['count'] for item in appointments_by_status}
             report_list = [
                 {'estado': choice[0], 'count': status_counts.get(choice[0], 0)}
                 for choice in Cita.ESTADO_CHOICES
             ]
-            total_revenue = queryset.filter(estado='Asistio').aggregate(total=Sum(F('servicios__precio')))['total'] or 0
+            total_revenue = sum_revenue(queryset, estados=['Asistio'])
             return Response({'report': report_list, 'total_revenue': total_revenue})
 
 class SedeReportView(APIView):
@@ -963,6 +1044,12 @@ class SedeReportView(APIView):
         if administered_sedes is None:
             raise PermissionDenied(_("You do not have permission to access this report."))
 
+        # OPTIMIZACIÓN: ETag + cache versionado por tenant (se invalida con cualquier escritura)
+        return cached_report_response(
+            request, 'sede_summary', lambda: self._build_report(request, administered_sedes)
+        )
+
+    def _build_report(self, request, administered_sedes):
         start_date_str = request.query_params.get('start_date')
         end_date_str = request.query_params.get('end_date')
         specific_sede_id = request.query_params.get('sede_id')
@@ -998,26 +1085,21 @@ class SedeReportView(APIView):
         if colaborador_id:
             base_queryset = base_queryset.filter(colaboradores__id=colaborador_id)
 
-        total_revenue = base_queryset.filter(estado='Asistio').aggregate(total=Sum(F('servicios__precio')))['total'] or 0
+        total_revenue = sum_revenue(base_queryset, estados=['Asistio'])
 
         queryset = base_queryset
         if estado:
             queryset = queryset.filter(estado=estado)
 
-        report_data = queryset.values('sede__id', 'sede__nombre').annotate(
+        # El precio de cada cita se calcula una sola vez (subquery) antes de agrupar por sede
+        report_data = with_precio(queryset).values('sede__id', 'sede__nombre').annotate(
             total_citas=Count('id'),
-            pendientes=Count(Case(When(estado='Pendiente', then=1), output_field=IntegerField())),
-            confirmadas=Count(Case(When(estado='Confirmada', then=1), output_field=IntegerField())),
-            canceladas=Count(Case(When(estado='Cancelada', then=1), output_field=IntegerField())),
-            asistio=Count(Case(When(estado='Asistio', then=1), output_field=IntegerField())),
-            no_asistio=Count(Case(When(estado='No Asistio', then=1), output_field=IntegerField())),
-            ingresos=Sum(
-                Case(
-                    When(estado='Asistio', then=F('servicios__precio')),
-                    default=Value(0),
-                    output_field=DecimalField()
-                )
-            )
+            pendientes=Count('id', filter=Q(estado='Pendiente')),
+            confirmadas=Count('id', filter=Q(estado='Confirmada')),
+            canceladas=Count('id', filter=Q(estado='Cancelada')),
+            asistio=Count('id', filter=Q(estado='Asistio')),
+            no_asistio=Count('id', filter=Q(estado='No Asistio')),
+            ingresos=Sum('precio_total', filter=Q(estado='Asistio'))
         ).order_by('sede__nombre')
 
         response_data = []
@@ -1036,13 +1118,13 @@ class SedeReportView(APIView):
                 'ingresos': item['ingresos'] or 0
             })
         
-        services_summary = queryset.values('servicios__nombre').annotate(count=Count('servicios__nombre')).order_by('servicios__nombre')
-        resources_summary = queryset.values('colaboradores__nombre').annotate(count=Count('colaboradores__nombre')).order_by('colaboradores__nombre')
+        services_summary = count_by_servicio(queryset)
+        resources_summary = count_by_colaborador(queryset)
 
         final_response = {
             'reporte_por_sede': response_data,
-            'resumen_servicios': list(services_summary),
-            'resumen_recursos': list(resources_summary),
+            'resumen_servicios': services_summary,
+            'resumen_recursos': resources_summary,
             'ingresos_totales': total_revenue,
         }
 
@@ -8,13 +8,13 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 import logging
 
 from .models import Cita
 from .serializers import GuestCitaSerializer
+from .outbox import enqueue_notification
 
 # SECURITY: Import custom throttles
 from core.throttling import PublicBookingIPThrottle, PublicBookingEmailThrottle
@@ -80,75 +80,25 @@ class PublicCitaViewSet(viewsets.ModelViewSet):
             )
 
         # CREAR CITA DE INVITADO (sin crear usuario)
+        # La cita y sus notificaciones (outbox) se confirman juntas; el envío
+        # (WhatsApp, email con link para gestionar la cita) ocurre fuera del request
         import secrets
-        cita = serializer.save(
-            user=None,  # No asignar usuario
-            tipo_cita='invitado',
-            token_invitado=secrets.token_urlsafe(32)  # Token único para gestionar cita
-        )
-
-        # Enviar notificaciones de WhatsApp de forma asíncrona
-        try:
-            from .tasks_whatsapp import send_whatsapp_confirmation, schedule_appointment_reminders
-
-            # Enviar confirmación inmediata
-            send_whatsapp_confirmation.delay(cita.id)
-
-            # Programar recordatorios (24h y 1h antes)
-            schedule_appointment_reminders.delay(cita.id)
-        except Exception as e:
-            # No fallar la creación de la cita si el WhatsApp falla
-            logger.warning(f"Error al programar WhatsApp para cita {cita.id}: {str(e)}")
-
-        # Enviar email de confirmación con link para gestionar cita
-        email = cita.email_cliente
-        if email:
-            try:
-                # Preparar link para gestionar cita (ver/cancelar)
-                frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000')
-                manage_link = f"{frontend_url}/cita/{cita.id}?token={cita.token_invitado}"
-
-                # Preparar mensaje de email
-                servicios_nombres = ', '.join([s.nombre for s in cita.servicios.all()])
-                fecha_formateada = cita.fecha.strftime('%d/%m/%Y a las %H:%M')
-
-                subject = f'Cita Confirmada - {cita.sede.nombre}'
-                message = f"""
-Hola {cita.nombre},
-
-¡Tu cita ha sido confirmada exitosamente!
-
-📅 Fecha: {fecha_formateada}
-📍 Sede: {cita.sede.nombre}
-💼 Servicios: {servicios_nombres}
-
-Para ver los detalles de tu cita o cancelarla, usa este enlace:
-{manage_link}
-
-Este enlace es personal e intransferible.
-
-Por favor, llega 10 minutos antes de tu cita.
-
-Si no solicitaste esta cita, puedes ignorar este correo.
-
-¡Te esperamos!
-{cita.sede.organizacion.nombre}
-                """.strip()
+        with transaction.atomic():
+            cita = serializer.save(
+                user=None,  # No asignar usuario
+                tipo_cita='invitado',
+                token_invitado=secrets.token_urlsafe(32)  # Token único para gestionar cita
+            )
 
-                # Enviar email
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
-                    recipient_list=[email],
-                    fail_silently=True
-                )
+            # Confirmación inmediata y recordatorios (24h y 1h antes) por WhatsApp
+            enqueue_notification(cita, 'confirmation', ['whatsapp'])
+            enqueue_notification(cita, 'schedule_reminders', ['whatsapp'])
 
-                logger.info(f"Cita de invitado creada y email enviado a {email} (ID cita: {cita.id})")
+            email = cita.email_cliente
+            if email:
+                enqueue_notification(cita, 'guest_booking', ['email'])
 
-            except Exception as e:
-                logger.error(f"Error enviando magic link para cita {cita.id}: {str(e)}")
-                # No fallar la creación de la cita si el email falla
+        logger.info(f"Cita de invitado creada (ID cita: {cita.id}), email en cola: {bool(email)}")
 
         return Response(
             {
@@ -249,37 +199,14 @@ class InvitadoCitaView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Cancelar la cita
-        cita.estado = 'Cancelada'
-        cita.save()
+        # Cancelar la cita y registrar las notificaciones en el outbox
+        with transaction.atomic():
+            cita.estado = 'Cancelada'
+            cita.save()
 
-        # Enviar notificación de WhatsApp de cancelación
-        try:
-            from .tasks_whatsapp import send_whatsapp_cancellation
-            send_whatsapp_cancellation.delay(cita.id, reason="Cancelada por el cliente")
-        except Exception as e:
-            logger.warning(f"Error al enviar WhatsApp de cancelación para cita {cita.id}: {str(e)}")
-
-        # Enviar email de confirmación de cancelación
-        if cita.email_cliente:
-            try:
-                send_mail(
-                    subject=f'Cita Cancelada - {cita.sede.nombre}',
-                    message=f"""
-Hola {cita.nombre},
-
-Tu cita del {cita.fecha.strftime('%d/%m/%Y a las %H:%M')} ha sido cancelada exitosamente.
-
-Si deseas reagendar, puedes visitar nuestra página de agendamiento.
-
-{cita.sede.organizacion.nombre}
-                    """.strip(),
-                    from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
-                    recipient_list=[cita.email_cliente],
-                    fail_silently=True
-                )
-            except Exception as e:
-                logger.error(f"Error enviando email de cancelación: {str(e)}")
+            enqueue_notification(cita, 'cancellation', ['whatsapp'], reason="Cancelada por el cliente")
+            if cita.email_cliente:
+                enqueue_notification(cita, 'guest_cancellation', ['email'])
 
         return Response({
             'message': 'Cita cancelada exitosamente',
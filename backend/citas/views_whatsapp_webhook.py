@@ -6,11 +6,11 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.utils import timezone
 from django.db import connection
 import logging
 
-from .models_whatsapp import WhatsAppMessage
+from .models_whatsapp import WhatsAppMessage, TwilioMessageIndex
+from .whatsapp.status_buffer import SCHEMA_NAME_RE, UPDATE_FIELDS, apply_status_update, enqueue_status_callback
 from organizacion.thread_locals import set_current_organization
 
 logger = logging.getLogger(__name__)
@@ -27,6 +27,10 @@ class TwilioWhatsAppWebhook(APIView):
     - read: Mensaje leído por el destinatario
     - failed: Mensaje falló
 
+    OPTIMIZACIÓN: El callback se encola en un Redis Stream y se responde 200 de
+    inmediato; process_whatsapp_status_callbacks lo aplica por lotes
+    (ver citas/whatsapp/status_buffer.py). Sin Redis se procesa sincrónicamente.
+
     POST /api/citas/whatsapp-webhook/
     """
 
@@ -63,35 +67,18 @@ class TwilioWhatsAppWebhook(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        tenant_hint = request.query_params.get('tenant')
+
+        # OPTIMIZACIÓN: Encolar en el Redis Stream y responder de inmediato.
+        # El consumidor Celery aplica los callbacks por lotes (bulk_update por schema).
+        if enqueue_status_callback(message_sid, message_status, error_code, error_message, tenant_hint):
+            self._schedule_consumer()
+            return Response({'status': 'queued'}, status=status.HTTP_200_OK)
+
+        # Fallback sin Redis: procesar sincrónicamente
         try:
-            # Buscar mensaje por SID de Twilio en todos los schemas
-            # Primero intentamos encontrarlo y establecer el tenant correcto
-            whatsapp_msg = None
-
-            # Buscar en todos los schemas de tenants
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT schema_name
-                    FROM information_schema.schemata
-                    WHERE schema_name LIKE 'tenant_%' OR schema_name = 'public'
-                    ORDER BY schema_name
-                """)
-                schemas = [row[0] for row in cursor.fetchall()]
-
-            for schema in schemas:
-                with connection.cursor() as cursor:
-                    cursor.execute(f"SET search_path TO {schema}")
-
-                try:
-                    msg = WhatsAppMessage.objects.get(twilio_sid=message_sid)
-                    whatsapp_msg = msg
-                    # Establecer el tenant correcto
-                    if msg.organizacion:
-                        set_current_organization(msg.organizacion)
-                        logger.info(f"[Twilio Webhook] Found message in schema {schema}, org: {msg.organizacion.nombre}")
-                    break
-                except WhatsAppMessage.DoesNotExist:
-                    continue
+            # Resolver el tenant en O(1) (pista en la URL o índice global)
+            whatsapp_msg = self._find_message(message_sid, tenant_hint)
 
             if not whatsapp_msg:
                 logger.error(f"[Twilio Webhook] Message with SID {message_sid} not found in any schema")
@@ -100,38 +87,14 @@ class TwilioWhatsAppWebhook(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # Actualizar según el estado
-            if message_status == 'delivered':
-                whatsapp_msg.status = 'delivered'
-                whatsapp_msg.delivered_at = timezone.now()
-                whatsapp_msg.save(update_fields=['status', 'delivered_at', 'updated_at'])
-                logger.info(f"[Twilio Webhook] Message {message_sid} marked as delivered")
-
-            elif message_status == 'read':
-                whatsapp_msg.status = 'read'
-                if not whatsapp_msg.delivered_at:
-                    whatsapp_msg.delivered_at = timezone.now()
-                whatsapp_msg.save(update_fields=['status', 'delivered_at', 'updated_at'])
-                logger.info(f"[Twilio Webhook] Message {message_sid} marked as read")
-
-            elif message_status in ['failed', 'undelivered']:
-                whatsapp_msg.status = 'failed'
-                if error_code:
-                    whatsapp_msg.error_code = error_code
-                if error_message:
-                    whatsapp_msg.error_message = error_message
-                whatsapp_msg.save(update_fields=['status', 'error_code', 'error_message', 'updated_at'])
-                logger.warning(
-                    f"[Twilio Webhook] Message {message_sid} failed: "
-                    f"{error_code} - {error_message}"
-                )
+            if whatsapp_msg.organizacion:
+                # Establecer el tenant correcto
+                set_current_organization(whatsapp_msg.organizacion)
 
-            elif message_status == 'sent':
-                # Ya está marcado como sent cuando se envía
-                # Pero actualizamos twilio_status por si acaso
-                whatsapp_msg.twilio_status = message_status
-                whatsapp_msg.save(update_fields=['twilio_status', 'updated_at'])
-                logger.info(f"[Twilio Webhook] Message {message_sid} confirmed as sent")
+            # Actualizar según el estado (read > delivered > sent; callbacks atrasados se ignoran)
+            if apply_status_update(whatsapp_msg, message_status, error_code, error_message):
+                whatsapp_msg.save(update_fields=UPDATE_FIELDS)
+                logger.info(f"[Twilio Webhook] Message {message_sid} marked as {whatsapp_msg.status}")
 
             return Response({'status': 'success'}, status=status.HTTP_200_OK)
 
@@ -141,3 +104,66 @@ class TwilioWhatsAppWebhook(APIView):
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    def _schedule_consumer(self):
+        """
+        Programa el consumidor del stream como máximo una vez por segundo
+        (debounce con cache.add); la tarea periódica de Beat cubre el resto.
+        """
+        from django.core.cache import cache
+        from .tasks_whatsapp import process_whatsapp_status_callbacks
+
+        try:
+            if cache.add('whatsapp:status_consumer_scheduled', 1, timeout=1):
+                process_whatsapp_status_callbacks.apply_async(countdown=1)
+        except Exception as e:
+            logger.warning(f"[Twilio Webhook] No se pudo programar el consumidor: {e}")
+
+    def _set_search_path(self, schema_name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SET search_path TO {connection.ops.quote_name(schema_name)}, public")
+
+    def _get_in_schema(self, schema_name, **lookup):
+        self._set_search_path(schema_name)
+        return WhatsAppMessage.objects.select_related('organizacion').filter(**lookup).first()
+
+    def _find_message(self, message_sid, tenant_hint=None):
+        """
+        Localiza el WhatsAppMessage del SID dejando el search_path en su schema.
+
+        Orden de búsqueda:
+        1. Pista `?tenant=<schema>` incluida en el status_callback al enviar
+        2. Índice global public.citas_twilio_message_index (1 lookup indexado)
+        3. Fallback: recorrer schemas (solo mensajes enviados antes del índice);
+           si se encuentra, se indexa para los siguientes callbacks
+        """
+        if tenant_hint and SCHEMA_NAME_RE.match(tenant_hint):
+            msg = self._get_in_schema(tenant_hint, twilio_sid=message_sid)
+            if msg:
+                return msg
+
+        indexed = TwilioMessageIndex.resolve(message_sid)
+        if indexed:
+            schema_name, message_id = indexed
+            msg = self._get_in_schema(schema_name, pk=message_id, twilio_sid=message_sid)
+            if msg:
+                return msg
+
+        logger.warning(f"[Twilio Webhook] SID {message_sid} no indexado, buscando en todos los schemas")
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT schema_name
+                FROM information_schema.schemata
+                WHERE schema_name LIKE 'tenant_%' OR schema_name = 'public'
+                ORDER BY schema_name
+            """)
+            schemas = [row[0] for row in cursor.fetchall()]
+
+        for schema in schemas:
+            msg = self._get_in_schema(schema, twilio_sid=message_sid)
+            if msg:
+                logger.info(f"[Twilio Webhook] Found message in schema {schema}")
+                TwilioMessageIndex.register(message_sid, msg.pk)
+                return msg
+
+        return None
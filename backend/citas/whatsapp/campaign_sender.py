@@ -0,0 +1,324 @@
+"""
+Envío masivo de campañas de marketing por WhatsApp.
+
+ARQUITECTURA:
+- Los mensajes de la campaña se crean con UN bulk_create en estado 'pending'.
+- Celery divide los mensajes pendientes en chunks (ver tasks_whatsapp):
+  cada chunk se envía con un pool de hilos de concurrencia acotada.
+- Un token bucket por cuenta de Twilio (en Redis, compartido entre workers)
+  limita los mensajes por segundo para no recibir 429 de Twilio.
+- Los resultados se guardan por lotes (bulk_update + índice de SIDs + contadores
+  de la campaña con F()), así una campaña interrumpida se reanuda enviando solo
+  los mensajes que siguen en 'pending'.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from twilio.base.exceptions import TwilioRestException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MESSAGES_PER_SECOND = 10
+CHUNK_SIZE = 200
+FLUSH_EVERY = 50
+
+# Token bucket atómico en Redis: recarga según el tiempo transcurrido y toma 1 token.
+# Retorna {permitido (0/1), segundos a esperar}
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+class TokenBucket:
+    """
+    Limitador de tasa (token bucket).
+
+    Con `redis_conn` el bucket se comparte entre procesos/workers (clave por
+    cuenta de Twilio); sin él se usa un bucket local al proceso.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 key: Optional[str] = None, redis_conn=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.key = key
+        self.redis_conn = redis_conn
+        self._script = redis_conn.register_script(TOKEN_BUCKET_LUA) if redis_conn is not None else None
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._ts = time.monotonic()
+
+    def _try_take_local(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def _try_take_redis(self) -> float:
+        allowed, wait = self._script(keys=[self.key], args=[self.rate, self.capacity, time.time()])
+        return 0.0 if int(allowed) else float(wait)
+
+    def acquire(self, timeout: float = 60.0) -> bool:
+        """
+        Bloquea hasta obtener un token.
+
+        Returns:
+            True si se obtuvo el token, False si se agotó el timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._try_take_redis() if self._script else self._try_take_local()
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def bucket_for_account(account_sid: str) -> TokenBucket:
+    """Token bucket compartido (Redis) para la cuenta de Twilio; local si Redis no responde."""
+    rate = getattr(settings, 'TWILIO_MESSAGES_PER_SECOND', DEFAULT_MESSAGES_PER_SECOND)
+    try:
+        from django_redis import get_redis_connection
+        redis_conn = get_redis_connection('default')
+        redis_conn.ping()
+        return TokenBucket(rate, key=f'twilio:rate:{account_sid}', redis_conn=redis_conn)
+    except Exception as e:
+        logger.warning(f"[WhatsApp] Token bucket en Redis no disponible, usando límite local: {e}")
+        return TokenBucket(rate)
+
+
+@dataclass
+class OutgoingMessage:
+    message_id: int
+    to: str
+    body: str
+    media_url: Optional[str] = None
+
+
+@dataclass
+class SendResult:
+    message_id: int
+    sid: Optional[str] = None
+    twilio_status: Optional[str] = None
+    error_code: Optional[str] = None
+    error_message: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.sid is not None
+
+
+class CampaignSender:
+    """
+    Envía mensajes a Twilio con concurrencia acotada y límite de tasa.
+    No toca la BD: entrega los resultados por lotes a `on_batch`.
+    """
+
+    def __init__(self, client, from_number: str, status_callback: Optional[str] = None,
+                 bucket: Optional[TokenBucket] = None, concurrency: int = DEFAULT_CONCURRENCY):
+        self.client = client
+        self.from_number = from_number
+        self.status_callback = status_callback
+        self.bucket = bucket
+        self.concurrency = concurrency
+
+    def _send_one(self, outgoing: OutgoingMessage) -> SendResult:
+        if self.bucket and not self.bucket.acquire():
+            return SendResult(outgoing.message_id, error_code='RATE', error_message='Rate limit timeout')
+
+        params = {'from_': self.from_number, 'to': outgoing.to, 'body': outgoing.body}
+        if self.status_callback:
+            params['status_callback'] = self.status_callback
+        if outgoing.media_url:
+            params['media_url'] = [outgoing.media_url]
+
+        try:
+            message = self.client.messages.create(**params)
+            return SendResult(outgoing.message_id, sid=message.sid, twilio_status=message.status)
+        except TwilioRestException as e:
+            return SendResult(outgoing.message_id, error_code=str(e.code), error_message=e.msg)
+        except Exception as e:
+            return SendResult(outgoing.message_id, error_code='UNKNOWN', error_message=str(e))
+
+    def send_many(self, messages: Iterable[OutgoingMessage],
+                  on_batch: Optional[Callable[[List[SendResult]], None]] = None,
+                  batch_size: int = FLUSH_EVERY) -> List[SendResult]:
+        """
+        Envía los mensajes y entrega los resultados a `on_batch` cada `batch_size`.
+
+        Returns:
+            Lista con todos los resultados
+        """
+        results = []
+        pending_batch = []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='whatsapp-send') as executor:
+            futures = [executor.submit(self._send_one, message) for message in messages]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                pending_batch.append(result)
+                if on_batch and len(pending_batch) >= batch_size:
+                    on_batch(pending_batch)
+                    pending_batch = []
+        if on_batch and pending_batch:
+            on_batch(pending_batch)
+        return results
+
+
+# ---------------------------------------------------------------------------
+# Persistencia
+# ---------------------------------------------------------------------------
+
+def create_campaign(organizacion, recipients, message_body, media_url=None, created_by=None):
+    """
+    Crea la campaña y sus mensajes (un bulk_create) en estado 'pending'.
+
+    Args:
+        organizacion: Organización que envía
+        recipients: Lista de tuplas (telefono, nombre)
+        message_body: Texto del mensaje
+        media_url: URL de imagen/media (opcional)
+        created_by: Usuario que lanza la campaña
+
+    Returns:
+        WhatsAppCampaign
+    """
+    from ..models_whatsapp import WhatsAppCampaign, WhatsAppMessage
+
+    campaign = WhatsAppCampaign.objects.create(
+        organizacion_id=organizacion.id,
+        created_by=created_by,
+        message_body=message_body,
+        media_url=media_url,
+        total=len(recipients),
+    )
+    WhatsAppMessage.objects.bulk_create(
+        [
+            WhatsAppMessage(
+                campaign=campaign,
+                cita=None,  # No asociado a cita específica
+                organizacion_id=organizacion.id,
+                message_type='marketing',
+                recipient_phone=phone,
+                recipient_name=name,
+                message_body=message_body,
+                status='pending',
+            )
+            for phone, name in recipients
+        ],
+        batch_size=1000,
+    )
+    return campaign
+
+
+def persist_results(campaign_id, results: List[SendResult]):
+    """
+    Guarda un lote de resultados: un bulk_update de mensajes, un upsert del
+    índice de SIDs y una actualización de contadores de la campaña.
+    """
+    from ..models_whatsapp import TwilioMessageIndex, WhatsAppCampaign, WhatsAppMessage
+
+    if not results:
+        return
+    by_id = {result.message_id: result for result in results}
+    messages = list(WhatsAppMessage.objects.filter(id__in=by_id.keys(), status='pending'))
+
+    now = timezone.now()
+    sent = failed = 0
+    for msg in messages:
+        result = by_id[msg.id]
+        if result.ok:
+            msg.status = 'sent'
+            msg.twilio_sid = result.sid
+            msg.twilio_status = result.twilio_status
+            msg.sent_at = now
+            sent += 1
+        else:
+            msg.status = 'failed'
+            msg.error_code = (result.error_code or '')[:10]
+            msg.error_message = result.error_message
+            failed += 1
+        msg.updated_at = now  # bulk_update no aplica auto_now
+
+    WhatsAppMessage.objects.bulk_update(
+        messages,
+        ['status', 'twilio_sid', 'twilio_status', 'sent_at', 'error_code', 'error_message', 'updated_at'],
+    )
+    TwilioMessageIndex.register_many(
+        [(msg.twilio_sid, msg.id) for msg in messages if msg.status == 'sent']
+    )
+    if campaign_id:
+        WhatsAppCampaign.objects.filter(pk=campaign_id).update(
+            sent_count=F('sent_count') + sent,
+            failed_count=F('failed_count') + failed,
+            updated_at=now,
+        )
+
+    # Panel en tiempo real: un evento por lote, no uno por mensaje
+    from organizacion.activity_events import publish_event
+    organizacion_id = messages[0].organizacion_id if messages else None
+    if sent:
+        publish_event('message_sent', organizacion_id, count=sent, campaign_id=campaign_id)
+    if failed:
+        publish_event('message_failed', organizacion_id, count=failed, campaign_id=campaign_id)
+
+
+def send_campaign_messages(campaign_id, message_ids, sender: CampaignSender):
+    """
+    Envía los mensajes indicados que sigan en 'pending' (reanudable).
+
+    Returns:
+        Tupla (enviados, fallidos)
+    """
+    from ..models_whatsapp import WhatsAppMessage
+
+    pending = WhatsAppMessage.objects.filter(
+        id__in=message_ids, status='pending'
+    ).select_related('campaign').only(
+        'id', 'recipient_phone', 'message_body', 'campaign__media_url'
+    )
+
+    from .whatsapp_service import whatsapp_service
+    outgoing = [
+        OutgoingMessage(
+            message_id=msg.id,
+            to=whatsapp_service.format_phone_number(msg.recipient_phone),
+            body=msg.message_body,
+            media_url=msg.campaign.media_url if msg.campaign else None,
+        )
+        for msg in pending
+    ]
+
+    results = sender.send_many(outgoing, on_batch=lambda batch: persist_results(campaign_id, batch))
+    sent = sum(1 for result in results if result.ok)
+    return sent, len(results) - sent
@@ -0,0 +1,229 @@
+"""
+Plantillas de WhatsApp por organización, validadas y precompiladas.
+
+Cada plantilla (texto con placeholders `{nombre}`, `{fecha}`, ...) se parsea
+UNA vez por proceso y por (organización, tipo de mensaje) en una lista de
+segmentos (texto literal, placeholder). Renderizar es solo concatenar, sin
+volver a parsear ni capturar KeyError por destinatario.
+
+- Las plantillas se validan al guardar la Organizacion (ver
+  Organizacion.clean): solo se aceptan placeholders conocidos del tipo de
+  mensaje y sin acceso a atributos/índices (`{nombre.__class__}`).
+- Una plantilla inválida guardada antes de la validación se reemplaza por la
+  plantilla por defecto (se registra un warning una sola vez por proceso).
+- La clave de cache incluye el texto de la plantilla: si la organización la
+  cambia, la siguiente renderización compila la nueva sin invalidar nada.
+"""
+import logging
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+BASE_PLACEHOLDERS = frozenset({
+    'nombre', 'fecha', 'hora', 'sede', 'servicios', 'colaboradores', 'sender_name',
+})
+
+# Placeholders permitidos por tipo de mensaje
+ALLOWED_PLACEHOLDERS = {
+    'confirmation': BASE_PLACEHOLDERS,
+    'reminder_24h': BASE_PLACEHOLDERS,
+    'reminder_1h': BASE_PLACEHOLDERS,
+    'cancellation': BASE_PLACEHOLDERS | {'razon'},
+}
+
+# Campo de Organizacion con la plantilla personalizada de cada tipo
+TEMPLATE_FIELDS = {
+    'confirmation': 'whatsapp_template_confirmation',
+    'reminder_24h': 'whatsapp_template_reminder_24h',
+    'reminder_1h': 'whatsapp_template_reminder_1h',
+    'cancellation': 'whatsapp_template_cancellation',
+}
+
+DEFAULT_TEMPLATES = {
+    'confirmation': """🔔 *{sender_name}*
+
+¡Hola {nombre}!
+
+Tu cita ha sido confirmada:
+
+📅 *Fecha:* {fecha} a las {hora}
+📍 *Sede:* {sede}
+💼 *Servicios:* {servicios}
+
+Te esperamos 10 minutos antes de tu cita.
+
+Si necesitas cancelar o reprogramar, por favor contáctanos lo antes posible.
+
+¡Gracias por preferirnos!""",
+
+    'reminder_24h': """⏰ *Recordatorio - {sender_name}*
+
+Hola {nombre},
+
+Te recordamos que mañana tienes tu cita:
+
+📅 *Fecha:* {fecha} a las {hora}
+📍 *Sede:* {sede}
+
+Nos vemos mañana. ¡No faltes! 😊""",
+
+    'reminder_1h': """🔔 *Recordatorio - {sender_name}*
+
+Hola {nombre},
+
+Tu cita es en 1 hora:
+
+🕐 *Hora:* {hora}
+📍 *Sede:* {sede}
+
+Te esperamos. Por favor llega a tiempo. ⏰""",
+
+    'cancellation': """❌ *Cancelación - {sender_name}*
+
+Hola {nombre},
+
+Tu cita ha sido cancelada:
+
+📅 *Fecha que tenías:* {fecha} a las {hora}
+📍 *Sede:* {sede}
+*Razón:* {razon}
+
+Si deseas reagendar, por favor contáctanos.
+
+Gracias por tu comprensión.""",
+}
+
+
+class TemplateError(ValueError):
+    """Plantilla con sintaxis inválida o placeholders no permitidos."""
+
+
+class CompiledTemplate:
+    """
+    Plantilla parseada: segmentos (literal, placeholder, format_spec, conversion).
+    """
+
+    __slots__ = ('segments', 'placeholders')
+
+    def __init__(self, segments: List[Tuple[str, str, str, str]]):
+        self.segments = segments
+        self.placeholders = frozenset(field for _literal, field, _spec, _conv in segments if field)
+
+    def render(self, context: Dict[str, object]) -> str:
+        """
+        Renderiza con el contexto. Los placeholders faltantes quedan vacíos
+        (el contexto de los envíos siempre trae todas las variables del tipo).
+        """
+        parts = []
+        for literal, field, spec, conversion in self.segments:
+            parts.append(literal)
+            if field:
+                value = context.get(field, '')
+                if conversion == 'r':
+                    value = repr(value)
+                elif conversion == 'a':
+                    value = ascii(value)
+                parts.append(format(value, spec) if spec else str(value))
+        return ''.join(parts)
+
+
+def compile_template(template: str, message_type: str) -> CompiledTemplate:
+    """
+    Parsea y valida una plantilla.
+
+    Raises:
+        TemplateError: sintaxis inválida, placeholders desconocidos o con
+            acceso a atributos/índices
+    """
+    allowed = ALLOWED_PLACEHOLDERS[message_type]
+    try:
+        parsed = list(Formatter().parse(template))
+    except ValueError as e:
+        raise TemplateError(f"Sintaxis inválida: {e}") from e
+
+    segments = []
+    desconocidos = []
+    for literal, field, spec, conversion in parsed:
+        if field is not None:
+            if field not in allowed:
+                # También rechaza {0}, {} y accesos como {nombre.upper} o {nombre[0]}
+                desconocidos.append(field or '{}')
+                continue
+            if spec and ('{' in spec):
+                raise TemplateError(f"Formato anidado no permitido en {{{field}}}")
+        segments.append((literal, field or '', spec or '', conversion or ''))
+
+    if desconocidos:
+        permitidos = ', '.join(f'{{{name}}}' for name in sorted(allowed))
+        raise TemplateError(
+            f"Variables no permitidas: {', '.join(sorted(set(desconocidos)))}. Usa: {permitidos}"
+        )
+
+    compiled = CompiledTemplate(segments)
+    # Verificar format specs (ej: {fecha:>10}) con un valor de prueba
+    try:
+        compiled.render({name: '' for name in compiled.placeholders})
+    except (ValueError, TypeError) as e:
+        raise TemplateError(f"Formato inválido: {e}") from e
+    return compiled
+
+
+def validate_template(template: str, message_type: str) -> frozenset:
+    """
+    Valida una plantilla personalizada (vacía = usar la de por defecto).
+
+    Returns:
+        Placeholders usados por la plantilla
+
+    Raises:
+        TemplateError
+    """
+    if not template or not template.strip():
+        return frozenset()
+    return compile_template(template, message_type).placeholders
+
+
+@lru_cache(maxsize=1024)
+def _compiled_for(organizacion_id, message_type: str, template: str) -> CompiledTemplate:
+    if template and template.strip():
+        try:
+            return compile_template(template, message_type)
+        except TemplateError as e:
+            logger.warning(
+                f"[WhatsApp] Plantilla {message_type} inválida en organización {organizacion_id}, "
+                f"usando la plantilla por defecto: {e}"
+            )
+    return _default_template(message_type)
+
+
+@lru_cache(maxsize=None)
+def _default_template(message_type: str) -> CompiledTemplate:
+    return compile_template(DEFAULT_TEMPLATES[message_type], message_type)
+
+
+def get_template(organizacion, message_type: str) -> CompiledTemplate:
+    """
+    Plantilla compilada de la organización para el tipo de mensaje
+    (la personalizada si es válida, si no la de por defecto).
+    """
+    template = getattr(organizacion, TEMPLATE_FIELDS[message_type], '') or ''
+    return _compiled_for(organizacion.pk, message_type, template)
+
+
+def render(organizacion, message_type: str, context: Dict[str, object]) -> str:
+    """Renderiza un mensaje con la plantilla compilada de la organización."""
+    return get_template(organizacion, message_type).render(context)
+
+
+def render_many(organizacion, message_type: str, contexts: Iterable[Dict[str, object]]) -> List[str]:
+    """
+    Renderiza un mensaje por contexto con UNA sola búsqueda de la plantilla
+    compilada (envíos masivos).
+
+    Returns:
+        Lista de mensajes en el mismo orden que los contextos
+    """
+    compiled = get_template(organizacion, message_type)
+    return [compiled.render(context) for context in contexts]
@@ -0,0 +1,153 @@
+"""
+Planificador de recordatorios de WhatsApp por lotes.
+
+`plan_reminders(cita_ids)` calcula los recordatorios 24h/1h de muchas citas
+con un número fijo de consultas por lote (sin importar cuántas citas sean):
+
+1. Un SELECT de las citas (con sede y organización).
+2. Un SELECT de los recordatorios existentes de esas citas.
+3. Un DELETE de los recordatorios pendientes que ya no corresponden (cita
+   cancelada, WhatsApp deshabilitado, sin teléfono o el nuevo horario ya pasó).
+4. Un INSERT ... ON CONFLICT (cita, reminder_type) DO UPDATE
+   (bulk_create(update_conflicts=True)): al reprogramar una cita se actualiza
+   scheduled_time en la misma fila, sin get_or_create por recordatorio.
+
+Un recordatorio ya enviado solo se vuelve a armar si la cita cambió de
+horario; volver a planificar una cita sin cambios no reenvía nada.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PLAN_BATCH_SIZE = 500
+
+REMINDER_OFFSETS = {
+    '24h': timedelta(hours=24),
+    '1h': timedelta(hours=1),
+}
+
+# Campo de Organizacion que habilita cada tipo de recordatorio
+REMINDER_ENABLED_FIELDS = {
+    '24h': 'whatsapp_reminder_24h_enabled',
+    '1h': 'whatsapp_reminder_1h_enabled',
+}
+
+
+def desired_reminders(cita, now):
+    """
+    Recordatorios que le corresponden a una cita.
+
+    Args:
+        cita: Cita con sede__organizacion cargada
+        now: Momento actual
+
+    Returns:
+        dict {reminder_type: scheduled_time}
+    """
+    org = cita.sede.organizacion
+    if org is None or not org.whatsapp_enabled:
+        return {}
+    if cita.estado == 'Cancelada' or not cita.telefono_cliente:
+        return {}
+
+    desired = {}
+    for reminder_type, offset in REMINDER_OFFSETS.items():
+        scheduled_time = cita.fecha - offset
+        # Solo programar si todavía falta más que el offset
+        if getattr(org, REMINDER_ENABLED_FIELDS[reminder_type]) and scheduled_time > now:
+            desired[reminder_type] = scheduled_time
+    return desired
+
+
+def _plan_batch(cita_ids, now):
+    from ..models import Cita
+    from ..models_whatsapp import WhatsAppReminderSchedule
+    from . import reminder_scheduler
+
+    citas = Cita.all_objects.select_related('sede__organizacion').filter(id__in=cita_ids)
+    desired = {}
+    for cita in citas:
+        for reminder_type, scheduled_time in desired_reminders(cita, now).items():
+            desired[(cita.id, reminder_type)] = scheduled_time
+
+    existing = WhatsAppReminderSchedule.objects.filter(cita_id__in=cita_ids).values_list(
+        'id', 'cita_id', 'reminder_type', 'scheduled_time', 'is_sent'
+    )
+
+    stale_ids = []
+    unchanged_sent = set()
+    for reminder_id, cita_id, reminder_type, scheduled_time, is_sent in existing:
+        key = (cita_id, reminder_type)
+        if key not in desired:
+            if not is_sent:
+                stale_ids.append(reminder_id)
+        elif is_sent and scheduled_time == desired[key]:
+            # Ya enviado para este mismo horario
+            unchanged_sent.add(key)
+
+    rows = [
+        WhatsAppReminderSchedule(
+            cita_id=cita_id,
+            reminder_type=reminder_type,
+            scheduled_time=scheduled_time,
+            is_sent=False,
+            sent_at=None,
+            claimed_at=None,
+            claimed_by='',
+            created_at=now,
+            updated_at=now,
+        )
+        for (cita_id, reminder_type), scheduled_time in desired.items()
+        if (cita_id, reminder_type) not in unchanged_sent
+    ]
+
+    with transaction.atomic():
+        if stale_ids:
+            WhatsAppReminderSchedule.objects.filter(id__in=stale_ids, is_sent=False).delete()
+        if rows:
+            # PostgreSQL devuelve los IDs también de las filas actualizadas
+            WhatsAppReminderSchedule.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['cita', 'reminder_type'],
+                update_fields=[
+                    'scheduled_time', 'is_sent', 'sent_at', 'claimed_at', 'claimed_by', 'updated_at',
+                ],
+            )
+
+    # Redis: ZADD actualiza el score de los reprogramados
+    reminder_scheduler.unschedule_reminders(stale_ids)
+    reminder_scheduler.schedule_reminders(rows)
+    return len(rows), len(stale_ids)
+
+
+def plan_reminders(cita_ids, batch_size=PLAN_BATCH_SIZE):
+    """
+    Crea, reprograma o elimina los recordatorios de muchas citas del schema actual.
+
+    Args:
+        cita_ids: IDs de las citas (nuevas, reprogramadas o canceladas)
+        batch_size: Citas por lote
+
+    Returns:
+        dict con scheduled (filas creadas/actualizadas) y deleted
+    """
+    cita_ids = list(dict.fromkeys(cita_ids))
+    now = timezone.now()
+    result = {'scheduled': 0, 'deleted': 0}
+
+    for start in range(0, len(cita_ids), batch_size):
+        scheduled, deleted = _plan_batch(cita_ids[start:start + batch_size], now)
+        result['scheduled'] += scheduled
+        result['deleted'] += deleted
+
+    if cita_ids:
+        logger.info(
+            f"[WhatsApp] Recordatorios planificados para {len(cita_ids)} citas: "
+            f"{result['scheduled']} programados, {result['deleted']} eliminados"
+        )
+    return result
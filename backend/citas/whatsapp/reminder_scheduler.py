@@ -0,0 +1,287 @@
+"""
+Programador de recordatorios de WhatsApp sobre un Redis sorted set.
+
+En lugar de consultar WhatsAppReminderSchedule cada 5 minutos:
+
+- `schedule_appointment_reminders` agrega cada recordatorio al sorted set de
+  su tenant (`whatsapp:reminders:due:<schema>`) con score = scheduled_time
+  (epoch). El miembro es "<schema>:<id>" para que el envío sepa en qué tenant
+  buscar el recordatorio; SCHEMAS_KEY guarda los schemas con sorted set.
+- Un dispatcher liviano (Beat, cada pocos segundos) recorre los tenants en
+  round-robin y saca atómicamente (Lua: ZRANGEBYSCORE + ZREM) como mucho
+  PER_TENANT_DISPATCH_LIMIT recordatorios vencidos de cada uno, encolando una
+  tarea de envío por recordatorio. Un tenant con mucho backlog no llena el
+  despacho de los demás. No hay table scans y el retraso máximo es el
+  intervalo del dispatcher.
+- La BD sigue siendo la fuente de verdad: `rebuild_from_db` reconstruye el set
+  con los recordatorios pendientes (p. ej. después de perder Redis).
+
+Reclamo multi-worker: antes de enviar, un worker marca el recordatorio como
+"en curso" (claimed_at/claimed_by). Los lotes se reclaman con
+SELECT ... FOR UPDATE SKIP LOCKED, así N workers se reparten el backlog sin
+enviar dos veces el mismo recordatorio. Un reclamo más viejo que
+CLAIM_TIMEOUT (worker caído a mitad del envío) se considera abandonado y el
+recordatorio vuelve a estar disponible.
+"""
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..tenant_schemas import current_schema
+
+logger = logging.getLogger(__name__)
+
+ZSET_KEY_PREFIX = 'whatsapp:reminders:due'
+SCHEMAS_KEY = 'whatsapp:reminders:schemas'
+ROUND_ROBIN_KEY = 'whatsapp:reminders:round_robin'
+PER_TENANT_DISPATCH_LIMIT = 200  # Recordatorios por tenant y ejecución del dispatcher
+REBUILD_CHUNK_SIZE = 1000
+CLAIM_BATCH_SIZE = 100
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Saca atómicamente hasta ARGV[2] miembros con score <= ARGV[1].
+# Dos dispatchers concurrentes nunca obtienen el mismo miembro.
+POP_DUE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def zset_key(schema_name):
+    return f'{ZSET_KEY_PREFIX}:{schema_name}'
+
+
+def _member(schema_name, reminder_id):
+    return f'{schema_name}:{reminder_id}'
+
+
+def _schemas(redis_conn):
+    """Schemas con sorted set de recordatorios (orden estable)."""
+    return sorted(
+        schema.decode() if isinstance(schema, bytes) else schema
+        for schema in redis_conn.smembers(SCHEMAS_KEY)
+    )
+
+
+def parse_member(member):
+    """
+    Returns:
+        Tupla (schema_name, reminder_id)
+    """
+    if isinstance(member, bytes):
+        member = member.decode()
+    schema_name, _, reminder_id = member.rpartition(':')
+    return schema_name, int(reminder_id)
+
+
+def schedule_reminders(reminders, schema_name=None):
+    """
+    Agrega (o reprograma) recordatorios en el sorted set.
+
+    Args:
+        reminders: Iterable de WhatsAppReminderSchedule
+        schema_name: Schema de los recordatorios (por defecto el actual)
+
+    Returns:
+        True si quedaron en Redis, False si Redis no está disponible
+        (la reconciliación los agregará después)
+    """
+    reminders = [reminder for reminder in reminders if not reminder.is_sent]
+    if not reminders:
+        return True
+
+    schema_name = schema_name or current_schema()
+    mapping = {
+        _member(schema_name, reminder.id): reminder.scheduled_time.timestamp()
+        for reminder in reminders
+    }
+
+    try:
+        redis_conn = _redis()
+        redis_conn.zadd(zset_key(schema_name), mapping)
+        redis_conn.sadd(SCHEMAS_KEY, schema_name)
+        return True
+    except Exception as e:
+        logger.warning(f"[WhatsApp] No se pudieron programar {len(mapping)} recordatorios en Redis: {e}")
+        return False
+
+
+def unschedule_reminders(reminder_ids, schema_name=None):
+    """Quita recordatorios del sorted set (ej: cita cancelada o eliminada)."""
+    schema_name = schema_name or current_schema()
+    members = [_member(schema_name, reminder_id) for reminder_id in reminder_ids]
+    if not members:
+        return
+    try:
+        _redis().zrem(zset_key(schema_name), *members)
+    except Exception as e:
+        logger.warning(f"[WhatsApp] No se pudieron quitar recordatorios de Redis: {e}")
+
+
+def pop_due(now_ts, per_tenant=PER_TENANT_DISPATCH_LIMIT):
+    """
+    Saca los recordatorios vencidos, como mucho `per_tenant` por tenant.
+
+    Los tenants se recorren en round-robin empezando cada vez por uno
+    distinto, así el orden de encolado también se reparte entre tenants.
+
+    Args:
+        now_ts: Epoch actual
+        per_tenant: Máximo de recordatorios a sacar de cada tenant
+
+    Returns:
+        Lista de tuplas (schema_name, reminder_id)
+    """
+    redis_conn = _redis()
+    schemas = _schemas(redis_conn)
+    if not schemas:
+        return []
+
+    start = redis_conn.incr(ROUND_ROBIN_KEY) % len(schemas)
+    script = redis_conn.register_script(POP_DUE_LUA)
+    due = []
+    for schema_name in schemas[start:] + schemas[:start]:
+        members = script(keys=[zset_key(schema_name)], args=[now_ts, per_tenant])
+        due.extend(parse_member(member) for member in members)
+    return due
+
+
+def pending_count():
+    """Recordatorios en los sets (vencidos o futuros); None si Redis no responde."""
+    try:
+        redis_conn = _redis()
+        return sum(redis_conn.zcard(zset_key(schema_name)) for schema_name in _schemas(redis_conn))
+    except Exception:
+        return None
+
+
+def rebuild_from_db(schema_name=None):
+    """
+    Reconciliación: agrega al set todos los recordatorios pendientes del schema.
+
+    ZADD es idempotente (solo actualiza el score), así que puede ejecutarse
+    periódicamente sin duplicar envíos; la tarea de envío además reclama el
+    recordatorio (ver `claim_reminder`) antes de enviarlo.
+
+    Returns:
+        Número de recordatorios pendientes agregados
+    """
+    from ..models_whatsapp import WhatsAppReminderSchedule
+
+    schema_name = schema_name or current_schema()
+    redis_conn = _redis()
+    key = zset_key(schema_name)
+    redis_conn.sadd(SCHEMAS_KEY, schema_name)
+
+    pending = WhatsAppReminderSchedule.objects.filter(is_sent=False).values_list('id', 'scheduled_time')
+    total = 0
+    mapping = {}
+    for reminder_id, scheduled_time in pending.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        mapping[_member(schema_name, reminder_id)] = scheduled_time.timestamp()
+        if len(mapping) >= REBUILD_CHUNK_SIZE:
+            redis_conn.zadd(key, mapping)
+            total += len(mapping)
+            mapping = {}
+    if mapping:
+        redis_conn.zadd(key, mapping)
+        total += len(mapping)
+    return total
+
+
+# ---------------------------------------------------------------------------
+# Reclamo de recordatorios (seguro con varios workers)
+# ---------------------------------------------------------------------------
+
+def worker_name():
+    return f'{socket.gethostname()}-{os.getpid()}'[:100]
+
+
+def _claimable(now):
+    """Recordatorios sin reclamo o con un reclamo abandonado."""
+    return Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - CLAIM_TIMEOUT)
+
+
+def claim_due_reminders(batch_size=CLAIM_BATCH_SIZE, worker=None):
+    """
+    Reclama un lote de recordatorios vencidos para este worker.
+
+    Las filas bloqueadas por otro worker se saltan (SKIP LOCKED) y las
+    reclamadas se marcan en curso antes de liberar el lock, así que ningún
+    otro worker las vuelve a tomar mientras se envían.
+
+    Returns:
+        Lista de IDs reclamados (ordenados por scheduled_time)
+    """
+    from ..models_whatsapp import WhatsAppReminderSchedule
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            WhatsAppReminderSchedule.objects
+            .select_for_update(skip_locked=True)
+            .filter(_claimable(now), is_sent=False, scheduled_time__lte=now)
+            .order_by('scheduled_time')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            WhatsAppReminderSchedule.objects.filter(id__in=ids).update(
+                claimed_at=now, claimed_by=worker or worker_name()
+            )
+    return ids
+
+
+def claim_reminder(reminder_id, worker=None):
+    """
+    Reclama un recordatorio puntual (envío despachado desde el sorted set).
+
+    Es un UPDATE condicional: solo un worker puede ganar el reclamo.
+
+    Returns:
+        True si este worker obtuvo el recordatorio
+    """
+    from ..models_whatsapp import WhatsAppReminderSchedule
+
+    now = timezone.now()
+    return WhatsAppReminderSchedule.objects.filter(
+        _claimable(now), id=reminder_id, is_sent=False
+    ).update(claimed_at=now, claimed_by=worker or worker_name()) == 1
+
+
+def release_reminders(reminder_ids):
+    """Libera reclamos (error al enviar) para que otro intento los tome."""
+    from ..models_whatsapp import WhatsAppReminderSchedule
+
+    if reminder_ids:
+        WhatsAppReminderSchedule.objects.filter(id__in=reminder_ids, is_sent=False).update(
+            claimed_at=None, claimed_by=''
+        )
+
+
+def recover_stale_claims():
+    """
+    Libera los recordatorios que quedaron en curso por un worker caído.
+
+    Returns:
+        Número de recordatorios recuperados
+    """
+    from ..models_whatsapp import WhatsAppReminderSchedule
+
+    recovered = WhatsAppReminderSchedule.objects.filter(
+        is_sent=False, claimed_at__lt=timezone.now() - CLAIM_TIMEOUT
+    ).update(claimed_at=None, claimed_by='')
+    if recovered:
+        logger.warning(f"[WhatsApp] {recovered} recordatorios en curso abandonados recuperados")
+    return recovered
@@ -0,0 +1,373 @@
+"""
+Buffer de callbacks de estado de Twilio en un Redis Stream.
+
+El webhook solo hace XADD y responde 200 (latencia constante). Un consumidor
+Celery (`process_whatsapp_status_callbacks`) lee los callbacks por lotes:
+
+1. Colapsa los callbacks del mismo SID quedándose con el estado más avanzado.
+2. Resuelve el schema de cada SID (pista del callback o índice global).
+3. Por schema: carga los mensajes en UNA query, aplica el orden de estados
+   (read > delivered > sent; los callbacks atrasados se ignoran) y guarda con
+   UN bulk_update.
+
+Los SIDs que todavía no existen (el callback llegó antes de que se guardara el
+SID al enviar) se reintentan hasta MAX_ATTEMPTS veces con backoff: esperan en
+el sorted set DELAYED_KEY (score = instante a partir del cual reintentar) y se
+devuelven al stream al vencer. Así los reintentos cubren los segundos que el
+envío masivo tarda en guardar los SIDs (ver campaign_sender.FLUSH_EVERY) en vez
+de agotarse en la misma ejecución del consumidor.
+
+Si un lote falla, sus entradas quedan pendientes y se reclaman en la siguiente
+ejecución. Las que ya se entregaron MAX_DELIVERIES veces se mueven al stream
+DEAD_LETTER_KEY (con su ID original y el número de entregas) para que un
+callback que siempre falla no bloquee el resto del lote.
+"""
+import json
+import logging
+import os
+import re
+import socket
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'whatsapp:status_callbacks'
+CONSUMER_GROUP = 'status-appliers'
+STREAM_MAXLEN = 200000  # Cota aproximada para no crecer sin límite si el consumidor cae
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 5
+CLAIM_IDLE_MS = 60000  # Reclamar entradas de consumidores caídos después de 60s
+MAX_DELIVERIES = 5  # Entregas de una entrada antes de moverla al dead-letter stream
+DEAD_LETTER_KEY = 'whatsapp:status_callbacks:dead'
+DEAD_LETTER_MAXLEN = 10000
+DELAYED_KEY = 'whatsapp:status_callbacks:delayed'
+RETRY_BASE_DELAY = 5  # Segundos; backoff 5, 10, 20, 40 (~75s en total)
+
+# Orden de los estados: solo se aplica un callback si avanza el estado actual
+STATUS_RANK = {
+    'pending': 0,
+    'queued': 1,
+    'sent': 1,
+    'failed': 2,
+    'delivered': 2,
+    'read': 3,
+}
+
+# Estados de Twilio -> estados de WhatsAppMessage
+TWILIO_STATUS_MAP = {
+    'sent': 'sent',
+    'delivered': 'delivered',
+    'read': 'read',
+    'failed': 'failed',
+    'undelivered': 'failed',
+}
+
+# Solo se aceptan pistas de tenant con forma de schema válido (evita SQL injection)
+SCHEMA_NAME_RE = re.compile(r'^(public|tenant_[a-z0-9_]{1,56})$')
+
+UPDATE_FIELDS = ['status', 'twilio_status', 'delivered_at', 'error_code', 'error_message', 'updated_at']
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _consumer_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def enqueue_status_callback(message_sid, message_status, error_code=None, error_message=None,
+                            tenant_hint=None, attempts=0):
+    """
+    Agrega un callback al stream.
+
+    Returns:
+        True si quedó encolado, False si Redis no está disponible
+    """
+    fields = {
+        'sid': message_sid,
+        'status': message_status,
+        'error_code': error_code or '',
+        'error_message': (error_message or '')[:1000],
+        'tenant': tenant_hint or '',
+        'attempts': attempts,
+    }
+    try:
+        _redis().xadd(STREAM_KEY, fields, maxlen=STREAM_MAXLEN, approximate=True)
+        return True
+    except Exception as e:
+        logger.error(f"[Twilio Webhook] No se pudo encolar callback {message_sid}: {e}")
+        return False
+
+
+def _schedule_retry(redis_conn, callback, attempts, now=None):
+    """Deja el callback en DELAYED_KEY hasta que venza su backoff."""
+    not_before = (now or time.time()) + RETRY_BASE_DELAY * 2 ** (attempts - 1)
+    member = json.dumps({**callback, 'attempts': attempts}, sort_keys=True)
+    redis_conn.zadd(DELAYED_KEY, {member: not_before})
+
+
+def _promote_due_retries(redis_conn, now=None):
+    """
+    Devuelve al stream los reintentos cuyo backoff venció.
+
+    Returns:
+        Número de callbacks promovidos
+    """
+    due = redis_conn.zrangebyscore(DELAYED_KEY, '-inf', now or time.time(), start=0, num=BATCH_SIZE)
+    promoted = 0
+    for member in due:
+        if not redis_conn.zrem(DELAYED_KEY, member):
+            continue  # Lo promovió otro consumidor
+        callback = json.loads(member)
+        enqueue_status_callback(
+            callback['sid'], callback['status'], callback.get('error_code'), callback.get('error_message'),
+            callback.get('tenant'), attempts=int(callback['attempts'])
+        )
+        promoted += 1
+    return promoted
+
+
+def apply_status_update(whatsapp_msg, message_status, error_code=None, error_message=None):
+    """
+    Aplica un callback de Twilio sobre el mensaje respetando el orden de estados.
+
+    Args:
+        whatsapp_msg: WhatsAppMessage (no se guarda aquí)
+        message_status: Estado reportado por Twilio
+
+    Returns:
+        True si el mensaje cambió y debe guardarse
+    """
+    new_status = TWILIO_STATUS_MAP.get(message_status)
+    if not new_status:
+        return False
+
+    current_rank = STATUS_RANK.get(whatsapp_msg.status, 0)
+    new_rank = STATUS_RANK[new_status]
+
+    if new_rank < current_rank or (new_rank == current_rank and new_status != 'sent'):
+        # Callback atrasado o repetido (ej: 'delivered' después de 'read')
+        return False
+
+    whatsapp_msg.twilio_status = message_status
+    if new_status == 'sent':
+        # Ya está marcado como sent cuando se envía; solo se confirma twilio_status
+        return True
+
+    whatsapp_msg.status = new_status
+    if new_status in ('delivered', 'read') and not whatsapp_msg.delivered_at:
+        whatsapp_msg.delivered_at = timezone.now()
+    if new_status == 'failed':
+        if error_code:
+            whatsapp_msg.error_code = error_code[:10]
+        if error_message:
+            whatsapp_msg.error_message = error_message
+    return True
+
+
+def _decode(entry_fields):
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in entry_fields.items()
+    }
+
+
+def _ensure_group(redis_conn):
+    try:
+        redis_conn.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id='0', mkstream=True)
+    except Exception as e:
+        # BUSYGROUP: el grupo ya existe
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _read_batch(redis_conn, consumer):
+    """Lee un lote: primero entradas abandonadas por consumidores caídos, luego nuevas."""
+    entries = []
+    try:
+        claimed = redis_conn.xautoclaim(
+            STREAM_KEY, CONSUMER_GROUP, consumer, CLAIM_IDLE_MS, start_id='0-0', count=BATCH_SIZE
+        )
+        entries.extend(_dead_letter_exhausted(redis_conn, consumer, claimed[1]))
+    except Exception as e:
+        logger.debug(f"[Twilio Webhook] xautoclaim no disponible: {e}")
+
+    remaining = BATCH_SIZE - len(entries)
+    if remaining > 0:
+        response = redis_conn.xreadgroup(CONSUMER_GROUP, consumer, {STREAM_KEY: '>'}, count=remaining)
+        for _stream, stream_entries in response or []:
+            entries.extend(stream_entries)
+    return [(entry_id, _decode(fields)) for entry_id, fields in entries if fields]
+
+
+def _dead_letter_exhausted(redis_conn, consumer, claimed):
+    """
+    Mueve al dead-letter stream las entradas reclamadas que ya se entregaron
+    MAX_DELIVERIES veces (XPENDING) y retorna las que siguen en el lote.
+    """
+    if not claimed:
+        return claimed
+
+    pending = redis_conn.xpending_range(
+        STREAM_KEY, CONSUMER_GROUP, min=claimed[0][0], max=claimed[-1][0],
+        count=len(claimed) * 2, consumername=consumer
+    )
+    deliveries = {item['message_id']: item['times_delivered'] for item in pending}
+
+    keep, exhausted = [], []
+    for entry_id, fields in claimed:
+        times = deliveries.get(entry_id, 0)
+        if fields and times > MAX_DELIVERIES:
+            exhausted.append((entry_id, fields, times))
+        else:
+            keep.append((entry_id, fields))
+
+    for entry_id, fields, times in exhausted:
+        callback = _decode(fields)
+        original_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+        logger.error(
+            f"[Twilio Webhook] Callback {original_id} (SID {callback.get('sid')}) falló "
+            f"{times} veces; se mueve a {DEAD_LETTER_KEY}"
+        )
+        redis_conn.xadd(
+            DEAD_LETTER_KEY,
+            {**callback, 'original_id': original_id, 'deliveries': times},
+            maxlen=DEAD_LETTER_MAXLEN, approximate=True
+        )
+
+    if exhausted:
+        exhausted_ids = [entry_id for entry_id, _fields, _times in exhausted]
+        redis_conn.xack(STREAM_KEY, CONSUMER_GROUP, *exhausted_ids)
+        redis_conn.xdel(STREAM_KEY, *exhausted_ids)
+    return keep
+
+
+def _collapse(callbacks):
+    """Un solo callback por SID: el de estado más avanzado."""
+    by_sid = {}
+    for callback in callbacks:
+        status = TWILIO_STATUS_MAP.get(callback['status'])
+        if not status:
+            continue
+        previous = by_sid.get(callback['sid'])
+        if previous is None or STATUS_RANK[status] >= STATUS_RANK[TWILIO_STATUS_MAP[previous['status']]]:
+            by_sid[callback['sid']] = callback
+    return by_sid
+
+
+def _resolve_schemas(by_sid):
+    """
+    Agrupa SIDs por schema usando la pista del callback o el índice global
+    (una sola query para todo el lote).
+    """
+    por_schema = defaultdict(list)
+    sin_pista = []
+    for sid, callback in by_sid.items():
+        if callback.get('tenant') and SCHEMA_NAME_RE.match(callback['tenant']):
+            por_schema[callback['tenant']].append(sid)
+        else:
+            sin_pista.append(sid)
+
+    if sin_pista:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT twilio_sid, schema_name
+                FROM public.citas_twilio_message_index
+                WHERE twilio_sid = ANY(%s)
+            """, [sin_pista])
+            for sid, schema_name in cursor.fetchall():
+                por_schema[schema_name].append(sid)
+
+    return por_schema
+
+
+def _apply_in_schema(schema_name, sids, by_sid):
+    """
+    Aplica los callbacks de un schema con una lectura y un bulk_update.
+
+    Returns:
+        (actualizados, set de SIDs encontrados)
+    """
+    from ..models_whatsapp import WhatsAppMessage
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SET search_path TO {connection.ops.quote_name(schema_name)}, public")
+
+    messages = list(
+        WhatsAppMessage.objects.filter(twilio_sid__in=sids).only(
+            'id', 'twilio_sid', 'status', 'twilio_status', 'delivered_at',
+            'error_code', 'error_message', 'updated_at'
+        )
+    )
+
+    now = timezone.now()
+    changed = []
+    for msg in messages:
+        callback = by_sid[msg.twilio_sid]
+        if apply_status_update(msg, callback['status'], callback.get('error_code'), callback.get('error_message')):
+            msg.updated_at = now  # bulk_update no aplica auto_now
+            changed.append(msg)
+
+    if changed:
+        WhatsAppMessage.objects.bulk_update(changed, UPDATE_FIELDS, batch_size=BATCH_SIZE)
+
+    return len(changed), {msg.twilio_sid for msg in messages}
+
+
+def process_status_batch():
+    """
+    Procesa un lote del stream.
+
+    Returns:
+        dict con contadores del lote (leidos, actualizados, reencolados,
+        descartados) y `only_requeued` si ningún SID del lote existía todavía
+    """
+    redis_conn = _redis()
+    _ensure_group(redis_conn)
+    consumer = _consumer_name()
+
+    _promote_due_retries(redis_conn)
+    entries = _read_batch(redis_conn, consumer)
+    result = {'read': len(entries), 'updated': 0, 'requeued': 0, 'dropped': 0, 'only_requeued': False}
+    if not entries:
+        return result
+
+    by_sid = _collapse([fields for _entry_id, fields in entries])
+
+    found = set()
+    try:
+        for schema_name, sids in _resolve_schemas(by_sid).items():
+            updated, found_in_schema = _apply_in_schema(schema_name, sids, by_sid)
+            result['updated'] += updated
+            found |= found_in_schema
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SET search_path TO public")
+
+    # SIDs sin mensaje todavía: reintentar con backoff (el envío pudo no haber guardado el SID aún)
+    for sid, callback in by_sid.items():
+        if sid in found:
+            continue
+        attempts = int(callback.get('attempts') or 0) + 1
+        if attempts < MAX_ATTEMPTS:
+            # Después del primer reintento se ignora la pista y se usa el índice global
+            retry = {**callback, 'tenant': callback.get('tenant') if attempts < 2 else ''}
+            _schedule_retry(redis_conn, retry, attempts)
+            result['requeued'] += 1
+        else:
+            logger.error(f"[Twilio Webhook] Message with SID {sid} not found after {attempts} attempts")
+            result['dropped'] += 1
+
+    result['only_requeued'] = bool(by_sid) and result['requeued'] == len(by_sid)
+
+    entry_ids = [entry_id for entry_id, _fields in entries]
+    redis_conn.xack(STREAM_KEY, CONSUMER_GROUP, *entry_ids)
+    redis_conn.xdel(STREAM_KEY, *entry_ids)
+
+    return result
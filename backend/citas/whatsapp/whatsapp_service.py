@@ -2,13 +2,21 @@
 Servicio centralizado para envío de mensajes de WhatsApp usando Twilio.
 """
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from django.conf import settings
 from django.utils import timezone
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
 
 from ..models_whatsapp import WhatsAppMessage
+from . import message_templates
+from .campaign_sender import (
+    DEFAULT_CONCURRENCY,
+    CampaignSender,
+    bucket_for_account,
+    create_campaign,
+    send_campaign_messages,
+)
 from organizacion.models import Organizacion
 from citas.models import Cita
 
@@ -40,6 +48,25 @@ class WhatsAppService:
         """Verifica si Twilio está configurado"""
         return self.client is not None
 
+    def status_callback_url(self) -> str:
+        """
+        URL del webhook de estados con el schema actual como pista de tenant
+        (?tenant=<schema>), para que el webhook no tenga que buscar el mensaje.
+
+        Returns:
+            URL absoluta del webhook
+        """
+        from django.db import connection
+
+        webhook_url = f"{settings.FRONTEND_URL}/api/citas/whatsapp-webhook/"
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT current_schema()")
+                schema_name = cursor.fetchone()[0]
+        except Exception:
+            return webhook_url
+        return f"{webhook_url}?tenant={schema_name}"
+
     def format_phone_number(self, phone: str) -> str:
         """
         Formatea número de teléfono para WhatsApp.
@@ -63,28 +90,44 @@ class WhatsAppService:
 
         return cleaned
 
-    def _render_template(self, template: str, context: Dict[str, Any], default_template: str) -> str:
+    def _template_context(self, cita: Cita, org: Organizacion, **extra) -> Dict[str, Any]:
+        """
+        Variables de las plantillas de WhatsApp para una cita.
+
+        Args:
+            cita: Cita (con servicios/colaboradores prefetch si es un lote)
+            org: Organización de la cita
+            **extra: Variables adicionales del tipo de mensaje (ej: razon)
+        """
+        context = {
+            'nombre': cita.nombre,
+            'fecha': cita.fecha.strftime('%d/%m/%Y'),
+            'hora': cita.fecha.strftime('%H:%M'),
+            'sede': cita.sede.nombre,
+            'servicios': ', '.join([s.nombre for s in cita.servicios.all()]),
+            'colaboradores': ', '.join([c.nombre for c in cita.colaboradores.all()]),
+            'sender_name': org.whatsapp_sender_name or org.nombre,
+        }
+        context.update(extra)
+        return context
+
+    def render_messages(self, org: Organizacion, message_type: str, citas, **extra) -> List[str]:
         """
-        Renderiza una plantilla personalizada o usa la plantilla por defecto.
+        Renderiza el mensaje de muchas citas de una organización con la
+        plantilla compilada una sola vez (ver message_templates.render_many).
 
         Args:
-            template: Plantilla personalizada de la organización
-            context: Variables para reemplazar en la plantilla
-            default_template: Plantilla por defecto si no hay personalizada
+            org: Organización
+            message_type: 'confirmation', 'reminder_24h', 'reminder_1h' o 'cancellation'
+            citas: Citas a renderizar (idealmente con prefetch de servicios/colaboradores)
+            **extra: Variables adicionales comunes a todos los mensajes
 
         Returns:
-            Mensaje renderizado
+            Lista de mensajes en el orden de `citas`
         """
-        # Si hay plantilla personalizada, úsala
-        if template and template.strip():
-            try:
-                return template.format(**context)
-            except KeyError as e:
-                logger.warning(f"Error en plantilla personalizada, usando default: {e}")
-                return default_template.format(**context)
-
-        # Usar plantilla por defecto
-        return default_template.format(**context)
+        return message_templates.render_many(
+            org, message_type, (self._template_context(cita, org, **extra) for cita in citas)
+        )
 
     def send_appointment_confirmation(self, cita: Cita) -> Optional[WhatsAppMessage]:
         """
@@ -109,47 +152,8 @@ class WhatsAppService:
             logger.warning(f"Cita #{cita.id} no tiene teléfono, no se puede enviar WhatsApp")
             return None
 
-        # Preparar variables para plantilla
-        sender_name = org.whatsapp_sender_name or org.nombre
-        fecha_formateada = cita.fecha.strftime('%d/%m/%Y')
-        hora_formateada = cita.fecha.strftime('%H:%M')
-        servicios_nombres = ', '.join([s.nombre for s in cita.servicios.all()])
-        colaboradores_nombres = ', '.join([c.nombre for c in cita.colaboradores.all()])
-
-        # Contexto para plantilla
-        context = {
-            'nombre': cita.nombre,
-            'fecha': fecha_formateada,
-            'hora': hora_formateada,
-            'sede': cita.sede.nombre,
-            'servicios': servicios_nombres,
-            'colaboradores': colaboradores_nombres,
-            'sender_name': sender_name
-        }
-
-        # Plantilla por defecto
-        default_template = """🔔 *{sender_name}*
-
-¡Hola {nombre}!
-
-Tu cita ha sido confirmada:
-
-📅 *Fecha:* {fecha} a las {hora}
-📍 *Sede:* {sede}
-💼 *Servicios:* {servicios}
-
-Te esperamos 10 minutos antes de tu cita.
-
-Si necesitas cancelar o reprogramar, por favor contáctanos lo antes posible.
-
-¡Gracias por preferirnos!"""
-
-        # Renderizar plantilla (personalizada o por defecto)
-        message_body = self._render_template(
-            org.whatsapp_template_confirmation,
-            context,
-            default_template
-        )
+        # Renderizar plantilla compilada (personalizada o por defecto)
+        message_body = message_templates.render(org, 'confirmation', self._template_context(cita, org))
 
         return self._send_message(
             cita=cita,
@@ -160,12 +164,13 @@ Si necesitas cancelar o reprogramar, por favor contáctanos lo antes posible.
             message_body=message_body
         )
 
-    def send_appointment_reminder_24h(self, cita: Cita) -> Optional[WhatsAppMessage]:
+    def send_appointment_reminder_24h(self, cita: Cita, message_body: Optional[str] = None) -> Optional[WhatsAppMessage]:
         """
         Envía recordatorio 24h antes de la cita.
 
         Args:
             cita: Instancia de la cita
+            message_body: Mensaje ya renderizado (lotes, ver render_messages)
 
         Returns:
             WhatsAppMessage instance o None si falla
@@ -179,38 +184,8 @@ Si necesitas cancelar o reprogramar, por favor contáctanos lo antes posible.
         if not phone:
             return None
 
-        sender_name = org.whatsapp_sender_name or org.nombre
-        fecha_formateada = cita.fecha.strftime('%d/%m/%Y')
-        hora_formateada = cita.fecha.strftime('%H:%M')
-        servicios_nombres = ', '.join([s.nombre for s in cita.servicios.all()])
-        colaboradores_nombres = ', '.join([c.nombre for c in cita.colaboradores.all()])
-
-        context = {
-            'nombre': cita.nombre,
-            'fecha': fecha_formateada,
-            'hora': hora_formateada,
-            'sede': cita.sede.nombre,
-            'servicios': servicios_nombres,
-            'colaboradores': colaboradores_nombres,
-            'sender_name': sender_name
-        }
-
-        default_template = """⏰ *Recordatorio - {sender_name}*
-
-Hola {nombre},
-
-Te recordamos que mañana tienes tu cita:
-
-📅 *Fecha:* {fecha} a las {hora}
-📍 *Sede:* {sede}
-
-Nos vemos mañana. ¡No faltes! 😊"""
-
-        message_body = self._render_template(
-            org.whatsapp_template_reminder_24h,
-            context,
-            default_template
-        )
+        if message_body is None:
+            message_body = message_templates.render(org, 'reminder_24h', self._template_context(cita, org))
 
         return self._send_message(
             cita=cita,
@@ -221,12 +196,13 @@ Nos vemos mañana. ¡No faltes! 😊"""
             message_body=message_body
         )
 
-    def send_appointment_reminder_1h(self, cita: Cita) -> Optional[WhatsAppMessage]:
+    def send_appointment_reminder_1h(self, cita: Cita, message_body: Optional[str] = None) -> Optional[WhatsAppMessage]:
         """
         Envía recordatorio 1h antes de la cita.
 
         Args:
             cita: Instancia de la cita
+            message_body: Mensaje ya renderizado (lotes, ver render_messages)
 
         Returns:
             WhatsAppMessage instance o None si falla
@@ -240,38 +216,8 @@ Nos vemos mañana. ¡No faltes! 😊"""
         if not phone:
             return None
 
-        sender_name = org.whatsapp_sender_name or org.nombre
-        fecha_formateada = cita.fecha.strftime('%d/%m/%Y')
-        hora_formateada = cita.fecha.strftime('%H:%M')
-        servicios_nombres = ', '.join([s.nombre for s in cita.servicios.all()])
-        colaboradores_nombres = ', '.join([c.nombre for c in cita.colaboradores.all()])
-
-        context = {
-            'nombre': cita.nombre,
-            'fecha': fecha_formateada,
-            'hora': hora_formateada,
-            'sede': cita.sede.nombre,
-            'servicios': servicios_nombres,
-            'colaboradores': colaboradores_nombres,
-            'sender_name': sender_name
-        }
-
-        default_template = """🔔 *Recordatorio - {sender_name}*
-
-Hola {nombre},
-
-Tu cita es en 1 hora:
-
-🕐 *Hora:* {hora}
-📍 *Sede:* {sede}
-
-Te esperamos. Por favor llega a tiempo. ⏰"""
-
-        message_body = self._render_template(
-            org.whatsapp_template_reminder_1h,
-            context,
-            default_template
-        )
+        if message_body is None:
+            message_body = message_templates.render(org, 'reminder_1h', self._template_context(cita, org))
 
         return self._send_message(
             cita=cita,
@@ -302,44 +248,8 @@ Te esperamos. Por favor llega a tiempo. ⏰"""
         if not phone:
             return None
 
-        sender_name = org.whatsapp_sender_name or org.nombre
-        fecha_formateada = cita.fecha.strftime('%d/%m/%Y')
-        hora_formateada = cita.fecha.strftime('%H:%M')
-        servicios_nombres = ', '.join([s.nombre for s in cita.servicios.all()])
-        colaboradores_nombres = ', '.join([c.nombre for c in cita.colaboradores.all()])
-
-        context = {
-            'nombre': cita.nombre,
-            'fecha': fecha_formateada,
-            'hora': hora_formateada,
-            'sede': cita.sede.nombre,
-            'servicios': servicios_nombres,
-            'colaboradores': colaboradores_nombres,
-            'razon': reason if reason else 'No especificada',
-            'sender_name': sender_name
-        }
-
-        reason_text = f"\n\n*Razón:* {reason}" if reason else ""
-
-        default_template = """❌ *Cancelación - {sender_name}*
-
-Hola {nombre},
-
-Tu cita ha sido cancelada:
-
-📅 *Fecha que tenías:* {fecha} a las {hora}
-📍 *Sede:* {sede}
-*Razón:* {razon}
-
-Si deseas reagendar, por favor contáctanos.
-
-Gracias por tu comprensión."""
-
-        message_body = self._render_template(
-            org.whatsapp_template_cancellation,
-            context,
-            default_template
-        )
+        context = self._template_context(cita, org, razon=reason if reason else 'No especificada')
+        message_body = message_templates.render(org, 'cancellation', context)
 
         return self._send_message(
             cita=cita,
@@ -393,8 +303,7 @@ Gracias por tu comprensión."""
             to_number = self.format_phone_number(recipient_phone)
 
             # URL del webhook para recibir actualizaciones de estado
-            from django.conf import settings
-            webhook_url = f"{settings.FRONTEND_URL}/api/citas/whatsapp-webhook/"
+            webhook_url = self.status_callback_url()
 
             # Enviar via Twilio
             message = self.client.messages.create(
@@ -441,6 +350,19 @@ Gracias por tu comprensión."""
             )
             return whatsapp_msg
 
+    def campaign_sender(self) -> CampaignSender:
+        """
+        Sender concurrente para campañas, limitado por el token bucket de la
+        cuenta de Twilio (compartido entre workers).
+        """
+        return CampaignSender(
+            client=self.client,
+            from_number=self.from_number,
+            status_callback=self.status_callback_url(),
+            bucket=bucket_for_account(self.account_sid),
+            concurrency=getattr(settings, 'WHATSAPP_CAMPAIGN_CONCURRENCY', DEFAULT_CONCURRENCY),
+        )
+
     def send_bulk_marketing_message(
         self,
         organizacion: Organizacion,
@@ -450,7 +372,11 @@ Gracias por tu comprensión."""
         media_url: Optional[str] = None
     ) -> tuple[int, int, list]:
         """
-        Envía mensajes de marketing masivos por WhatsApp.
+        Envía mensajes de marketing masivos por WhatsApp (sincrónico).
+
+        Crea una campaña con bulk_create y envía con concurrencia acotada y
+        límite de tasa. Para campañas grandes usar la tarea Celery
+        `send_whatsapp_campaign`, que divide el envío en chunks.
 
         Args:
             organizacion: Organización que envía
@@ -466,84 +392,20 @@ Gracias por tu comprensión."""
             logger.error("Twilio no está configurado, no se puede enviar mensajes")
             return (0, 0, [])
 
-        sent_count = 0
-        failed_count = 0
-        messages = []
-
-        for phone, name in zip(recipient_phones, recipient_names):
-            # Crear registro en BD
-            # Usar organizacion_id en lugar de organizacion para evitar validación del router
-            whatsapp_msg = WhatsAppMessage.objects.create(
-                cita=None,  # No asociado a cita específica
-                organizacion_id=organizacion.id,
-                message_type='marketing',
-                recipient_phone=phone,
-                recipient_name=name,
-                message_body=message_body,
-                status='pending'
-            )
+        campaign = create_campaign(
+            organizacion,
+            list(zip(recipient_phones, recipient_names)),
+            message_body,
+            media_url=media_url,
+        )
+        message_ids = list(campaign.messages.values_list('id', flat=True))
+        sent_count, failed_count = send_campaign_messages(campaign.id, message_ids, self.campaign_sender())
 
-            try:
-                # Formatear número
-                to_number = self.format_phone_number(phone)
-
-                # URL del webhook para recibir actualizaciones de estado
-                from django.conf import settings
-                webhook_url = f"{settings.FRONTEND_URL}/api/citas/whatsapp-webhook/"
-
-                # Preparar parámetros del mensaje
-                message_params = {
-                    'from_': self.from_number,
-                    'to': to_number,
-                    'body': message_body,
-                    'status_callback': webhook_url  # Twilio llamará a esta URL con actualizaciones
-                }
-
-                # Agregar media si está presente
-                if media_url:
-                    message_params['media_url'] = [media_url]
-
-                # Enviar via Twilio
-                message = self.client.messages.create(**message_params)
-
-                # Actualizar registro con éxito
-                whatsapp_msg.mark_as_sent(
-                    twilio_sid=message.sid,
-                    twilio_status=message.status
-                )
-
-                sent_count += 1
-                logger.info(
-                    f"WhatsApp marketing enviado a {name} ({phone}) - SID: {message.sid}"
-                )
-
-            except TwilioRestException as e:
-                # Error de Twilio
-                whatsapp_msg.mark_as_failed(
-                    error_code=str(e.code),
-                    error_message=e.msg
-                )
-                failed_count += 1
-                logger.error(
-                    f"Error Twilio enviando WhatsApp marketing a {name}: "
-                    f"[{e.code}] {e.msg}"
-                )
-
-            except Exception as e:
-                # Error genérico
-                whatsapp_msg.mark_as_failed(
-                    error_code='UNKNOWN',
-                    error_message=str(e)
-                )
-                failed_count += 1
-                logger.error(
-                    f"Error enviando WhatsApp marketing a {name}: {str(e)}",
-                    exc_info=True
-                )
-
-            messages.append(whatsapp_msg)
-
-        return (sent_count, failed_count, messages)
+        logger.info(
+            f"WhatsApp marketing enviado: {sent_count} exitosos, {failed_count} fallidos "
+            f"(Campaña #{campaign.id})"
+        )
+        return (sent_count, failed_count, list(campaign.messages.all()))
 
 
 # Instancia singleton del servicio
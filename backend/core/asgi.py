@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Se usa para el stream SSE del panel en tiempo real (vista async que no
+retiene un worker), ej:
+    gunicorn core.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -0,0 +1,28 @@
+"""
+Backend de cache Redis con métricas de hits/misses (ver core/metrics.py).
+"""
+from django_redis.cache import RedisCache
+
+from .metrics import record_cache_lookup
+
+_MISSING = object()
+
+
+class InstrumentedRedisCache(RedisCache):
+    """django_redis.cache.RedisCache que cuenta hits y misses por namespace."""
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, _MISSING, version=version, client=client)
+        # None también es miss: django_redis lo devuelve si Redis no responde
+        if value is _MISSING or value is None:
+            record_cache_lookup(key, hits=0, misses=1)
+            return default
+        record_cache_lookup(key, hits=1)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        values = super().get_many(keys, version=version, client=client)
+        if keys:
+            record_cache_lookup(keys[0], hits=len(values), misses=len(keys) - len(values))
+        return values
@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
@@ -16,15 +17,68 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+
+@worker_process_shutdown.connect
+def close_email_connection(**kwargs):
+    """Cierra la conexión SMTP reutilizada del proceso (core.mailer)."""
+    from core.mailer import close_pooled_connection
+    close_pooled_connection()
+
+
+@worker_process_shutdown.connect
+def flush_database_logs(**kwargs):
+    """Guarda los logs encolados por DatabaseLogHandler antes de salir."""
+    from organizacion.logging_handler import flush_database_logs
+    flush_database_logs()
+
+
+# Métricas de duración de tareas (core/metrics.py)
+from core.metrics import connect_celery_signals  # noqa: E402
+connect_celery_signals()
+
+# Queries lentas de las tareas (core/slow_queries.py)
+from core.slow_queries import connect_celery_signals as connect_slow_query_signals  # noqa: E402
+connect_slow_query_signals()
+
 # Importar explícitamente las tareas de WhatsApp
 app.autodiscover_tasks(['citas'], related_name='tasks_whatsapp')
 
 # Configuración de tareas periódicas (Celery Beat)
 app.conf.beat_schedule = {
-    # Enviar recordatorios de WhatsApp cada 5 minutos
-    'send-whatsapp-reminders': {
-        'task': 'citas.tasks_whatsapp.send_scheduled_reminders',
-        'schedule': crontab(minute='*/5'),  # Cada 5 minutos
+    # Enviar las notificaciones (email/WhatsApp) registradas en el outbox
+    'dispatch-notification-outbox': {
+        'task': 'citas.tasks.dispatch_notification_outbox',
+        'schedule': 5.0,  # Cada 5 segundos
+    },
+
+    # Despachar recordatorios de WhatsApp vencidos desde el sorted set de Redis
+    'dispatch-whatsapp-reminders': {
+        'task': 'citas.tasks_whatsapp.dispatch_due_reminders',
+        'schedule': 5.0,  # Cada 5 segundos
+    },
+
+    # Barrido de seguridad por tenant: recordatorios vencidos que no llegaron a Redis
+    'fan-out-whatsapp-reminders': {
+        'task': 'citas.tasks_whatsapp.fan_out_scheduled_reminders',
+        'schedule': crontab(minute=7),  # Cada hora
+    },
+
+    # Reconstruir el sorted set de recordatorios desde la BD (pérdida de Redis)
+    'reconcile-whatsapp-reminders': {
+        'task': 'citas.tasks_whatsapp.reconcile_reminder_schedule',
+        'schedule': crontab(minute='*/15'),  # Cada 15 minutos
+    },
+
+    # Aplicar por lotes los callbacks de estado de Twilio encolados por el webhook
+    'process-whatsapp-status-callbacks': {
+        'task': 'citas.tasks_whatsapp.process_whatsapp_status_callbacks',
+        'schedule': 10.0,  # Cada 10 segundos
+    },
+
+    # Particiones mensuales futuras + retención de ApplicationLog por particiones
+    'maintain-partitions': {
+        'task': 'organizacion.tasks.maintain_partitions',
+        'schedule': crontab(hour=2, minute=30),  # Todos los días a las 2:30 AM
     },
 
     # Limpiar mensajes antiguos de WhatsApp (diario a las 3 AM)
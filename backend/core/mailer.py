@@ -0,0 +1,149 @@
+"""
+Capa de envío de emails con conexión SMTP reutilizada.
+
+`django.core.mail.send_mail` abre una conexión SMTP (TCP + EHLO + STARTTLS +
+AUTH) por cada llamada. Aquí cada proceso/hilo mantiene UNA conexión abierta
+y la reutiliza entre envíos:
+
+- `send_email()` reemplaza a send_mail usando la conexión compartida.
+- `send_messages()` envía lotes de mensajes (uno por destinatario) sobre la
+  misma conexión.
+- Si la conexión estuvo inactiva más de KEEPALIVE_IDLE_SECONDS se verifica con
+  NOOP antes de usarla; si el servidor la cerró, se reabre y el lote se
+  reintenta una vez.
+
+Con backends que no son SMTP (console, locmem en tests) funciona igual, solo
+que no hay conexión real que reutilizar.
+"""
+import logging
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_IDLE_SECONDS = 30
+DEFAULT_BATCH_SIZE = 100
+
+_local = threading.local()
+
+
+def _is_alive(connection):
+    """NOOP sobre la conexión SMTP abierta (solo backends SMTP)."""
+    smtp = getattr(connection, 'connection', None)
+    if smtp is None:
+        return True
+    try:
+        return smtp.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+def get_pooled_connection():
+    """
+    Conexión de email abierta y reutilizable del proceso/hilo actual.
+
+    Returns:
+        Backend de email con la conexión ya abierta
+    """
+    connection = getattr(_local, 'connection', None)
+    last_used = getattr(_local, 'last_used', 0)
+
+    if connection is not None and time.monotonic() - last_used > KEEPALIVE_IDLE_SECONDS:
+        if not _is_alive(connection):
+            logger.info("[Email] Conexión SMTP inactiva cerrada por el servidor, reabriendo")
+            close_pooled_connection()
+            connection = None
+
+    if connection is None:
+        connection = get_connection(fail_silently=False)
+        # Abrirla aquí hace que send_messages() no la cierre al terminar
+        connection.open()
+        _local.connection = connection
+
+    _local.last_used = time.monotonic()
+    return connection
+
+
+def close_pooled_connection():
+    """Cierra la conexión compartida (ej: al apagar el worker)."""
+    connection = getattr(_local, 'connection', None)
+    _local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception as e:
+            logger.debug(f"[Email] Error cerrando conexión SMTP: {e}")
+
+
+def build_message(subject, message, recipient, html_message=None, from_email=None):
+    """
+    Mensaje para UN destinatario (los destinatarios no ven las direcciones de los demás).
+    """
+    if isinstance(recipient, str):
+        recipient = [recipient]
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient),
+    )
+    if html_message:
+        email.attach_alternative(html_message, 'text/html')
+    return email
+
+
+def send_messages(messages, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Envía los mensajes por lotes sobre la conexión compartida.
+
+    Args:
+        messages: Lista de EmailMessage
+        batch_size: Mensajes por lote
+
+    Returns:
+        Número de mensajes enviados
+
+    Raises:
+        Excepciones del backend (SMTP) si el envío falla
+    """
+    sent = 0
+    for start in range(0, len(messages), batch_size):
+        batch = messages[start:start + batch_size]
+        try:
+            sent += get_pooled_connection().send_messages(batch) or 0
+        except smtplib.SMTPServerDisconnected:
+            # El servidor cerró la conexión entre el NOOP y el envío: reabrir y reintentar una vez
+            logger.info("[Email] Conexión SMTP perdida durante el envío, reintentando el lote")
+            close_pooled_connection()
+            sent += get_pooled_connection().send_messages(batch) or 0
+        except Exception:
+            # La conexión puede haber quedado en un estado inválido
+            close_pooled_connection()
+            raise
+    return sent
+
+
+def send_email(subject, message, recipient_list, html_message=None, from_email=None,
+               fail_silently=False):
+    """
+    Reemplazo de send_mail que reutiliza la conexión SMTP compartida.
+    Envía un mensaje por destinatario.
+
+    Returns:
+        Número de mensajes enviados
+    """
+    messages = [
+        build_message(subject, message, recipient, html_message, from_email)
+        for recipient in dict.fromkeys(recipient_list)  # Sin duplicados, preservando el orden
+    ]
+    try:
+        return send_messages(messages)
+    except Exception:
+        if not fail_silently:
+            raise
+        logger.exception(f"[Email] Error enviando '{subject}' a {len(messages)} destinatarios")
+        return 0
@@ -0,0 +1,222 @@
+"""
+Métricas de la aplicación en formato Prometheus.
+
+Series registradas:
+- http_request_duration_seconds{view, method, status, tenant}: duración de
+  cada request por nombre de URL resuelto y schema del tenant.
+- http_request_db_queries{view} / http_request_db_duration_seconds{view}:
+  queries SQL y tiempo en la BD por request (connection.execute_wrapper).
+- cache_requests_total{namespace, result}: hits/misses del cache (ver
+  core/cache_backends.py); namespace es el prefijo de la clave ('citas', 'logs', ...).
+- celery_task_duration_seconds{task, state}: duración de las tareas Celery.
+
+Se exponen en /metrics (solo staff, o `Authorization: Bearer <METRICS_TOKEN>`
+para el scraper de Prometheus).
+
+Multiproceso (gunicorn / Celery prefork): definir PROMETHEUS_MULTIPROC_DIR
+(un directorio escribible) en el entorno ANTES de arrancar los procesos.
+Cada proceso escribe sus series en ese directorio y /metrics las agrega con
+MultiProcessCollector; gunicorn_config.py lo limpia al arrancar.
+
+prometheus_client es una dependencia opcional: si no está instalada las
+métricas no se registran y /metrics responde 503.
+"""
+import hmac
+import logging
+import os
+import re
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+    )
+except ImportError:  # Dependencia opcional
+    Counter = Histogram = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = Histogram is not None
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TASK_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+_NAMESPACE_RE = re.compile(r'^[a-z_]{1,30}$')
+
+if METRICS_ENABLED:
+    REQUEST_DURATION = Histogram(
+        'http_request_duration_seconds', 'Duración de los requests HTTP',
+        ['view', 'method', 'status', 'tenant'], buckets=LATENCY_BUCKETS,
+    )
+    REQUEST_DB_QUERIES = Histogram(
+        'http_request_db_queries', 'Queries SQL ejecutadas por request',
+        ['view'], buckets=QUERY_COUNT_BUCKETS,
+    )
+    REQUEST_DB_DURATION = Histogram(
+        'http_request_db_duration_seconds', 'Tiempo total en la BD por request',
+        ['view'], buckets=LATENCY_BUCKETS,
+    )
+    CACHE_REQUESTS = Counter(
+        'cache_requests_total', 'Lecturas del cache por resultado',
+        ['namespace', 'result'],
+    )
+    CELERY_TASK_DURATION = Histogram(
+        'celery_task_duration_seconds', 'Duración de las tareas Celery',
+        ['task', 'state'], buckets=TASK_BUCKETS,
+    )
+
+
+class QueryCounter:
+    """
+    execute_wrapper que cuenta las queries y el tiempo en la BD.
+
+    Uso:
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            ...
+        counter.count, counter.duration
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def view_label(request):
+    """Nombre de la URL resuelta (cardinalidad acotada, sin IDs del path)."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def _tenant_label():
+    from organizacion.thread_locals import get_current_organization
+
+    org = get_current_organization()
+    return getattr(org, 'schema_name', None) or 'public'
+
+
+class MetricsMiddleware:
+    """
+    Registra duración, status y queries SQL de cada request.
+    Debe ir PRIMERO en MIDDLEWARE para medir el request completo.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not METRICS_ENABLED:
+            return self.get_response(request)
+
+        from organizacion.thread_locals import set_current_organization
+
+        # El thread-local del tenant lo fija OrganizacionMiddleware; limpiarlo
+        # evita etiquetar con el tenant del request anterior de este hilo
+        set_current_organization(None)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        status = 500
+        try:
+            with connection.execute_wrapper(counter):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            duration = time.perf_counter() - start
+            try:
+                view = view_label(request)
+                REQUEST_DURATION.labels(view, request.method, str(status), _tenant_label()).observe(duration)
+                REQUEST_DB_QUERIES.labels(view).observe(counter.count)
+                REQUEST_DB_DURATION.labels(view).observe(counter.duration)
+            except Exception as e:
+                logger.debug(f"[Metrics] No se pudo registrar el request: {e}")
+
+
+def record_cache_lookup(key, hits, misses=0):
+    """Cuenta hits/misses de lecturas del cache por namespace de la clave."""
+    if not METRICS_ENABLED:
+        return
+    namespace = str(key).split(':', 1)[0] if ':' in str(key) else 'other'
+    if not _NAMESPACE_RE.match(namespace):
+        namespace = 'other'
+    if hits:
+        CACHE_REQUESTS.labels(namespace, 'hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels(namespace, 'miss').inc(misses)
+
+
+# ---------------------------------------------------------------------------
+# Celery
+# ---------------------------------------------------------------------------
+
+_task_starts = {}
+
+
+def _task_prerun(task_id=None, **kwargs):
+    _task_starts[task_id] = time.perf_counter()
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    start = _task_starts.pop(task_id, None)
+    if start is None or not METRICS_ENABLED:
+        return
+    name = getattr(task, 'name', None) or 'unknown'
+    CELERY_TASK_DURATION.labels(name, state or 'UNKNOWN').observe(time.perf_counter() - start)
+
+
+def connect_celery_signals():
+    """Registra la duración de las tareas (llamar desde core/celery.py)."""
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(_task_prerun, weak=False)
+    task_postrun.connect(_task_postrun, weak=False)
+
+
+# ---------------------------------------------------------------------------
+# Endpoint /metrics
+# ---------------------------------------------------------------------------
+
+def _registry():
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        # Agrega las series de todos los procesos (workers de gunicorn y Celery)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def _authorized(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    # SECURITY: token para el scraper, comparado en tiempo constante
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+
+def metrics_view(request):
+    """Métricas en formato de texto de Prometheus (solo staff o token)."""
+    if not _authorized(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    if not METRICS_ENABLED:
+        return HttpResponse('prometheus_client no está instalado', status=503, content_type='text/plain')
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
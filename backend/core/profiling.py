@@ -0,0 +1,286 @@
+"""
+Profiling bajo demanda de requests en producción.
+
+ProfilingMiddleware ejecuta el request bajo un profiler cuando:
+- un usuario staff envía la cabecera `X-Profile: 1`, o
+- el request cae en la muestra aleatoria PROFILING_SAMPLE_RATE (0.0 = nunca).
+
+Se usa pyinstrument (profiler por muestreo, reporte HTML tipo flame) si está
+instalado y cProfile si no. Junto con el reporte se guarda la línea de tiempo
+de las queries SQL del request. Los perfiles se guardan en Redis durante
+PROFILING_TTL segundos (índice acotado a PROFILING_MAX_PROFILES) y se ven en
+/admin/profiles/ (organizacion/profile_viewer.py). La respuesta de un
+request perfilado por cabecera incluye `X-Profile-Id`.
+
+Los requests no perfilados solo pagan la lectura de la cabecera.
+
+SECURITY: la cabecera solo activa el profiler si ANTES de ejecutar el request
+se comprueba que viene de un staff activo (token JWT Bearer válido o sesión
+de Django; una query solo cuando la cabecera está presente). Un cliente
+anónimo no puede forzar perfiles (pyinstrument + timeline SQL) para
+amplificar la carga.
+"""
+import io
+import json
+import logging
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:  # Dependencia opcional
+    PyinstrumentProfiler = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = 'profiling:index'
+REPORT_KEY = 'profiling:report:{}'
+MAX_SQL_ENTRIES = 500
+MAX_SQL_LENGTH = 2000
+EXCLUDED_PREFIXES = ('/static/', '/media/', '/metrics', '/admin/profiles/')
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+class SqlTimeline:
+    """execute_wrapper que registra inicio, duración y SQL de cada query."""
+
+    def __init__(self, started):
+        self.started = started
+        self.entries = []
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if len(self.entries) < MAX_SQL_ENTRIES:
+                self.entries.append({
+                    'start_ms': round((start - self.started) * 1000, 2),
+                    'duration_ms': round(elapsed * 1000, 2),
+                    'sql': sql[:MAX_SQL_LENGTH],
+                })
+
+
+class _CProfileRunner:
+    """Misma interfaz que pyinstrument.Profiler sobre cProfile."""
+
+    name = 'cprofile'
+
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def report(self):
+        import pstats
+
+        output = io.StringIO()
+        pstats.Stats(self.profile, stream=output).sort_stats('cumulative').print_stats(80)
+        return output.getvalue()
+
+
+class _PyinstrumentRunner:
+    name = 'pyinstrument'
+
+    def __init__(self):
+        self.profiler = PyinstrumentProfiler(interval=0.001)
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def report(self):
+        return self.profiler.output_html()
+
+
+def _new_profiler():
+    return _PyinstrumentRunner() if PyinstrumentProfiler is not None else _CProfileRunner()
+
+
+# ---------------------------------------------------------------------------
+# Almacenamiento en Redis
+# ---------------------------------------------------------------------------
+
+def save_profile(meta, report, sql):
+    """
+    Guarda el perfil (reporte + timeline SQL) y lo agrega al índice.
+
+    Returns:
+        True si se guardó
+    """
+    ttl = getattr(settings, 'PROFILING_TTL', 60 * 60 * 24)
+    max_profiles = getattr(settings, 'PROFILING_MAX_PROFILES', 200)
+    try:
+        pipe = _redis().pipeline()
+        pipe.setex(REPORT_KEY.format(meta['id']), ttl, json.dumps({'meta': meta, 'report': report, 'sql': sql}))
+        pipe.lpush(INDEX_KEY, json.dumps(meta))
+        pipe.ltrim(INDEX_KEY, 0, max_profiles - 1)
+        pipe.expire(INDEX_KEY, ttl)
+        pipe.execute()
+        return True
+    except Exception as e:
+        logger.warning(f"[Profiling] No se pudo guardar el perfil {meta['id']}: {e}")
+        return False
+
+
+def list_profiles(endpoint='', tenant='', limit=200):
+    """
+    Perfiles recientes (más nuevos primero), filtrables por endpoint y tenant.
+
+    Returns:
+        Lista de dicts de metadatos
+    """
+    try:
+        raw = _redis().lrange(INDEX_KEY, 0, limit - 1)
+    except Exception as e:
+        logger.warning(f"[Profiling] No se pudo leer el índice de perfiles: {e}")
+        return []
+
+    profiles = []
+    for item in raw:
+        meta = json.loads(item)
+        if endpoint and endpoint not in meta['view'] and endpoint not in meta['path']:
+            continue
+        if tenant and meta['tenant'] != tenant:
+            continue
+        profiles.append(meta)
+    return profiles
+
+
+def get_profile(profile_id):
+    """
+    Returns:
+        dict con meta, report y sql, o None si expiró
+    """
+    try:
+        raw = _redis().get(REPORT_KEY.format(profile_id))
+    except Exception as e:
+        logger.warning(f"[Profiling] No se pudo leer el perfil {profile_id}: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+def _header_user_is_staff(request):
+    """
+    Comprueba antes de perfilar que el request viene de un usuario staff.
+
+    El middleware corre antes de la autenticación (sesión y DRF/JWT), así que
+    se resuelve el usuario desde el token Bearer o la cookie de sesión.
+    """
+    from django.contrib.auth import SESSION_KEY, get_user_model
+
+    user_id = None
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    if auth_header.startswith('Bearer '):
+        try:
+            from rest_framework_simplejwt.tokens import AccessToken
+            user_id = AccessToken(auth_header.split(' ', 1)[1])['user_id']
+        except Exception:
+            return False
+    else:
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not session_key:
+            return False
+        try:
+            from importlib import import_module
+            session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+            user_id = session.get(SESSION_KEY)
+        except Exception:
+            return False
+
+    if user_id is None:
+        return False
+    return get_user_model()._default_manager.filter(pk=user_id, is_staff=True, is_active=True).exists()
+
+
+def _tenant_label():
+    from organizacion.thread_locals import get_current_organization
+
+    org = get_current_organization()
+    return getattr(org, 'schema_name', None) or 'public'
+
+
+class ProfilingMiddleware:
+    """
+    Perfila los requests pedidos por staff (`X-Profile: 1`) o muestreados.
+    Ver docstring del módulo.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _trigger(self, request):
+        if request.META.get('HTTP_X_PROFILE') == '1' and _header_user_is_staff(request):
+            return 'header'
+        sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        if sample_rate and random.random() < sample_rate and not request.path.startswith(EXCLUDED_PREFIXES):
+            return 'sample'
+        return None
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        profiler = _new_profiler()
+        started = time.perf_counter()
+        timeline = SqlTimeline(started)
+        try:
+            profiler.start()
+        except Exception as e:
+            # Ej: otro profiler activo en el hilo (cProfile no admite dos)
+            logger.debug(f"[Profiling] No se pudo iniciar el profiler: {e}")
+            return self.get_response(request)
+
+        try:
+            with connection.execute_wrapper(timeline):
+                response = self.get_response(request)
+        finally:
+            profiler.stop()
+        duration = time.perf_counter() - started
+
+        user = getattr(request, 'user', None)
+        match = getattr(request, 'resolver_match', None)
+        meta = {
+            'id': uuid.uuid4().hex[:16],
+            'created_at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': (match.view_name or match._func_path) if match else 'unresolved',
+            'tenant': _tenant_label(),
+            'user': user.get_username() if user is not None and user.is_authenticated else '',
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': timeline.count,
+            'sql_ms': round(timeline.duration * 1000, 1),
+            'profiler': profiler.name,
+            'trigger': trigger,
+        }
+        if save_profile(meta, profiler.report(), timeline.entries) and trigger == 'header':
+            response['X-Profile-Id'] = meta['id']
+        return response
@@ -0,0 +1,148 @@
+"""
+Presupuesto de queries por request y detector de N+1.
+
+QueryBudgetMiddleware (activo con QUERY_BUDGET_ENABLED) cuenta las queries
+SQL de cada request y agrupa las que tienen la misma forma (SQL con los
+literales y las listas IN normalizadas). Un request se marca si:
+
+- ejecuta más queries que el presupuesto de la vista, o
+- repite la misma forma de query más de `query_repeat_limit` veces (N+1:
+  una query por fila en lugar de un select_related/prefetch_related).
+
+En producción se registra un warning (llega a ApplicationLog por
+DatabaseLogHandler); con QUERY_BUDGET_RAISE (suite de tests) se lanza
+QueryBudgetExceeded y el test falla.
+
+Presupuestos por vista como atributos:
+
+    class CitaViewSet(viewsets.ModelViewSet):
+        query_budget = {'list': 25, 'retrieve': 20}  # o un int para todas las acciones
+        query_repeat_limit = 5
+
+    @query_budget(10)
+    def log_viewer(request): ...
+"""
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 50
+DEFAULT_REPEAT_LIMIT = 10
+
+_IN_LIST_RE = re.compile(r'\((?:%s,\s*)+%s\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE_RE = re.compile(r'\s+')
+# Sentencias de control que se repiten legítimamente en cada request
+_IGNORED_PREFIXES = ('SET ', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """El request superó el presupuesto de queries o tiene un patrón N+1."""
+
+
+def sql_shape(sql):
+    """Forma de la query: sin literales y con las listas IN colapsadas."""
+    sql = _IN_LIST_RE.sub('(%s...)', sql)
+    sql = _STRING_RE.sub("'?'", sql)
+    sql = _NUMBER_RE.sub('N', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper que cuenta queries y formas de SQL repetidas."""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if not sql.lstrip().upper().startswith(_IGNORED_PREFIXES):
+            self.shapes[sql_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, limit):
+        """Formas ejecutadas más de `limit` veces, de la más repetida a la menos."""
+        return [(shape, times) for shape, times in self.shapes.most_common() if times > limit]
+
+
+def query_budget(limit=None, repeat_limit=None):
+    """Decorador para declarar el presupuesto de una vista función."""
+    def decorator(view):
+        if limit is not None:
+            view.query_budget = limit
+        if repeat_limit is not None:
+            view.query_repeat_limit = repeat_limit
+        return view
+    return decorator
+
+
+def _view_attribute(request, name):
+    """
+    Atributo de presupuesto de la vista resuelta (función, CBV o ViewSet).
+    Un dict se resuelve por la acción del ViewSet ('list', 'retrieve', ...).
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    func = match.func
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    value = getattr(func, name, None)
+    if value is None and view_class is not None:
+        value = getattr(view_class, name, None)
+    if isinstance(value, dict):
+        actions = getattr(func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        value = value.get(action, value.get('default'))
+    return value
+
+
+class QueryBudgetMiddleware:
+    """
+    Cuenta las queries de cada request y avisa si supera el presupuesto o
+    repite la misma query (N+1). Ver docstring del módulo.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', False):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        self._check(request, recorder)
+        return response
+
+    def _check(self, request, recorder):
+        budget = _view_attribute(request, 'query_budget')
+        if budget is None:
+            budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', DEFAULT_BUDGET)
+        repeat_limit = _view_attribute(request, 'query_repeat_limit')
+        if repeat_limit is None:
+            repeat_limit = getattr(settings, 'QUERY_BUDGET_REPEAT_LIMIT', DEFAULT_REPEAT_LIMIT)
+
+        problems = []
+        if recorder.count > budget:
+            problems.append(f"{recorder.count} queries (presupuesto {budget})")
+        for shape, times in recorder.repeated(repeat_limit)[:3]:
+            problems.append(f"posible N+1, {times}x: {shape[:300]}")
+        if not problems:
+            return
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        message = f"[QueryBudget] {request.method} {request.path} ({view}): " + '; '.join(problems)
+
+        if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message, extra={'request': request})
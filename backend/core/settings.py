@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 # Standard Python Libraries
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -35,6 +36,9 @@ SECRET_KEY = config('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = config('DEBUG', default=False, cast=bool)
 
+# Ejecución de la suite de tests (manage.py test)
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '16.52.17.116', '52.44.192.66','admin.softex-labs.xyz','appcitas.softex-labs.xyz']
 
 
@@ -64,6 +68,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'organizacion.health_check.HealthCheckMiddleware',  # /health/live y /health/ready sin el resto de la cadena
+    'core.metrics.MetricsMiddleware',  # Mide el request completo (ver core/metrics.py)
+    'core.query_budget.QueryBudgetMiddleware',  # Presupuesto de queries / N+1 (ver core/query_budget.py)
+    'core.profiling.ProfilingMiddleware',  # X-Profile: 1 (staff) o muestreo (ver core/profiling.py)
+    'core.slow_queries.SlowQueryMiddleware',  # Queries lentas + EXPLAIN (ver core/slow_queries.py)
     'django.middleware.security.SecurityMiddleware',
     'csp.middleware.CSPMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -74,6 +83,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'organizacion.middleware.OrganizacionMiddleware',  # Multi-tenancy: identifica el tenant
+    'organizacion.live_counters.LiveCountersMiddleware',  # Usuarios activos (HyperLogLog, ver organizacion/live_counters.py)
     'core.tenant_middleware.TenantSchemaMiddleware',  # DATABASE-PER-TENANT: setea search_path de PostgreSQL
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -98,6 +108,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+# Stream SSE del panel en tiempo real (organizacion/realtime_activity.py)
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -133,7 +145,8 @@ DATABASE_ROUTERS = ['core.tenant_router.TenantRouter']
 # Caching configuration for Redis
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        # RedisCache de django_redis + métricas de hits/misses
+        "BACKEND": "core.cache_backends.InstrumentedRedisCache",
         "LOCATION": "redis://127.0.0.1:6379/1",  # Using DB 1 for caching
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
@@ -273,7 +286,9 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'x-organization-id',  # Multi-tenant header
+    'x-profile',  # Profiling bajo demanda para staff (core/profiling.py)
 ]
+CORS_EXPOSE_HEADERS = ['x-profile-id']
 
 CORS_ALLOW_CREDENTIALS = True
 
@@ -390,6 +405,82 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', '')
 TWILIO_WHATSAPP_FROM = os.getenv('TWILIO_WHATSAPP_FROM', '')
 
+# ============================================================================
+# LOGGING - Logs WARNING+ a consola y a ApplicationLog (visor de logs del admin)
+# ============================================================================
+# OPTIMIZACIÓN: DatabaseLogHandler encola los logs y los guarda con bulk_create
+# desde un hilo de fondo (ver organizacion/logging_handler.py)
+# Desactivado por defecto: requiere la tabla organizacion_application_log
+# (modelo ApplicationLog, `makemigrations organizacion && migrate`).
+DATABASE_LOGGING = config('DATABASE_LOGGING', default=False, cast=bool) and not TESTING
+# Loggers de la aplicación que llegan a ApplicationLog. No se usa root: los
+# comandos de manage.py, Celery beat y librerías de terceros no escriben en la BD.
+DATABASE_LOGGERS = ['citas', 'core', 'marketing', 'organizacion', 'usuarios', 'django.request']
+
+# ============================================================================
+# MÉTRICAS - Endpoint /metrics en formato Prometheus (ver core/metrics.py)
+# ============================================================================
+# Token para el scraper (Authorization: Bearer <token>); vacío = solo staff.
+# En gunicorn/Celery definir también PROMETHEUS_MULTIPROC_DIR en el entorno.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# ============================================================================
+# PRESUPUESTO DE QUERIES - Detector de N+1 por request (ver core/query_budget.py)
+# ============================================================================
+# Las vistas declaran `query_budget` (int o dict por acción) y `query_repeat_limit`.
+# En producción se registra un warning; en la suite de tests el request falla.
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=TESTING, cast=bool)
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=50, cast=int)
+QUERY_BUDGET_REPEAT_LIMIT = config('QUERY_BUDGET_REPEAT_LIMIT', default=10, cast=int)
+QUERY_BUDGET_RAISE = TESTING
+
+# ============================================================================
+# PROFILING - Perfiles de requests bajo demanda (ver core/profiling.py)
+# ============================================================================
+# Staff: cabecera `X-Profile: 1`. Muestreo aleatorio: fracción de requests (0.0 = apagado).
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_TTL = config('PROFILING_TTL', default=60 * 60 * 24, cast=int)
+PROFILING_MAX_PROFILES = config('PROFILING_MAX_PROFILES', default=200, cast=int)
+
+# ============================================================================
+# QUERIES LENTAS - Captura con EXPLAIN automático (ver core/slow_queries.py)
+# ============================================================================
+SLOW_QUERY_CAPTURE = config('SLOW_QUERY_CAPTURE', default=not TESTING, cast=bool)
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=int)
+SLOW_QUERY_RETENTION_DAYS = config('SLOW_QUERY_RETENTION_DAYS', default=7, cast=int)
+
+# Retención de ApplicationLog (particiones mensuales, ver organizacion/partitioning.py)
+APPLICATION_LOG_RETENTION_DAYS = config('APPLICATION_LOG_RETENTION_DAYS', default=90, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'database': {
+            'class': 'organizacion.logging_handler.DatabaseLogHandler',
+            'level': config('DATABASE_LOG_LEVEL', default='WARNING'),
+            'batch_size': config('DATABASE_LOG_BATCH_SIZE', default=100, cast=int),
+            'flush_interval': config('DATABASE_LOG_FLUSH_INTERVAL', default=0.5, cast=float),
+            'max_queue_size': config('DATABASE_LOG_MAX_QUEUE', default=10000, cast=int),
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        **{
+            name: {'handlers': ['database'], 'level': 'WARNING'}
+            for name in (DATABASE_LOGGERS if DATABASE_LOGGING else [])
+        },
+        # Aviso de fallback a 'public' en cada query de Celery (sin tenant): solo consola
+        'core.tenant_router': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 # ============================================================================
 # SECURITY HEADERS - Solo activos en producción (DEBUG=False)
 # ============================================================================
@@ -0,0 +1,355 @@
+"""
+Captura de queries lentas con EXPLAIN automático.
+
+SlowQueryRecorder es un execute_wrapper que mide cada query; las que tardan
+más de SLOW_QUERY_THRESHOLD_MS se registran en Redis agrupadas por
+fingerprint (forma normalizada del SQL, ver core/query_budget.sql_shape):
+
+- slowq:fp:<fp>            hash con SQL de ejemplo, parámetros, schema,
+                           vista, conteo, tiempo total y el plan
+- slowq:fp:<fp>:durations  últimas MAX_SAMPLES duraciones (p50/p95)
+- slowq:fp:<fp>:sources    conteo por "schema|vista"
+- slowq:index              sorted set fingerprint -> última vez vista
+
+Para los SELECT el plan se obtiene con `EXPLAIN (FORMAT JSON)` en la tarea
+Celery organizacion.tasks.explain_slow_query (como mucho una vez por
+fingerprint cada EXPLAIN_INTERVAL), fuera del request. Todas las claves
+expiran a los SLOW_QUERY_RETENTION_DAYS días sin repetirse.
+
+Se activa en los requests con SlowQueryMiddleware y en las tareas Celery con
+connect_celery_signals(). El admin lo muestra en /admin/slow-queries/.
+
+SECURITY: los parámetros pueden contener datos personales; se guardan
+truncados y solo los ve staff.
+"""
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+from .query_budget import sql_shape
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'slowq'
+INDEX_KEY = f'{KEY_PREFIX}:index'
+MAX_SAMPLES = 500
+MAX_SQL_LENGTH = 10000
+MAX_PARAMS_LENGTH = 2000
+MAX_PER_UNIT = 20  # Queries lentas registradas por request/tarea
+EXPLAIN_INTERVAL = 60 * 60
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _key(fingerprint, suffix=''):
+    return f'{KEY_PREFIX}:fp:{fingerprint}{suffix}'
+
+
+def fingerprint(sql):
+    """Identificador estable de la forma del SQL."""
+    return hashlib.sha1(sql_shape(sql).encode()).hexdigest()[:16]
+
+
+def _serialize_params(params):
+    try:
+        serialized = json.dumps(list(params) if params is not None else None, cls=DjangoJSONEncoder)
+    except (TypeError, ValueError):
+        serialized = json.dumps(repr(params))
+    return serialized[:MAX_PARAMS_LENGTH]
+
+
+def _connection_schema(context):
+    """
+    Schema activo en la conexión que ejecutó la query (current_schema()).
+
+    Se lee de la conexión y no del thread-local de la organización, que las
+    tareas Celery no fijan (cambian el search_path con use_schema). Solo se
+    consulta al registrar una query lenta, con el cursor DB-API para no pasar
+    por los execute_wrappers.
+    """
+    db = (context or {}).get('connection') or connection
+    try:
+        with db.connection.cursor() as cursor:
+            cursor.execute("SELECT current_schema()")
+            return cursor.fetchone()[0] or 'public'
+    except Exception:
+        return 'public'  # Sin conexión o transacción abortada por la propia query
+
+
+def record_slow_query(sql, params, duration_ms, schema_name, source):
+    """
+    Registra una ejecución lenta y encola el EXPLAIN si corresponde.
+
+    Args:
+        sql: SQL con placeholders
+        params: Parámetros de la query
+        duration_ms: Duración en milisegundos
+        schema_name: Schema activo en la conexión al ejecutarla
+        source: Vista o tarea que ejecutó la query
+    """
+    fp = fingerprint(sql)
+    ttl = getattr(settings, 'SLOW_QUERY_RETENTION_DAYS', 7) * 24 * 60 * 60
+    now = time.time()
+    is_select = sql.lstrip()[:6].upper() == 'SELECT'
+    serialized_params = _serialize_params(params)
+
+    pipe = _redis().pipeline()
+    pipe.hset(_key(fp), mapping={
+        'shape': sql_shape(sql)[:MAX_SQL_LENGTH],
+        'sql': sql[:MAX_SQL_LENGTH],
+        'params': serialized_params,
+        'schema': schema_name,
+        'source': source,
+        'last_seen': now,
+    })
+    pipe.hincrby(_key(fp), 'count', 1)
+    pipe.hincrbyfloat(_key(fp), 'total_ms', duration_ms)
+    pipe.lpush(_key(fp, ':durations'), round(duration_ms, 2))
+    pipe.ltrim(_key(fp, ':durations'), 0, MAX_SAMPLES - 1)
+    pipe.hincrby(_key(fp, ':sources'), f'{schema_name}|{source}', 1)
+    pipe.zadd(INDEX_KEY, {fp: now})
+    for key in (_key(fp), _key(fp, ':durations'), _key(fp, ':sources'), INDEX_KEY):
+        pipe.expire(key, ttl)
+    if is_select:
+        # Un EXPLAIN por fingerprint cada EXPLAIN_INTERVAL
+        pipe.set(_key(fp, ':explain_lock'), 1, nx=True, ex=EXPLAIN_INTERVAL)
+    results = pipe.execute()
+
+    if is_select and results[-1]:
+        explain_params = _explain_params(params)
+        if explain_params is not False:
+            from organizacion.tasks import explain_slow_query
+            explain_slow_query.delay(fp, sql, explain_params, schema_name)
+
+
+def _explain_params(params):
+    """Parámetros completos para la tarea de EXPLAIN (False si no son serializables)."""
+    if params is None:
+        return None
+    try:
+        return json.loads(json.dumps(list(params), cls=DjangoJSONEncoder))
+    except (TypeError, ValueError):
+        return False
+
+
+def store_plan(fp, plan):
+    """Guarda el plan de EXPLAIN (JSON) del fingerprint."""
+    try:
+        _redis().hset(_key(fp), mapping={'plan': json.dumps(plan), 'plan_at': time.time()})
+    except Exception as e:
+        logger.warning(f"[SlowQuery] No se pudo guardar el plan de {fp}: {e}")
+
+
+class SlowQueryRecorder:
+    """execute_wrapper que registra las queries que superan el umbral."""
+
+    def __init__(self, source):
+        self.source = source
+        self.threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200)
+        self.recorded = 0
+
+    def get_source(self):
+        return self.source
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if duration_ms >= self.threshold_ms and not many and self.recorded < MAX_PER_UNIT:
+                self.recorded += 1
+                try:
+                    record_slow_query(sql, params, duration_ms, _connection_schema(context), self.get_source())
+                except Exception as e:
+                    logger.debug(f"[SlowQuery] No se pudo registrar la query lenta: {e}")
+
+
+class _RequestRecorder(SlowQueryRecorder):
+    """La vista se resuelve durante el request: se lee al registrar."""
+
+    def __init__(self, request):
+        super().__init__(source='unresolved')
+        self.request = request
+
+    def get_source(self):
+        match = getattr(self.request, 'resolver_match', None)
+        if match is None:
+            return self.source
+        return match.view_name or match._func_path
+
+
+class SlowQueryMiddleware:
+    """Registra las queries lentas del request con el nombre de la vista."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SLOW_QUERY_CAPTURE', False):
+            return self.get_response(request)
+
+        with connection.execute_wrapper(_RequestRecorder(request)):
+            return self.get_response(request)
+
+
+# ---------------------------------------------------------------------------
+# Celery
+# ---------------------------------------------------------------------------
+
+_task_recorders = threading.local()
+
+
+def _task_prerun(task=None, **kwargs):
+    if not getattr(settings, 'SLOW_QUERY_CAPTURE', False):
+        return
+    recorder = SlowQueryRecorder(source=f"task:{getattr(task, 'name', 'unknown')}")
+    _task_recorders.current = recorder
+    connection.execute_wrappers.append(recorder)
+
+
+def _task_postrun(**kwargs):
+    recorder = getattr(_task_recorders, 'current', None)
+    if recorder is None:
+        return
+    _task_recorders.current = None
+    if recorder in connection.execute_wrappers:
+        connection.execute_wrappers.remove(recorder)
+
+
+def connect_celery_signals():
+    """Registra las queries lentas de las tareas (llamar desde core/celery.py)."""
+    from celery.signals import task_postrun, task_prerun
+
+    task_prerun.connect(_task_prerun, weak=False)
+    task_postrun.connect(_task_postrun, weak=False)
+
+
+# ---------------------------------------------------------------------------
+# Lectura (admin)
+# ---------------------------------------------------------------------------
+
+def percentile(values, pct):
+    """Percentil por rango más cercano (values ordenados)."""
+    if not values:
+        return 0.0
+    index = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def slow_query_groups(limit=200):
+    """
+    Fingerprints vistos recientemente con sus estadísticas.
+
+    Returns:
+        Lista de dicts (fingerprint, shape, schema, source, count, total_ms,
+        p50_ms, p95_ms, max_ms, has_plan, last_seen), de mayor a menor tiempo total
+    """
+    try:
+        conn = _redis()
+        fingerprints = [_decode(fp) for fp in conn.zrevrange(INDEX_KEY, 0, limit - 1)]
+        pipe = conn.pipeline()
+        for fp in fingerprints:
+            pipe.hmget(_key(fp), 'shape', 'schema', 'source', 'count', 'total_ms', 'last_seen', 'plan_at')
+            pipe.lrange(_key(fp, ':durations'), 0, -1)
+        results = pipe.execute()
+    except Exception as e:
+        logger.warning(f"[SlowQuery] No se pudieron leer las queries lentas: {e}")
+        return []
+
+    groups = []
+    for i, fp in enumerate(fingerprints):
+        shape, schema, source, count, total_ms, last_seen, plan_at = (_decode(v) for v in results[i * 2])
+        if shape is None:
+            continue  # Expiró entre el índice y el hash
+        durations = sorted(float(d) for d in results[i * 2 + 1])
+        groups.append({
+            'fingerprint': fp,
+            'shape': shape,
+            'schema': schema,
+            'source': source,
+            'count': int(count or 0),
+            'total_ms': round(float(total_ms or 0), 1),
+            'p50_ms': round(percentile(durations, 50), 1),
+            'p95_ms': round(percentile(durations, 95), 1),
+            'max_ms': round(durations[-1], 1) if durations else 0.0,
+            'has_plan': plan_at is not None,
+            'last_seen': float(last_seen or 0),
+        })
+    groups.sort(key=lambda group: group['total_ms'], reverse=True)
+    return groups
+
+
+def seq_scans(plan):
+    """
+    Nodos Seq Scan del plan (candidatos a índice).
+
+    Returns:
+        Lista de dicts (relation, rows, filter)
+    """
+    scans = []
+
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan':
+            scans.append({
+                'relation': node.get('Relation Name'),
+                'rows': node.get('Plan Rows'),
+                'filter': node.get('Filter', ''),
+            })
+        for child in node.get('Plans', []):
+            walk(child)
+
+    if plan:
+        walk(plan[0]['Plan'])
+    return scans
+
+
+def slow_query_detail(fp):
+    """
+    Returns:
+        dict con el hash completo, duraciones, orígenes, plan y seq scans, o None
+    """
+    try:
+        conn = _redis()
+        pipe = conn.pipeline()
+        pipe.hgetall(_key(fp))
+        pipe.lrange(_key(fp, ':durations'), 0, -1)
+        pipe.hgetall(_key(fp, ':sources'))
+        data, durations, sources = pipe.execute()
+    except Exception as e:
+        logger.warning(f"[SlowQuery] No se pudo leer la query {fp}: {e}")
+        return None
+    if not data:
+        return None
+
+    data = {_decode(k): _decode(v) for k, v in data.items()}
+    durations = sorted(float(d) for d in durations)
+    plan = json.loads(data['plan']) if data.get('plan') else None
+    return {
+        'fingerprint': fp,
+        'sql': data.get('sql', ''),
+        'params': data.get('params', ''),
+        'count': int(data.get('count', 0)),
+        'p50_ms': round(percentile(durations, 50), 1),
+        'p95_ms': round(percentile(durations, 95), 1),
+        'max_ms': round(durations[-1], 1) if durations else 0.0,
+        'sources': sorted(
+            ((_decode(k), int(v)) for k, v in sources.items()), key=lambda item: item[1], reverse=True
+        ),
+        'plan': json.dumps(plan, indent=2) if plan else None,
+        'seq_scans': seq_scans(plan),
+    }
@@ -44,6 +44,7 @@ class TenantRouter:
         'usuarios.ActiveJWTToken',  # Session management
         'usuarios.AuditLog',  # Audit log global
         'usuarios.PerfilUsuario',  # MOVED: Perfiles accesibles desde admin sin tenant
+        'citas.TwilioMessageIndex',  # Índice global Twilio SID -> schema (webhook)
     ]
 
     # Tablas que van al schema del tenant actual
@@ -8,18 +8,27 @@ from citas.views import WelcomeView
 from organizacion.admin_dashboard import admin_dashboard
 from organizacion.health_check import system_health
 from organizacion.log_viewer import log_viewer
+from organizacion.profile_viewer import profile_list, profile_detail, profile_report
+from organizacion.slow_query_viewer import slow_query_list, slow_query_detail
 from organizacion.usage_stats import usage_statistics
 from organizacion.realtime_activity import realtime_activity, activity_stream
+from core.metrics import metrics_view
 
 urlpatterns = [
     path('', WelcomeView.as_view(), name='api-root-welcome'),
     path('admin/dashboard/', admin_dashboard, name='admin_dashboard'),
     path('admin/health/', system_health, name='system_health'),
     path('admin/logs/', log_viewer, name='log_viewer'),
+    path('admin/profiles/', profile_list, name='profile_list'),
+    path('admin/profiles/<str:profile_id>/', profile_detail, name='profile_detail'),
+    path('admin/profiles/<str:profile_id>/report/', profile_report, name='profile_report'),
+    path('admin/slow-queries/', slow_query_list, name='slow_query_list'),
+    path('admin/slow-queries/<str:fingerprint>/', slow_query_detail, name='slow_query_detail'),
     path('admin/usage-stats/', usage_statistics, name='usage_stats'),
     path('admin/realtime/', realtime_activity, name='realtime_activity'),
     path('admin/realtime/stream/', activity_stream, name='activity_stream'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/citas/', include('citas.urls', namespace='citas')),
@@ -58,6 +58,22 @@ max_requests_jitter = 50  # Randomize restart to avoid all workers restarting at
 # keyfile = '/path/to/keyfile'
 # certfile = '/path/to/certfile'
 
+def on_starting(server):
+    """Called just before the master process is initialized."""
+    # Métricas Prometheus multiproceso: empezar con el directorio vacío
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for name in os.listdir(multiproc_dir):
+            if name.endswith('.db'):
+                os.remove(os.path.join(multiproc_dir, name))
+
+def child_exit(server, worker):
+    """Called just after a worker has been exited."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
 def when_ready(server):
     """Called just after the server is started."""
     print("Server is ready. Spawning workers")
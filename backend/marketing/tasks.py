@@ -0,0 +1,65 @@
+"""
+Tareas Celery del módulo de marketing.
+"""
+import logging
+import smtplib
+
+from celery import shared_task
+
+from core.mailer import build_message, send_messages
+
+logger = logging.getLogger(__name__)
+
+# Destinatarios por tarea: cada chunk reutiliza una conexión SMTP del worker
+MARKETING_EMAIL_CHUNK_SIZE = 100
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_marketing_email_chunk(self, subject, message, recipients):
+    """
+    Envía un email de marketing a un chunk de destinatarios, un mensaje por
+    destinatario (nadie ve las direcciones de los demás).
+
+    Los mensajes se envían de a uno sobre la conexión compartida: si el
+    servidor falla a mitad del chunk, el reintento incluye solo los
+    destinatarios que faltaban (los anteriores no reciben el email dos veces).
+    Un destinatario rechazado por el servidor se descarta sin reintentar.
+
+    Args:
+        subject: Asunto
+        message: Cuerpo en texto plano
+        recipients: Lista de emails del chunk
+
+    Returns:
+        Número de emails enviados
+    """
+    sent = 0
+    for index, recipient in enumerate(recipients):
+        try:
+            sent += send_messages([build_message(subject, message, recipient)])
+        except smtplib.SMTPRecipientsRefused as exc:
+            logger.warning(f"[Marketing] Destinatario rechazado {recipient}: {exc}")
+        except Exception as exc:
+            remaining = recipients[index:]
+            logger.error(
+                f"[Marketing] Error enviando email ({sent} enviados, {len(remaining)} pendientes "
+                f"del chunk): {exc}"
+            )
+            raise self.retry(exc=exc, args=(subject, message, remaining))
+
+    logger.info(f"[Marketing] Chunk de email enviado: {sent}/{len(recipients)}")
+    return sent
+
+
+def queue_marketing_email(subject, message, recipient_list, chunk_size=MARKETING_EMAIL_CHUNK_SIZE):
+    """
+    Divide los destinatarios en chunks y encola una tarea por chunk.
+
+    Returns:
+        Número de chunks encolados
+    """
+    recipients = list(dict.fromkeys(recipient_list))
+    chunks = [recipients[i:i + chunk_size] for i in range(0, len(recipients), chunk_size)]
+    for chunk in chunks:
+        send_marketing_email_chunk.delay(subject, message, chunk)
+    return len(chunks)
@@ -1,3 +1,107 @@
-from django.test import TestCase
+import unittest
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:  # Dependencia solo de tests
+    Controller = None
+
+
+class _SinkHandler:
+    """Servidor SMTP de prueba: guarda los mensajes y cuenta las conexiones (EHLO)."""
+
+    def __init__(self):
+        self.envelopes = []
+        self.ehlo_count = 0
+        self.fail_once = set()  # Destinatarios que reciben un 451 la primera vez
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.ehlo_count += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if envelope.rcpt_tos[0] in self.fail_once:
+            self.fail_once.discard(envelope.rcpt_tos[0])
+            return '451 Temporary failure'
+        self.envelopes.append(envelope)
+        return '250 Message accepted for delivery'
+
+
+@unittest.skipIf(Controller is None, 'aiosmtpd no está instalado')
+class PooledSMTPTests(SimpleTestCase):
+    """
+    core.mailer contra un servidor SMTP local: una sola conexión reutilizada
+    para muchos mensajes y reconexión si el servidor la cierra.
+    """
+
+    def setUp(self):
+        import socket
+        from core.mailer import close_pooled_connection
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        self.handler = _SinkHandler()
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=port)
+        self.controller.start()
+
+        self.settings_override = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=port,
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            EMAIL_HOST_USER='',
+            EMAIL_HOST_PASSWORD='',
+            DEFAULT_FROM_EMAIL='citas@example.com',
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.addCleanup(self.controller.stop)
+        self.addCleanup(close_pooled_connection)
+        close_pooled_connection()
+
+    def test_batch_reuses_one_connection(self):
+        from core.mailer import build_message, send_messages
+
+        messages = [build_message('Promo', 'Hola', f'cliente{i}@example.com') for i in range(25)]
+        self.assertEqual(send_messages(messages, batch_size=10), 25)
+        self.assertEqual(send_messages(messages[:5]), 5)
+
+        self.assertEqual(len(self.handler.envelopes), 30)
+        self.assertEqual(self.handler.ehlo_count, 1)
+        # Un destinatario por mensaje
+        self.assertTrue(all(len(envelope.rcpt_tos) == 1 for envelope in self.handler.envelopes))
+
+    def test_reconnects_when_connection_is_lost(self):
+        from core.mailer import get_pooled_connection, send_email
+
+        send_email('Uno', 'Hola', ['a@example.com'])
+        get_pooled_connection().connection.close()  # El servidor cortó la conexión
+
+        self.assertEqual(send_email('Dos', 'Hola', ['b@example.com', 'b@example.com']), 1)
+        self.assertEqual(len(self.handler.envelopes), 2)
+        self.assertEqual(self.handler.ehlo_count, 2)
+
+    def test_marketing_chunk_sends_one_message_per_recipient(self):
+        from .tasks import send_marketing_email_chunk
+
+        recipients = [f'cliente{i}@example.com' for i in range(12)]
+        result = send_marketing_email_chunk.apply(args=('Promo', 'Descuento', recipients))
+
+        self.assertEqual(result.get(), 12)
+        self.assertEqual(sorted(e.rcpt_tos[0] for e in self.handler.envelopes), sorted(recipients))
+        self.assertEqual(self.handler.ehlo_count, 1)
+
+    def test_marketing_chunk_retry_skips_already_sent_recipients(self):
+        from .tasks import send_marketing_email_chunk
+
+        recipients = [f'cliente{i}@example.com' for i in range(12)]
+        self.handler.fail_once.add('cliente5@example.com')
+        send_marketing_email_chunk.apply(args=('Promo', 'Descuento', recipients))
+
+        delivered = [e.rcpt_tos[0] for e in self.handler.envelopes]
+        self.assertEqual(sorted(delivered), sorted(recipients))  # Cada uno exactamente una vez
@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import SendMarketingEmailView, SendMarketingWhatsAppView
+from .views import SendMarketingEmailView, SendMarketingWhatsAppView, WhatsAppCampaignDetailView
 
 app_name = 'marketing'
 
 urlpatterns = [
     path('send-email/', SendMarketingEmailView.as_view(), name='send_marketing_email'),
     path('send-whatsapp/', SendMarketingWhatsAppView.as_view(), name='send_marketing_whatsapp'),
+    path('whatsapp-campaigns/<int:campaign_id>/', WhatsAppCampaignDetailView.as_view(), name='whatsapp_campaign_detail'),
 ]
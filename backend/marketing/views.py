@@ -1,4 +1,3 @@
-from django.core.mail import send_mail
 from django.contrib.auth.models import User
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -7,6 +6,10 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from citas.permissions import IsOwnerAdminOrSedeAdmin
 from usuarios.utils import get_perfil_or_first
 from citas.whatsapp.whatsapp_service import whatsapp_service
+from citas.whatsapp.campaign_sender import create_campaign
+from citas.tasks_whatsapp import send_whatsapp_campaign
+from citas.tenant_schemas import current_schema
+from .tasks import queue_marketing_email
 from django.core.files.storage import default_storage
 from django.conf import settings
 from organizacion.thread_locals import set_current_organization
@@ -62,7 +65,9 @@ class SendMarketingEmailView(APIView):
                     perfiles__organizacion=perfil.organizacion
                 )
 
-            recipient_list = [user.email for user in client_users.distinct() if user.email]
+            recipient_list = list(
+                client_users.exclude(email='').values_list('email', flat=True).distinct()
+            )
 
         if not recipient_list:
             return Response(
@@ -71,15 +76,13 @@ class SendMarketingEmailView(APIView):
             )
 
         try:
-            send_mail(
-                subject,
-                message,
-                None,  # Uses DEFAULT_FROM_EMAIL from settings
-                recipient_list,
-                fail_silently=False,
-            )
+            # OPTIMIZACIÓN: Un mensaje por destinatario, enviado en chunks por Celery
+            # (cada worker reutiliza su conexión SMTP) en lugar de un solo email
+            # con todos los clientes en el campo To dentro del request
+            chunks = queue_marketing_email(subject, message, recipient_list)
+            logger.info(f"[Marketing] Email '{subject}' encolado: {len(recipient_list)} destinatarios, {chunks} chunks")
             return Response(
-                {'message': f'Email sent successfully to {len(recipient_list)} recipients.'},
+                {'message': f'Email queued for {len(recipient_list)} recipients.'},
                 status=status.HTTP_200_OK
             )
         except Exception as e:
@@ -208,32 +211,23 @@ class SendMarketingWhatsAppView(APIView):
             # Establecer tenant actual para el router de BD
             set_current_organization(organizacion)
 
-            # Enviar mensajes de forma asíncrona (en background)
-            from django.core.management import call_command
-            import threading
-
-            def send_messages_async():
-                """Función para enviar mensajes en background"""
-                try:
-                    set_current_organization(organizacion)
-                    whatsapp_service.send_bulk_marketing_message(
-                        organizacion=organizacion,
-                        recipient_phones=recipient_phones_list,
-                        recipient_names=recipient_names_list,
-                        message_body=message,
-                        media_url=media_url
-                    )
-                except Exception as e:
-                    logger.error(f"Error enviando WhatsApp en background: {str(e)}")
-
-            # Iniciar thread en background
-            thread = threading.Thread(target=send_messages_async)
-            thread.daemon = True
-            thread.start()
+            # Crear campaña + mensajes (bulk_create) y enviar por chunks en Celery.
+            # A diferencia del thread daemon anterior, sobrevive a reinicios del
+            # worker web y se puede reanudar (solo se reenvía lo pendiente).
+            campaign = create_campaign(
+                organizacion,
+                list(zip(recipient_phones_list, recipient_names_list)),
+                message,
+                media_url=media_url,
+                created_by=request.user,
+            )
+            # El worker no hereda el search_path del request: se le pasa el schema
+            send_whatsapp_campaign.delay(campaign.id, current_schema())
 
             return Response({
                 'message': f'WhatsApp en proceso de envío a {len(recipient_phones_list)} destinatarios.',
                 'total': len(recipient_phones_list),
+                'campaign_id': campaign.id,
                 'status': 'processing'
             }, status=status.HTTP_202_ACCEPTED)
 
@@ -241,4 +235,57 @@ class SendMarketingWhatsAppView(APIView):
             return Response(
                 {'error': f'Error al enviar WhatsApp: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class WhatsAppCampaignDetailView(APIView):
+    """
+    Progreso de una campaña de WhatsApp (GET) y reanudación (POST).
+
+    GET  /api/marketing/whatsapp-campaigns/<id>/
+    POST /api/marketing/whatsapp-campaigns/<id>/  -> reanuda enviando solo lo pendiente
+    """
+    permission_classes = [IsOwnerAdminOrSedeAdmin]
+
+    def _get_campaign(self, request, campaign_id):
+        from citas.models_whatsapp import WhatsAppCampaign
+
+        campaigns = WhatsAppCampaign.objects.all()
+        if not request.user.is_superuser:
+            perfil = get_perfil_or_first(request.user)
+            if not perfil or not perfil.organizacion:
+                return None
+            campaigns = campaigns.filter(organizacion=perfil.organizacion)
+        return campaigns.filter(pk=campaign_id).first()
+
+    def get(self, request, campaign_id, *args, **kwargs):
+        campaign = self._get_campaign(request, campaign_id)
+        if not campaign:
+            return Response({'error': 'Campaña no encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'campaign_id': campaign.id,
+            'status': campaign.status,
+            'total': campaign.total,
+            'sent': campaign.sent_count,
+            'failed': campaign.failed_count,
+            'pending': campaign.pending_count,
+            'created_at': campaign.created_at,
+            'started_at': campaign.started_at,
+            'finished_at': campaign.finished_at,
+        })
+
+    def post(self, request, campaign_id, *args, **kwargs):
+        campaign = self._get_campaign(request, campaign_id)
+        if not campaign:
+            return Response({'error': 'Campaña no encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+        if campaign.status == 'completed':
+            return Response({'message': 'La campaña ya fue completada.'}, status=status.HTTP_200_OK)
+
+        send_whatsapp_campaign.delay(campaign.id, current_schema())
+        return Response({
+            'message': 'Reanudando el envío de la campaña.',
+            'campaign_id': campaign.id,
+            'status': 'processing'
+        }, status=status.HTTP_202_ACCEPTED)
+
@@ -0,0 +1,171 @@
+"""
+Eventos de dominio para el panel de actividad en tiempo real.
+
+Los puntos donde ocurre la actividad publican un evento (ver publish_event):
+- cita_created / cita_cancelled (citas/signals.py, citas/outbox.py)
+- message_sent / message_failed (WhatsAppMessage.mark_as_*, campañas)
+- login (JWT en usuarios/serializers.py y login del admin)
+
+Cada evento, al confirmarse la transacción:
+- incrementa los contadores en vivo (organizacion/live_counters.py),
+- en los logins, registra al usuario en los HyperLogLog de usuarios activos,
+- se agrega a la lista de actividad reciente y
+- se publica en el canal CHANNEL.
+
+El panel (realtime_activity.activity_stream) se suscribe al canal y arma
+el snapshot solo con Redis: no consulta la base de datos.
+Si Redis no responde, los eventos se descartan (el panel no es crítico).
+"""
+import json
+import logging
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from organizacion import live_counters
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'activity:events'
+KEY_PREFIX = 'activity'
+RECENT_KEY = f'{KEY_PREFIX}:recent'
+ORGS_KEY = f'{KEY_PREFIX}:orgs'
+ORG_NAMES_KEY = f'{KEY_PREFIX}:org_names'
+
+HOUR = 60 * 60
+RECENT_LIMIT = 20
+SNAPSHOT_RECENT = 10
+
+# Evento -> métrica de los contadores en vivo
+EVENT_METRICS = {
+    'cita_created': 'citas',
+    'cita_cancelled': 'cancellations',
+    'message_sent': 'messages',
+    'message_failed': 'messages_failed',
+}
+METRICS = ('citas', 'cancellations', 'messages', 'messages_failed')
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def _organizacion_nombre(organizacion_id):
+    from django.core.cache import cache
+    from organizacion.models import Organizacion
+
+    return cache.get_or_set(
+        f'activity:org_name:{organizacion_id}',
+        lambda: Organizacion.objects.filter(pk=organizacion_id).values_list('nombre', flat=True).first() or '',
+        HOUR,
+    )
+
+
+def _record(event_type, organizacion_id, count, data):
+    now = time.time()
+    event = {
+        'type': event_type,
+        'org_id': organizacion_id,
+        'org_nombre': _organizacion_nombre(organizacion_id) if organizacion_id else '',
+        'timestamp': timezone.now().isoformat(),
+        'count': count,
+        **data,
+    }
+
+    pipe = _redis().pipeline()
+    metric = EVENT_METRICS.get(event_type)
+    if metric:
+        live_counters.increment(metric, organizacion_id, count, now=now, pipe=pipe)
+    if event_type == 'login' and data.get('user_id'):
+        live_counters.record_active_user(data['user_id'], organizacion_id, now=now, pipe=pipe)
+    if organizacion_id:
+        pipe.zadd(ORGS_KEY, {organizacion_id: now})
+        pipe.zremrangebyscore(ORGS_KEY, '-inf', now - HOUR)
+        pipe.hset(ORG_NAMES_KEY, organizacion_id, event['org_nombre'])
+    payload = json.dumps(event)
+    pipe.lpush(RECENT_KEY, payload)
+    pipe.ltrim(RECENT_KEY, 0, RECENT_LIMIT - 1)
+    pipe.publish(CHANNEL, payload)
+    pipe.execute()
+
+
+def publish_event(event_type, organizacion_id=None, count=1, **data):
+    """
+    Publica un evento de actividad al confirmar la transacción actual.
+
+    Args:
+        event_type: 'cita_created', 'cita_cancelled', 'message_sent',
+            'message_failed' o 'login'
+        organizacion_id: Organización del evento (None = solo global)
+        count: Ocurrencias que representa el evento (lotes de campañas)
+        **data: Datos extra para la actividad reciente (JSON serializable)
+    """
+    def record():
+        try:
+            _record(event_type, organizacion_id, count, data)
+        except Exception as e:
+            logger.debug(f"[Activity] No se pudo publicar el evento {event_type}: {e}")
+
+    transaction.on_commit(record)
+
+
+def publish_cita_event(cita, event_type):
+    """Publica un evento de la cita con la organización de su sede."""
+    from organizacion.models import Sede
+
+    organizacion_id = None
+    if cita.sede_id:
+        organizacion_id = Sede.all_objects.filter(pk=cita.sede_id).values_list('organizacion_id', flat=True).first()
+    publish_event(event_type, organizacion_id, cita_id=cita.pk, estado=cita.estado)
+
+
+# ---------------------------------------------------------------------------
+# Snapshot (solo Redis)
+# ---------------------------------------------------------------------------
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def snapshot(now=None):
+    """
+    Métricas del panel armadas desde Redis (mismo formato que consume
+    templates/admin/realtime_activity.html).
+
+    Returns:
+        dict con timestamp, global, organizations y recent_activities
+    """
+    now = now or time.time()
+    conn = _redis()
+    org_ids = [int(_decode(org_id)) for org_id in conn.zrangebyscore(ORGS_KEY, now - HOUR, '+inf')]
+
+    counters = live_counters.read_counters(METRICS, org_ids, windows=('minute', 'hour'), now=now)
+    active = live_counters.read_active_users(org_ids, windows=('online',), now=now)
+    pipe = conn.pipeline()
+    pipe.hgetall(ORG_NAMES_KEY)
+    pipe.lrange(RECENT_KEY, 0, SNAPSHOT_RECENT - 1)
+    names, recent = pipe.execute()
+    names = {int(_decode(k)): _decode(v) for k, v in names.items()}
+
+    values = {}
+    for scope, data in counters.items():
+        values[scope] = {'users_online': active[scope]['active_online']}
+        for metric in METRICS:
+            values[scope][f'{metric}_last_minute'] = data[f'{metric}_minute']
+            values[scope][f'{metric}_last_hour'] = data[f'{metric}_hour']
+
+    organizations = []
+    for org_id in org_ids:
+        data = values[org_id]
+        if data['citas_last_hour'] or data['messages_last_hour'] or data['users_online']:
+            organizations.append({'id': org_id, 'nombre': names.get(org_id, ''), **data})
+    organizations.sort(key=lambda org: org['nombre'])
+
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'global': values[live_counters.GLOBAL_SCOPE],
+        'organizations': organizations,
+        'recent_activities': [json.loads(item) for item in recent],
+    }
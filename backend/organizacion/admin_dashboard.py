@@ -10,9 +10,9 @@ from datetime import timedelta
 from django.db.models import Count, Q
 import logging
 
+from organizacion import live_counters
 from organizacion.models import Organizacion
 from usuarios.models import User
-from citas.models_whatsapp import WhatsAppMessage
 
 logger = logging.getLogger(__name__)
 
@@ -36,29 +36,33 @@ def admin_dashboard(request):
     # ===== ESTADÍSTICAS DE ORGANIZACIONES =====
     # Optimización: Usar annotate para obtener counts en una sola query
     organizations = Organizacion.objects.annotate(
-        users_count=Count('perfiles__id', filter=Q(perfiles__usuario__is_active=True), distinct=True),
-        inactive_users_count=Count('perfiles__id', filter=Q(perfiles__usuario__is_active=False), distinct=True),
-        active_users_7d=Count('perfiles__id', filter=Q(perfiles__usuario__last_login__gte=last_7_days), distinct=True),
+        users_count=Count('miembros__id', filter=Q(miembros__user__is_active=True), distinct=True),
+        inactive_users_count=Count('miembros__id', filter=Q(miembros__user__is_active=False), distinct=True),
         sedes_count=Count('sedes__id', distinct=True)
     ).order_by('-created_at')
 
+    # OPTIMIZACIÓN: citas, mensajes y usuarios activos de los últimos 7 días
+    # salen de los contadores en vivo de Redis (número fijo de claves por
+    # organización) en lugar de COUNT(*) sobre el schema de cada tenant.
+    org_ids = [org.id for org in organizations]
+    try:
+        counters = live_counters.read_counters(
+            ('citas', 'messages', 'messages_failed'), org_ids, windows=('7d',)
+        )
+        active_users = live_counters.read_active_users(org_ids, windows=('7d',))
+    except Exception as e:
+        logger.warning(f"[Counters] Contadores en vivo no disponibles: {e}")
+        counters, active_users = {}, {}
+
     organizations_data = []
 
     for org in organizations:
         try:
-            # Estadísticas de citas y mensajes WhatsApp en UNA SOLA query por org
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_cita" WHERE created_at >= %s) as citas_7d,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_whatsapp_message" WHERE created_at >= %s) as messages_7d,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_whatsapp_message" WHERE created_at >= %s AND status = 'failed') as failed_7d
-                """, [last_7_days, last_7_days, last_7_days])
-
-                result = cursor.fetchone()
-                citas_7d = result[0] if result else 0
-                messages_7d = result[1] if result else 0
-                failed_7d = result[2] if result else 0
+            org_counters = counters.get(org.id, {})
+            citas_7d = org_counters.get('citas_7d', 0)
+            failed_7d = org_counters.get('messages_failed_7d', 0)
+            # Mensajes procesados en el período: enviados + fallidos
+            messages_7d = org_counters.get('messages_7d', 0) + failed_7d
 
             # Calcular tasa de error
             error_rate = (failed_7d / messages_7d * 100) if messages_7d > 0 else 0
@@ -80,7 +84,7 @@ def admin_dashboard(request):
                 'schema': org.schema_name,
                 'users_count': org.users_count,
                 'inactive_users_count': org.inactive_users_count,
-                'active_users_7d': org.active_users_7d,
+                'active_users_7d': active_users.get(org.id, {}).get('active_7d', 0),
                 'sedes_count': org.sedes_count,
                 'citas_7d': citas_7d,
                 'messages_7d': messages_7d,
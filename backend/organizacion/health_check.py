@@ -1,16 +1,36 @@
 """
 Panel de Salud del Sistema - Health Check
 Verifica el estado de servicios externos, conectividad y recursos.
+
+ARQUITECTURA:
+- run_checks() ejecuta los checks en paralelo en un pool de threads, cada uno
+  con su timeout (CHECKS). Un check que no responde se informa como error y
+  no bloquea al resto; si sigue colgado, las llamadas siguientes reutilizan
+  la misma ejecución en curso en lugar de abrir otro thread.
+- Los resultados se cachean en memoria del proceso con un TTL por check: los
+  checks de red (Twilio) y de schemas no se repiten en cada request. La caché
+  es por proceso a propósito: disco, memoria y conexión a la base de datos
+  son propios de cada instancia.
+- Endpoints:
+    /health/live   liveness: el proceso responde. Sin base de datos ni Redis.
+    /health/ready  readiness: base de datos (cacheada READINESS_TTL). 200/503.
+    /admin/health/ panel completo para staff (?refresh=1 ignora la caché).
+  Los dos sondeos los responde HealthCheckMiddleware, primero en MIDDLEWARE:
+  no pasan por el resto de middlewares (TenantSchemaMiddleware ejecuta
+  SET search_path en cada request, redirección HTTPS, métricas).
 """
 from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
-from django.db import connection, connections
+from django.db import connection
 from django.conf import settings
 from django.utils import timezone
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import logging
 import psutil
 import os
+import threading
+import time
 
 from organizacion.models import Organizacion
 
@@ -21,6 +41,7 @@ def check_database():
     """Verifica conectividad y estado de la base de datos"""
     try:
         with connection.cursor() as cursor:
+            cursor.execute("SET statement_timeout = %s", [f"{CHECKS['database'][1]}s"])
             cursor.execute("SELECT 1")
             cursor.fetchone()
 
@@ -51,6 +72,7 @@ def check_database():
 def check_twilio():
     """Verifica conectividad con Twilio"""
     try:
+        from twilio.http.http_client import TwilioHttpClient
         from twilio.rest import Client
 
         # Verificar que las credenciales existen
@@ -65,7 +87,7 @@ def check_twilio():
             }
 
         # Intentar conectar
-        client = Client(account_sid, auth_token)
+        client = Client(account_sid, auth_token, http_client=TwilioHttpClient(timeout=CHECKS['twilio'][1]))
         account = client.api.accounts(account_sid).fetch()
 
         return {
@@ -83,65 +105,54 @@ def check_twilio():
         }
 
 
+TENANT_TABLES = ('citas_cita', 'citas_whatsapp_message')
+
+
 def check_migrations():
-    """Verifica estado de migraciones por tenant"""
+    """
+    Verifica estado de migraciones por tenant.
+
+    OPTIMIZACIÓN: una sola consulta a information_schema.tables para todos
+    los schemas (antes: SET search_path + 2 consultas por tenant).
+    """
+    organizaciones = list(Organizacion.objects.order_by('nombre').values('id', 'nombre', 'schema_name'))
+    schemas = sorted({org['schema_name'] or 'public' for org in organizaciones})
+
+    with connection.cursor() as cursor:
+        cursor.execute("SET statement_timeout = %s", [f"{CHECKS['migrations'][1]}s"])
+        cursor.execute("""
+            SELECT table_schema, table_name
+            FROM information_schema.tables
+            WHERE table_schema = ANY(%s)
+            AND table_name = ANY(%s)
+        """, [schemas, list(TENANT_TABLES)])
+        existing = set(cursor.fetchall())
+
     results = []
+    for org in organizaciones:
+        schema = org['schema_name'] or 'public'
+        citas_exists = (schema, 'citas_cita') in existing
+        whatsapp_exists = (schema, 'citas_whatsapp_message') in existing
 
-    for org in Organizacion.objects.all():
-        try:
-            with connection.cursor() as cursor:
-                # Cambiar al schema del tenant
-                cursor.execute(f"SET search_path TO {org.schema_name}")
-
-                # Verificar si existen las tablas principales
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables
-                        WHERE table_schema = %s
-                        AND table_name = 'citas_cita'
-                    )
-                """, [org.schema_name])
-                citas_exists = cursor.fetchone()[0]
-
-                cursor.execute("""
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables
-                        WHERE table_schema = %s
-                        AND table_name = 'citas_whatsapp_message'
-                    )
-                """, [org.schema_name])
-                whatsapp_exists = cursor.fetchone()[0]
-
-                if citas_exists and whatsapp_exists:
-                    status = 'healthy'
-                    message = 'Todas las tablas existen'
-                elif citas_exists or whatsapp_exists:
-                    status = 'warning'
-                    message = 'Algunas tablas faltan'
-                else:
-                    status = 'error'
-                    message = 'Tablas principales no existen'
-
-                results.append({
-                    'org_name': org.nombre,
-                    'org_id': org.id,
-                    'schema': org.schema_name,
-                    'status': status,
-                    'message': message,
-                    'citas_table': citas_exists,
-                    'whatsapp_table': whatsapp_exists,
-                })
-        except Exception as e:
-            logger.error(f"Migration check failed for {org.nombre}: {str(e)}")
-            results.append({
-                'org_name': org.nombre,
-                'org_id': org.id,
-                'schema': org.schema_name,
-                'status': 'error',
-                'message': str(e),
-                'citas_table': False,
-                'whatsapp_table': False,
-            })
+        if citas_exists and whatsapp_exists:
+            status = 'healthy'
+            message = 'Todas las tablas existen'
+        elif citas_exists or whatsapp_exists:
+            status = 'warning'
+            message = 'Algunas tablas faltan'
+        else:
+            status = 'error'
+            message = 'Tablas principales no existen'
+
+        results.append({
+            'org_name': org['nombre'],
+            'org_id': org['id'],
+            'schema': schema,
+            'status': status,
+            'message': message,
+            'citas_table': citas_exists,
+            'whatsapp_table': whatsapp_exists,
+        })
 
     return results
 
@@ -241,6 +252,152 @@ def check_webhook_connectivity():
         }
 
 
+# ---------------------------------------------------------------------------
+# Ejecución concurrente con timeout y caché
+# ---------------------------------------------------------------------------
+
+# nombre -> (función, timeout en segundos, TTL de la caché en segundos)
+CHECKS = {
+    'database': (check_database, 3, 10),
+    'twilio': (check_twilio, 5, 300),
+    'migrations': (check_migrations, 5, 300),
+    'disk': (check_disk_space, 2, 60),
+    'memory': (check_memory, 2, 10),
+    'webhook': (check_webhook_connectivity, 1, 300),
+}
+READINESS_CHECKS = ('database',)
+READINESS_TTL = 5
+
+_executor = ThreadPoolExecutor(max_workers=len(CHECKS), thread_name_prefix='health-check')
+_lock = threading.Lock()
+_cache = {}     # nombre -> (expira, resultado)
+_inflight = {}  # nombre -> Future en ejecución
+
+
+def _run_isolated(func):
+    """Ejecuta el check en el thread del pool y cierra su conexión a la base de datos."""
+    from django.db import connections
+
+    try:
+        return func()
+    finally:
+        # Las conexiones de Django son por thread: no dejar una abierta por worker del pool
+        connections.close_all()
+
+
+def _failed(name, message):
+    logger.error(f"[Health] Check {name} falló: {message}")
+    if name == 'migrations':
+        return [{
+            'org_name': 'Todas las organizaciones',
+            'org_id': None,
+            'schema': '-',
+            'status': 'error',
+            'message': message,
+            'citas_table': False,
+            'whatsapp_table': False,
+        }]
+    return {'status': 'error', 'message': message}
+
+
+def run_checks(names=None, ttl=None, use_cache=True):
+    """
+    Ejecuta los checks en paralelo, cada uno con su timeout.
+
+    Args:
+        names: Checks a ejecutar (claves de CHECKS); None = todos
+        ttl: TTL de caché a usar en lugar del de CHECKS
+        use_cache: False fuerza la verificación (los resultados nuevos se cachean igual)
+
+    Returns:
+        dict nombre -> resultado del check
+    """
+    names = list(names or CHECKS)
+    now = time.monotonic()
+    results = {}
+    futures = {}
+
+    with _lock:
+        for name in names:
+            cached = _cache.get(name)
+            if use_cache and cached and cached[0] > now:
+                results[name] = cached[1]
+                continue
+            future = _inflight.get(name)
+            if future is None or future.done():
+                future = _executor.submit(_run_isolated, CHECKS[name][0])
+                _inflight[name] = future
+            futures[name] = future
+
+    for name, future in futures.items():
+        timeout = CHECKS[name][1]
+        try:
+            result = future.result(timeout=max(timeout - (time.monotonic() - now), 0))
+        except FutureTimeoutError:
+            results[name] = _failed(name, f'Sin respuesta en {timeout}s')
+            continue
+        except Exception as e:
+            results[name] = _failed(name, f'Error: {str(e)}')
+            continue
+
+        results[name] = result
+        with _lock:
+            _cache[name] = (time.monotonic() + (CHECKS[name][2] if ttl is None else ttl), result)
+            if _inflight.get(name) is future:
+                del _inflight[name]
+
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Endpoints
+# ---------------------------------------------------------------------------
+
+def liveness(request):
+    """
+    Liveness para el orquestador / balanceador: el proceso atiende requests.
+    No toca la base de datos ni Redis.
+    """
+    return JsonResponse({'status': 'ok'})
+
+
+def readiness(request):
+    """
+    Readiness: la instancia puede atender tráfico (base de datos accesible).
+    El resultado se cachea READINESS_TTL segundos por proceso, así los
+    sondeos del balanceador no agregan carga a la base de datos.
+    """
+    results = run_checks(READINESS_CHECKS, ttl=READINESS_TTL)
+    ready = all(result['status'] == 'healthy' for result in results.values())
+    # SECURITY: sin detalles (endpoint público); el detalle está en /admin/health/
+    return JsonResponse(
+        {'status': 'ok' if ready else 'unavailable', 'checks': {name: r['status'] for name, r in results.items()}},
+        status=200 if ready else 503,
+    )
+
+
+PROBES = {
+    '/health/live': liveness,
+    '/health/ready': readiness,
+}
+
+
+class HealthCheckMiddleware:
+    """Responde los sondeos de liveness/readiness antes del resto de middlewares."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        probe = PROBES.get(request.path_info.rstrip('/'))
+        if probe is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+
+        response = probe(request)
+        response['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
+        return response
+
+
 @staff_member_required
 def system_health(request):
     """
@@ -248,14 +405,14 @@ def system_health(request):
     Muestra el estado de todos los componentes y servicios.
     """
 
-    # Ejecutar todos los health checks
-    db_health = check_database()
-    twilio_health = check_twilio()
-    disk_health = check_disk_space()
-    memory_health = check_memory()
-    webhook_health = check_webhook_connectivity()
-    migration_status = check_migrations()
-
+    # Ejecutar todos los health checks (en paralelo, cacheados salvo ?refresh=1)
+    results = run_checks(use_cache=request.GET.get('refresh') != '1')
+    db_health = results['database']
+    twilio_health = results['twilio']
+    disk_health = results['disk']
+    memory_health = results['memory']
+    webhook_health = results['webhook']
+    migration_status = results['migrations']
     # Calcular estado general del sistema
     critical_checks = [
         db_health['status'] == 'error',
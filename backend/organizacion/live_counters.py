@@ -0,0 +1,239 @@
+"""
+Contadores en vivo del sistema en Redis (por tenant y globales).
+
+Reemplazan los COUNT(*) sobre cada schema de tenant en los paneles del admin
+(realtime_activity, admin_dashboard, usage_stats).
+
+- Contadores de eventos (citas, cancelaciones, mensajes enviados/fallidos):
+  buckets por minuto, hora y día (`counter:<métrica>:<alcance>:<gran>:<bucket>`)
+  incrementados desde los eventos de dominio (organizacion/activity_events.py).
+  "Último minuto/hora/día" se lee con dos claves y ventana deslizante
+  aproximada: bucket actual + bucket anterior ponderado por la fracción que
+  sigue dentro de la ventana. "Últimos N días" suma N+1 buckets diarios.
+- Usuarios activos distintos: HyperLogLog por minuto, hora y día
+  (`hll:active:<alcance>:<gran>:<bucket>`), alimentado por
+  LiveCountersMiddleware (un PFADD por usuario y minuto por proceso).
+
+Todas las lecturas usan un número fijo de claves (no dependen del volumen de
+datos) y se hacen en un pipeline. Los buckets diarios se conservan
+DAY_RETENTION_DAYS días. Los contadores empiezan a contar al desplegar;
+`python manage.py backfill_live_counters` siembra los días anteriores.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY_SECONDS = {'minute': 60, 'hour': 60 * 60, 'day': 24 * 60 * 60}
+DAY_RETENTION_DAYS = 35
+TTL_SECONDS = {
+    'minute': 2 * 60 * 60,
+    'hour': 2 * 24 * 60 * 60,
+    'day': DAY_RETENTION_DAYS * 24 * 60 * 60,
+}
+ONLINE_MINUTES = 5
+GLOBAL_SCOPE = 'global'
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def bucket(granularity, timestamp):
+    return int(timestamp) // GRANULARITY_SECONDS[granularity]
+
+
+def _counter_key(metric, scope, granularity, index):
+    return f'counter:{metric}:{scope}:{granularity}:{index}'
+
+
+def _hll_key(scope, granularity, index):
+    return f'hll:active:{scope}:{granularity}:{index}'
+
+
+def _scopes(organizacion_id):
+    return [GLOBAL_SCOPE] + ([str(organizacion_id)] if organizacion_id else [])
+
+
+# ---------------------------------------------------------------------------
+# Escritura
+# ---------------------------------------------------------------------------
+
+def increment(metric, organizacion_id=None, count=1, now=None, pipe=None):
+    """
+    Incrementa la métrica en los buckets de minuto, hora y día, para el
+    tenant y el global.
+
+    Args:
+        metric: Nombre de la métrica ('citas', 'messages', ...)
+        organizacion_id: Tenant (None = solo global)
+        count: Cantidad a sumar
+        now: Timestamp (para tests)
+        pipe: Pipeline de Redis existente (se ejecuta fuera); si no, se crea uno
+    """
+    now = now or time.time()
+    own_pipe = pipe is None
+    pipe = _redis().pipeline() if own_pipe else pipe
+    for scope in _scopes(organizacion_id):
+        for granularity in GRANULARITY_SECONDS:
+            key = _counter_key(metric, scope, granularity, bucket(granularity, now))
+            pipe.incrby(key, count)
+            pipe.expire(key, TTL_SECONDS[granularity])
+    if own_pipe:
+        pipe.execute()
+
+
+def record_active_user(user_id, organizacion_id=None, now=None, pipe=None):
+    """Agrega el usuario a los HyperLogLog de minuto, hora y día."""
+    now = now or time.time()
+    own_pipe = pipe is None
+    pipe = _redis().pipeline() if own_pipe else pipe
+    for scope in _scopes(organizacion_id):
+        for granularity in GRANULARITY_SECONDS:
+            key = _hll_key(scope, granularity, bucket(granularity, now))
+            pipe.pfadd(key, user_id)
+            pipe.expire(key, TTL_SECONDS[granularity])
+    if own_pipe:
+        pipe.execute()
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+def _window_keys(metric, scope, granularity, buckets, now):
+    current = bucket(granularity, now)
+    return [_counter_key(metric, scope, granularity, current - offset) for offset in range(buckets + 1)]
+
+
+def _sliding_sum(values, granularity, now):
+    """
+    Suma de los `len(values) - 1` buckets más recientes más la parte del
+    bucket más antiguo que sigue dentro de la ventana.
+    """
+    values = [int(value or 0) for value in values]
+    seconds = GRANULARITY_SECONDS[granularity]
+    elapsed = (now % seconds) / seconds
+    return round(sum(values[:-1]) + values[-1] * (1 - elapsed))
+
+
+# Ventanas de lectura: nombre -> (granularidad, buckets)
+WINDOWS = {
+    'minute': ('minute', 1),
+    'hour': ('hour', 1),
+    'day': ('day', 1),
+    '7d': ('day', 7),
+    '30d': ('day', 30),
+}
+
+
+def read_counters(metrics, organizacion_ids=(), windows=('minute', 'hour', 'day'), now=None):
+    """
+    Lee varias métricas y ventanas para el global y los tenants indicados
+    en un solo pipeline.
+
+    Returns:
+        dict alcance ('global' o id del tenant) -> {'<métrica>_<ventana>': int}
+    """
+    now = now or time.time()
+    scopes = [GLOBAL_SCOPE] + [str(org_id) for org_id in organizacion_ids]
+    plan = []
+    pipe = _redis().pipeline()
+    for scope in scopes:
+        for metric in metrics:
+            for window in windows:
+                granularity, buckets = WINDOWS[window]
+                pipe.mget(_window_keys(metric, scope, granularity, buckets, now))
+                plan.append((scope, f'{metric}_{window}', granularity))
+    results = pipe.execute()
+
+    counters = {scope: {} for scope in scopes}
+    for (scope, name, granularity), values in zip(plan, results):
+        counters[scope][name] = _sliding_sum(values, granularity, now)
+    return {(int(scope) if scope != GLOBAL_SCOPE else scope): data for scope, data in counters.items()}
+
+
+# Ventanas de usuarios distintos: nombre -> (granularidad, buckets)
+ACTIVE_WINDOWS = {
+    'online': ('minute', ONLINE_MINUTES),
+    'hour': ('minute', 60),
+    'day': ('hour', 24),
+    '7d': ('day', 7),
+    '30d': ('day', 30),
+}
+
+
+def read_active_users(organizacion_ids=(), windows=('online',), now=None):
+    """
+    Usuarios distintos activos (PFCOUNT de la unión de buckets; error ~0.8%).
+
+    Returns:
+        dict alcance -> {'active_<ventana>': int}
+    """
+    now = now or time.time()
+    scopes = [GLOBAL_SCOPE] + [str(org_id) for org_id in organizacion_ids]
+    plan = []
+    pipe = _redis().pipeline()
+    for scope in scopes:
+        for window in windows:
+            granularity, buckets = ACTIVE_WINDOWS[window]
+            current = bucket(granularity, now)
+            pipe.pfcount(*[_hll_key(scope, granularity, current - offset) for offset in range(buckets)])
+            plan.append((scope, f'active_{window}'))
+    results = pipe.execute()
+
+    active = {scope: {} for scope in scopes}
+    for (scope, name), value in zip(plan, results):
+        active[scope][name] = int(value)
+    return {(int(scope) if scope != GLOBAL_SCOPE else scope): data for scope, data in active.items()}
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+_seen_lock = threading.Lock()
+_seen = {'minute': None, 'keys': set()}
+
+
+def _first_time_this_minute(user_id, organizacion_id, now):
+    """True la primera vez que el proceso ve al usuario (y tenant) en el minuto."""
+    minute = bucket('minute', now)
+    key = (user_id, organizacion_id)
+    with _seen_lock:
+        if _seen['minute'] != minute:
+            _seen['minute'] = minute
+            _seen['keys'] = set()
+        if key in _seen['keys']:
+            return False
+        _seen['keys'].add(key)
+        return True
+
+
+class LiveCountersMiddleware:
+    """
+    Registra el usuario autenticado en los HyperLogLog de usuarios activos.
+    Se lee request.user al terminar: con JWT, DRF lo autentica dentro de la vista.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            from organizacion.thread_locals import get_current_organization
+
+            org = get_current_organization()
+            organizacion_id = getattr(org, 'id', None)
+            now = time.time()
+            if _first_time_this_minute(user.pk, organizacion_id, now):
+                try:
+                    record_active_user(user.pk, organizacion_id, now)
+                except Exception as e:
+                    logger.debug(f"[Counters] No se pudo registrar el usuario activo: {e}")
+        return response
@@ -0,0 +1,179 @@
+"""
+Búsqueda y estadísticas del visor de logs sin table scans.
+
+- Búsqueda: columna generada `search_vector` (tsvector de message, pathname,
+  func_name y exc_info) con índice GIN. Se crea con
+  `python manage.py setup_log_search`; mientras no exista, la búsqueda usa
+  icontains como antes. La búsqueda es por palabras (websearch_to_tsquery:
+  "error twilio", "\"slot ocupado\"", "-debug"), no por subcadenas.
+- Conteos: si el planner estima más de EXACT_COUNT_THRESHOLD filas se usa
+  la estimación de EXPLAIN (pg_class.reltuples + estadísticas por columna)
+  en lugar de COUNT(*). Las estadísticas y los loggers únicos se cachean.
+"""
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'simple'
+SEARCH_INDEX_NAME = 'organizacion_application_log_search_idx'
+EXACT_COUNT_THRESHOLD = 10000
+STATS_CACHE_TIMEOUT = 60
+LOGGERS_CACHE_TIMEOUT = 60 * 10
+SEARCH_COLUMN_CACHE_TIMEOUT = 60 * 5
+
+# Tracebacks enormes: to_tsvector falla con textos de más de 1MB
+SEARCH_VECTOR_SQL = f"""
+    to_tsvector('{SEARCH_CONFIG}'::regconfig,
+        left(coalesce(message, ''), 100000) || ' ' ||
+        coalesce(pathname, '') || ' ' ||
+        coalesce(func_name, '') || ' ' ||
+        left(coalesce(exc_info, ''), 100000))
+"""
+
+
+def has_search_vector():
+    """True si la tabla ya tiene la columna search_vector (cacheado)."""
+    key = 'logs:has_search_vector'
+    try:
+        cached = cache.get(key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return cached
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'public'
+              AND table_name = 'organizacion_application_log'
+              AND column_name = 'search_vector'
+        """)
+        exists = cursor.fetchone() is not None
+
+    try:
+        cache.set(key, exists, SEARCH_COLUMN_CACHE_TIMEOUT)
+    except Exception:
+        pass
+    return exists
+
+
+def apply_search(queryset, text):
+    """
+    Filtra los logs por texto: índice GIN si existe, icontains si no.
+    """
+    if has_search_vector():
+        return queryset.extra(
+            where=[f"search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)"],
+            params=[text],
+        )
+    return queryset.filter(
+        Q(message__icontains=text) |
+        Q(pathname__icontains=text) |
+        Q(func_name__icontains=text) |
+        Q(exc_info__icontains=text)
+    )
+
+
+def estimated_count(queryset):
+    """
+    Filas estimadas por el planner para el queryset (EXPLAIN, sin ejecutarlo).
+
+    Returns:
+        int con la estimación, o None si no se pudo obtener
+    """
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        logger.debug(f"[Logs] No se pudo estimar el conteo: {e}")
+        return None
+
+
+def fast_count(queryset):
+    """
+    Conteo exacto si el resultado es chico, estimado si es grande.
+
+    Returns:
+        Tupla (conteo, es_estimado)
+    """
+    estimate = estimated_count(queryset)
+    if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+        return estimate, True
+    return queryset.count(), False
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator que no hace COUNT(*) sobre resultados grandes."""
+
+    @cached_property
+    def count(self):
+        count, self.is_estimated = fast_count(self.object_list)
+        return count
+
+
+def _cached(key, timeout, compute):
+    try:
+        value = cache.get(key)
+    except Exception:
+        value = None
+    if value is None:
+        value = compute()
+        try:
+            cache.set(key, value, timeout)
+        except Exception:
+            pass
+    return value
+
+
+def log_stats(queryset, filters):
+    """
+    Total, errores y advertencias del queryset filtrado (cacheado por filtros).
+
+    Args:
+        queryset: Logs ya filtrados
+        filters: dict de filtros activos (forma parte de la clave de cache)
+
+    Returns:
+        dict con total, errors, warnings y estimated
+    """
+    digest = hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+
+    def compute():
+        total, total_estimated = fast_count(queryset)
+        errors, errors_estimated = fast_count(queryset.filter(level__in=['ERROR', 'CRITICAL']))
+        warnings, warnings_estimated = fast_count(queryset.filter(level='WARNING'))
+        return {
+            'total': total,
+            'errors': errors,
+            'warnings': warnings,
+            'estimated': total_estimated or errors_estimated or warnings_estimated,
+        }
+
+    return _cached(f'logs:stats:{digest}', STATS_CACHE_TIMEOUT, compute)
+
+
+def unique_loggers(limit=50):
+    """Nombres de logger para el filtro (DISTINCT cacheado)."""
+    from .models_logs import ApplicationLog
+
+    return _cached(
+        f'logs:unique_loggers:{limit}',
+        LOGGERS_CACHE_TIMEOUT,
+        lambda: list(
+            ApplicationLog.objects.values_list('logger_name', flat=True)
+            .distinct().order_by('logger_name')[:limit]
+        ),
+    )
@@ -3,8 +3,7 @@ Visor de logs para el panel de administración.
 """
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
-from django.core.paginator import Paginator
-from django.db.models import Q
+from organizacion.log_search import EstimatedCountPaginator, apply_search, log_stats, unique_loggers
 from organizacion.models_logs import ApplicationLog
 from organizacion.models import Organizacion
 
@@ -37,48 +36,33 @@ def log_viewer(request):
     if logger_name:
         logs = logs.filter(logger_name__icontains=logger_name)
 
-    # Búsqueda en mensaje
+    # Búsqueda en mensaje (índice GIN full-text, ver log_search.py)
     if search:
-        logs = logs.filter(
-            Q(message__icontains=search) |
-            Q(pathname__icontains=search) |
-            Q(func_name__icontains=search) |
-            Q(exc_info__icontains=search)
-        )
+        logs = apply_search(logs, search)
 
-    # Paginación
-    paginator = Paginator(logs, 50)  # 50 logs por página
+    # Paginación (sin COUNT(*) exacto sobre resultados grandes)
+    paginator = EstimatedCountPaginator(logs, 50)  # 50 logs por página
     page_obj = paginator.get_page(page)
 
     # Obtener lista de organizaciones para el filtro
     organizations = Organizacion.objects.all().order_by('nombre')
 
-    # Obtener loggers únicos para el filtro
-    unique_loggers = ApplicationLog.objects.values_list(
-        'logger_name', flat=True
-    ).distinct().order_by('logger_name')[:50]  # Limitar a 50 loggers más comunes
-
-    # Estadísticas rápidas
-    total_logs = logs.count()
-    error_count = logs.filter(level__in=['ERROR', 'CRITICAL']).count()
-    warning_count = logs.filter(level='WARNING').count()
+    # Filtros activos (también son la clave de cache de las estadísticas)
+    filters = {
+        'level': level,
+        'org_id': org_id,
+        'search': search,
+        'logger_name': logger_name,
+    }
 
     context = {
         'page_obj': page_obj,
         'organizations': organizations,
-        'unique_loggers': unique_loggers,
+        # OPTIMIZACIÓN: loggers únicos y estadísticas cacheadas/estimadas
+        'unique_loggers': unique_loggers(),
         'level_choices': ApplicationLog.LEVEL_CHOICES,
-        'filters': {
-            'level': level,
-            'org_id': org_id,
-            'search': search,
-            'logger_name': logger_name,
-        },
-        'stats': {
-            'total': total_logs,
-            'errors': error_count,
-            'warnings': warning_count,
-        }
+        'filters': filters,
+        'stats': log_stats(logs, filters),
     }
 
     return render(request, 'admin/log_viewer.html', context)
@@ -1,80 +1,238 @@
 """
 Custom logging handler para guardar logs en base de datos.
+
+OPTIMIZACIÓN: emit() ya no hace un INSERT por log en el hilo del request.
+Solo arma los campos del ApplicationLog (organización, usuario y request se
+leen en el hilo que loguea) y los agrega a una cola en memoria. Un hilo de
+fondo por proceso los guarda con bulk_create cada `batch_size` registros o
+cada `flush_interval` segundos, lo que ocurra primero.
+
+- La cola es acotada (`max_queue_size`): si la BD no da abasto se descartan
+  los logs MÁS VIEJOS y se informa cuántos por stderr.
+- close()/flush() (logging.shutdown al salir, worker_process_shutdown en
+  Celery) guardan lo pendiente antes de terminar.
+- Después de un fork (gunicorn/Celery prefork) el proceso hijo arranca con la
+  cola vacía y crea su propio hilo la primera vez que loguea.
 """
+import atexit
+import collections
 import logging
+import os
+import sys
+import threading
 import traceback
-from django.conf import settings
+import weakref
+from datetime import datetime, timezone as dt_timezone
+
+
+_handlers = weakref.WeakSet()
 
 
 class DatabaseLogHandler(logging.Handler):
     """
-    Handler que guarda logs en la base de datos usando el modelo ApplicationLog.
+    Handler que guarda logs en la base de datos usando el modelo ApplicationLog,
+    por lotes y desde un hilo de fondo.
+
+    Args:
+        batch_size: Registros por bulk_create
+        flush_interval: Segundos máximos que un log espera en la cola
+        max_queue_size: Registros en memoria antes de descartar los más viejos
     """
 
+    def __init__(self, level=logging.NOTSET, batch_size=100, flush_interval=0.5, max_queue_size=10000):
+        super().__init__(level)
+        self.batch_size = int(batch_size)
+        self.flush_interval = float(flush_interval)
+        self.max_queue_size = int(max_queue_size)
+
+        self._queue = collections.deque()
+        self._queue_lock = threading.Lock()
+        self._flush_lock = threading.RLock()  # close() puede loguear mientras guarda
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._dropped = 0
+        self._worker = None
+        _handlers.add(self)
+
+    # ------------------------------------------------------------------
+    # Hilo que loguea
+    # ------------------------------------------------------------------
+
     def emit(self, record):
         """
-        Guarda el log record en la base de datos.
+        Encola el log record; el INSERT lo hace el hilo de fondo.
+        """
+        # Logs generados por el propio guardado (ej: errores de la BD): evitar bucles
+        if self._worker is not None and record.thread == self._worker.ident:
+            return
+
+        try:
+            fields = self._record_fields(record)
+        except Exception as e:
+            print(f"Error preparing log for database: {str(e)}", file=sys.stderr)
+            return
+
+        with self._queue_lock:
+            if len(self._queue) >= self.max_queue_size:
+                # Sobrecarga: descartar el más viejo
+                self._queue.popleft()
+                self._dropped += 1
+            self._queue.append(fields)
+            queued = len(self._queue)
+
+        if self._stopped:
+            # Después de close() (ej: logs durante el apagado): guardar en línea
+            self.flush()
+            return
+
+        self._ensure_worker()
+        if queued >= self.batch_size:
+            self._wakeup.set()
+
+    def _record_fields(self, record):
+        """Campos de ApplicationLog a partir del record (en el hilo que loguea)."""
+        from organizacion.thread_locals import get_current_organization
+
+        # Obtener organización actual del thread local si existe
+        organizacion_id = None
+        try:
+            organizacion = get_current_organization()
+            organizacion_id = getattr(organizacion, 'pk', None)
+        except Exception:
+            pass
+
+        # Obtener información del usuario si está disponible
+        user_id = None
+        user_username = ''
+        if hasattr(record, 'request') and hasattr(record.request, 'user'):
+            user = record.request.user
+            if user and user.is_authenticated:
+                user_id = user.id
+                user_username = user.username
+
+        # Obtener traceback si hay excepción
+        exc_info_str = ''
+        if record.exc_info:
+            exc_info_str = ''.join(traceback.format_exception(*record.exc_info))
+
+        # Obtener información del request si está disponible
+        request_path = ''
+        request_method = ''
+        request_user_agent = ''
+        if hasattr(record, 'request'):
+            req = record.request
+            request_path = getattr(req, 'path', '')
+            request_method = getattr(req, 'method', '')
+            if hasattr(req, 'META'):
+                request_user_agent = req.META.get('HTTP_USER_AGENT', '')[:500]
+
+        return {
+            'level': record.levelname,
+            'logger_name': record.name[:200],
+            'message': record.getMessage(),
+            'organizacion_id': organizacion_id,
+            'user_id': user_id,
+            'user_username': user_username,
+            'pathname': (record.pathname or '')[:500],
+            'func_name': (record.funcName or '')[:100],
+            'lineno': record.lineno,
+            'exc_info': exc_info_str,
+            'request_path': request_path[:500],
+            'request_method': request_method,
+            'request_user_agent': request_user_agent,
+            # Momento del log, no del INSERT
+            'created_at': datetime.fromtimestamp(record.created, tz=dt_timezone.utc),
+        }
+
+    # ------------------------------------------------------------------
+    # Hilo de fondo
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._queue_lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name='database-log-handler', daemon=True
+            )
+            self._worker.start()
+
+    def _after_fork_in_child(self):
+        # El hilo no sobrevive al fork y los locks pudieron copiarse tomados.
+        # Los logs copiados de la cola los guarda el proceso padre.
+        self._queue_lock = threading.Lock()
+        self._flush_lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._queue.clear()
+        self._dropped = 0
+        self._worker = None
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Guarda todo lo encolado (por lotes de batch_size).
         """
+        with self._flush_lock:
+            while True:
+                with self._queue_lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                    dropped, self._dropped = self._dropped, 0
+                if dropped:
+                    print(f"DatabaseLogHandler: {dropped} logs descartados por sobrecarga", file=sys.stderr)
+                if not batch:
+                    return
+                self._save_batch(batch)
+
+    def _save_batch(self, batch):
         try:
             # Importar aquí para evitar circular imports
+            from django.db import connection
             from organizacion.models_logs import ApplicationLog
-            from organizacion.thread_locals import get_current_organization
-
-            # Obtener organización actual del thread local si existe
-            organizacion = None
-            try:
-                organizacion = get_current_organization()
-            except Exception:
-                pass
-
-            # Obtener información del usuario si está disponible
-            user_id = None
-            user_username = ''
-            if hasattr(record, 'request') and hasattr(record.request, 'user'):
-                user = record.request.user
-                if user and user.is_authenticated:
-                    user_id = user.id
-                    user_username = user.username
-
-            # Obtener traceback si hay excepción
-            exc_info_str = ''
-            if record.exc_info:
-                exc_info_str = ''.join(traceback.format_exception(*record.exc_info))
-
-            # Obtener información del request si está disponible
-            request_path = ''
-            request_method = ''
-            request_user_agent = ''
-            if hasattr(record, 'request'):
-                req = record.request
-                request_path = getattr(req, 'path', '')
-                request_method = getattr(req, 'method', '')
-                if hasattr(req, 'META'):
-                    request_user_agent = req.META.get('HTTP_USER_AGENT', '')[:500]
-
-            # Crear el log en la base de datos
-            ApplicationLog.objects.create(
-                level=record.levelname,
-                logger_name=record.name,
-                message=record.getMessage(),
-                organizacion=organizacion,
-                user_id=user_id,
-                user_username=user_username,
-                pathname=record.pathname,
-                func_name=record.funcName,
-                lineno=record.lineno,
-                exc_info=exc_info_str,
-                request_path=request_path,
-                request_method=request_method,
-                request_user_agent=request_user_agent,
-            )
 
+            connection.close_if_unusable_or_obsolete()
+            # ARQUITECTURA: los logs van en el schema 'public' (compartido)
+            with connection.cursor() as cursor:
+                cursor.execute("SET search_path TO public;")
+            ApplicationLog.objects.bulk_create([ApplicationLog(**fields) for fields in batch])
         except Exception as e:
             # No queremos que un error en el logging rompa la aplicación
             # Solo loggear en stderr
-            import sys
-            print(f"Error saving log to database: {str(e)}", file=sys.stderr)
+            print(f"Error saving {len(batch)} logs to database: {str(e)}", file=sys.stderr)
+
+    def close(self):
+        """Detiene el hilo de fondo y guarda los logs pendientes."""
+        self._stopped = True
+        self._wakeup.set()
+        worker = self._worker
+        if worker is not None and worker.is_alive() and worker is not threading.current_thread():
+            worker.join(timeout=max(self.flush_interval * 4, 2))
+        self.flush()
+        super().close()
 
     def format(self, record):
         """No necesitamos formatear porque guardamos campos individuales"""
         return record.getMessage()
+
+
+def flush_database_logs():
+    """Guarda los logs encolados de todos los DatabaseLogHandler del proceso."""
+    for handler in list(_handlers):
+        handler.flush()
+
+
+def _reset_handlers_after_fork():
+    for handler in list(_handlers):
+        handler._after_fork_in_child()
+
+
+# logging.shutdown() ya llama close(); esto cubre procesos que terminan sin él
+atexit.register(flush_database_logs)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_handlers_after_fork)
@@ -0,0 +1,92 @@
+"""
+Siembra los buckets diarios de los contadores en vivo con datos históricos.
+
+Uso:
+    python manage.py backfill_live_counters
+    python manage.py backfill_live_counters --days 30
+
+Ejecutar una vez tras el despliegue de organizacion/live_counters.py para que
+los paneles de 7/30 días no arranquen vacíos. Solo escribe días completos
+anteriores a hoy (SET: se puede repetir sin duplicar); el día actual lo
+cuentan los eventos en vivo.
+
+- messages / messages_failed: filas de citas_whatsapp_message por día.
+- usuarios activos: el día del last_login de cada usuario.
+- citas: no hay fecha de creación en citas_cita; se cuentan desde el deploy.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from organizacion import live_counters
+
+SENT_STATUSES = ('sent', 'delivered', 'read')
+
+
+class Command(BaseCommand):
+    help = 'Siembra los contadores en vivo (buckets diarios) con datos históricos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help=f'Días hacia atrás (máximo {live_counters.DAY_RETENTION_DAYS - 1})'
+        )
+
+    def handle(self, *args, **options):
+        from citas.tenant_schemas import tenant_schemas_with_table
+        from usuarios.models import PerfilUsuario
+
+        days = min(options['days'], live_counters.DAY_RETENTION_DAYS - 1)
+        today = live_counters.bucket('day', datetime.now(dt_timezone.utc).timestamp())
+        until = datetime.fromtimestamp(today * live_counters.GRANULARITY_SECONDS['day'], dt_timezone.utc)
+        since = until - timedelta(days=days)
+
+        # (métrica, alcance, día) -> conteo
+        counts = Counter()
+        for schema_name in tenant_schemas_with_table('citas_whatsapp_message'):
+            with connection.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT organizacion_id,
+                           FLOOR(EXTRACT(EPOCH FROM created_at) / 86400)::bigint AS day,
+                           status = 'failed' AS failed,
+                           COUNT(*)
+                    FROM "{schema_name}"."citas_whatsapp_message"
+                    WHERE created_at >= %s AND created_at < %s
+                    AND (status = 'failed' OR status = ANY(%s))
+                    GROUP BY 1, 2, 3
+                """, [since, until, list(SENT_STATUSES)])
+                for organizacion_id, day, failed, count in cursor.fetchall():
+                    metric = 'messages_failed' if failed else 'messages'
+                    for scope in live_counters._scopes(organizacion_id):
+                        counts[(metric, scope, day)] += count
+
+        # alcance -> día -> usuarios
+        active = defaultdict(lambda: defaultdict(set))
+        for user_id, organizacion_id, last_login in PerfilUsuario.all_objects.filter(
+            user__last_login__gte=since, user__last_login__lt=until
+        ).values_list('user_id', 'organizacion_id', 'user__last_login'):
+            day = live_counters.bucket('day', last_login.timestamp())
+            for scope in live_counters._scopes(organizacion_id):
+                active[scope][day].add(user_id)
+
+        day_seconds = live_counters.GRANULARITY_SECONDS['day']
+        pipe = live_counters._redis().pipeline()
+        for (metric, scope, day), count in counts.items():
+            ttl = live_counters.TTL_SECONDS['day'] - (today - day) * day_seconds
+            pipe.set(live_counters._counter_key(metric, scope, 'day', day), count, ex=max(ttl, 1))
+        for scope, by_day in active.items():
+            for day, user_ids in by_day.items():
+                key = live_counters._hll_key(scope, 'day', day)
+                ttl = live_counters.TTL_SECONDS['day'] - (today - day) * day_seconds
+                pipe.pfadd(key, *user_ids)
+                pipe.expire(key, max(ttl, 1))
+        pipe.execute()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {len(counts)} contadores diarios y {sum(len(d) for d in active.values())} '
+            f'días de usuarios activos sembrados ({days} días)'
+        ))
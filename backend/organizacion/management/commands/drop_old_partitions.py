@@ -0,0 +1,58 @@
+"""
+Comando de retención: elimina las particiones mensuales antiguas.
+
+Uso:
+    python manage.py drop_old_partitions --days 90
+    python manage.py drop_old_partitions --days 90 --whatsapp-messages
+
+Elimina particiones completas (DETACH + DROP) en lugar de DELETE fila por
+fila. Solo aplica a tablas ya particionadas (ver partition_tables).
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+
+from organizacion.partitioning import drop_partitions_before, is_partitioned
+from organizacion.tasks import APPLICATION_LOG_TABLE
+
+
+class Command(BaseCommand):
+    help = 'Elimina particiones de logs (y opcionalmente mensajes WhatsApp) más antiguas que --days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'APPLICATION_LOG_RETENTION_DAYS', 90),
+            help='Días de logs a conservar (se eliminan meses completos anteriores)'
+        )
+        parser.add_argument(
+            '--whatsapp-messages',
+            action='store_true',
+            help='Aplicar también la retención a citas_whatsapp_message de cada tenant'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+
+        if is_partitioned(APPLICATION_LOG_TABLE):
+            dropped = drop_partitions_before(APPLICATION_LOG_TABLE, cutoff)
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {APPLICATION_LOG_TABLE}: {len(dropped)} particiones eliminadas {", ".join(dropped)}'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'{APPLICATION_LOG_TABLE} no está particionada; ejecuta partition_tables --application-log'
+            ))
+
+        if options['whatsapp_messages']:
+            from citas.tasks_whatsapp import drop_old_whatsapp_message_partitions
+            from citas.tenant_schemas import tenant_schemas_with_table
+
+            for schema_name in tenant_schemas_with_table('citas_whatsapp_message'):
+                dropped = drop_old_whatsapp_message_partitions(schema_name, cutoff)
+                if dropped is None:
+                    self.stdout.write(f'- {schema_name}.citas_whatsapp_message no está particionada')
+                else:
+                    self.stdout.write(f'✓ {schema_name}.citas_whatsapp_message: {len(dropped)} particiones eliminadas')
@@ -0,0 +1,70 @@
+"""
+Comando para particionar por mes las tablas de crecimiento continuo.
+
+Uso:
+    python manage.py partition_tables --application-log
+    python manage.py partition_tables --whatsapp-messages
+    python manage.py partition_tables            # Solo crea particiones futuras
+
+Convierte las tablas (una sola vez, en una ventana de mantenimiento) y crea
+las particiones de los próximos meses. La tarea diaria maintain_partitions
+sigue creando las particiones futuras después.
+"""
+from django.core.management.base import BaseCommand
+import logging
+
+from organizacion.partitioning import DEFAULT_MONTHS_AHEAD, convert_to_partitioned, ensure_partitions
+from organizacion.tasks import APPLICATION_LOG_TABLE, WHATSAPP_MESSAGE_TABLE, partitioned_tables
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Particiona por mes organizacion_application_log / citas_whatsapp_message y crea particiones futuras'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--application-log',
+            action='store_true',
+            help='Convertir public.organizacion_application_log en tabla particionada'
+        )
+        parser.add_argument(
+            '--whatsapp-messages',
+            action='store_true',
+            help='Convertir citas_whatsapp_message en tabla particionada (public y cada tenant)'
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=DEFAULT_MONTHS_AHEAD,
+            help=f'Meses futuros con partición creada (default: {DEFAULT_MONTHS_AHEAD})'
+        )
+
+    def handle(self, *args, **options):
+        from citas.tenant_schemas import tenant_schemas_with_table
+
+        months_ahead = options['months_ahead']
+        targets = []
+        if options['application_log']:
+            targets.append(('public', APPLICATION_LOG_TABLE))
+        if options['whatsapp_messages']:
+            targets.extend(
+                (schema_name, WHATSAPP_MESSAGE_TABLE)
+                for schema_name in tenant_schemas_with_table(WHATSAPP_MESSAGE_TABLE)
+            )
+
+        for schema_name, table_name in targets:
+            try:
+                if convert_to_partitioned(table_name, schema_name, months_ahead=months_ahead):
+                    self.stdout.write(self.style.SUCCESS(f'✓ {schema_name}.{table_name} particionada'))
+                else:
+                    self.stdout.write(f'- {schema_name}.{table_name} ya estaba particionada')
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'✗ Error particionando {schema_name}.{table_name}: {e}'))
+                logger.error(f"Error particionando {schema_name}.{table_name}: {e}", exc_info=True)
+
+        # Particiones futuras de todas las tablas ya particionadas
+        for schema_name, table_name in partitioned_tables():
+            created = ensure_partitions(table_name, schema_name, months_ahead=months_ahead)
+            if created:
+                self.stdout.write(f'  {schema_name}.{table_name}: {len(created)} particiones nuevas')
@@ -0,0 +1,46 @@
+"""
+Comando para crear el índice de búsqueda full-text del visor de logs.
+
+Uso:
+    python manage.py setup_log_search
+
+Agrega a organizacion_application_log la columna generada `search_vector`
+(tsvector) y su índice GIN. Agregar una columna STORED reescribe la tabla:
+en tablas muy grandes conviene ejecutarlo en una ventana de mantenimiento.
+"""
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from organizacion.log_search import SEARCH_INDEX_NAME, SEARCH_VECTOR_SQL
+from organizacion.partitioning import is_partitioned
+
+
+class Command(BaseCommand):
+    help = 'Crea la columna tsvector y el índice GIN para buscar en ApplicationLog'
+
+    def handle(self, *args, **options):
+        table = 'public.organizacion_application_log'
+
+        with connection.cursor() as cursor:
+            self.stdout.write("1. Creando columna search_vector...")
+            cursor.execute(f"""
+                ALTER TABLE {table}
+                ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED
+            """)
+            self.stdout.write(self.style.SUCCESS("   ✓ Columna creada"))
+
+            # CONCURRENTLY no se permite sobre la tabla padre de una tabla particionada
+            concurrently = '' if is_partitioned('organizacion_application_log') else 'CONCURRENTLY'
+            self.stdout.write("2. Creando índice GIN...")
+            cursor.execute(
+                f"CREATE INDEX {concurrently} IF NOT EXISTS {SEARCH_INDEX_NAME} "
+                f"ON {table} USING GIN (search_vector)"
+            )
+            self.stdout.write(self.style.SUCCESS("   ✓ Índice creado"))
+
+            cursor.execute(f"ANALYZE {table}")
+
+        cache.delete('logs:has_search_vector')
+        self.stdout.write(self.style.SUCCESS("\n✅ Búsqueda full-text de logs configurada\n"))
@@ -147,7 +147,41 @@ class Organizacion(models.Model):  # type: ignore
         db_table = 'organizacion_organizacion'
         # Esta tabla SIEMPRE va en el schema 'public' (shared)
 
+    def clean(self):
+        super().clean()
+        self.validate_whatsapp_templates()
+
+    def validate_whatsapp_templates(self, field_names=None):
+        """
+        Valida las plantillas de WhatsApp: sintaxis y solo variables conocidas
+        de cada tipo de mensaje (ver citas/whatsapp/message_templates.py).
+        Se llama desde clean() y desde save(), así que también cubre los
+        guardados desde serializers, comandos o el shell.
+
+        Args:
+            field_names: Solo validar estos campos (ej: update_fields de save)
+
+        Raises:
+            ValidationError: con el error de cada plantilla inválida
+        """
+        from django.core.exceptions import ValidationError
+        from citas.whatsapp.message_templates import TEMPLATE_FIELDS, TemplateError, validate_template
+
+        errors = {}
+        for message_type, field_name in TEMPLATE_FIELDS.items():
+            if field_names is not None and field_name not in field_names:
+                continue
+            try:
+                validate_template(getattr(self, field_name), message_type)
+            except TemplateError as e:
+                errors[field_name] = str(e)
+        if errors:
+            raise ValidationError(errors)
+
     def save(self, *args, **kwargs):
+        # Las plantillas se validan antes de cualquier escritura
+        self.validate_whatsapp_templates(kwargs.get('update_fields'))
+
         # ARQUITECTURA: Forzar search_path a public para guardar organizaciones
         from django.db import connection as db_conn
         with db_conn.cursor() as cursor:
@@ -0,0 +1,270 @@
+"""
+Particionamiento nativo de PostgreSQL por mes (RANGE sobre created_at).
+
+Tablas de crecimiento continuo (organizacion_application_log,
+citas_whatsapp_message) se convierten en tablas particionadas con una
+partición por mes (`<tabla>_pYYYYMM`) y una partición DEFAULT de respaldo:
+
+- Los índices se mantienen por partición: insertar en el mes actual no
+  actualiza índices de millones de filas históricas.
+- La retención elimina particiones completas (DETACH + DROP) en lugar de
+  ejecutar DELETE fila por fila (sin bloat ni VACUUM posterior).
+- `ensure_partitions` crea por adelantado las particiones de los próximos
+  meses (tarea diaria `maintain_partitions`); la DEFAULT solo recibe filas si
+  esa tarea dejó de ejecutarse.
+
+Limitaciones de PostgreSQL que aplican al convertir:
+- La PK pasa a ser (id, created_at): la clave de partición debe estar en la PK.
+- Las FKs de OTRAS tablas hacia la tabla particionada se eliminan (no pueden
+  apuntar solo a `id`). Django sigue aplicando on_delete en Python; antes de
+  borrar una partición, `before_drop` permite limpiar esas referencias.
+"""
+import logging
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MONTHS_AHEAD = 3
+PARTITION_SUFFIX_RE = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _qualified(schema_name, table_name):
+    return f'{_qn(schema_name)}.{_qn(table_name)}'
+
+
+def month_start(value):
+    """Primer instante (UTC) del mes de `value`."""
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table_name, month):
+    return f'{table_name}_p{month:%Y%m}'
+
+
+def is_partitioned(table_name, schema_name='public'):
+    """True si la tabla ya es una tabla particionada."""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT 1
+            FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = %s
+        """, [schema_name, table_name])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table_name, schema_name='public'):
+    """
+    Particiones mensuales de la tabla (sin la DEFAULT).
+
+    Returns:
+        Lista ordenada de tuplas (nombre_particion, inicio_del_mes)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            JOIN pg_namespace n ON n.oid = parent.relnamespace
+            WHERE n.nspname = %s AND parent.relname = %s
+        """, [schema_name, table_name])
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_SUFFIX_RE.search(name)
+        if match and name[:match.start()] == table_name:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _create_partition(cursor, table_name, schema_name, month):
+    # Los límites los generamos nosotros (no vienen del usuario)
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {_qualified(schema_name, partition_name(table_name, month))} "
+        f"PARTITION OF {_qualified(schema_name, table_name)} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def ensure_partitions(table_name, schema_name='public', months_ahead=DEFAULT_MONTHS_AHEAD, now=None):
+    """
+    Crea las particiones del mes actual y de los próximos `months_ahead` meses.
+
+    Returns:
+        Nombres de las particiones creadas
+    """
+    current = month_start(now or timezone.now())
+    existing = {name for name, _month in list_partitions(table_name, schema_name)}
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(table_name, month)
+            if name not in existing:
+                _create_partition(cursor, table_name, schema_name, month)
+                created.append(name)
+    if created:
+        logger.info(f"[Partitions] {schema_name}.{table_name}: particiones creadas {', '.join(created)}")
+    return created
+
+
+def drop_partitions_before(table_name, cutoff, schema_name='public', before_drop=None):
+    """
+    Retención: elimina las particiones cuyo mes termina antes de `cutoff`.
+    Las filas de la partición del mes de `cutoff` se conservan completas.
+
+    Args:
+        table_name: Tabla particionada
+        cutoff: Fecha límite (aware)
+        schema_name: Schema de la tabla
+        before_drop: Callback opcional (cursor, nombre_calificado) antes de
+            eliminar cada partición (ej: limpiar referencias)
+
+    Returns:
+        Nombres de las particiones eliminadas
+    """
+    dropped = []
+    for name, month in list_partitions(table_name, schema_name):
+        if add_months(month, 1) > cutoff:
+            break
+        qualified = _qualified(schema_name, name)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if before_drop is not None:
+                before_drop(cursor, qualified)
+            cursor.execute(f"ALTER TABLE {_qualified(schema_name, table_name)} DETACH PARTITION {qualified}")
+            cursor.execute(f"DROP TABLE {qualified}")
+        dropped.append(name)
+    if dropped:
+        logger.info(f"[Partitions] {schema_name}.{table_name}: particiones eliminadas {', '.join(dropped)}")
+    return dropped
+
+
+def convert_to_partitioned(table_name, schema_name='public', column='created_at',
+                           months_ahead=DEFAULT_MONTHS_AHEAD):
+    """
+    Convierte una tabla existente en una tabla particionada por mes,
+    copiando sus filas, índices y FKs salientes. Idempotente.
+
+    La copia se hace en UNA transacción con la tabla bloqueada: en tablas
+    muy grandes conviene ejecutarlo en una ventana de mantenimiento.
+
+    Returns:
+        True si la tabla se convirtió, False si ya estaba particionada
+    """
+    if is_partitioned(table_name, schema_name):
+        return False
+
+    table = _qualified(schema_name, table_name)
+    old_name = f'{table_name}_unpartitioned'
+    old_table = _qualified(schema_name, old_name)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+
+        # Definiciones a recrear (capturadas antes de renombrar)
+        cursor.execute("""
+            SELECT i.indexname, i.indexdef
+            FROM pg_indexes i
+            WHERE i.schemaname = %s AND i.tablename = %s
+              AND i.indexname NOT IN (
+                  SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'
+              )
+        """, [schema_name, table_name, table])
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+            "WHERE confrelid = %s::regclass AND contype = 'f'",
+            [table]
+        )
+        referencing = cursor.fetchall()
+
+        for conname, referencing_table in referencing:
+            logger.warning(
+                f"[Partitions] Eliminando FK {conname} de {referencing_table} hacia {schema_name}.{table_name} "
+                f"(on_delete lo sigue aplicando Django)"
+            )
+            cursor.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {_qn(conname)}")
+
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {_qn(old_name)}")
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING IDENTITY "
+            f"INCLUDING GENERATED INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS) "
+            f"PARTITION BY RANGE ({_qn(column)})"
+        )
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {_qn(column)})")
+
+        # Particiones desde el mes más antiguo con datos + DEFAULT de respaldo
+        cursor.execute(f"SELECT MIN({_qn(column)}) FROM {old_table}")
+        oldest = cursor.fetchone()[0]
+        current = month_start(timezone.now())
+        month = month_start(oldest) if oldest and oldest < current else current
+        while month <= add_months(current, months_ahead):
+            _create_partition(cursor, table_name, schema_name, month)
+            month = add_months(month, 1)
+        cursor.execute(
+            f"CREATE TABLE {_qualified(schema_name, table_name + '_default')} PARTITION OF {table} DEFAULT"
+        )
+
+        # Columnas generadas (ej: search_vector) se recalculan, no se copian
+        cursor.execute(
+            "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 "
+            "AND NOT attisdropped AND attgenerated = '' ORDER BY attnum",
+            [old_table]
+        )
+        columns = ', '.join(_qn(row[0]) for row in cursor.fetchall())
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) OVERRIDING SYSTEM VALUE SELECT {columns} FROM {old_table}"
+        )
+
+        # Secuencia del id: identity nueva (ajustar al máximo) o serial de la tabla vieja (reasignar dueño)
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+            [table]
+        )
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)",
+                [table]
+            )
+        else:
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [old_table])
+            sequence = cursor.fetchone()[0]
+            if sequence:
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+
+        cursor.execute(f"DROP TABLE {old_table}")
+
+        for index_name, index_def in indexes:
+            if index_def.startswith('CREATE UNIQUE'):
+                # Un índice único debería incluir la clave de partición
+                logger.warning(f"[Partitions] Índice único {index_name} omitido en {schema_name}.{table_name}")
+                continue
+            cursor.execute(index_def)
+        for conname, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {_qn(conname)} {definition}")
+
+    logger.info(f"[Partitions] {schema_name}.{table_name} convertida a tabla particionada por mes")
+    return True
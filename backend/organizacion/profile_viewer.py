@@ -0,0 +1,67 @@
+"""
+Vistas del admin para los perfiles de requests (ver core/profiling.py).
+"""
+from csp.decorators import csp_exempt
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
+from django.shortcuts import render
+
+from core.profiling import get_profile, list_profiles
+
+
+@staff_member_required
+def profile_list(request):
+    """
+    Perfiles recientes, filtrables por endpoint y tenant.
+    """
+    endpoint = request.GET.get('endpoint', '').strip()
+    tenant = request.GET.get('tenant', '').strip()
+
+    profiles = list_profiles(endpoint=endpoint, tenant=tenant)
+    all_profiles = profiles if not (endpoint or tenant) else list_profiles()
+
+    context = {
+        'profiles': profiles,
+        'tenants': sorted({profile['tenant'] for profile in all_profiles}),
+        'filters': {'endpoint': endpoint, 'tenant': tenant},
+    }
+    return render(request, 'admin/profiles.html', context)
+
+
+@staff_member_required
+def profile_detail(request, profile_id):
+    """
+    Metadatos, línea de tiempo SQL y reporte del perfil.
+    """
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise Http404('El perfil no existe o ya expiró')
+
+    sql = profile['sql']
+    total_ms = max(profile['meta']['duration_ms'], 1)
+    for entry in sql:
+        # Posición y ancho de la barra en la línea de tiempo (porcentaje del request)
+        entry['offset_pct'] = round(min(entry['start_ms'] / total_ms * 100, 100), 2)
+        entry['width_pct'] = round(max(entry['duration_ms'] / total_ms * 100, 0.3), 2)
+
+    context = {
+        'meta': profile['meta'],
+        'sql': sql,
+        # cProfile es texto plano; pyinstrument es HTML y se abre aparte
+        'text_report': profile['report'] if profile['meta']['profiler'] == 'cprofile' else None,
+    }
+    return render(request, 'admin/profile_detail.html', context)
+
+
+@csp_exempt
+@staff_member_required
+def profile_report(request, profile_id):
+    """
+    Reporte HTML de pyinstrument (documento completo con JS inline, por eso sin CSP).
+    """
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise Http404('El perfil no existe o ya expiró')
+    if profile['meta']['profiler'] == 'cprofile':
+        return HttpResponse(profile['report'], content_type='text/plain; charset=utf-8')
+    return HttpResponse(profile['report'])
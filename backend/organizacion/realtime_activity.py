@@ -1,17 +1,38 @@
 """
 Panel de Actividad en Tiempo Real
 Monitorea actividad del sistema en vivo usando Server-Sent Events (SSE)
+
+ARQUITECTURA: el stream se alimenta de los eventos de dominio publicados en
+Redis (ver organizacion/activity_events.py). Es una vista async que espera
+mensajes del canal pub/sub: no consulta la base de datos y, servida por
+ASGI, no ocupa un worker mientras la pestaña está abierta.
+
+Despliegue: servir /admin/realtime/stream/ con el ASGI de core/asgi.py, ej:
+    gunicorn core.asgi:application -k uvicorn.workers.UvicornWorker
+Bajo WSGI (workers sync) la vista responde un solo snapshot con `retry:` y
+el navegador vuelve a conectarse: polling barato, sin retener el worker.
 """
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import render
-from django.http import StreamingHttpResponse
-from django.db import connection
-from django.utils import timezone
-from datetime import timedelta
-from organizacion.models import Organizacion
-from usuarios.models import User
-import json
-import time
+
+from organizacion.activity_events import CHANNEL, snapshot
+
+logger = logging.getLogger(__name__)
+
+# Mínimo entre snapshots (agrupa ráfagas de eventos) y refresco sin eventos
+# (las ventanas deslizantes cambian aunque no lleguen eventos)
+MIN_SEND_INTERVAL = 1.0
+REFRESH_INTERVAL = 30.0
+HEARTBEAT_INTERVAL = 15.0
+WSGI_RETRY_MS = 10000
 
 
 @staff_member_required
@@ -22,162 +43,77 @@ def realtime_activity(request):
     return render(request, 'admin/realtime_activity.html')
 
 
-@staff_member_required
-def activity_stream(request):
+def _sse(data):
+    return f"data: {json.dumps(data)}\n\n".encode('utf-8')
+
+
+async def _snapshot_event():
+    try:
+        return _sse(await sync_to_async(snapshot, thread_sensitive=False)())
+    except Exception as e:
+        logger.warning(f"[Activity] No se pudo armar el snapshot: {e}")
+        return _sse({'error': 'Métricas no disponibles'})
+
+
+def _redis_url():
+    return getattr(settings, 'ACTIVITY_REDIS_URL', None) or settings.CACHES['default']['LOCATION']
+
+
+async def event_stream():
     """
-    Stream de eventos Server-Sent Events (SSE) para actualizaciones en tiempo real.
+    Generador SSE: un snapshot al conectar y otro tras cada ráfaga de eventos
+    (o cada REFRESH_INTERVAL), con heartbeats para mantener viva la conexión.
     """
-    def event_stream():
-        """Generador de eventos SSE"""
-        while True:
-            try:
-                # Recopilar métricas en tiempo real
-                data = get_realtime_metrics()
-
-                # Enviar datos en formato SSE (debe ser bytes)
-                yield f"data: {json.dumps(data)}\n\n".encode('utf-8')
-
-                # Actualizar cada 10 segundos (optimizado, antes era 3)
-                time.sleep(10)
-
-            except Exception as e:
-                # En caso de error, enviar mensaje de error
-                error_data = {'error': str(e)}
-                yield f"data: {json.dumps(error_data)}\n\n".encode('utf-8')
-                time.sleep(5)
-
-    response = StreamingHttpResponse(
-        event_stream(),
-        content_type='text/event-stream'
-    )
-    response['Cache-Control'] = 'no-cache'
-    response['X-Accel-Buffering'] = 'no'  # Disable buffering in nginx
-    return response
+    import redis.asyncio as redis_asyncio
 
+    client = redis_asyncio.from_url(_redis_url())
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(CHANNEL)
+        loop = asyncio.get_running_loop()
 
-def get_realtime_metrics():
+        yield await _snapshot_event()
+        last_sent = last_write = loop.time()
+        pending = False
+
+        while True:
+            now = loop.time()
+            if pending:
+                timeout = max(MIN_SEND_INTERVAL - (now - last_sent), 0)
+            else:
+                timeout = min(HEARTBEAT_INTERVAL, REFRESH_INTERVAL - (now - last_sent))
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=max(timeout, 0.01))
+            if message is not None:
+                pending = True
+
+            now = loop.time()
+            if (pending and now - last_sent >= MIN_SEND_INTERVAL) or now - last_sent >= REFRESH_INTERVAL:
+                yield await _snapshot_event()
+                last_sent = last_write = now
+                pending = False
+            elif now - last_write >= HEARTBEAT_INTERVAL:
+                yield b": ping\n\n"
+                last_write = now
+    finally:
+        # El cliente cerró la pestaña: Django cancela el iterador
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def activity_stream(request):
     """
-    Obtiene métricas en tiempo real de todas las organizaciones.
-    Optimizado para reducir queries a la base de datos.
+    Stream de eventos Server-Sent Events (SSE) para actualizaciones en tiempo real.
     """
-    now = timezone.now()
-    last_minute = now - timedelta(minutes=1)
-    last_5_minutes = now - timedelta(minutes=5)
-    last_hour = now - timedelta(hours=1)
-
-    metrics = {
-        'timestamp': now.isoformat(),
-        'global': {
-            'users_online': 0,
-            'citas_last_minute': 0,
-            'citas_last_hour': 0,
-            'messages_last_minute': 0,
-            'messages_last_hour': 0,
-        },
-        'organizations': [],
-        'recent_activities': []
-    }
-
-    # Usuarios activos (últimos 5 minutos basado en last_login)
-    users_online = User.objects.filter(
-        last_login__gte=last_5_minutes,
-        is_active=True
-    ).count()
-    metrics['global']['users_online'] = users_online
-
-    # Optimización: Cargar organizaciones una sola vez con prefetch de perfiles
-    from django.db.models import Prefetch
-    from usuarios.models import PerfilUsuario
-
-    organizations = Organizacion.objects.filter(is_active=True).prefetch_related(
-        Prefetch(
-            'perfiles',
-            queryset=PerfilUsuario.objects.select_related('usuario').filter(
-                usuario__last_login__gte=last_5_minutes,
-                usuario__is_active=True
-            )
-        )
-    ).order_by('nombre')
-
-    # Recopilar actividades recientes de todas las orgs en una sola pasada
-    recent_activities = []
-
-    # Por cada organización
-    for org in organizations:
-        try:
-            org_data = {
-                'id': org.id,
-                'nombre': org.nombre,
-                'citas_last_minute': 0,
-                'citas_last_hour': 0,
-                'messages_last_minute': 0,
-                'messages_last_hour': 0,
-                'users_online': 0,
-            }
-
-            # Optimización: Una sola query para todos los counts de citas y mensajes
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_cita" WHERE created_at >= %s) as citas_minute,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_cita" WHERE created_at >= %s) as citas_hour,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_whatsapp_message" WHERE created_at >= %s) as messages_minute,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_whatsapp_message" WHERE created_at >= %s) as messages_hour
-                """, [last_minute, last_hour, last_minute, last_hour])
-
-                result = cursor.fetchone()
-                org_data['citas_last_minute'] = result[0] if result else 0
-                org_data['citas_last_hour'] = result[1] if result else 0
-                org_data['messages_last_minute'] = result[2] if result else 0
-                org_data['messages_last_hour'] = result[3] if result else 0
-
-            # Usuarios online de esta organización (usar prefetch ya cargado)
-            org_data['users_online'] = len(org.perfiles.all())
-
-            # Actualizar métricas globales
-            metrics['global']['citas_last_minute'] += org_data['citas_last_minute']
-            metrics['global']['citas_last_hour'] += org_data['citas_last_hour']
-            metrics['global']['messages_last_minute'] += org_data['messages_last_minute']
-            metrics['global']['messages_last_hour'] += org_data['messages_last_hour']
-
-            # Recopilar actividades recientes de esta org (en el mismo loop)
-            try:
-                with connection.cursor() as cursor:
-                    cursor.execute(f"""
-                        SELECT
-                            id,
-                            created_at,
-                            estado
-                        FROM "{org.schema_name}"."citas_cita"
-                        ORDER BY created_at DESC
-                        LIMIT 5
-                    """)
-
-                    for row in cursor.fetchall():
-                        cita_id, created_at, estado = row
-                        recent_activities.append({
-                            'type': 'cita',
-                            'org_nombre': org.nombre,
-                            'org_id': org.id,
-                            'cita_id': cita_id,
-                            'timestamp': created_at.isoformat() if created_at else None,
-                            'estado': estado,
-                        })
-            except:
-                pass
-
-            # Solo agregar si tiene actividad
-            if (org_data['citas_last_hour'] > 0 or
-                org_data['messages_last_hour'] > 0 or
-                org_data['users_online'] > 0):
-                metrics['organizations'].append(org_data)
-
-        except Exception:
-            # Si hay error en esta org, continuar con las demás
-            continue
-
-    # Ordenar por timestamp y tomar las 10 más recientes
-    recent_activities.sort(key=lambda x: x['timestamp'] or '', reverse=True)
-    metrics['recent_activities'] = recent_activities[:10]
-
-    return metrics
+    user = await request.auser()
+    if not (user.is_active and user.is_staff):
+        return HttpResponseForbidden()
+
+    if not isinstance(request, ASGIRequest):
+        # WSGI: no retener el worker; un snapshot y reconexión del navegador
+        body = f"retry: {WSGI_RETRY_MS}\n".encode('utf-8') + await _snapshot_event()
+        response = HttpResponse(body, content_type='text/event-stream')
+    else:
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable buffering in nginx
+    return response
@@ -0,0 +1,46 @@
+"""
+Vistas del admin para las queries lentas (ver core/slow_queries.py).
+"""
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from django.shortcuts import render
+
+from core.slow_queries import slow_query_detail as get_slow_query, slow_query_groups
+
+
+@staff_member_required
+def slow_query_list(request):
+    """
+    Queries lentas agrupadas por fingerprint con p50/p95, filtrables por
+    tabla (ej: citas_cita), vista y schema.
+    """
+    table = request.GET.get('table', '').strip()
+    source = request.GET.get('source', '').strip()
+    schema = request.GET.get('schema', '').strip()
+
+    groups = slow_query_groups()
+    schemas = sorted({group['schema'] for group in groups if group['schema']})
+    if table:
+        groups = [group for group in groups if table in group['shape']]
+    if source:
+        groups = [group for group in groups if source in (group['source'] or '')]
+    if schema:
+        groups = [group for group in groups if group['schema'] == schema]
+
+    context = {
+        'groups': groups,
+        'schemas': schemas,
+        'filters': {'table': table, 'source': source, 'schema': schema},
+    }
+    return render(request, 'admin/slow_queries.html', context)
+
+
+@staff_member_required
+def slow_query_detail(request, fingerprint):
+    """
+    SQL de ejemplo, parámetros, orígenes y plan de EXPLAIN del fingerprint.
+    """
+    query = get_slow_query(fingerprint)
+    if query is None:
+        raise Http404('La query no existe o ya expiró')
+    return render(request, 'admin/slow_query_detail.html', {'query': query})
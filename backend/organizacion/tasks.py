@@ -0,0 +1,96 @@
+"""
+Tareas periódicas de mantenimiento de tablas particionadas (ver partitioning.py)
+y EXPLAIN de las queries lentas (ver core/slow_queries.py).
+"""
+import json
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .partitioning import drop_partitions_before, ensure_partitions, is_partitioned
+
+logger = logging.getLogger(__name__)
+
+APPLICATION_LOG_TABLE = 'organizacion_application_log'
+WHATSAPP_MESSAGE_TABLE = 'citas_whatsapp_message'
+
+
+def partitioned_tables():
+    """
+    Tablas administradas que ya están particionadas.
+
+    Returns:
+        Lista de tuplas (schema_name, table_name)
+    """
+    from citas.tenant_schemas import tenant_schemas_with_table
+
+    tables = []
+    if is_partitioned(APPLICATION_LOG_TABLE):
+        tables.append(('public', APPLICATION_LOG_TABLE))
+    for schema_name in tenant_schemas_with_table(WHATSAPP_MESSAGE_TABLE):
+        if is_partitioned(WHATSAPP_MESSAGE_TABLE, schema_name):
+            tables.append((schema_name, WHATSAPP_MESSAGE_TABLE))
+    return tables
+
+
+@shared_task
+def maintain_partitions():
+    """
+    Tarea diaria: crea las particiones de los próximos meses y aplica la
+    retención de ApplicationLog eliminando particiones completas.
+    (La retención de mensajes WhatsApp la aplica cleanup_old_whatsapp_messages.)
+    """
+    created = 0
+    for schema_name, table_name in partitioned_tables():
+        try:
+            created += len(ensure_partitions(table_name, schema_name))
+        except Exception as e:
+            logger.error(f"[Partitions] Error creando particiones de {schema_name}.{table_name}: {e}")
+
+    dropped = []
+    if is_partitioned(APPLICATION_LOG_TABLE):
+        retention_days = getattr(settings, 'APPLICATION_LOG_RETENTION_DAYS', 90)
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        dropped = drop_partitions_before(APPLICATION_LOG_TABLE, cutoff)
+
+    return {'created': created, 'dropped': len(dropped)}
+
+
+@shared_task(ignore_result=True)
+def explain_slow_query(fingerprint, sql, params, schema_name='public'):
+    """
+    Obtiene el plan (EXPLAIN sin ANALYZE: no ejecuta la query) de una query
+    lenta en el schema donde se ejecutó y lo guarda junto a su fingerprint.
+
+    Args:
+        fingerprint: Fingerprint de la query (core.slow_queries.fingerprint)
+        sql: SQL con placeholders
+        params: Parámetros (lista serializada a JSON) o None
+        schema_name: Schema del tenant
+    """
+    from citas.whatsapp.status_buffer import SCHEMA_NAME_RE
+    from core.slow_queries import store_plan
+
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return
+    if not SCHEMA_NAME_RE.match(schema_name):
+        schema_name = 'public'
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            # SET LOCAL: vuelve al search_path de la conexión al terminar la transacción
+            cursor.execute(f"SET LOCAL search_path TO {connection.ops.quote_name(schema_name)}, public")
+            cursor.execute("SET LOCAL statement_timeout = '5s'")
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+    except Exception as e:
+        logger.warning(f"[SlowQuery] No se pudo obtener el plan de {fingerprint}: {e}")
+        return
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    store_plan(fingerprint, plan)
@@ -0,0 +1,490 @@
+import logging
+
+from django.test import SimpleTestCase
+
+
+class DatabaseLogHandlerTests(SimpleTestCase):
+    """
+    DatabaseLogHandler: los logs se encolan en el hilo que loguea y se
+    guardan por lotes (bulk_create) desde el hilo de fondo.
+    """
+
+    def _handler(self, **kwargs):
+        from .logging_handler import DatabaseLogHandler
+
+        handler = DatabaseLogHandler(**kwargs)
+        self.batches = []
+        handler._save_batch = self.batches.append
+        self.addCleanup(handler.close)
+        return handler
+
+    def _record(self, message):
+        return logging.LogRecord('citas.views', logging.WARNING, __file__, 1, message, None, None)
+
+    def test_flushes_in_batches_from_background_thread(self):
+        import threading
+
+        handler = self._handler(batch_size=10, flush_interval=60)
+        saved = threading.Event()
+        handler._save_batch = lambda batch: (self.batches.append(batch), saved.set())
+
+        for i in range(10):
+            handler.emit(self._record(f'[AVAIL DEBUG] slot {i}'))
+
+        # El lote lleno despierta al hilo sin esperar flush_interval
+        self.assertTrue(saved.wait(5))
+        self.assertEqual([len(batch) for batch in self.batches], [10])
+        self.assertEqual(self.batches[0][0]['message'], '[AVAIL DEBUG] slot 0')
+        self.assertEqual(self.batches[0][0]['level'], 'WARNING')
+
+    def test_drops_oldest_when_queue_is_full(self):
+        handler = self._handler(batch_size=1000, flush_interval=60, max_queue_size=5)
+
+        for i in range(8):
+            handler.emit(self._record(f'log {i}'))
+        handler.flush()
+
+        messages = [fields['message'] for batch in self.batches for fields in batch]
+        self.assertEqual(messages, [f'log {i}' for i in range(3, 8)])
+
+    def test_close_flushes_pending_records(self):
+        handler = self._handler(batch_size=1000, flush_interval=60)
+
+        handler.emit(self._record('pendiente'))
+        handler.close()
+
+        self.assertEqual([fields['message'] for batch in self.batches for fields in batch], ['pendiente'])
+
+
+class MonthlyPartitionTests(SimpleTestCase):
+    """Cálculo de los rangos mensuales de las particiones."""
+
+    def test_month_ranges_cross_year_boundaries(self):
+        from datetime import datetime, timezone
+        from .partitioning import add_months, month_start, partition_name
+
+        month = month_start(datetime(2026, 12, 31, 23, 59, tzinfo=timezone.utc))
+
+        self.assertEqual(month, datetime(2026, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(add_months(month, 1), datetime(2027, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(add_months(month, -12), datetime(2025, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(partition_name('organizacion_application_log', month), 'organizacion_application_log_p202612')
+
+
+class LogViewerCountTests(SimpleTestCase):
+    """El visor de logs no hace COUNT(*) exacto sobre resultados grandes."""
+
+    def test_large_results_use_planner_estimate(self):
+        from unittest.mock import MagicMock, patch
+        from .log_search import EstimatedCountPaginator
+
+        queryset = MagicMock()
+        queryset.count.side_effect = AssertionError('COUNT(*) sobre millones de filas')
+
+        with patch('organizacion.log_search.estimated_count', return_value=25_000_000):
+            paginator = EstimatedCountPaginator(queryset, 50)
+            self.assertEqual(paginator.count, 25_000_000)
+            self.assertEqual(paginator.num_pages, 500_000)
+        self.assertTrue(paginator.is_estimated)
+
+    def test_small_results_are_counted_exactly(self):
+        from unittest.mock import MagicMock, patch
+        from .log_search import fast_count
+
+        queryset = MagicMock()
+        queryset.count.return_value = 42
+
+        with patch('organizacion.log_search.estimated_count', return_value=120):
+            self.assertEqual(fast_count(queryset), (42, False))
+
+
+class MetricsTests(SimpleTestCase):
+    """Middleware de métricas y endpoint /metrics (core/metrics.py)."""
+
+    def setUp(self):
+        from core import metrics
+        if not metrics.METRICS_ENABLED:
+            self.skipTest('prometheus_client no está instalado')
+
+    def test_middleware_records_duration_and_queries_by_view(self):
+        from django.db import connection
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.urls import ResolverMatch
+        from prometheus_client import REGISTRY
+        from core.metrics import MetricsMiddleware, QueryCounter
+
+        def view(request):
+            request.resolver_match = ResolverMatch(view, (), {}, url_name='test-metrics')
+            # Sin BD en estos tests: ejecutar el wrapper activo como lo haría una query
+            for wrapper in connection.execute_wrappers:
+                wrapper(lambda *args: None, 'SELECT 1', None, False, {})
+            return HttpResponse(status=201)
+
+        labels = {'view': 'test-metrics', 'method': 'GET', 'status': '201', 'tenant': 'public'}
+        before = REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) or 0
+        queries_before = REGISTRY.get_sample_value('http_request_db_queries_sum', {'view': 'test-metrics'}) or 0
+
+        MetricsMiddleware(view)(RequestFactory().get('/api/citas/'))
+
+        self.assertEqual(REGISTRY.get_sample_value('http_request_duration_seconds_count', labels), before + 1)
+        self.assertEqual(
+            REGISTRY.get_sample_value('http_request_db_queries_sum', {'view': 'test-metrics'}), queries_before + 1
+        )
+        self.assertIsInstance(QueryCounter().duration, float)
+
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory, override_settings
+        from core.metrics import metrics_view
+
+        request = RequestFactory().get('/metrics')
+        request.user = AnonymousUser()
+        self.assertEqual(metrics_view(request).status_code, 403)
+
+        with override_settings(METRICS_TOKEN='s3cret'):
+            request = RequestFactory().get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+            request.user = AnonymousUser()
+            response = metrics_view(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_duration_seconds', response.content)
+
+
+class QueryBudgetTests(SimpleTestCase):
+    """Presupuesto de queries por vista y detector de N+1 (core/query_budget.py)."""
+
+    def _run(self, queries, budget=None, repeat_limit=None):
+        from django.db import connection
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.urls import ResolverMatch
+        from core.query_budget import QueryBudgetMiddleware, query_budget
+
+        @query_budget(budget, repeat_limit)
+        def view(request):
+            request.resolver_match = ResolverMatch(view, (), {}, url_name='test-budget')
+            # Sin BD en estos tests: ejecutar el wrapper activo como lo haría una query
+            for sql in queries:
+                for wrapper in connection.execute_wrappers:
+                    wrapper(lambda *args: None, sql, None, False, {})
+            return HttpResponse()
+
+        return QueryBudgetMiddleware(view)(RequestFactory().get('/api/citas/'))
+
+    def test_sql_shape_collapses_literals_and_in_lists(self):
+        from core.query_budget import sql_shape
+
+        self.assertEqual(
+            sql_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 42'),
+            sql_shape('SELECT *  FROM t WHERE id IN (%s, %s) AND x = 7'),
+        )
+
+    def test_over_budget_fails_under_tests(self):
+        from django.test import override_settings
+        from core.query_budget import QueryBudgetExceeded
+
+        queries = [f'SELECT {i} FROM citas_cita' for i in range(4)]
+        with override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True):
+            self.assertEqual(self._run(queries, budget=4).status_code, 200)
+            with self.assertRaisesMessage(QueryBudgetExceeded, '4 queries (presupuesto 3)'):
+                self._run(queries, budget=3)
+
+    def test_repeated_shape_is_logged_in_production(self):
+        from django.test import override_settings
+
+        queries = ['SELECT * FROM citas_colaborador WHERE id = %s'] * 6 + ['SET search_path TO public'] * 6
+        with override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=False):
+            with self.assertLogs('core.query_budget', 'WARNING') as logs:
+                self._run(queries, repeat_limit=5)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('posible N+1, 6x', logs.output[0])
+        self.assertNotIn('search_path', logs.output[0])
+
+
+class ProfilingTests(SimpleTestCase):
+    """Profiling bajo demanda con X-Profile y muestreo (core/profiling.py)."""
+
+    def _run(self, user, **headers):
+        from unittest import mock
+        from django.db import connection
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+
+        def view(request):
+            request.user = user  # DRF autentica el JWT dentro de la vista
+            for wrapper in connection.execute_wrappers:
+                wrapper(lambda *args: None, 'SELECT 1', None, False, {})
+            return HttpResponse()
+
+        from core.profiling import ProfilingMiddleware
+
+        with mock.patch('core.profiling.save_profile', return_value=True) as save:
+            response = ProfilingMiddleware(view)(RequestFactory().get('/api/citas/', **headers))
+        return response, save
+
+    def _user(self, is_staff):
+        from unittest import mock
+        return mock.Mock(is_authenticated=True, is_staff=is_staff, get_username=lambda: 'ana')
+
+    def test_staff_header_stores_profile_with_sql_timeline(self):
+        from unittest import mock
+
+        with mock.patch('core.profiling._header_user_is_staff', return_value=True):
+            response, save = self._run(self._user(True), HTTP_X_PROFILE='1')
+
+        meta, report, sql = save.call_args.args
+        self.assertEqual(response['X-Profile-Id'], meta['id'])
+        self.assertEqual((meta['trigger'], meta['queries'], meta['user']), ('header', 1, 'ana'))
+        self.assertEqual(sql[0]['sql'], 'SELECT 1')
+        self.assertTrue(report)
+
+    def test_header_from_non_staff_never_starts_the_profiler(self):
+        from unittest import mock
+
+        with mock.patch('core.profiling._header_user_is_staff', return_value=False), \
+                mock.patch('core.profiling._new_profiler') as new:
+            response, save = self._run(self._user(False), HTTP_X_PROFILE='1')
+
+        new.assert_not_called()
+        save.assert_not_called()
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_header_without_valid_credentials_never_starts_the_profiler(self):
+        from unittest import mock
+
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer no-es-un-jwt'}):
+            with mock.patch('core.profiling._new_profiler') as new:
+                _response, save = self._run(self._user(True), HTTP_X_PROFILE='1', **headers)
+            new.assert_not_called()
+            save.assert_not_called()
+
+    def test_unprofiled_requests_skip_the_profiler(self):
+        from unittest import mock
+        from django.test import override_settings
+
+        with override_settings(PROFILING_SAMPLE_RATE=0.0), mock.patch('core.profiling._new_profiler') as new:
+            _response, save = self._run(self._user(True))
+
+        new.assert_not_called()
+        save.assert_not_called()
+
+    def test_sampled_requests_fall_back_to_cprofile(self):
+        from unittest import mock
+        from django.test import override_settings
+
+        with override_settings(PROFILING_SAMPLE_RATE=1.0), mock.patch('core.profiling.PyinstrumentProfiler', None):
+            _response, save = self._run(self._user(False))
+
+        meta, report, _sql = save.call_args.args
+        self.assertEqual((meta['trigger'], meta['profiler']), ('sample', 'cprofile'))
+        self.assertIn('function calls', report)
+
+
+class SlowQueryTests(SimpleTestCase):
+    """Captura de queries lentas y lectura de planes (core/slow_queries.py)."""
+
+    def test_recorder_only_records_queries_over_threshold(self):
+        import time
+        from unittest import mock
+        from django.test import override_settings
+        from core.slow_queries import SlowQueryRecorder
+
+        def slow_execute(*args):
+            time.sleep(0.02)
+
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=10), \
+                mock.patch('core.slow_queries.record_slow_query') as record:
+            recorder = SlowQueryRecorder(source='task:citas.tasks.x')
+            recorder(lambda *args: None, 'SELECT 1', None, False, {})
+            recorder(slow_execute, 'SELECT * FROM citas_cita WHERE sede_id = %s', [3], False, {})
+
+        record.assert_called_once()
+        sql, params, duration_ms, schema_name, source = record.call_args.args
+        self.assertEqual((sql, params, schema_name, source), (
+            'SELECT * FROM citas_cita WHERE sede_id = %s', [3], 'public', 'task:citas.tasks.x'
+        ))
+        self.assertGreaterEqual(duration_ms, 10)
+
+    def test_recorder_reads_schema_from_the_connection(self):
+        import time
+        from unittest import mock
+        from django.test import override_settings
+        from core.slow_queries import SlowQueryRecorder
+
+        def slow_execute(*args):
+            time.sleep(0.02)
+
+        # Una tarea Celery bajo use_schema: sin organización en el thread-local
+        db = mock.MagicMock()
+        cursor = db.connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = ('tenant_a',)
+
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=10), \
+                mock.patch('core.slow_queries.record_slow_query') as record:
+            SlowQueryRecorder(source='task:citas.tasks.x')(
+                slow_execute, 'SELECT * FROM citas_cita', None, False, {'connection': db}
+            )
+
+        cursor.execute.assert_called_once_with("SELECT current_schema()")
+        self.assertEqual(record.call_args.args[3], 'tenant_a')
+
+    def test_fingerprint_groups_same_shape(self):
+        from core.slow_queries import fingerprint
+
+        self.assertEqual(
+            fingerprint('SELECT * FROM citas_cita WHERE id IN (%s, %s)'),
+            fingerprint('SELECT * FROM citas_cita WHERE id IN (%s, %s, %s)'),
+        )
+        self.assertNotEqual(fingerprint('SELECT 1 FROM a'), fingerprint('SELECT 1 FROM b'))
+
+    def test_percentiles_and_seq_scans(self):
+        from core.slow_queries import percentile, seq_scans
+
+        values = sorted(float(v) for v in range(1, 101))
+        self.assertEqual((percentile(values, 50), percentile(values, 95)), (50.0, 95.0))
+
+        plan = [{'Plan': {'Node Type': 'Sort', 'Plans': [
+            {'Node Type': 'Seq Scan', 'Relation Name': 'citas_cita', 'Plan Rows': 5000, 'Filter': '(sede_id = 3)'},
+            {'Node Type': 'Index Scan', 'Relation Name': 'citas_servicio'},
+        ]}}]
+        self.assertEqual(seq_scans(plan), [{'relation': 'citas_cita', 'rows': 5000, 'filter': '(sede_id = 3)'}])
+
+
+class LiveCountersTests(SimpleTestCase):
+    """Contadores en vivo por minuto/hora/día y usuarios activos (HyperLogLog)."""
+
+    def test_sliding_sum_weights_the_oldest_bucket(self):
+        from organizacion.live_counters import _sliding_sum
+
+        now = 1_700_000_000 - 1_700_000_000 % 60 + 15  # 25% del minuto actual
+        self.assertEqual(_sliding_sum([b'2', b'8'], 'minute', now), 8)  # 2 + 8 * 0.75
+        self.assertEqual(_sliding_sum([b'1', None, b'3', b'4'], 'minute', now), 7)
+
+    def test_increment_writes_every_granularity_for_tenant_and_global(self):
+        from unittest import mock
+        from organizacion.live_counters import bucket, increment
+
+        pipe = mock.Mock()
+        now = 1_700_000_000
+        increment('citas', 5, count=2, now=now, pipe=pipe)
+
+        keys = [call.args[0] for call in pipe.incrby.call_args_list]
+        self.assertEqual(len(keys), 6)
+        self.assertIn(f"counter:citas:5:minute:{bucket('minute', now)}", keys)
+        self.assertIn(f"counter:citas:global:day:{bucket('day', now)}", keys)
+        pipe.execute.assert_not_called()  # El pipeline lo ejecuta quien lo pasó
+
+    def test_middleware_records_each_user_once_per_minute(self):
+        from unittest import mock
+        from django.test import RequestFactory
+        from organizacion.live_counters import LiveCountersMiddleware
+
+        middleware = LiveCountersMiddleware(lambda request: 'response')
+        request = RequestFactory().get('/api/citas/')
+        request.user = mock.Mock(is_authenticated=True, pk=42)
+
+        with mock.patch('organizacion.live_counters.record_active_user') as record, \
+                mock.patch('organizacion.thread_locals.get_current_organization', return_value=mock.Mock(id=3)):
+            for _ in range(3):
+                self.assertEqual(middleware(request), 'response')
+
+        record.assert_called_once()
+        self.assertEqual(record.call_args.args[:2], (42, 3))
+
+
+class ActivityEventsTests(SimpleTestCase):
+    """Eventos de dominio y stream SSE del panel en tiempo real."""
+
+    def test_events_are_published_after_commit(self):
+        from unittest import mock
+        from organizacion.activity_events import publish_event
+
+        with mock.patch('organizacion.activity_events._record') as record, \
+                mock.patch('organizacion.activity_events.transaction.on_commit') as on_commit:
+            publish_event('message_sent', 3, count=10, campaign_id=7)
+            record.assert_not_called()
+            on_commit.call_args.args[0]()
+
+        record.assert_called_once_with('message_sent', 3, 10, {'campaign_id': 7})
+
+    def test_stream_requires_staff_and_serves_snapshot_under_wsgi(self):
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.test import RequestFactory
+        from organizacion.realtime_activity import activity_stream
+
+        def request_for(is_staff):
+            request = RequestFactory().get('/admin/realtime/stream/')
+            user = mock.Mock(is_active=True, is_staff=is_staff)
+
+            async def auser():
+                return user
+            request.auser = auser
+            return request
+
+        self.assertEqual(async_to_sync(activity_stream)(request_for(False)).status_code, 403)
+
+        data = {'global': {'users_online': 1}, 'organizations': [], 'recent_activities': []}
+        with mock.patch('organizacion.realtime_activity.snapshot', return_value=data):
+            response = async_to_sync(activity_stream)(request_for(True))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.content.startswith(b'retry: '))
+        self.assertIn(b'"users_online": 1', response.content)
+
+
+class HealthCheckTests(SimpleTestCase):
+    """Checks en paralelo con timeout, caché por TTL y sondeos liveness/readiness."""
+
+    def setUp(self):
+        from organizacion import health_check
+
+        health_check._cache.clear()
+        health_check._inflight.clear()
+
+    def test_checks_are_cached_and_slow_checks_time_out(self):
+        import threading
+        from unittest import mock
+        from organizacion import health_check
+
+        calls = []
+        release = threading.Event()
+
+        def fast():
+            calls.append('fast')
+            return {'status': 'healthy'}
+
+        def slow():
+            release.wait(5)
+            return {'status': 'healthy'}
+
+        checks = {'fast': (fast, 1, 60), 'slow': (slow, 0.05, 60)}
+        with mock.patch.dict(health_check.CHECKS, checks, clear=True):
+            first = health_check.run_checks()
+            second = health_check.run_checks(['fast'])
+            release.set()
+
+        self.assertEqual(first['fast'], {'status': 'healthy'})
+        self.assertEqual(first['slow']['status'], 'error')
+        self.assertEqual(second['fast'], {'status': 'healthy'})
+        self.assertEqual(calls, ['fast'])
+
+    def test_probes_are_answered_by_the_middleware(self):
+        from unittest import mock
+        from django.test import RequestFactory
+        from organizacion.health_check import HealthCheckMiddleware
+
+        get_response = mock.Mock()
+        middleware = HealthCheckMiddleware(get_response)
+
+        response = middleware(RequestFactory().get('/health/live'))
+        self.assertEqual(response.status_code, 200)
+
+        with mock.patch('organizacion.health_check.run_checks', return_value={'database': {'status': 'error'}}):
+            response = middleware(RequestFactory().get('/health/ready/'))
+        self.assertEqual(response.status_code, 503)
+        get_response.assert_not_called()
+
+        middleware(RequestFactory().get('/api/citas/'))
+        get_response.assert_called_once()
@@ -4,13 +4,42 @@ Panel de Estadísticas de Uso por Organización
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 from django.db import connection
-from django.utils import timezone
-from datetime import timedelta
 from django.db.models import Count, Q
+from organizacion import live_counters
 from organizacion.models import Organizacion
-from usuarios.models import User
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+
+def _estimated_rows(table_names):
+    """
+    Filas estimadas por (schema, tabla) según las estadísticas de PostgreSQL
+    (pg_class.reltuples, actualizado por ANALYZE/autovacuum). Las tablas
+    particionadas suman sus particiones.
+
+    Returns:
+        dict (schema, tabla) -> filas estimadas
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT n.nspname, COALESCE(parent.relname, c.relname) AS table_name,
+                       SUM(GREATEST(c.reltuples, 0))::bigint
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+                LEFT JOIN pg_class parent ON parent.oid = i.inhparent
+                WHERE c.relkind = 'r'
+                AND COALESCE(parent.relname, c.relname) = ANY(%s)
+                GROUP BY 1, 2
+            """, [list(table_names)])
+            return {(schema, table): rows for schema, table, rows in cursor.fetchall()}
+    except Exception as e:
+        logger.warning(f"[Counters] No se pudo estimar el tamaño de las tablas: {e}")
+        return {}
+
 
 @staff_member_required
 def usage_statistics(request):
@@ -18,21 +47,27 @@ def usage_statistics(request):
     Vista para ver estadísticas de uso detalladas por organización.
     """
 
-    # Período de análisis
-    today = timezone.now()
-    last_7_days = today - timedelta(days=7)
-    last_30_days = today - timedelta(days=30)
-
     # Optimización: Usar annotate para obtener todos los counts en una sola query
     organizations = Organizacion.objects.annotate(
-        total_users=Count('perfiles__id', distinct=True),
-        active_users=Count('perfiles__id', filter=Q(perfiles__usuario__is_active=True), distinct=True),
-        inactive_users=Count('perfiles__id', filter=Q(perfiles__usuario__is_active=False), distinct=True),
-        recently_active=Count('perfiles__id', filter=Q(perfiles__usuario__last_login__gte=last_7_days), distinct=True),
-        never_logged_in=Count('perfiles__id', filter=Q(perfiles__usuario__last_login__isnull=True), distinct=True),
+        total_users=Count('miembros__id', distinct=True),
+        active_users=Count('miembros__id', filter=Q(miembros__user__is_active=True), distinct=True),
+        inactive_users=Count('miembros__id', filter=Q(miembros__user__is_active=False), distinct=True),
+        never_logged_in=Count('miembros__id', filter=Q(miembros__user__last_login__isnull=True), distinct=True),
         sedes_count=Count('sedes__id', distinct=True)
     ).order_by('-created_at')
 
+    # OPTIMIZACIÓN: conteos de 7/30 días y usuarios activos desde los
+    # contadores en vivo de Redis; los totales son la estimación de filas
+    # de PostgreSQL (una query para todos los schemas, sin COUNT(*)).
+    org_ids = [org.id for org in organizations]
+    try:
+        counters = live_counters.read_counters(('citas', 'messages', 'messages_failed'), org_ids, windows=('7d', '30d'))
+        active = live_counters.read_active_users(org_ids, windows=('7d',))
+    except Exception as e:
+        logger.warning(f"[Counters] Contadores en vivo no disponibles: {e}")
+        counters, active = {}, {}
+    estimated_rows = _estimated_rows(('citas_cita', 'citas_whatsapp_message'))
+
     organizations_stats = []
 
     for org in organizations:
@@ -41,29 +76,18 @@ def usage_statistics(request):
             total_users = org.total_users
             active_users = org.active_users
             inactive_users = org.inactive_users
-            recently_active = org.recently_active
+            recently_active = active.get(org.id, {}).get('active_7d', 0)
             never_logged_in = org.never_logged_in
 
             # ===== CITAS Y MENSAJES =====
-            # Optimización: Una sola query para obtener todos los counts de citas y mensajes
-            with connection.cursor() as cursor:
-                cursor.execute(f"""
-                    SELECT
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_cita" WHERE created_at >= %s) as citas_7d,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_cita" WHERE created_at >= %s) as citas_30d,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_cita") as citas_total,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_whatsapp_message" WHERE created_at >= %s) as messages_7d,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_whatsapp_message" WHERE created_at >= %s) as messages_30d,
-                        (SELECT COUNT(*) FROM "{org.schema_name}"."citas_whatsapp_message") as messages_total
-                """, [last_7_days, last_30_days, last_7_days, last_30_days])
-
-                result = cursor.fetchone()
-                citas_7d = result[0] if result else 0
-                citas_30d = result[1] if result else 0
-                citas_total = result[2] if result else 0
-                messages_7d = result[3] if result else 0
-                messages_30d = result[4] if result else 0
-                messages_total = result[5] if result else 0
+            org_counters = counters.get(org.id, {})
+            citas_7d = org_counters.get('citas_7d', 0)
+            citas_30d = org_counters.get('citas_30d', 0)
+            citas_total = estimated_rows.get((org.schema_name, 'citas_cita'), 0)
+            # Mensajes procesados: enviados + fallidos
+            messages_7d = org_counters.get('messages_7d', 0) + org_counters.get('messages_failed_7d', 0)
+            messages_30d = org_counters.get('messages_30d', 0) + org_counters.get('messages_failed_30d', 0)
+            messages_total = estimated_rows.get((org.schema_name, 'citas_whatsapp_message'), 0)
 
             # ===== STORAGE =====
             # Tamaño de logos y archivos
@@ -1,3 +1,101 @@
-from django.test import TestCase
+import io
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import pytz
+from django.contrib.auth.models import User
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from citas.models import Cita, Colaborador, Servicio
+from organizacion.models import Organizacion, Sede
+from organizacion.thread_locals import set_current_organization, set_current_user
+from usuarios.models import PerfilUsuario
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Dependencia opcional (ver citas/parquet_export.py)
+    pq = None
+
+
+class CitasParquetExportTests(APITestCase):
+    """Exportación Parquet del historial: contenido, permisos y pyarrow ausente."""
+
+    URL = '/api/reports/citas-parquet/'
+
+    def setUp(self):
+        self.org = Organizacion.objects.create(nombre='Org Parquet')
+        self.sede = Sede.all_objects.create(organizacion=self.org, nombre='Sede Norte')
+        otra_org = Organizacion.objects.create(nombre='Otra Org')
+        otra_sede = Sede.all_objects.create(organizacion=otra_org, nombre='Sede Otra')
+
+        corte = Servicio.all_objects.create(nombre='Corte', sede=self.sede, precio=Decimal('20000'))
+        barba = Servicio.all_objects.create(nombre='Barba', sede=self.sede, precio=Decimal('15000'))
+        luis = Colaborador.all_objects.create(nombre='Luis', sede=self.sede)
+
+        fecha = datetime(2026, 3, 2, 15, 0, tzinfo=pytz.UTC)
+        self.cita = Cita.all_objects.create(nombre='ana', fecha=fecha, sede=self.sede, estado='Asistio')
+        self.cita.servicios.add(corte, barba)
+        self.cita.colaboradores.add(luis)
+        self.sin_servicios = Cita.all_objects.create(nombre='beto', fecha=fecha + timedelta(days=1), sede=self.sede)
+        Cita.all_objects.create(nombre='ajeno', fecha=fecha, sede=otra_sede)
+
+        self.owner = self._user('owner', 'owner')
+        self.sede_admin = self._user('sede_admin', 'sede_admin')
+
+    def tearDown(self):
+        set_current_user(None)
+        set_current_organization(None)
+
+    def _user(self, username, role):
+        user = User.objects.create_user(username=username, password='password123')
+        PerfilUsuario.all_objects.create(user=user, organizacion=self.org, role=role)
+        return user
+
+    def _get(self, user, params=None):
+        # El middleware de organización resuelve el tenant desde el JWT
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return self.client.get(self.URL, params or {})
+
+    @unittest.skipIf(pq is None, 'pyarrow no está instalado')
+    def test_export_round_trips_the_organization_citas(self):
+        response = self._get(self.owner)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        rows = {row['id']: row for row in table.to_pylist()}
+
+        self.assertEqual(set(rows), {self.cita.id, self.sin_servicios.id})
+        row = rows[self.cita.id]
+        self.assertEqual((row['cliente'], row['estado'], row['sede']), ('ana', 'Asistio', 'Sede Norte'))
+        self.assertEqual(row['servicios'], ['Barba', 'Corte'])
+        self.assertEqual(row['colaboradores'], ['Luis'])
+        self.assertEqual(row['precio_total'], Decimal('35000'))
+        self.assertEqual(rows[self.sin_servicios.id]['servicios'], [])
+        self.assertEqual(rows[self.sin_servicios.id]['precio_total'], Decimal('0'))
+
+    @unittest.skipIf(pq is None, 'pyarrow no está instalado')
+    def test_date_range_filters_the_export(self):
+        response = self._get(self.owner, {'start_date': '2026-03-03'})
+
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('id').to_pylist(), [self.sin_servicios.id])
+
+    def test_only_organization_admins_can_export(self):
+        self.assertEqual(self._get(self.sede_admin).status_code, status.HTTP_403_FORBIDDEN)
+
+        superuser = User.objects.create_superuser(username='root', password='password123')
+        self.assertEqual(self._get(superuser).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_missing_pyarrow_returns_501(self):
+        from unittest import mock
+        from citas.parquet_export import ParquetExportUnavailable
+
+        error = ParquetExportUnavailable('La exportación a Parquet requiere pyarrow (pip install pyarrow).')
+        with mock.patch('citas.parquet_export._import_pyarrow', side_effect=error):
+            response = self._get(self.owner)
+
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertIn('pyarrow', response.data['error'])
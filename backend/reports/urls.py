@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import FinancialSummaryView
+from .views import FinancialSummaryView, CitasParquetExportView
 
 app_name = 'reports'
 
 urlpatterns = [
     path('financial-summary/', FinancialSummaryView.as_view(), name='financial-summary'),
+    path('citas-parquet/', CitasParquetExportView.as_view(), name='citas-parquet'),
 ]
@@ -1,6 +1,4 @@
 from datetime import datetime, timedelta
-from django.db.models import Sum, Count, Q, F, Case, When, DecimalField, Value
-from django.db.models.functions import Coalesce
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -8,6 +6,8 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 
 from citas.models import Cita, Colaborador
+from citas.revenue import ESTADOS_ASISTIDA, revenue_by_estado, revenue_by_servicio
+from citas.report_cache import cached_report_response
 from .permissions import IsAdminOrSedeAdmin
 
 # MULTI-TENANT: Import helper for profile management
@@ -37,6 +37,14 @@ class FinancialSummaryView(APIView):
     permission_classes = [IsAuthenticated, IsAdminOrSedeAdmin]
 
     def get(self, request, *args, **kwargs):
+        # OPTIMIZACIÓN: ETag + cache versionado por tenant.
+        # Los dashboards consultan este endpoint repetidamente; si no hubo
+        # escrituras de citas/servicios/colaboradores se responde 304 o desde cache.
+        return cached_report_response(
+            request, 'financial_summary', lambda: self._build_summary(request)
+        )
+
+    def _build_summary(self, request):
         # 1. Obtener parámetros de fecha
         start_date, end_date = self._get_date_range(request)
 
@@ -56,65 +64,25 @@ class FinancialSummaryView(APIView):
                 pass
 
         # 4. OPTIMIZACIÓN: Calcular todas las métricas principales en UNA SOLA QUERY
-        metrics = queryset.aggregate(
-            # Ingresos realizados (citas con estado 'Asistio' o 'Asistió')
-            ingresos_realizados=Coalesce(
-                Sum(
-                    'servicios__precio',
-                    filter=Q(estado__in=['Asistio', 'Asistió'])
-                ),
-                Value(0),
-                output_field=DecimalField()
-            ),
-
-            # Ingresos proyectados (citas Pendiente o Confirmada)
-            ingresos_proyectados=Coalesce(
-                Sum(
-                    'servicios__precio',
-                    filter=Q(estado__in=['Pendiente', 'Confirmada'])
-                ),
-                Value(0),
-                output_field=DecimalField()
-            ),
-
-            # Ingresos perdidos (citas No Asistio o No Asistió)
-            ingresos_perdidos=Coalesce(
-                Sum(
-                    'servicios__precio',
-                    filter=Q(estado__in=['No Asistio', 'No Asistió'])
-                ),
-                Value(0),
-                output_field=DecimalField()
-            ),
-
-            # Ingresos cancelados (citas Cancelada)
-            ingresos_cancelados=Coalesce(
-                Sum(
-                    'servicios__precio',
-                    filter=Q(estado='Cancelada')
-                ),
-                Value(0),
-                output_field=DecimalField()
-            ),
-
-            # Conteo de citas por estado (distinct para evitar duplicados por ManyToMany)
-            total_citas=Count('id', distinct=True),
-            citas_asistio=Count('id', filter=Q(estado__in=['Asistio', 'Asistió']), distinct=True),
-            citas_pendiente=Count('id', filter=Q(estado='Pendiente'), distinct=True),
-            citas_confirmada=Count('id', filter=Q(estado='Confirmada'), distinct=True),
-            citas_no_asistio=Count('id', filter=Q(estado__in=['No Asistio', 'No Asistió']), distinct=True),
-            citas_cancelada=Count('id', filter=Q(estado='Cancelada'), distinct=True),
-        )
+        # El precio de cada cita se calcula una sola vez (subquery correlacionada),
+        # así el filtro por colaborador no multiplica los ingresos.
+        metrics = revenue_by_estado(queryset, {
+            'realizados': ESTADOS_ASISTIDA,
+            'proyectados': ['Pendiente', 'Confirmada'],
+            'perdidos': ['No Asistio', 'No Asistió'],
+            'cancelados': ['Cancelada'],
+            # Pendiente y Confirmada se reportan por separado en citas_por_estado
+            'pendiente': ['Pendiente'],
+            'confirmada': ['Confirmada'],
+        })
+        metrics['citas_asistio'] = metrics['citas_realizados']
+        metrics['citas_no_asistio'] = metrics['citas_perdidos']
+        metrics['citas_cancelada'] = metrics['citas_cancelados']
 
         # 5. Calcular ingresos por servicio (solo citas asistidas)
-        ingresos_por_servicio = queryset.filter(
-            estado__in=['Asistio', 'Asistió']
-        ).values(
-            'servicios__nombre'
-        ).annotate(
-            total_ingresos=Sum('servicios__precio'),
-            cantidad_citas=Count('id')
-        ).order_by('-total_ingresos')[:10]  # Top 10 servicios
+        ingresos_por_servicio = revenue_by_servicio(
+            queryset, estados=ESTADOS_ASISTIDA, limit=10
+        )  # Top 10 servicios
 
         # 6. Preparar respuesta
         response_data = {
@@ -181,7 +149,7 @@ class FinancialSummaryView(APIView):
             ],
             'ingresos_por_servicio': [
                 {
-                    'servicio': item['servicios__nombre'] or 'Sin servicio',
+                    'servicio': item['servicio__nombre'] or 'Sin servicio',
                     'total_ingresos': float(item['total_ingresos'] or 0),
                     'cantidad_citas': item['cantidad_citas']
                 }
@@ -238,12 +206,7 @@ class FinancialSummaryView(APIView):
             cursor.execute("SET search_path TO public;")
 
         # Obtener queryset base usando all_objects para bypass de OrganizacionManager
-        queryset = Cita.all_objects.select_related(
-            'sede',
-            'sede__organizacion'
-        ).prefetch_related(
-            'servicios'
-        )
+        queryset = Cita.all_objects.all()
 
         # Superusuarios ven todo
         if user.is_superuser:
@@ -276,3 +239,74 @@ class FinancialSummaryView(APIView):
             queryset = queryset.none()
 
         return queryset
+
+
+class CitasParquetExportView(APIView):
+    """
+    Exporta el historial de citas de la organización en formato Parquet
+    (columnar, para herramientas de BI).
+
+    GET /api/reports/citas-parquet/
+
+    Query Parameters:
+    - start_date / end_date (opcionales): Rango en formato YYYY-MM-DD
+    - organizacion_id: Requerido solo para superusuarios
+
+    Permisos:
+    - Superusuarios y owners/admins de la organización (el export es completo,
+      no filtrado por sede)
+    """
+
+    permission_classes = [IsAuthenticated, IsAdminOrSedeAdmin]
+
+    def get(self, request, *args, **kwargs):
+        import tempfile
+        from django.http import FileResponse
+        from citas.parquet_export import ParquetExportUnavailable, export_citas_parquet
+        from organizacion.models import Organizacion
+
+        user = request.user
+        if user.is_superuser:
+            try:
+                org = Organizacion.objects.get(id=int(request.query_params.get('organizacion_id')))
+            except (TypeError, ValueError, Organizacion.DoesNotExist):
+                return Response(
+                    {'error': 'Debe indicar un organizacion_id válido.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            perfil = get_perfil_or_first(user)
+            if not perfil or not perfil.organizacion or perfil.role not in ['owner', 'admin']:
+                return Response(
+                    {'error': 'Solo los administradores de la organización pueden exportar el historial.'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            org = perfil.organizacion
+
+        try:
+            start_date = self._parse_date(request.query_params.get('start_date'))
+            end_date = self._parse_date(request.query_params.get('end_date'))
+        except ValueError:
+            return Response(
+                {'error': 'Formato de fecha inválido. Use YYYY-MM-DD.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # El archivo se escribe en disco por row groups y se envía en streaming
+        output = tempfile.TemporaryFile()
+        try:
+            export_citas_parquet(org, output, start_date=start_date, end_date=end_date)
+        except ParquetExportUnavailable as e:
+            output.close()
+            return Response({'error': str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        output.seek(0)
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=f'citas_{org.schema_name}.parquet',
+            content_type='application/vnd.apache.parquet',
+        )
+
+    def _parse_date(self, value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
@@ -243,7 +243,7 @@ class ClientSerializer(serializers.ModelSerializer):
         import secrets
         import string
         import logging
-        from django.core.mail import send_mail
+        from core.mailer import send_email
         from django.template.loader import render_to_string
         from django.conf import settings
         from datetime import datetime
@@ -324,7 +324,7 @@ Saludos,
                 """.strip()
 
                 # Enviar email
-                send_mail(
+                send_email(
                     subject=f'Bienvenido a {organization_name} - Tus Credenciales de Acceso',
                     message=plain_message,
                     from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else None,
@@ -472,8 +472,10 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
 
             # Ahora UserSerializer puede usar OrganizationManager correctamente
             user_data = UserSerializer(self.user).data
+            login_org = get_current_organization()
 
         except ObjectDoesNotExist:
+            login_org = None
             # Si no hay perfil, serializa solo los datos básicos del usuario
             user_data = {
                 'id': self.user.id,
@@ -502,6 +504,10 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         )
         logger.info(f"[SECURITY] New session created for user {self.user.username} from IP {ip_address}")
 
+        # Panel en tiempo real: usuarios online (organizacion/activity_events.py)
+        from organizacion.activity_events import publish_event
+        publish_event('login', getattr(login_org, 'id', None), user_id=self.user.id)
+
         return data
 
 
@@ -1,3 +1,4 @@
+from django.contrib.auth.signals import user_logged_in
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 from .models import PerfilUsuario
@@ -18,3 +19,16 @@ def auto_assign_organizacion_from_sede(sender, instance, **kwargs):
     if instance.sede and not instance.organizacion:
         instance.organizacion = instance.sede.organizacion
         logger.info(f"Auto-asignando organización {instance.organizacion} al usuario {instance.user.username} desde la sede {instance.sede}")
+
+
+@receiver(user_logged_in)
+def publish_login_activity(sender, request, user, **kwargs):
+    """
+    Login por sesión (admin) para el panel en tiempo real. El login JWT lo
+    publica MyTokenObtainPairSerializer (SimpleJWT no emite user_logged_in).
+    """
+    from organizacion.activity_events import publish_event
+    from organizacion.thread_locals import get_current_organization
+
+    org = get_current_organization()
+    publish_event('login', getattr(org, 'id', None), user_id=user.id)
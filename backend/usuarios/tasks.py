@@ -2,7 +2,7 @@
 Celery tasks for asynchronous operations in usuarios app.
 """
 from celery import shared_task
-from django.core.mail import send_mail
+from core.mailer import send_email
 from django.template.loader import render_to_string
 from django.conf import settings
 import logging
@@ -33,7 +33,7 @@ def send_invitation_email_task(self, invitation_id, email, context):
         )
 
         # Enviar email
-        send_mail(
+        send_email(
             subject=f'Invitaci�n a {context["organization_name"]}',
             message=f'Has sido invitado a {context["organization_name"]}. Visita {context["accept_url"]} para aceptar.',
             from_email=settings.DEFAULT_FROM_EMAIL,
@@ -103,16 +103,31 @@ def get_perfil_or_first(user):
     # Intentar obtener perfil de la organización actual
     org = get_current_organization()
 
+    # OPTIMIZACIÓN: se llama varias veces por request (permisos, get_queryset,
+    # serializers) sobre el mismo request.user; se memoiza en la instancia
+    # del usuario, que vive lo que dura el request.
+    cache = user.__dict__.setdefault('_perfil_or_first_cache', {})
+    cache_key = org.pk if org else None
+    if cache_key in cache:
+        return cache[cache_key]
+
+    perfil = None
     if org:
         try:
-            return user.perfiles.select_related('organizacion', 'sede').get(
+            perfil = user.perfiles.select_related('organizacion', 'sede').get(
                 organizacion=org
             )
         except PerfilUsuario.DoesNotExist:
             pass
 
-    # Fallback: primer perfil disponible
-    return user.perfiles.select_related('organizacion', 'sede').first()
+    if perfil is None:
+        # Fallback: primer perfil disponible
+        perfil = user.perfiles.select_related('organizacion', 'sede').first()
+
+    # Solo se cachean perfiles encontrados: uno creado más tarde en el mismo request se ve
+    if perfil is not None:
+        cache[cache_key] = perfil
+    return perfil
 
 
 def has_perfil_in_current_org(user):
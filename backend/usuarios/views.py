@@ -15,10 +15,9 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth.models import User, Group # Added Group
 from citas.permissions import IsAdminOrSedeAdmin
 from rest_framework.decorators import action
-from django.db.models import Count, Q, Sum
-from citas.models import Cita
+from django.db.models import Q
 from citas.serializers import CitaSerializer
-from django.core.mail import send_mail
+from core.mailer import send_email
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
@@ -490,13 +489,21 @@ class ClientViewSet(viewsets.ModelViewSet):
 
         SEGURIDAD: Verifica que el usuario solicitante y el cliente pertenezcan
         a la misma organización (excepto superusuarios).
+
+        OPTIMIZACIÓN: Las estadísticas (conteos, LTV, servicios más usados) se leen
+        de ClientStats, que se mantiene al día con cada cambio de cita. Las citas
+        se devuelven paginadas (?page=, ?page_size=; metadatos en
+        'citas_pagination') y solo se serializa la página.
         """
-        from django.db.models import Prefetch
+        from django.db.models import Prefetch, prefetch_related_objects
         from citas.models import Servicio, Colaborador
+        from citas.client_stats import client_citas, get_client_stats
+        from citas.pagination import StandardResultsSetPagination
         from rest_framework.exceptions import PermissionDenied
 
         client = self.get_object()
         user = request.user
+        client_perfil = get_perfil_or_first(client)
 
         # VALIDACIÓN DE SEGURIDAD MULTI-TENANT
         # Superusuarios tienen acceso completo
@@ -506,7 +513,6 @@ class ClientViewSet(viewsets.ModelViewSet):
             if not user_perfil:
                 raise PermissionDenied("Tu cuenta no tiene un perfil asignado.")
 
-            client_perfil = get_perfil_or_first(client)
             if not client_perfil:
                 raise PermissionDenied("El cliente solicitado no tiene un perfil asignado.")
 
@@ -523,52 +529,44 @@ class ClientViewSet(viewsets.ModelViewSet):
                     "Solo puedes acceder a clientes de tu organización."
                 )
 
+        # MULTI-TENANT: Estadísticas e historial dentro de la organización del cliente
+        organizacion_id = client_perfil.organizacion_id if client_perfil else None
+
+        client_stats = get_client_stats(client, organizacion_id)
+
         # CRITICAL FIX: Use Prefetch with _base_manager to bypass OrganizacionManager
         # This ensures servicios and colaboradores are fetched correctly
         servicios_prefetch = Prefetch('servicios', queryset=Servicio._base_manager.all())
         colaboradores_prefetch = Prefetch('colaboradores', queryset=Colaborador._base_manager.all())
 
-        # Usar all_objects para evitar filtrado por OrganizacionManager
-        citas = Cita.all_objects.filter(
-            Q(user=client) | Q(nombre=client.username)
-        ).select_related(
+        citas = client_citas(client, organizacion_id).select_related(
             'sede',
             'user'  # Optimize user access
-        ).prefetch_related(
+        ).order_by('-fecha', '-id')
+
+        # Paginar ANTES de los prefetch: solo se cargan las relaciones de la página
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(citas, request, view=self)
+        prefetch_related_objects(
+            page,
             servicios_prefetch,
             colaboradores_prefetch,
             'user__groups',
             'user__perfiles',  # FIX: Changed from perfil to perfiles (ForeignKey relation)
             'user__perfiles__sedes_administradas'
-        ).distinct().order_by('-fecha')
-
-        # Calcular estadísticas generales
-        stats = citas.aggregate(
-            total=Count('id'),
-            asistidas=Count('id', filter=Q(estado='Asistio')),
-            canceladas=Count('id', filter=Q(estado='Cancelada')),
-            no_asistidas=Count('id', filter=Q(estado='No Asistio'))
         )
 
-        # Calcular el Lifetime Value (LTV) del cliente
-        # LTV = suma de precios de todos los servicios en citas con estado 'Asistio'
-        ltv_result = citas.filter(
-            estado='Asistio'
-        ).aggregate(
-            ltv=Sum('servicios__precio')
-        )
-
-        # Asegurar que LTV sea 0 si no hay citas asistidas o si el resultado es None
-        stats['ltv'] = ltv_result['ltv'] or 0
-
-        servicios_usados = citas.values('servicios__nombre').annotate(count=Count('servicios__id')).order_by('-count')
-
         # Incluir datos del cliente en la respuesta para evitar llamada adicional en el frontend
         return Response({
             'client': ClientSerializer(client).data,
-            'citas': CitaSerializer(citas, many=True).data,
-            'stats': stats,
-            'servicios_mas_usados': list(servicios_usados)
+            'citas': CitaSerializer(page, many=True).data,
+            'citas_pagination': {
+                'count': paginator.page.paginator.count,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+            },
+            'stats': client_stats.as_stats(),
+            'servicios_mas_usados': client_stats.servicios_top,
         })
 
 
@@ -1155,7 +1153,7 @@ Saludos,
 El equipo de {getattr(settings, 'SITE_NAME', 'Citas')}
                         """.strip()
 
-                        send_mail(
+                        send_email(
                             subject=subject,
                             message=plain_message,
                             from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
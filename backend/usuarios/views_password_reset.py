@@ -7,7 +7,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
+from core.mailer import send_email
 from django.conf import settings
 import logging
 
@@ -79,7 +79,7 @@ Equipo de {getattr(settings, 'SITE_NAME', 'Sistema de Citas')}
             """.strip()
 
             # Enviar email
-            send_mail(
+            send_email(
                 subject=subject,
                 message=message,
                 from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
@@ -419,7 +419,7 @@ export const getClientById = (id: number) => api.get<Client>(`/api/clients/${id}
 export const createClient = (clientData: Partial<Client>) => api.post<Client>('/api/clients/', clientData);
 export const updateClient = (id: number, clientData: Partial<Client>) => api.patch<Client>(`/api/clients/${id}/`, clientData);
 export const deleteClient = (id: number) => api.delete(`/api/clients/${id}/`);
-export const getClientHistory = (id: number) => api.get(`/api/clients/${id}/history/`);
+export const getClientHistory = (id: number, page: number = 1) => api.get(`/api/clients/${id}/history/`, { params: { page } });
 
 // Funciones para Marketing
 export const sendMarketingEmail = (data: { subject: string; message: string; recipient_emails?: string[] }) => api.post('/api/marketing/send-email/', data);
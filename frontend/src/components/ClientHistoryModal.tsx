@@ -1,4 +1,4 @@
-import React, { useEffect } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import { Modal, Button, Spinner, Alert, Table, Card, Row, Col, Badge } from 'react-bootstrap';
 import { useTranslation } from 'react-i18next';
 import { useApi } from '../hooks/useApi';
@@ -15,12 +15,28 @@ interface ClientHistoryModalProps {
 const ClientHistoryModal: React.FC<ClientHistoryModalProps> = ({ client, show, onHide }) => {
     const { t } = useTranslation();
     const { data: history, loading, error, request: fetchHistory } = useApi(getClientHistory);
+    // Citas acumuladas de las páginas cargadas (el backend pagina el historial)
+    const [citas, setCitas] = useState<any[]>([]);
+    const [page, setPage] = useState(1);
+
+    const loadPage = useCallback(async (clientId: number, pageNumber: number) => {
+        const result = await fetchHistory(clientId, pageNumber);
+        if (result.success && result.data) {
+            const pageCitas = result.data.citas || [];
+            setCitas((prev) => (pageNumber === 1 ? pageCitas : [...prev, ...pageCitas]));
+            setPage(pageNumber);
+        }
+    }, [fetchHistory]);
 
     useEffect(() => {
         if (client && show) {
-            fetchHistory(client.id);
+            setCitas([]);
+            loadPage(client.id, 1);
         }
-    }, [client, show, fetchHistory]);
+    }, [client, show, loadPage]);
+
+    const totalCitas = history?.citas_pagination?.count ?? citas.length;
+    const hasMore = Boolean(history?.citas_pagination?.next);
 
     // Optimización: El backend ahora devuelve datos del cliente en history.client
     // para evitar llamadas adicionales a la API
@@ -52,7 +68,7 @@ const ClientHistoryModal: React.FC<ClientHistoryModalProps> = ({ client, show, o
                 </Modal.Title>
             </Modal.Header>
             <Modal.Body style={{ maxHeight: '75vh', overflowY: 'auto' }} className="px-4">
-                {loading && (
+                {loading && citas.length === 0 && (
                     <div className="loading-container text-center py-5">
                         <Spinner animation="border" variant="primary" className="mb-3" />
                         <p className="text-muted">{t('loading')}...</p>
@@ -169,8 +185,8 @@ const ClientHistoryModal: React.FC<ClientHistoryModalProps> = ({ client, show, o
                                         </tr>
                                     </thead>
                                     <tbody>
-                                        {history.citas && history.citas.length > 0 ? (
-                                            history.citas.map((cita: any) => (
+                                        {citas.length > 0 ? (
+                                            citas.map((cita: any) => (
                                                 <tr key={cita.id}>
                                                     <td className="text-nowrap">
                                                         <div className="date-cell">
@@ -223,6 +239,24 @@ const ClientHistoryModal: React.FC<ClientHistoryModalProps> = ({ client, show, o
                                     </tbody>
                                 </Table>
                             </div>
+                            {citas.length > 0 && (
+                                <div className="d-flex justify-content-between align-items-center p-3">
+                                    <small className="text-muted">
+                                        {t('showing') || 'Mostrando'} {citas.length} / {totalCitas}
+                                    </small>
+                                    {hasMore && (
+                                        <Button
+                                            variant="outline-primary"
+                                            size="sm"
+                                            disabled={loading}
+                                            onClick={() => client && loadPage(client.id, page + 1)}
+                                        >
+                                            {loading && <Spinner animation="border" size="sm" className="me-2" />}
+                                            {t('load_more') || 'Cargar más'}
+                                        </Button>
+                                    )}
+                                </div>
+                            )}
                         </Card>
                     </div>
                 )}